@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from configuracion import configuracion
+
+# ==============================
+# Niveles y umbrales
+# ==============================
+# De menor a mayor holgura; cada umbral es el máximo de días restantes del nivel
+# (días restantes = días completos hasta la fecha límite, negativos si ya pasó)
+NIVELES = ['vencido', 'critico', 'muy_urgente', 'urgente', 'por_vencer', 'disponible']
+SIN_FECHA = 'sin_deadline'
+
+# Deadlines y entregas usan los mismos cortes. Antes el tablero y Proyecto sumaban un
+# día a los días restantes de la entrega y la marcaban urgente hasta 5 días; ahora es
+# urgente con ≤3 días y sin desfase, igual que ya mostraba la página de Delivery.
+def umbrales_vigentes():
+    """Umbrales de cada nivel; los intermedios salen de la configuración (ALERTA_DIAS_*)"""
+    config = configuracion()
+    return {
+        'vencido': -1,
+        'critico': 0,
+        'muy_urgente': config.ALERTA_DIAS_MUY_URGENTE,
+        'urgente': config.ALERTA_DIAS_URGENTE,
+        'por_vencer': config.ALERTA_DIAS_POR_VENCER,
+    }
+
+ESTILOS = {
+    'vencido': {'color': '#666666', 'icono': '☠️', 'fondo': '#F5F5F5'},
+    'critico': {'color': '#dc2626', 'icono': '🔥', 'fondo': '#fef2f2'},
+    'muy_urgente': {'color': '#ea580c', 'icono': '⏰', 'fondo': '#fff7ed'},
+    'urgente': {'color': '#ea580c', 'icono': '⏳', 'fondo': '#fff7ed'},
+    'por_vencer': {'color': '#ca8a04', 'icono': '📅', 'fondo': '#fefce8'},
+    'disponible': {'color': '#16a34a', 'icono': '✅', 'fondo': '#f0fdf4'},
+    'sin_deadline': {'color': '#16a34a', 'icono': '📌', 'fondo': '#f0fdf4'}
+}
+
+def estilo_alerta(nivel):
+    """Color, icono y fondo de un nivel de alerta"""
+    return ESTILOS.get(nivel, ESTILOS[SIN_FECHA])
+
+def limites_dias(umbrales=None):
+    """Días restantes [desde, hasta) de cada nivel; None = sin límite"""
+    umbrales = umbrales or umbrales_vigentes()
+    cortes = [umbrales[nivel] + 1 for nivel in NIVELES[:-1]]
+    return dict(zip(NIVELES, zip([None] + cortes, cortes + [None])))
+
+# ==============================
+# Clasificación por lote
+# ==============================
+def bordes_niveles(ahora, umbrales=None):
+    """Fechas de corte entre niveles, ascendentes: una fecha < bordes[i] cae en NIVELES[i] o antes"""
+    umbrales = umbrales or umbrales_vigentes()
+    return np.array([ahora + timedelta(days=umbrales[nivel] + 1) for nivel in NIVELES[:-1]],
+                    dtype='datetime64[us]')
+
+def clasificar_fechas(fechas, ahora=None, umbrales=None):
+    """Nivel y días restantes para un arreglo de fechas límite (NaT = sin fecha).
+
+    Se ordenan las fechas una vez y cada borde se ubica con searchsorted, así que
+    el costo es un sort más k búsquedas, sin comparar fila por fila.
+    """
+    ahora = ahora or datetime.now()
+    fechas = pd.to_datetime(pd.Series(fechas), errors='coerce').to_numpy(dtype='datetime64[us]')
+    validas = ~np.isnat(fechas)
+
+    orden = np.argsort(fechas, kind='stable')   # NaT queda al final
+    ordenadas = fechas[orden]
+    cortes = np.searchsorted(ordenadas[:validas.sum()], bordes_niveles(ahora, umbrales), side='left')
+    tramos = np.diff(np.concatenate(([0], cortes, [validas.sum()])))
+
+    codigos = np.full(len(fechas), len(NIVELES), dtype=np.int8)
+    codigos[orden[:validas.sum()]] = np.repeat(np.arange(len(NIVELES), dtype=np.int8), tramos)
+    niveles = np.array(NIVELES + [SIN_FECHA], dtype=object)[codigos]
+
+    dias = np.full(len(fechas), np.nan)
+    dias[validas] = np.floor((fechas[validas] - np.datetime64(ahora, 'us')) / np.timedelta64(1, 'D'))
+    return niveles, dias
+
+def alertas_portafolio(df, ahora=None, umbrales=None):
+    """Nivel y días restantes del deadline de propuesta y de la entrega para cada proyecto del portafolio"""
+    ahora = ahora or datetime.now()
+    fecha_entrega = df['fecha_ingreso_oc'] + pd.to_timedelta(df['plazo_entrega'].astype(float), unit='D')
+    nivel_deadline, dias_deadline = clasificar_fechas(df['fecha_deadline_propuesta'], ahora, umbrales)
+    nivel_entrega, dias_entrega = clasificar_fechas(fecha_entrega, ahora, umbrales)
+    return pd.DataFrame({
+        'nivel_deadline': nivel_deadline,
+        'dias_deadline': dias_deadline,
+        'nivel_entrega': nivel_entrega,
+        'dias_entrega': dias_entrega,
+    }, index=df.index)
+
+def alertas_por_id(df, ahora=None, umbrales=None):
+    """{id: {'nivel_deadline', 'dias_deadline', 'nivel_entrega', 'dias_entrega'}} para búsquedas por tarjeta"""
+    return alertas_portafolio(df, ahora, umbrales).to_dict('index')
+
+def nivel_alerta(fecha, ahora=None, umbrales=None):
+    """(nivel, días restantes) de una sola fecha límite, con los mismos cortes que el lote"""
+    niveles, dias = clasificar_fechas([fecha], ahora, umbrales)
+    return niveles[0], None if np.isnan(dias[0]) else int(dias[0])
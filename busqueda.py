@@ -0,0 +1,134 @@
+import argparse
+import re
+import threading
+
+import pandas as pd
+from sqlalchemy import text
+
+from database import engine
+
+# ==============================
+# Índice FTS5
+# ==============================
+# Una sola tabla para todas las entidades; el rowid codifica el tipo (rowid = id * 4 + tipo)
+# para que los triggers borren e inserten por clave primaria, sin recorrer el índice
+TIPOS = {0: 'proyecto', 1: 'cliente', 2: 'evento'}
+
+# remove_diacritics 2: "licitacion" encuentra "Licitación" y viceversa
+DDL_INDICE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS busqueda_fts USING fts5(
+        titulo, contenido,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+# (tabla, código de tipo, columnas que disparan la reindexación, título, contenido)
+FUENTES = [
+    ('proyectos', 0, 'codigo_proyecto, nombre, descripcion, codigo_convocatoria',
+     "{t}.codigo_proyecto || ' ' || {t}.nombre",
+     "COALESCE({t}.descripcion, '') || ' ' || COALESCE({t}.codigo_convocatoria, '')"),
+    ('clientes', 1, 'nombre, ruc',
+     "{t}.nombre",
+     "COALESCE({t}.ruc, '')"),
+    ('eventos_historial', 2, 'evento',
+     "''",
+     "{t}.evento"),
+]
+
+def _ddl_triggers(tabla, tipo, columnas, titulo, contenido):
+    insertar = (f"INSERT INTO busqueda_fts (rowid, titulo, contenido) "
+                f"VALUES (new.id * 4 + {tipo}, {titulo.format(t='new')}, {contenido.format(t='new')});")
+    borrar = f"DELETE FROM busqueda_fts WHERE rowid = old.id * 4 + {tipo};"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {tabla}_fts_ai AFTER INSERT ON {tabla} BEGIN {insertar} END",
+        f"CREATE TRIGGER IF NOT EXISTS {tabla}_fts_au AFTER UPDATE OF {columnas} ON {tabla} BEGIN {borrar} {insertar} END",
+        f"CREATE TRIGGER IF NOT EXISTS {tabla}_fts_ad AFTER DELETE ON {tabla} BEGIN {borrar} END",
+    ]
+
+def _poblar(conn):
+    for tabla, tipo, _, titulo, contenido in FUENTES:
+        conn.execute(text(f"""
+            INSERT INTO busqueda_fts (rowid, titulo, contenido)
+            SELECT t.id * 4 + {tipo}, {titulo.format(t='t')}, {contenido.format(t='t')} FROM {tabla} t
+        """))
+
+_esquema_listo = False
+_esquema_lock = threading.Lock()
+
+def asegurar_esquema():
+    """Crea el índice y sus triggers; si el índice es nuevo lo llena con los datos existentes"""
+    global _esquema_listo
+    if _esquema_listo:
+        return
+    with _esquema_lock:
+        if _esquema_listo:
+            return
+        with engine.begin() as conn:
+            existe = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'busqueda_fts'"
+            )).first()
+            conn.execute(text(DDL_INDICE))
+            for fuente in FUENTES:
+                for ddl in _ddl_triggers(*fuente):
+                    conn.execute(text(ddl))
+            if not existe:
+                _poblar(conn)
+        _esquema_listo = True
+
+def reconstruir_indice():
+    """Vacía y vuelve a llenar el índice (por ejemplo tras cargas masivas sin triggers)"""
+    asegurar_esquema()
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM busqueda_fts"))
+        _poblar(conn)
+        conn.execute(text("INSERT INTO busqueda_fts (busqueda_fts) VALUES ('optimize')"))
+
+# ==============================
+# Búsqueda
+# ==============================
+def consulta_fts(texto):
+    """Convierte el texto libre en una consulta FTS5: cada palabra como prefijo, todas requeridas"""
+    palabras = re.findall(r"\w+", texto or '')
+    return " ".join(f'"{palabra}"*' for palabra in palabras)
+
+def buscar(texto, limite=20):
+    """Resultados ordenados por relevancia (bm25, el título pesa más que el contenido).
+
+    Los eventos se devuelven con el proyecto al que pertenecen; proyectos y
+    eventos de proyectos inactivos se descartan.
+    """
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return pd.DataFrame(columns=['tipo', 'id', 'proyecto_id', 'titulo', 'fragmento', 'puntaje'])
+    asegurar_esquema()
+    with engine.connect() as conn:
+        df = pd.read_sql_query(text("""
+            SELECT f.rowid % 4 AS tipo, f.rowid / 4 AS id, p.id AS proyecto_id,
+                   COALESCE(p.codigo_proyecto || ' - ' || p.nombre, c.nombre) AS titulo,
+                   CASE WHEN c.id IS NOT NULL THEN 'RUC ' || COALESCE(c.ruc, '-')
+                        ELSE snippet(busqueda_fts, -1, '**', '**', '…', 12) END AS fragmento,
+                   bm25(busqueda_fts, 5.0, 1.0) AS puntaje
+            FROM busqueda_fts f
+            LEFT JOIN eventos_historial e ON f.rowid % 4 = 2 AND e.id = f.rowid / 4
+            LEFT JOIN proyectos p ON p.id = CASE f.rowid % 4 WHEN 0 THEN f.rowid / 4 WHEN 2 THEN e.proyecto_id END
+            LEFT JOIN clientes c ON f.rowid % 4 = 1 AND c.id = f.rowid / 4
+            WHERE busqueda_fts MATCH :consulta
+              AND (p.activo = 1 OR c.activo = 1)
+            ORDER BY puntaje
+            LIMIT :limite
+        """), conn, params={'consulta': consulta, 'limite': limite})
+    df['tipo'] = df['tipo'].map(TIPOS)
+    return df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Búsqueda global de proyectos, clientes y eventos")
+    parser.add_argument("texto", nargs="?", help="Texto a buscar")
+    parser.add_argument("--reconstruir", action="store_true", help="Reconstruir el índice completo")
+    args = parser.parse_args()
+
+    if args.reconstruir:
+        reconstruir_indice()
+        print("Índice reconstruido")
+    if args.texto:
+        print(buscar(args.texto).to_string(index=False))
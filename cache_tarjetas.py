@@ -0,0 +1,72 @@
+import os
+import threading
+from collections import OrderedDict
+
+# ==============================
+# Caché de vistas de tarjetas
+# ==============================
+# Tarjetas memorizadas (compartidas entre sesiones); las menos usadas se descartan primero
+MAX_TARJETAS = int(os.getenv("CACHE_TARJETAS_MAX", "2000"))
+
+class CacheLRU:
+    """Caché acotada con desalojo del elemento usado hace más tiempo"""
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    def obtener(self, clave, construir):
+        """Valor guardado para `clave`; si no existe se calcula con `construir()` y se guarda"""
+        with self._lock:
+            if clave in self._datos:
+                self._datos.move_to_end(clave)
+                self.aciertos += 1
+                return self._datos[clave]
+
+        # Se construye fuera del lock para no bloquear a otras sesiones
+        valor = construir()
+        with self._lock:
+            self.fallos += 1
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+        return valor
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'entradas': len(self._datos),
+                'maximo': self.maximo,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'desalojos': self.desalojos,
+            }
+
+_cache = CacheLRU(MAX_TARJETAS)
+
+def clave_tarjeta(vista, proyecto, moneda, valor_convertido, *extra):
+    """Clave de la tarjeta: versión del proyecto y ajustes de visualización.
+
+    `valor_convertido` ya refleja el tipo de cambio aplicado. Los textos que dependen
+    de la hora ("días restantes", "días sin actualizar", nivel de alerta) van en `extra`
+    con los mismos valores que recibe la tarjeta, así se renueva justo cuando cambian.
+    """
+    return (vista, proyecto.id, proyecto.fecha_ultima_actualizacion, moneda,
+            round(float(valor_convertido), 2), *extra)
+
+def tarjeta_cacheada(vista, proyecto, moneda, valor_convertido, construir, *extra):
+    """Vista de la tarjeta desde la caché; solo se construye si el proyecto o la visualización cambió"""
+    return _cache.obtener(clave_tarjeta(vista, proyecto, moneda, valor_convertido, *extra), construir)
+
+def estadisticas_cache():
+    return _cache.estadisticas()
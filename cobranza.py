@@ -0,0 +1,171 @@
+import threading
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import text
+
+from configuracion import configuracion
+from database import engine
+from models import Estado
+from portafolio import factor_conversion
+
+# ==============================
+# Vencimiento indexado
+# ==============================
+# La expresión y el filtro deben escribirse igual en el índice y en las consultas
+# para que SQLite use el índice parcial (solo facturas abiertas)
+EXPR_VENCIMIENTO = "date(p.fecha_facturacion, '+' || COALESCE(p.dias_pago, 15) || ' days')"
+FILTRO_ABIERTAS = "p.activo = 1 AND p.pagado = 0 AND p.fecha_facturacion IS NOT NULL"
+
+# (clave, etiqueta, días vencidos desde, hasta); None = sin límite
+TRAMOS = [
+    ('por_vencer', "Por vencer", None, -1),
+    ('0_30', "0-30 días", 0, 30),
+    ('31_60', "31-60 días", 31, 60),
+    ('61_90', "61-90 días", 61, 90),
+    ('90_mas', "90+ días", 91, None),
+]
+ETIQUETAS_TRAMOS = {clave: etiqueta for clave, etiqueta, _, _ in TRAMOS}
+
+_esquema_listo = False
+_esquema_lock = threading.Lock()
+
+def asegurar_esquema():
+    """Crea el índice parcial sobre la fecha de vencimiento si no existe"""
+    global _esquema_listo
+    if _esquema_listo:
+        return
+    with _esquema_lock:
+        if _esquema_listo:
+            return
+        with engine.begin() as conn:
+            conn.execute(text(f"""
+                CREATE INDEX IF NOT EXISTS ix_proyectos_vencimiento
+                ON proyectos ({EXPR_VENCIMIENTO.replace('p.', '')})
+                WHERE {FILTRO_ABIERTAS.replace('p.', '')}
+            """))
+        _esquema_listo = True
+
+def _rango_tramo(tramo, hoy):
+    """(desde, hasta) de la fecha de vencimiento para un tramo; None = abierto"""
+    _, _, dias_desde, dias_hasta = next(t for t in TRAMOS if t[0] == tramo)
+    desde = (hoy - timedelta(days=dias_hasta)).isoformat() if dias_hasta is not None else None
+    hasta = (hoy - timedelta(days=dias_desde)).isoformat() if dias_desde is not None else None
+    return desde, hasta
+
+def _sql_tramo():
+    """CASE que asigna el tramo según los días vencidos"""
+    dias = f"CAST(julianday(:hoy) - julianday({EXPR_VENCIMIENTO}) AS INTEGER)"
+    casos = " ".join(
+        f"WHEN {dias} <= {hasta} THEN '{clave}'" for clave, _, _, hasta in TRAMOS if hasta is not None
+    )
+    return f"CASE {casos} ELSE '{TRAMOS[-1][0]}' END"
+
+# ==============================
+# Consultas
+# ==============================
+def aging_cartera(hoy=None, moneda_destino='PEN', tipo_cambio=None):
+    """Cantidad, total y saldo neto por tramo de antigüedad, en la moneda destino"""
+    asegurar_esquema()
+    hoy = hoy or date.today()
+    tipo_cambio = tipo_cambio or configuracion().TIPO_CAMBIO_DEFAULT
+    with engine.connect() as conn:
+        filas = conn.execute(text(f"""
+            SELECT {_sql_tramo()} AS tramo, p.moneda, COUNT(*),
+                   COALESCE(SUM(p.valor_estimado), 0),
+                   COALESCE(SUM(p.valor_estimado - COALESCE(p.monto_detraccion, 0)
+                                - COALESCE(p.monto_retencion, 0) - COALESCE(p.monto_penalidad, 0)), 0)
+            FROM proyectos p
+            WHERE {FILTRO_ABIERTAS}
+            GROUP BY tramo, p.moneda
+        """), {'hoy': hoy.isoformat()}).fetchall()
+
+    df = pd.DataFrame(filas, columns=['tramo', 'moneda', 'cantidad', 'total', 'neto'])
+    factor = factor_conversion(df['moneda'].to_numpy(), moneda_destino, tipo_cambio)
+    df = df.assign(total=df['total'] * factor, neto=df['neto'] * factor)
+    resumen = df.groupby('tramo')[['cantidad', 'total', 'neto']].sum()
+    resumen = resumen.reindex([clave for clave, _, _, _ in TRAMOS], fill_value=0)
+    resumen['cantidad'] = resumen['cantidad'].astype(int)
+    return resumen
+
+def _filtros_abiertas(hoy, tramo=None, cliente_id=None):
+    condiciones, parametros = [FILTRO_ABIERTAS], {'hoy': hoy.isoformat()}
+    if tramo:
+        desde, hasta = _rango_tramo(tramo, hoy)
+        if desde:
+            condiciones.append(f"{EXPR_VENCIMIENTO} >= :desde")
+            parametros['desde'] = desde
+        if hasta:
+            condiciones.append(f"{EXPR_VENCIMIENTO} <= :hasta")
+            parametros['hasta'] = hasta
+    if cliente_id:
+        condiciones.append("p.cliente_id = :cliente_id")
+        parametros['cliente_id'] = cliente_id
+    return " AND ".join(condiciones), parametros
+
+def contar_facturas_abiertas(hoy=None, tramo=None, cliente_id=None):
+    asegurar_esquema()
+    where, parametros = _filtros_abiertas(hoy or date.today(), tramo, cliente_id)
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT COUNT(*) FROM proyectos p WHERE {where}"), parametros).scalar()
+
+def facturas_abiertas(hoy=None, tramo=None, cliente_id=None, limite=200, desplazamiento=0):
+    """Página de facturas abiertas ordenadas por vencimiento (recorre el índice, no la tabla)"""
+    asegurar_esquema()
+    hoy = hoy or date.today()
+    where, parametros = _filtros_abiertas(hoy, tramo, cliente_id)
+    parametros.update({'limite': limite, 'desplazamiento': desplazamiento})
+    with engine.connect() as conn:
+        df = pd.read_sql_query(text(f"""
+            SELECT p.id, p.codigo_proyecto, p.nombre, c.nombre AS cliente, c.ruc, u.nombre AS ejecutivo,
+                   p.numero_factura, p.moneda, p.valor_estimado,
+                   p.valor_estimado - COALESCE(p.monto_detraccion, 0) - COALESCE(p.monto_retencion, 0)
+                       - COALESCE(p.monto_penalidad, 0) AS neto,
+                   p.fecha_facturacion, {EXPR_VENCIMIENTO} AS vencimiento,
+                   CAST(julianday(:hoy) - julianday({EXPR_VENCIMIENTO}) AS INTEGER) AS dias_vencido,
+                   {_sql_tramo()} AS tramo
+            FROM proyectos p
+            LEFT JOIN clientes c ON c.id = p.cliente_id
+            LEFT JOIN usuarios u ON u.id = p.asignado_a_id
+            WHERE {where}
+            ORDER BY {EXPR_VENCIMIENTO}
+            LIMIT :limite OFFSET :desplazamiento
+        """), conn, params=parametros)
+    df['vencimiento'] = pd.to_datetime(df['vencimiento'])
+    df['fecha_facturacion'] = pd.to_datetime(df['fecha_facturacion'], format='mixed')
+    return df
+
+def pendientes_de_factura():
+    """Proyectos en COBRANZA sin fecha de facturación (no entran al aging)"""
+    with engine.connect() as conn:
+        return pd.read_sql_query(text("""
+            SELECT p.id, p.codigo_proyecto, p.nombre, c.nombre AS cliente, p.moneda, p.valor_estimado
+            FROM proyectos p
+            LEFT JOIN clientes c ON c.id = p.cliente_id
+            WHERE p.activo = 1 AND p.pagado = 0 AND p.fecha_facturacion IS NULL AND p.estado_actual = :estado
+            ORDER BY p.fecha_ultima_actualizacion
+        """), conn, params={'estado': Estado.COBRANZA.value})
+
+# ==============================
+# Registro de pagos
+# ==============================
+def monto_esperado(proyecto):
+    """Lo que el cliente debería depositar: valor menos detracción, retención y penalidad"""
+    return ((proyecto.valor_estimado or 0) - (proyecto.monto_detraccion or 0)
+            - (proyecto.monto_retencion or 0) - (proyecto.monto_penalidad or 0))
+
+def aplicar_pago(proyecto, fecha_pago, monto, usuario_id=None, referencia=None):
+    """Marca el proyecto como pagado y lo pasa a POSTVENTA (la sesión la confirma quien llama)"""
+    if isinstance(fecha_pago, date) and not isinstance(fecha_pago, datetime):
+        fecha_pago = datetime.combine(fecha_pago, datetime.min.time())
+    proyecto.fecha_pago = fecha_pago
+    proyecto.monto_final_pagado = monto
+    proyecto.pagado = True
+    simbolo = "S/" if proyecto.moneda == "PEN" else "$"
+    detalle = f" ({referencia})" if referencia else ""
+    proyecto.agregar_evento_historial(
+        f"💰 Pago registrado: {simbolo} {monto:,.2f} el {fecha_pago.strftime('%d/%m/%Y')}{detalle}",
+        usuario_id
+    )
+    if proyecto.estado_actual == Estado.COBRANZA.value:
+        proyecto.mover_a_estado(Estado.POSTVENTA, usuario_id)
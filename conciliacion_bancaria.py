@@ -0,0 +1,308 @@
+import argparse
+import csv
+import io
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from datetime import date, datetime
+
+import pandas as pd
+
+from database import SessionLocal
+from models import Proyecto, Cliente, Estado
+from cobranza import aplicar_pago
+
+# ==============================
+# Configuración
+# ==============================
+# Diferencia aceptada entre el abono y el monto esperado (redondeos y comisiones)
+TOLERANCIA_ABSOLUTA = 1.00
+TOLERANCIA_RELATIVA = 0.001
+
+PATRON_FACTURA = re.compile(r"\b([FBE][A-Z0-9]{3})[\s\-_/]*0*(\d{1,8})\b")
+PATRON_RUC = re.compile(r"\b((?:10|15|17|20)\d{9})\b")
+
+# Encabezados reconocidos en los CSV de los bancos (sin tildes, en minúsculas)
+COLUMNAS_CSV = {
+    'fecha': ('fecha', 'fecha operacion', 'fecha valor', 'date'),
+    'monto': ('monto', 'importe', 'amount'),
+    'abono': ('abono', 'abonos', 'credito', 'creditos', 'haber'),
+    'cargo': ('cargo', 'cargos', 'debito', 'debitos', 'debe'),
+    'descripcion': ('descripcion', 'glosa', 'concepto', 'detalle', 'description'),
+    'referencia': ('referencia', 'operacion', 'nro operacion', 'numero operacion', 'reference'),
+    'moneda': ('moneda', 'currency'),
+}
+
+METODOS = {
+    'factura': "Número de factura",
+    'factura_monto_difiere': "Factura (monto difiere)",
+    'ruc_monto': "RUC + monto",
+    'monto': "Solo monto",
+}
+# Métodos que se marcan para aplicar sin revisión
+METODOS_AUTOMATICOS = ('factura', 'ruc_monto')
+
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', str(texto or '')).encode('ascii', 'ignore').decode()
+    return texto.strip().lower()
+
+def clave_factura(serie, numero):
+    return f"{serie.upper()}-{int(numero)}"
+
+def facturas_en_texto(texto):
+    """Claves de factura (serie-número sin ceros) mencionadas en un texto"""
+    return {clave_factura(serie, numero) for serie, numero in PATRON_FACTURA.findall(str(texto or '').upper())}
+
+# ==============================
+# Lectura de extractos (streaming)
+# ==============================
+def _parse_monto(valor):
+    """Monto con separadores de miles/decimales en formato 1,234.56 o 1.234,56"""
+    texto = re.sub(r"[^\d,.\-]", "", str(valor or ''))
+    if not texto or texto == '-':
+        return None
+    if ',' in texto and '.' in texto:
+        decimal = ',' if texto.rfind(',') > texto.rfind('.') else '.'
+        texto = texto.replace('.' if decimal == ',' else ',', '').replace(',', '.')
+    elif ',' in texto:
+        texto = texto.replace(',', '.') if re.search(r",\d{1,2}$", texto) else texto.replace(',', '')
+    return float(texto)
+
+def _parse_fecha(valor):
+    texto = str(valor or '').strip()[:10]
+    for formato in ('%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%Y%m%d', '%d/%m/%y'):
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    return None
+
+def leer_csv(archivo):
+    """Abonos de un CSV bancario, fila por fila (no carga el archivo completo)"""
+    texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', errors='replace', newline='')
+    primera = texto.readline()
+    separador = ';' if primera.count(';') > primera.count(',') else ','
+    encabezado = [_normalizar(c) for c in next(csv.reader([primera], delimiter=separador))]
+    posiciones = {
+        campo: next((encabezado.index(n) for n in nombres if n in encabezado), None)
+        for campo, nombres in COLUMNAS_CSV.items()
+    }
+    valor = lambda fila, campo: fila[posiciones[campo]] if posiciones[campo] is not None and posiciones[campo] < len(fila) else None
+
+    for numero, fila in enumerate(csv.reader(texto, delimiter=separador), start=2):
+        if not any(fila):
+            continue
+        monto = _parse_monto(valor(fila, 'abono')) if posiciones['abono'] is not None else _parse_monto(valor(fila, 'monto'))
+        if not monto or monto <= 0:
+            continue  # Solo abonos
+        yield {
+            'linea': numero,
+            'fecha': _parse_fecha(valor(fila, 'fecha')),
+            'monto': monto,
+            'descripcion': (valor(fila, 'descripcion') or '').strip(),
+            'referencia': (valor(fila, 'referencia') or '').strip(),
+            'moneda': (valor(fila, 'moneda') or '').strip().upper() or None,
+        }
+
+def leer_ofx(archivo):
+    """Abonos (<STMTTRN> con TRNAMT positivo) de un OFX 1.x (SGML) o 2.x (XML), línea por línea"""
+    texto = io.TextIOWrapper(archivo, encoding='utf-8', errors='replace')
+    moneda = None
+    transaccion = None
+    numero = 0
+    for linea in texto:
+        for fragmento in linea.split('<')[1:]:
+            etiqueta, _, contenido = fragmento.partition('>')
+            etiqueta, contenido = etiqueta.strip().upper(), contenido.strip()
+            if etiqueta == 'CURDEF':
+                moneda = contenido.upper()
+            elif etiqueta == 'STMTTRN':
+                transaccion = {}
+            elif etiqueta == '/STMTTRN' and transaccion is not None:
+                numero += 1
+                monto = _parse_monto(transaccion.get('TRNAMT'))
+                if monto and monto > 0:
+                    yield {
+                        'linea': numero,
+                        'fecha': _parse_fecha(transaccion.get('DTPOSTED', '')[:8]),
+                        'monto': monto,
+                        'descripcion': ' '.join(filter(None, (transaccion.get('NAME'), transaccion.get('MEMO')))),
+                        'referencia': transaccion.get('FITID') or transaccion.get('CHECKNUM') or '',
+                        'moneda': moneda,
+                    }
+                transaccion = None
+            elif transaccion is not None and not etiqueta.startswith('/') and contenido:
+                transaccion[etiqueta] = contenido
+
+def leer_extracto(archivo, nombre):
+    """Generador de abonos según la extensión del archivo (.csv, .txt, .ofx, .qfx)"""
+    extension = nombre.rsplit('.', 1)[-1].lower()
+    if extension in ('ofx', 'qfx'):
+        return leer_ofx(archivo)
+    if extension in ('csv', 'txt'):
+        return leer_csv(archivo)
+    raise ValueError(f"Formato de extracto no soportado: .{extension}")
+
+# ==============================
+# Índices hash de facturas abiertas
+# ==============================
+def _dentro_tolerancia(monto, esperado):
+    return abs(monto - esperado) <= max(TOLERANCIA_ABSOLUTA, esperado * TOLERANCIA_RELATIVA)
+
+def montos_aceptados(proyecto):
+    """Montos que puede depositar el cliente: total, sin detracción, sin retención o neto"""
+    valor = proyecto['valor_estimado'] or 0.0
+    detraccion = proyecto['monto_detraccion'] or 0.0
+    retencion = proyecto['monto_retencion'] or 0.0
+    penalidad = proyecto['monto_penalidad'] or 0.0
+    return {round(m, 2) for m in (valor, valor - detraccion, valor - retencion,
+                                  valor - detraccion - retencion - penalidad) if m > 0}
+
+class IndiceFacturas:
+    """Facturas abiertas indexadas por número, RUC del cliente y monto aceptado"""
+
+    def __init__(self, proyectos):
+        self.proyectos = {p['id']: p for p in proyectos}
+        self.por_factura = defaultdict(set)
+        self.por_ruc = defaultdict(set)
+        self.por_monto = defaultdict(set)
+        # Ancho fijo de los buckets: la mayor tolerancia de los montos indexados, así un
+        # abono dentro de tolerancia cae en el bucket de su monto o en uno vecino
+        self.ancho = max([TOLERANCIA_ABSOLUTA] + [m * TOLERANCIA_RELATIVA for p in proyectos for m in p['montos']])
+        for p in proyectos:
+            for clave in facturas_en_texto(p['numero_factura']):
+                self.por_factura[clave].add(p['id'])
+            if p['ruc']:
+                self.por_ruc[p['ruc'].strip()].add(p['id'])
+            for monto in p['montos']:
+                self.por_monto[math.floor(monto / self.ancho)].add(p['id'])
+
+    def por_importe(self, monto, moneda=None):
+        """Ids cuyo monto aceptado coincide dentro de la tolerancia (bucket del abono y sus dos vecinos)"""
+        clave = math.floor(monto / self.ancho)
+        candidatos = set().union(*(self.por_monto.get(vecino, set()) for vecino in (clave - 1, clave, clave + 1)))
+        return {pid for pid in candidatos
+                if (moneda is None or self.proyectos[pid]['moneda'] == moneda)
+                and any(_dentro_tolerancia(monto, m) for m in self.proyectos[pid]['montos'])}
+
+def cargar_facturas_abiertas():
+    """Proyectos activos sin pagar que ya tienen factura o están en COBRANZA"""
+    db = SessionLocal()
+    try:
+        filas = db.query(
+            Proyecto.id, Proyecto.codigo_proyecto, Proyecto.nombre, Proyecto.numero_factura, Proyecto.moneda,
+            Proyecto.valor_estimado, Proyecto.monto_detraccion, Proyecto.monto_retencion, Proyecto.monto_penalidad,
+            Cliente.nombre, Cliente.ruc,
+        ).join(Cliente, Proyecto.cliente_id == Cliente.id, isouter=True).filter(
+            Proyecto.activo == True,
+            Proyecto.pagado == False,
+            (Proyecto.fecha_facturacion.isnot(None)) | (Proyecto.estado_actual == Estado.COBRANZA.value),
+        ).all()
+    finally:
+        db.close()
+
+    proyectos = []
+    for fila in filas:
+        proyecto = dict(zip(('id', 'codigo_proyecto', 'nombre', 'numero_factura', 'moneda', 'valor_estimado',
+                             'monto_detraccion', 'monto_retencion', 'monto_penalidad', 'cliente', 'ruc'), fila))
+        proyecto['montos'] = montos_aceptados(proyecto)
+        proyectos.append(proyecto)
+    return proyectos
+
+# ==============================
+# Conciliación
+# ==============================
+def conciliar(movimientos, proyectos=None):
+    """Propone una factura para cada abono.
+
+    Prioridad: número de factura en la glosa/referencia, luego RUC + monto y por
+    último monto único. Cada factura se asigna a un solo abono. Devuelve
+    (propuestas, sin_conciliar) como DataFrames.
+    """
+    indice = IndiceFacturas(proyectos if proyectos is not None else cargar_facturas_abiertas())
+    asignados = set()
+    propuestas, sin_conciliar = [], []
+
+    for movimiento in movimientos:
+        texto = f"{movimiento['descripcion']} {movimiento['referencia']}"
+        monto, moneda = movimiento['monto'], movimiento['moneda']
+        por_importe = indice.por_importe(monto, moneda)
+        elegido, metodo = None, None
+
+        por_factura = set().union(*(indice.por_factura.get(c, set()) for c in facturas_en_texto(texto))) - asignados
+        if por_factura:
+            coinciden = por_factura & por_importe
+            elegido = min(coinciden or por_factura)
+            metodo = 'factura' if coinciden else 'factura_monto_difiere'
+        else:
+            por_ruc = set().union(*(indice.por_ruc.get(r, set()) for r in PATRON_RUC.findall(texto)))
+            candidatos = (por_ruc & por_importe) - asignados
+            if len(candidatos) == 1:
+                elegido, metodo = candidatos.pop(), 'ruc_monto'
+            else:
+                candidatos = por_importe - asignados
+                if len(candidatos) == 1:
+                    elegido, metodo = candidatos.pop(), 'monto'
+
+        if elegido is None:
+            sin_conciliar.append(movimiento)
+            continue
+
+        asignados.add(elegido)
+        proyecto = indice.proyectos[elegido]
+        esperado = min(proyecto['montos'], key=lambda m: abs(m - monto)) if proyecto['montos'] else 0.0
+        propuestas.append({
+            **movimiento,
+            'proyecto_id': elegido,
+            'codigo_proyecto': proyecto['codigo_proyecto'],
+            'cliente': proyecto['cliente'],
+            'numero_factura': proyecto['numero_factura'],
+            'monto_esperado': esperado,
+            'diferencia': round(monto - esperado, 2),
+            'metodo': metodo,
+            'aplicar': metodo in METODOS_AUTOMATICOS,
+        })
+
+    return pd.DataFrame(propuestas), pd.DataFrame(sin_conciliar)
+
+def aplicar_conciliacion(propuestas, usuario_id=None):
+    """Registra los pagos de las propuestas marcadas en una sola transacción; devuelve cuántos aplicó"""
+    marcadas = propuestas[propuestas['aplicar']] if 'aplicar' in propuestas else propuestas
+    if marcadas.empty:
+        return 0
+
+    db = SessionLocal()
+    try:
+        ids = [int(pid) for pid in marcadas['proyecto_id']]
+        proyectos = {p.id: p for p in db.query(Proyecto).filter(Proyecto.id.in_(ids)).all()}
+        aplicados = 0
+        for fila in marcadas.itertuples():
+            proyecto = proyectos.get(int(fila.proyecto_id))
+            if proyecto is None or proyecto.pagado:
+                continue  # Pagado por otra vía desde la propuesta
+            fecha = fila.fecha if isinstance(fila.fecha, date) else date.today()
+            referencia = f"extracto {fila.referencia}" if fila.referencia else "extracto bancario"
+            aplicar_pago(proyecto, fecha, float(fila.monto), usuario_id, referencia)
+            aplicados += 1
+        db.commit()
+        return aplicados
+    except Exception as e:
+        db.rollback()
+        raise e
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Conciliación de extractos bancarios con facturas abiertas")
+    parser.add_argument("extracto", help="Archivo CSV u OFX")
+    parser.add_argument("--aplicar", action="store_true", help="Registrar los pagos de coincidencias automáticas")
+    args = parser.parse_args()
+
+    with open(args.extracto, 'rb') as archivo:
+        propuestas, sin_conciliar = conciliar(leer_extracto(archivo, args.extracto))
+    print(f"{len(propuestas)} abonos conciliados, {len(sin_conciliar)} sin conciliar")
+    if not propuestas.empty:
+        print(propuestas[['fecha', 'monto', 'codigo_proyecto', 'numero_factura', 'metodo', 'diferencia']].to_string(index=False))
+    if args.aplicar and not propuestas.empty:
+        print(f"{aplicar_conciliacion(propuestas)} pagos registrados")
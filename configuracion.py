@@ -0,0 +1,111 @@
+import argparse
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, fields
+from datetime import datetime
+
+from sqlalchemy import text
+
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Definición tipada
+# ==============================
+@dataclass(frozen=True)
+class Configuracion:
+    """Valores de la tabla configuraciones con su tipo; los defaults aplican si falta la fila"""
+    MONEDA_DEFAULT: str = "PEN"
+    TIPO_CAMBIO_DEFAULT: float = 3.80
+    DIAS_ALERTA_RIESGO: int = 7
+    DIAS_ALERTA_CRITICO: int = 15
+    RUTA_ARCHIVOS: str = ""
+    EMAIL_NOTIFICACIONES: str = "notificaciones@localhost"
+    PROBABILIDAD_OPORTUNIDAD: int = 25
+    PROBABILIDAD_PREVENTA: int = 50
+    ALERTA_DIAS_MUY_URGENTE: int = 1
+    ALERTA_DIAS_URGENTE: int = 3
+    ALERTA_DIAS_POR_VENCER: int = 7
+
+TIPOS = {campo.name: campo.type for campo in fields(Configuracion)}
+
+# Segundos antes de volver a leer la tabla (otros procesos pueden cambiarla)
+TTL_CONFIGURACION = int(os.environ.get("CONFIGURACION_TTL", "30"))
+
+# ==============================
+# Caché de proceso
+# ==============================
+_memoria = {'valores': None, 'leido': 0.0}
+_memoria_lock = threading.Lock()
+
+def _convertir(clave, valor):
+    """Valor de la tabla al tipo declarado; None si no se puede convertir"""
+    try:
+        return TIPOS[clave](valor.strip())
+    except (ValueError, AttributeError):
+        logger.warning(f"Configuración {clave}={valor!r} no es {TIPOS[clave].__name__}; se usa el valor por defecto")
+        return None
+
+def _leer_tabla():
+    """Carga todas las filas conocidas de configuraciones en una instancia tipada"""
+    with engine.connect() as conn:
+        filas = conn.execute(text("SELECT clave, valor FROM configuraciones")).fetchall()
+    valores = {}
+    for clave, valor in filas:
+        if clave in TIPOS and valor is not None:
+            convertido = _convertir(clave, valor)
+            if convertido is not None:
+                valores[clave] = convertido
+    return Configuracion(**valores)
+
+def configuracion():
+    """Configuración vigente; la tabla se relee como máximo cada TTL_CONFIGURACION segundos"""
+    with _memoria_lock:
+        if _memoria['valores'] is not None and time.monotonic() - _memoria['leido'] < TTL_CONFIGURACION:
+            return _memoria['valores']
+        anterior = _memoria['valores']
+
+    try:
+        valores = _leer_tabla()
+    except Exception as e:
+        # Sin tabla (BD nueva) o BD ocupada: se mantiene lo último leído
+        logger.warning(f"No se pudo leer configuraciones: {e}")
+        valores = anterior or Configuracion()
+
+    with _memoria_lock:
+        _memoria['valores'] = valores
+        _memoria['leido'] = time.monotonic()
+    return valores
+
+def recargar():
+    """Fuerza la relectura en la próxima consulta"""
+    with _memoria_lock:
+        _memoria['leido'] = 0.0
+
+def guardar(clave, valor):
+    """Actualiza (o crea) una clave validando su tipo y recarga la caché"""
+    if clave not in TIPOS:
+        raise KeyError(f"Clave de configuración desconocida: {clave}")
+    valor = TIPOS[clave](valor)
+    with engine.begin() as conn:
+        actualizadas = conn.execute(text("""
+            UPDATE configuraciones SET valor = :valor, fecha_actualizacion = :fecha WHERE clave = :clave
+        """), {'clave': clave, 'valor': str(valor), 'fecha': datetime.now()}).rowcount
+        if not actualizadas:
+            conn.execute(text("""
+                INSERT INTO configuraciones (clave, valor, fecha_actualizacion) VALUES (:clave, :valor, :fecha)
+            """), {'clave': clave, 'valor': str(valor), 'fecha': datetime.now()})
+    recargar()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consulta o cambia la configuración de la aplicación")
+    parser.add_argument("--poner", nargs=2, metavar=("CLAVE", "VALOR"), help="Guardar un valor")
+    args = parser.parse_args()
+
+    if args.poner:
+        guardar(*args.poner)
+    for clave, valor in vars(configuracion()).items():
+        print(f"{clave} = {valor!r}")
@@ -0,0 +1,269 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from datetime import date, datetime, timedelta
+from itertools import accumulate, chain
+
+import numpy as np
+from sqlalchemy import event
+
+from configuracion import configuracion
+from database import SessionLocal
+from models import Proyecto
+from portafolio import ATRIBUTOS_PORTAFOLIO, construir_portafolio, factor_conversion, resumen_kpis, tasas_para_base
+from tipo_cambio import tipos_cambio_a_fecha
+
+# ==============================
+# Cubo de métricas del pipeline
+# ==============================
+# Celdas por (estado, ejecutivo, cliente, moneda, mes de creación). Cada celda guarda
+# sumas en la moneda original y convertidas al tipo de cambio histórico, más
+# histogramas por día (última actualización, deadline) para contar riesgo y deadlines
+# vencidos a cualquier momento con los mismos cortes que resumen_kpis. El aporte de
+# cada proyecto se guarda por id, así que aplicar dos veces el mismo cambio no altera nada.
+
+# Reconstrucción completa periódica (escrituras de otros procesos)
+CUBO_TTL_SEGUNDOS = 600
+
+ATRIBUTOS = (
+    'activo', 'estado_actual', 'asignado_a_id', 'cliente_id', 'moneda', 'fecha_creacion',
+    'valor_estimado', 'probabilidad_cierre', 'tipo_cambio_historico',
+    'fecha_ultima_actualizacion', 'fecha_deadline_propuesta',
+)
+
+MEDIDAS = ('cantidad', 'valor', 'valor_prob', 'valor_pen', 'valor_prob_pen', 'valor_usd', 'valor_prob_usd')
+
+_celdas = {}
+_aportes = {}       # proyecto_id -> aporte vigente en _celdas
+_diarios = []       # cambios recibidos durante cada reconstrucción en curso
+_estado = {'construido': None}
+_lock = threading.Lock()
+
+class Histograma:
+    """Cantidad de fechas por día; cuenta las anteriores a un corte con bisect sobre acumulados.
+
+    Solo el día del corte se revisa con las horas exactas.
+    """
+    __slots__ = ('dias', '_indice')
+
+    def __init__(self):
+        self.dias = {}          # día -> Counter de fechas con hora
+        self._indice = None     # (días ordenados, acumulados), se arma en la primera consulta
+
+    def sumar(self, momento, signo):
+        if not isinstance(momento, datetime):
+            momento = datetime.combine(momento, datetime.min.time())
+        horas = self.dias.setdefault(momento.date(), Counter())
+        horas[momento] += signo
+        if horas[momento] <= 0:
+            del horas[momento]
+            if not horas:
+                del self.dias[momento.date()]
+        self._indice = None
+
+    def contar_antes(self, limite, incluir_limite=False):
+        """Fechas < limite (<= con incluir_limite)"""
+        if self._indice is None:
+            dias = sorted(self.dias)
+            self._indice = (dias, list(accumulate(sum(self.dias[dia].values()) for dia in dias)))
+        dias, acumulados = self._indice
+        dia = limite.date()
+        posicion = bisect_left(dias, dia)
+        cantidad = acumulados[posicion - 1] if posicion else 0
+        if posicion < len(dias) and dias[posicion] == dia:
+            cantidad += sum(n for momento, n in self.dias[dia].items()
+                            if momento < limite or (incluir_limite and momento == limite))
+        return cantidad
+
+def _aporte(valores):
+    """(clave, medidas, fecha de actualización, deadline) de un proyecto, o None si no cuenta"""
+    if not valores['activo']:
+        return None
+    fecha_creacion = valores['fecha_creacion']
+    clave = (
+        valores['estado_actual'],
+        valores['asignado_a_id'],
+        valores['cliente_id'],
+        valores['moneda'],
+        fecha_creacion.strftime('%Y-%m') if fecha_creacion else None,
+    )
+    valor = float(valores['valor_estimado'] or 0.0)
+    valor_prob = valor * (valores['probabilidad_cierre'] or 0) / 100
+    tipo_cambio = float(valores['tipo_cambio_historico'] or configuracion().TIPO_CAMBIO_DEFAULT)
+    a_pen = float(factor_conversion([valores['moneda']], 'PEN', tipo_cambio)[0])
+    a_usd = float(factor_conversion([valores['moneda']], 'USD', tipo_cambio)[0])
+    medidas = (1, valor, valor_prob, valor * a_pen, valor_prob * a_pen, valor * a_usd, valor_prob * a_usd)
+
+    return clave, medidas, valores['fecha_ultima_actualizacion'], valores['fecha_deadline_propuesta']
+
+def _aplicar(celdas, aporte, signo):
+    """Suma (signo=1) o resta (signo=-1) un aporte en su celda"""
+    clave, medidas, actualizacion, deadline = aporte
+    celda = celdas.get(clave)
+    if celda is None:
+        celda = celdas[clave] = {
+            **{medida: 0.0 for medida in MEDIDAS},
+            'actualizaciones': Histograma(),
+            'deadlines': Histograma(),
+        }
+    for medida, valor in zip(MEDIDAS, medidas):
+        celda[medida] += signo * valor
+    if actualizacion:
+        celda['actualizaciones'].sumar(actualizacion, signo)
+    if deadline:
+        celda['deadlines'].sumar(deadline, signo)
+    if celda['cantidad'] <= 0:
+        del celdas[clave]
+
+def _fijar(celdas, aportes, proyecto_id, aporte):
+    """Reemplaza el aporte de un proyecto (None = ya no cuenta); idempotente"""
+    previo = aportes.pop(proyecto_id, None)
+    if previo:
+        _aplicar(celdas, previo, -1)
+    if aporte:
+        _aplicar(celdas, aporte, 1)
+        aportes[proyecto_id] = aporte
+
+def reconstruir_cubo():
+    """Recalcula todas las celdas desde la base de datos.
+
+    La lectura corre fuera del lock; los cambios confirmados mientras tanto se anotan
+    en un diario y se vuelven a aplicar sobre el cubo nuevo antes de reemplazar el actual.
+    """
+    global _celdas, _aportes
+    diario = []
+    with _lock:
+        _diarios.append(diario)
+    try:
+        db = SessionLocal()
+        try:
+            filas = db.query(Proyecto.id, *(getattr(Proyecto, atributo) for atributo in ATRIBUTOS)).filter(
+                Proyecto.activo == True).all()
+        finally:
+            db.close()
+
+        celdas, aportes = {}, {}
+        for proyecto_id, *valores in filas:
+            _fijar(celdas, aportes, proyecto_id, _aporte(dict(zip(ATRIBUTOS, valores))))
+    except Exception:
+        with _lock:
+            _diarios.remove(diario)
+        raise
+
+    with _lock:
+        _diarios.remove(diario)
+        for proyecto_id, aporte in diario:
+            _fijar(celdas, aportes, proyecto_id, aporte)
+        _celdas, _aportes = celdas, aportes
+        _estado['construido'] = time.monotonic()
+
+def _asegurar_cubo():
+    construido = _estado['construido']
+    if construido is None or time.monotonic() - construido > CUBO_TTL_SEGUNDOS:
+        reconstruir_cubo()
+
+# ==============================
+# Consultas
+# ==============================
+def tipo_cambio_hoy():
+    return float(tipos_cambio_a_fecha(np.array([np.datetime64(date.today(), 'D')]))[0])
+
+def kpis_cubo(moneda_destino, estados=None, asignados=None, clientes=None, monedas=None,
+              tipo_cambio=None, probabilidad_fija=None, dias_riesgo=None, ahora=None):
+    """Mismas métricas que resumen_kpis, sumando celdas del cubo que cumplen los filtros.
+
+    Sin `tipo_cambio` usa el histórico de cada proyecto; con un valor, ese tipo de cambio
+    para todos. Los filtros son colecciones de valores admitidos (None = todos).
+    Sin `dias_riesgo` usa DIAS_ALERTA_RIESGO de la configuración.
+    """
+    _asegurar_cubo()
+    ahora = ahora or datetime.now()
+    if dias_riesgo is None:
+        dias_riesgo = configuracion().DIAS_ALERTA_RIESGO
+    # (ahora - actualización).days > dias_riesgo, igual que dias_sin_actualizar en el portafolio
+    limite_riesgo = ahora - timedelta(days=dias_riesgo + 1)
+
+    cantidad = total = ponderado = 0.0
+    en_riesgo = deadlines_vencidos = 0
+    with _lock:
+        for (estado, asignado, cliente, moneda, _mes), celda in _celdas.items():
+            if ((estados is not None and estado not in estados)
+                    or (asignados is not None and asignado not in asignados)
+                    or (clientes is not None and cliente not in clientes)
+                    or (monedas is not None and moneda not in monedas)):
+                continue
+
+            if tipo_cambio is None and moneda_destino in ('PEN', 'USD'):
+                sufijo = '_pen' if moneda_destino == 'PEN' else '_usd'
+                valor, valor_prob = celda['valor' + sufijo], celda['valor_prob' + sufijo]
+            else:
+                factor = float(factor_conversion([moneda], moneda_destino, tipo_cambio or configuracion().TIPO_CAMBIO_DEFAULT)[0])
+                valor, valor_prob = celda['valor'] * factor, celda['valor_prob'] * factor
+
+            cantidad += celda['cantidad']
+            total += valor
+            ponderado += valor * probabilidad_fija / 100 if probabilidad_fija is not None else valor_prob
+            en_riesgo += celda['actualizaciones'].contar_antes(limite_riesgo, incluir_limite=True)
+            deadlines_vencidos += celda['deadlines'].contar_antes(ahora)
+
+    cantidad = int(round(cantidad))
+    return {
+        'cantidad': cantidad,
+        'total': total,
+        'ponderado': ponderado,
+        'promedio': total / cantidad if cantidad else 0.0,
+        'en_riesgo': en_riesgo,
+        'deadlines_vencidos': deadlines_vencidos,
+    }
+
+def kpis_pipeline(moneda_destino, base_tipo_cambio='historico', estados=None, asignados=None,
+                  clientes=None, monedas=None, probabilidad_fija=None, dias_riesgo=None):
+    """KPIs desde el cubo; las bases de tipo de cambio por fecha de cada proyecto cargan solo las filas filtradas"""
+    if base_tipo_cambio in ('historico', 'hoy'):
+        tipo_cambio = None if base_tipo_cambio == 'historico' else tipo_cambio_hoy()
+        return kpis_cubo(moneda_destino, estados, asignados, clientes, monedas,
+                         tipo_cambio, probabilidad_fija, dias_riesgo)
+
+    condiciones = [Proyecto.activo == True]
+    for atributo, admitidos in (('estado_actual', estados), ('asignado_a_id', asignados),
+                                ('cliente_id', clientes), ('moneda', monedas)):
+        if admitidos is not None:
+            condiciones.append(getattr(Proyecto, atributo).in_(list(admitidos)))
+    db = SessionLocal()
+    try:
+        filas = db.query(*(getattr(Proyecto, atributo) for atributo in ATRIBUTOS_PORTAFOLIO)).filter(*condiciones).all()
+    finally:
+        db.close()
+    filtrado = construir_portafolio(filas)
+    return resumen_kpis(filtrado, moneda_destino, tasas_para_base(filtrado, base_tipo_cambio),
+                        probabilidad_fija, dias_riesgo)
+
+# ==============================
+# Mantenimiento incremental en las escrituras
+# ==============================
+@event.listens_for(SessionLocal, "after_flush")
+def _registrar_cambios(session, flush_context):
+    cambios = session.info.setdefault('cubo_cambios', [])
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Proyecto):
+            vigente = obj not in session.deleted
+            cambios.append((obj.id, _aporte({atributo: getattr(obj, atributo) for atributo in ATRIBUTOS})
+                            if vigente else None))
+
+@event.listens_for(SessionLocal, "after_commit")
+def _aplicar_cambios(session):
+    cambios = session.info.pop('cubo_cambios', [])
+    if not cambios:
+        return
+    with _lock:
+        for diario in _diarios:
+            diario.extend(cambios)
+        if _estado['construido'] is None:
+            return
+        for proyecto_id, aporte in cambios:
+            _fijar(_celdas, _aportes, proyecto_id, aporte)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _descartar_cambios(session):
+    session.info.pop('cubo_cambios', None)
@@ -1,12 +1,80 @@
-from sqlalchemy import create_engine
+import os
+import threading
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///proyectos.db"
+# RAZUMFLOW_DB_URL permite apuntar scripts y pruebas a otra base sin tocar proyectos.db
+SQLALCHEMY_DATABASE_URL = os.environ.get("RAZUMFLOW_DB_URL", "sqlite:///proyectos.db")
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
+    SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False}
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+
+# Columnas agregadas después del script de creación de BD: (tabla, columna, definición SQL)
+COLUMNAS_ADICIONALES = [
+    ("proyecto_archivos", "tamanio_bytes", "INTEGER"),
+]
+
+def asegurar_columnas(conexion, columnas=COLUMNAS_ADICIONALES):
+    """Agrega las columnas faltantes en tablas existentes (idempotente)"""
+    cursor = conexion.cursor()
+    tablas = {fila[0] for fila in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for tabla, columna, definicion in columnas:
+        if tabla not in tablas:
+            continue
+        existentes = {fila[1] for fila in cursor.execute(f"PRAGMA table_info({tabla})")}
+        if columna not in existentes:
+            cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}")
+
+# Tablas agregadas después del script de creación de BD: (tabla, DDL de tabla e índices)
+TABLAS_ADICIONALES = [
+    ("transiciones_estado", [
+        """
+        CREATE TABLE IF NOT EXISTS transiciones_estado (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            proyecto_id INTEGER NOT NULL REFERENCES proyectos(id),
+            estado_origen VARCHAR(20),
+            estado_destino VARCHAR(20) NOT NULL,
+            fecha DATETIME NOT NULL,
+            usuario_id INTEGER REFERENCES usuarios(id),
+            evento_id INTEGER UNIQUE REFERENCES eventos_historial(id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_transiciones_estado_proyecto ON transiciones_estado (proyecto_id, fecha)",
+        "CREATE INDEX IF NOT EXISTS ix_transiciones_estado_destino ON transiciones_estado (estado_destino, fecha)",
+    ]),
+]
+
+def asegurar_tablas(conexion, tablas=TABLAS_ADICIONALES):
+    """Crea las tablas faltantes y sus índices (idempotente)"""
+    cursor = conexion.cursor()
+    for _, sentencias in tablas:
+        for sentencia in sentencias:
+            cursor.execute(sentencia)
+
+_migracion_lista = False
+_migracion_lock = threading.Lock()
+
+@event.listens_for(engine, "connect")
+def _migrar_al_conectar(conexion, _registro):
+    """Aplica columnas y tablas adicionales con la primera conexión del proceso, no al importar"""
+    global _migracion_lista
+    if _migracion_lista:
+        return
+    with _migracion_lock:
+        if _migracion_lista:
+            return
+        asegurar_columnas(conexion)
+        asegurar_tablas(conexion)
+        conexion.commit()
+        _migracion_lista = True
+
+def asegurar_esquema(*elementos):
+    """Crea tablas o índices (objetos SQLAlchemy) que aún no existan"""
+    for elemento in elementos:
+        elemento.create(bind=engine, checkfirst=True)
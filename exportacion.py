@@ -0,0 +1,393 @@
+import csv
+import hashlib
+import hmac
+import io
+import logging
+import os
+import queue
+import re
+import secrets
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+from sqlalchemy.orm import joinedload
+
+from database import SessionLocal
+from models import Proyecto, ProyectoArchivos
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Configuración de exportaciones
+# ==============================
+# Los ZIP se escriben en disco y se descargan por un servidor HTTP propio que los
+# envía por bloques: el handler estático de Streamlit rechaza archivos de más de 200 MB.
+DIRECTORIO_EXPORTACIONES = "files/exportaciones"
+TAMANIO_BLOQUE = 1024 * 1024  # 1 MB por bloque de copia
+NOMBRE_MANIFIESTO = "MANIFIESTO.csv"
+
+# Formatos que ya vienen comprimidos: se almacenan sin volver a comprimir
+EXTENSIONES_COMPRIMIDAS = {'.pdf', '.docx', '.xlsx', '.jpg', '.jpeg', '.png', '.zip', '.rar'}
+
+ALCANCES = ('proyecto', 'cliente', 'convocatoria')
+
+def _sanitizar(texto):
+    """Sanitiza un texto para usarlo como nombre dentro del ZIP"""
+    texto = re.sub(r'[<>:"/\\|?*]', '', str(texto or '')).strip()
+    return texto.replace(' ', '_') or 'SIN_NOMBRE'
+
+def _prefijo(alcance, valor):
+    """Prefijo de los ZIP de un alcance: id o código, nunca el nombre visible (puede repetirse)"""
+    valor = str(valor)
+    identificador = re.sub(r'[^\w.-]', '', valor)
+    if identificador != valor or not identificador:
+        # Códigos con caracteres especiales: se añade un hash para que dos códigos no colisionen
+        identificador = f"{identificador}~{hashlib.sha256(valor.encode()).hexdigest()[:8]}"
+    return f"{alcance}_{identificador}"
+
+# ==============================
+# Selección de archivos
+# ==============================
+def obtener_archivos_exportacion(alcance, valor):
+    """Obtiene los archivos a exportar para un proyecto, cliente o convocatoria"""
+    if alcance not in ALCANCES:
+        raise ValueError(f"Alcance de exportación no válido: {alcance}")
+
+    db = SessionLocal()
+    try:
+        consulta = db.query(ProyectoArchivos).join(Proyecto).options(
+            joinedload(ProyectoArchivos.tipo_archivo),
+            joinedload(ProyectoArchivos.usuario),
+            joinedload(ProyectoArchivos.proyecto).joinedload(Proyecto.cliente)
+        )
+
+        if alcance == 'proyecto':
+            consulta = consulta.filter(ProyectoArchivos.proyecto_id == valor)
+        elif alcance == 'cliente':
+            consulta = consulta.filter(Proyecto.cliente_id == valor)
+        else:
+            consulta = consulta.filter(Proyecto.codigo_convocatoria == valor)
+
+        return consulta.order_by(Proyecto.codigo_proyecto, ProyectoArchivos.fecha_subida).all()
+    finally:
+        db.close()
+
+def calcular_huella(archivos):
+    """Huella del conjunto de archivos: cambia si se agrega, quita o modifica alguno"""
+    hasher = hashlib.sha256()
+    for archivo in sorted(archivos, key=lambda a: a.id):
+        try:
+            info = os.stat(archivo.ruta_archivo)
+            firma = f"{info.st_size}:{info.st_mtime_ns}"
+        except OSError:
+            firma = "faltante"
+        hasher.update(f"{archivo.id}|{archivo.ruta_archivo}|{firma}\n".encode('utf-8'))
+    return hasher.hexdigest()
+
+# ==============================
+# Construcción del ZIP
+# ==============================
+def _ruta_en_zip(archivo, usados):
+    """Ruta única dentro del ZIP: CLIENTE/CODIGO_PROYECTO/TIPO/archivo"""
+    proyecto = archivo.proyecto
+    cliente = proyecto.cliente.nombre if proyecto and proyecto.cliente else 'sin_cliente'
+    codigo = proyecto.codigo_proyecto if proyecto else str(archivo.proyecto_id)
+    tipo = archivo.tipo_archivo.nombre if archivo.tipo_archivo else 'OTRO'
+
+    base = f"{_sanitizar(cliente)}/{_sanitizar(codigo)}/{_sanitizar(tipo)}/{os.path.basename(archivo.ruta_archivo)}"
+    ruta, contador = base, 1
+    while ruta in usados:
+        nombre, extension = os.path.splitext(base)
+        ruta = f"{nombre}_{contador}{extension}"
+        contador += 1
+    usados.add(ruta)
+    return ruta
+
+def _copiar_a_zip(zip_destino, ruta_origen, ruta_en_zip):
+    """Copia un archivo al ZIP por bloques y devuelve (bytes, sha256)"""
+    extension = os.path.splitext(ruta_origen)[1].lower()
+    compresion = zipfile.ZIP_STORED if extension in EXTENSIONES_COMPRIMIDAS else zipfile.ZIP_DEFLATED
+
+    info = zipfile.ZipInfo.from_file(ruta_origen, ruta_en_zip)
+    info.compress_type = compresion
+
+    hasher = hashlib.sha256()
+    total = 0
+    with open(ruta_origen, "rb") as origen, zip_destino.open(info, "w", force_zip64=True) as destino:
+        while True:
+            bloque = origen.read(TAMANIO_BLOQUE)
+            if not bloque:
+                break
+            hasher.update(bloque)
+            destino.write(bloque)
+            total += len(bloque)
+    return total, hasher.hexdigest()
+
+def _escribir_zip(ruta_destino, archivos):
+    """Escribe el ZIP de forma incremental y agrega el manifiesto al final"""
+    manifiesto = io.StringIO()
+    writer = csv.writer(manifiesto)
+    writer.writerow([
+        "id", "codigo_proyecto", "cliente", "codigo_convocatoria", "tipo",
+        "nombre_archivo", "ruta_en_zip", "tamanio_bytes", "sha256",
+        "fecha_subida", "subido_por", "estado"
+    ])
+
+    incluidos, faltantes, usados = 0, 0, set()
+    with zipfile.ZipFile(ruta_destino, "w", allowZip64=True) as zip_destino:
+        for archivo in archivos:
+            proyecto = archivo.proyecto
+            fila = [
+                archivo.id,
+                proyecto.codigo_proyecto if proyecto else archivo.proyecto_id,
+                proyecto.cliente.nombre if proyecto and proyecto.cliente else '',
+                proyecto.codigo_convocatoria if proyecto else '',
+                archivo.tipo_archivo.nombre if archivo.tipo_archivo else '',
+                archivo.nombre_archivo,
+            ]
+            fecha = archivo.fecha_subida.strftime('%d/%m/%Y %H:%M') if archivo.fecha_subida else ''
+            usuario = archivo.usuario.nombre if archivo.usuario else ''
+
+            if os.path.exists(archivo.ruta_archivo):
+                ruta_en_zip = _ruta_en_zip(archivo, usados)
+                tamanio, sha256 = _copiar_a_zip(zip_destino, archivo.ruta_archivo, ruta_en_zip)
+                writer.writerow(fila + [ruta_en_zip, tamanio, sha256, fecha, usuario, "incluido"])
+                incluidos += 1
+            else:
+                writer.writerow(fila + ["", "", "", fecha, usuario, "faltante"])
+                faltantes += 1
+
+        zip_destino.writestr(NOMBRE_MANIFIESTO, manifiesto.getvalue().encode('utf-8-sig'),
+                             compress_type=zipfile.ZIP_DEFLATED)
+
+    return incluidos, faltantes
+
+def exportar_zip(alcance, valor):
+    """Genera (o reutiliza) el ZIP con todos los documentos del alcance indicado"""
+    archivos = obtener_archivos_exportacion(alcance, valor)
+    if not archivos:
+        return None
+
+    huella = calcular_huella(archivos)
+    prefijo = _prefijo(alcance, valor)
+    nombre = f"{prefijo}_{huella[:16]}.zip"
+    ruta = os.path.join(DIRECTORIO_EXPORTACIONES, nombre)
+
+    os.makedirs(DIRECTORIO_EXPORTACIONES, exist_ok=True)
+    reutilizado = os.path.exists(ruta)
+
+    if not reutilizado:
+        descriptor, ruta_temporal = tempfile.mkstemp(suffix=".tmp", dir=DIRECTORIO_EXPORTACIONES)
+        os.close(descriptor)
+        try:
+            _escribir_zip(ruta_temporal, archivos)
+            os.replace(ruta_temporal, ruta)
+        except Exception:
+            if os.path.exists(ruta_temporal):
+                os.remove(ruta_temporal)
+            raise
+
+        # Eliminar versiones anteriores del mismo alcance (solo el prefijo exacto más la huella)
+        anteriores = re.compile(rf"^{re.escape(prefijo)}_[0-9a-f]{{16}}\.zip$")
+        for existente in os.listdir(DIRECTORIO_EXPORTACIONES):
+            if anteriores.match(existente) and existente != nombre:
+                try:
+                    os.remove(os.path.join(DIRECTORIO_EXPORTACIONES, existente))
+                except OSError:
+                    pass
+
+    faltantes = sum(1 for a in archivos if not os.path.exists(a.ruta_archivo))
+    return {
+        'ruta': ruta,
+        'nombre': nombre,
+        'total_archivos': len(archivos),
+        'faltantes': faltantes,
+        'tamanio_bytes': os.path.getsize(ruta),
+        'reutilizado': reutilizado,
+        'fecha': datetime.fromtimestamp(os.path.getmtime(ruta)),
+    }
+
+# ==============================
+# Generación en segundo plano
+# ==============================
+# Segundos que se conserva el estado de un trabajo terminado
+TTL_TRABAJOS = 3600
+
+_cola = queue.Queue()
+_trabajos = {}  # clave -> {'estado', 'resultado', 'error', 'inicio', 'fin'}
+_trabajos_lock = threading.Lock()
+_worker = None
+_worker_lock = threading.Lock()
+
+def _procesar_cola():
+    while True:
+        clave, alcance, valor = _cola.get()
+        try:
+            resultado = exportar_zip(alcance, valor)
+            trabajo = {'estado': 'listo' if resultado else 'vacio', 'resultado': resultado}
+        except Exception as e:
+            logger.error(f"Error generando ZIP {clave}: {e}")
+            trabajo = {'estado': 'error', 'error': str(e)}
+        trabajo['fin'] = time.monotonic()
+        with _trabajos_lock:
+            _trabajos[clave].update(trabajo)
+        _cola.task_done()
+
+def _podar_trabajos():
+    """Quita los trabajos terminados hace más de TTL_TRABAJOS (llamar con _trabajos_lock)"""
+    limite = time.monotonic() - TTL_TRABAJOS
+    for clave in [clave for clave, trabajo in _trabajos.items() if trabajo.get('fin', limite + 1) < limite]:
+        del _trabajos[clave]
+
+def iniciar_worker():
+    """Inicia (una sola vez por proceso) el hilo que genera los ZIP"""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_procesar_cola, name="exportacion-zip", daemon=True)
+            _worker.start()
+
+def solicitar_exportacion(alcance, valor):
+    """Encola la generación del ZIP fuera de la ejecución de la página; devuelve la clave del trabajo"""
+    if alcance not in ALCANCES:
+        raise ValueError(f"Alcance de exportación no válido: {alcance}")
+    clave = f"{alcance}:{valor}"
+    with _trabajos_lock:
+        _podar_trabajos()
+        if _trabajos.get(clave, {}).get('estado') == 'en_proceso':
+            return clave
+        _trabajos[clave] = {'estado': 'en_proceso', 'inicio': datetime.now()}
+    iniciar_worker()
+    _cola.put((clave, alcance, valor))
+    return clave
+
+def estado_exportacion(clave):
+    """Copia del estado de un trabajo: en_proceso, listo, vacio o error (None si no existe)"""
+    with _trabajos_lock:
+        _podar_trabajos()
+        trabajo = _trabajos.get(clave)
+        return dict(trabajo) if trabajo else None
+
+# ==============================
+# Servidor de descargas
+# ==============================
+# Servidor HTTP aparte que envía el ZIP por bloques, sin límite de tamaño y con
+# soporte de Range para reanudar descargas. Los enlaces van firmados y vencen.
+# Por defecto solo escucha en la máquina local; para exponerlo hay que elegirlo:
+# EXPORTACION_HOST=0.0.0.0 o un proxy HTTPS delante, anunciado con EXPORTACION_URL.
+EXPORTACION_HOST = os.environ.get("EXPORTACION_HOST", "127.0.0.1")
+EXPORTACION_PUERTO = int(os.environ.get("EXPORTACION_PUERTO", "8502"))
+VIGENCIA_ENLACE = 6 * 3600  # segundos
+# Con varios procesos sirviendo la app, todos deben compartir el secreto
+_SECRETO = os.environ.get("EXPORTACION_SECRETO", "").encode() or secrets.token_bytes(32)
+_PATRON_NOMBRE = re.compile(r"^[\w.-]+\.zip$")
+_PATRON_RANGO = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def _firma(nombre, expira):
+    return hmac.new(_SECRETO, f"{nombre}:{expira}".encode(), hashlib.sha256).hexdigest()
+
+def url_descarga(nombre, base, vigencia=VIGENCIA_ENLACE):
+    """Enlace firmado para descargar un ZIP desde el servidor de descargas en `base`"""
+    iniciar_servidor_descargas()
+    expira = int(time.time()) + vigencia
+    return f"{base.rstrip('/')}/descargas/{quote(nombre)}?expira={expira}&firma={_firma(nombre, expira)}"
+
+class _ManejadorDescargas(BaseHTTPRequestHandler):
+    """Valida la firma del enlace y envía el ZIP (o el rango pedido) por bloques"""
+
+    def do_HEAD(self):
+        self._responder(enviar_cuerpo=False)
+
+    def do_GET(self):
+        self._responder(enviar_cuerpo=True)
+
+    def _ruta_autorizada(self):
+        partes = urlsplit(self.path)
+        if not partes.path.startswith("/descargas/"):
+            return None
+        nombre = unquote(partes.path[len("/descargas/"):])
+        parametros = parse_qs(partes.query)
+        expira = (parametros.get('expira') or ['0'])[0]
+        firma = (parametros.get('firma') or [''])[0]
+        if not _PATRON_NOMBRE.match(nombre) or not expira.isdigit() or int(expira) < time.time():
+            return None
+        if not hmac.compare_digest(firma, _firma(nombre, int(expira))):
+            return None
+        return os.path.join(DIRECTORIO_EXPORTACIONES, nombre)
+
+    def _responder(self, enviar_cuerpo):
+        ruta = self._ruta_autorizada()
+        if ruta is None:
+            self.send_error(403, "Enlace inválido o vencido")
+            return
+        try:
+            archivo = open(ruta, "rb")
+        except OSError:
+            self.send_error(404, "Exportación no encontrada")
+            return
+
+        with archivo:
+            tamanio = os.fstat(archivo.fileno()).st_size
+            inicio, fin = 0, tamanio - 1
+            rango = _PATRON_RANGO.match(self.headers.get("Range", ""))
+            if rango and (rango.group(1) or rango.group(2)):
+                if rango.group(1):
+                    inicio = int(rango.group(1))
+                    fin = min(int(rango.group(2)), tamanio - 1) if rango.group(2) else tamanio - 1
+                else:
+                    inicio = max(tamanio - int(rango.group(2)), 0)
+                if inicio > fin:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{tamanio}")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {inicio}-{fin}/{tamanio}")
+            else:
+                self.send_response(200)
+
+            self.send_header("Content-Type", "application/zip")
+            self.send_header("Content-Length", str(fin - inicio + 1))
+            self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(ruta)}"')
+            self.send_header("Accept-Ranges", "bytes")
+            self.end_headers()
+            if not enviar_cuerpo:
+                return
+
+            archivo.seek(inicio)
+            restante = fin - inicio + 1
+            try:
+                while restante > 0:
+                    bloque = archivo.read(min(TAMANIO_BLOQUE, restante))
+                    if not bloque:
+                        break
+                    self.wfile.write(bloque)
+                    restante -= len(bloque)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # El navegador canceló la descarga
+
+    def log_message(self, formato, *args):
+        logger.debug(formato % args)
+
+_servidor = None
+_servidor_lock = threading.Lock()
+
+def iniciar_servidor_descargas(host=EXPORTACION_HOST, puerto=EXPORTACION_PUERTO):
+    """Inicia (una sola vez por proceso) el servidor de descargas en un hilo"""
+    global _servidor
+    with _servidor_lock:
+        if _servidor is not None:
+            return _servidor
+        try:
+            _servidor = ThreadingHTTPServer((host, puerto), _ManejadorDescargas)
+        except OSError as e:
+            logger.error(f"No se pudo iniciar el servidor de descargas en {host}:{puerto}: {e}")
+            return None
+        _servidor.daemon_threads = True
+        threading.Thread(target=_servidor.serve_forever, name="descargas-zip", daemon=True).start()
+        return _servidor
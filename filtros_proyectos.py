@@ -0,0 +1,198 @@
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import and_, case, func, or_, text, literal_column
+from sqlalchemy.orm import joinedload
+
+from alertas import limites_dias
+from configuracion import configuracion
+from database import engine
+from models import Proyecto, Estado
+
+# ==============================
+# Tramos por tiempo
+# ==============================
+RIESGOS = ('Normal', 'En Riesgo', 'Crítico')
+
+def rangos_riesgo():
+    """Días sin actualizar [desde, hasta) de cada riesgo; mismos cortes que get_estado_riesgo (DIAS_ALERTA_*)"""
+    config = configuracion()
+    riesgo, critico = config.DIAS_ALERTA_RIESGO + 1, config.DIAS_ALERTA_CRITICO + 1
+    return dict(zip(RIESGOS, [(None, riesgo), (riesgo, critico), (critico, None)]))
+
+# Tramos hasta el deadline o la entrega ("Urgente" agrupa muy_urgente y urgente)
+TRAMOS_PLAZO = {
+    'vencido': "Vencido",
+    'critico': "Crítico",
+    'urgente': "Urgente",
+    'por_vencer': "Por Vencer",
+    'disponible': "Disponible",
+}
+SIN_PLAZO = 'sin_deadline'
+PROPUESTA_PRESENTADA = 'propuesta_presentada'
+
+def rangos_plazo():
+    """Días restantes [desde, hasta) de cada tramo, con los umbrales vigentes del motor de alertas"""
+    limites = limites_dias()
+    rangos = {tramo: limites[tramo] for tramo in TRAMOS_PLAZO}
+    rangos['urgente'] = (limites['muy_urgente'][0], limites['urgente'][1])
+    return rangos
+
+ETIQUETAS_PLAZO = dict(TRAMOS_PLAZO)
+ETIQUETAS_PLAZO[SIN_PLAZO] = "Sin Deadline"
+ETIQUETAS_PLAZO[PROPUESTA_PRESENTADA] = "✅ Propuesta Presentada"
+
+# Fecha estimada de entrega; se escribe igual en el índice de expresión y en la consulta
+EXPR_ENTREGA = "datetime(fecha_ingreso_oc, '+' || plazo_entrega || ' days')"
+
+# Sub-estados por página (mismas reglas que obtener_estado_preventa / obtener_estado_delivery)
+SUBESTADOS = {
+    'preventa_activa': ("📋 PREVENTA ACTIVA",
+                        lambda: Proyecto.probabilidad_cierre < configuracion().PROBABILIDAD_PREVENTA),
+    'propuesta_entregada': ("📤 PROPUESTA ENTREGADA",
+                            lambda: Proyecto.probabilidad_cierre.between(configuracion().PROBABILIDAD_PREVENTA, 74)),
+    'oc_firmada': ("🎉 OC FIRMADA", lambda: Proyecto.probabilidad_cierre >= 75),
+    'pendiente_entrega': ("📦 PENDIENTE DE ENTREGA", lambda: Proyecto.entregado == False),
+    'entregado': ("✅ ENTREGADO", lambda: (Proyecto.entregado == True) & (Proyecto.facturado == False)),
+    'facturado': ("🧾 FACTURADO", lambda: Proyecto.facturado == True),
+}
+
+# ==============================
+# Índices
+# ==============================
+INDICES = [
+    "CREATE INDEX IF NOT EXISTS ix_proyectos_estado_actualizacion ON proyectos (estado_actual, fecha_ultima_actualizacion) WHERE activo = 1",
+    "CREATE INDEX IF NOT EXISTS ix_proyectos_estado_deadline ON proyectos (estado_actual, fecha_deadline_propuesta) WHERE activo = 1",
+    f"CREATE INDEX IF NOT EXISTS ix_proyectos_estado_entrega ON proyectos (estado_actual, {EXPR_ENTREGA}) WHERE activo = 1",
+    "CREATE INDEX IF NOT EXISTS ix_proyectos_asignado ON proyectos (asignado_a_id, estado_actual) WHERE activo = 1",
+    "CREATE INDEX IF NOT EXISTS ix_proyectos_cliente ON proyectos (cliente_id, estado_actual) WHERE activo = 1",
+]
+
+_esquema_listo = False
+_esquema_lock = threading.Lock()
+
+def asegurar_esquema():
+    """Crea los índices parciales que usan los filtros (idempotente)"""
+    global _esquema_listo
+    if _esquema_listo:
+        return
+    with _esquema_lock:
+        if _esquema_listo:
+            return
+        with engine.begin() as conn:
+            for ddl in INDICES:
+                conn.execute(text(ddl))
+        _esquema_listo = True
+
+def _rango(columna, ahora, desde, hasta, signo=1):
+    """Condiciones de rango sobre una fecha para [desde, hasta) días respecto de `ahora`.
+
+    signo=1: días restantes (fecha - ahora); signo=-1: días transcurridos (ahora - fecha).
+    """
+    condiciones = []
+    if signo > 0:
+        if desde is not None:
+            condiciones.append(columna >= ahora + timedelta(days=desde))
+        if hasta is not None:
+            condiciones.append(columna < ahora + timedelta(days=hasta))
+    else:
+        if desde is not None:
+            condiciones.append(columna <= ahora - timedelta(days=desde))
+        if hasta is not None:
+            condiciones.append(columna > ahora - timedelta(days=hasta))
+    return condiciones
+
+def condicion_niveles_deadline(niveles, ahora):
+    """Deadline de propuesta en alguno de los niveles del motor de alertas (SIN_PLAZO = sin deadline)"""
+    columna = Proyecto.fecha_deadline_propuesta
+    limites = limites_dias()
+    partes = [columna.is_(None) if nivel == SIN_PLAZO else and_(columna.isnot(None), *_rango(columna, ahora, *limites[nivel]))
+              for nivel in niveles]
+    return or_(*partes)
+
+# ==============================
+# Especificación de filtros
+# ==============================
+@dataclass
+class FiltroProyectos:
+    """Filtros de las páginas por estado; se compilan a una sola consulta con predicados por id"""
+    estado: Optional[str] = None
+    asignado_a_id: Optional[int] = None
+    cliente_id: Optional[int] = None
+    moneda: Optional[str] = None
+    riesgo: Optional[str] = None        # clave de RIESGOS
+    deadline: Optional[str] = None      # clave de TRAMOS_PLAZO, SIN_PLAZO o PROPUESTA_PRESENTADA
+    entrega: Optional[str] = None       # clave de TRAMOS_PLAZO o SIN_PLAZO
+    subestado: Optional[str] = None     # clave de SUBESTADOS
+    ahora: datetime = field(default_factory=datetime.now)
+
+    def condiciones(self):
+        condiciones = [Proyecto.activo == True]
+        if self.estado:
+            condiciones.append(Proyecto.estado_actual == self.estado)
+        if self.asignado_a_id is not None:
+            condiciones.append(Proyecto.asignado_a_id == self.asignado_a_id)
+        if self.cliente_id is not None:
+            condiciones.append(Proyecto.cliente_id == self.cliente_id)
+        if self.moneda:
+            condiciones.append(Proyecto.moneda == self.moneda)
+        if self.riesgo:
+            desde, hasta = rangos_riesgo()[self.riesgo]
+            condiciones += _rango(Proyecto.fecha_ultima_actualizacion, self.ahora, desde, hasta, signo=-1)
+        if self.subestado:
+            condiciones.append(SUBESTADOS[self.subestado][1]())
+        if self.deadline:
+            condiciones += self._condiciones_deadline()
+        if self.entrega:
+            condiciones += self._condiciones_entrega()
+        return condiciones
+
+    def _condiciones_deadline(self):
+        # En PREVENTA una propuesta presentada deja de contar para el deadline
+        presentada = Proyecto.fecha_presentacion_cotizacion.isnot(None)
+        if self.deadline == PROPUESTA_PRESENTADA:
+            return [presentada]
+        condiciones = [~presentada] if self.estado == Estado.PREVENTA.value else []
+        if self.deadline == SIN_PLAZO:
+            return condiciones + [Proyecto.fecha_deadline_propuesta.is_(None)]
+        desde, hasta = rangos_plazo()[self.deadline]
+        return condiciones + [Proyecto.fecha_deadline_propuesta.isnot(None)] + \
+            _rango(Proyecto.fecha_deadline_propuesta, self.ahora, desde, hasta)
+
+    def _condiciones_entrega(self):
+        if self.entrega == SIN_PLAZO:
+            return [(Proyecto.fecha_ingreso_oc.is_(None)) | (Proyecto.plazo_entrega.is_(None))]
+        desde, hasta = rangos_plazo()[self.entrega]
+        # datetime() devuelve 'YYYY-MM-DD HH:MM:SS', así que los límites se pasan en ese formato
+        ahora = self.ahora.replace(microsecond=0)
+        fecha_entrega = literal_column(EXPR_ENTREGA)
+        condiciones = [fecha_entrega.isnot(None)]
+        if desde is not None:
+            condiciones.append(fecha_entrega >= (ahora + timedelta(days=desde)).strftime('%Y-%m-%d %H:%M:%S'))
+        if hasta is not None:
+            condiciones.append(fecha_entrega < (ahora + timedelta(days=hasta)).strftime('%Y-%m-%d %H:%M:%S'))
+        return condiciones
+
+    def consulta(self, db):
+        """Query de Proyecto con los filtros y las relaciones que usan las tarjetas"""
+        asegurar_esquema()
+        return db.query(Proyecto).options(
+            joinedload(Proyecto.cliente),
+            joinedload(Proyecto.asignado_a),
+            joinedload(Proyecto.contacto_principal),
+        ).filter(*self.condiciones()).order_by(Proyecto.id)
+
+    def condicion(self):
+        """Todas las condiciones en una sola expresión, para usarla como caso de conteos()"""
+        return and_(*self.condiciones())
+
+    def conteos(self, db, **casos):
+        """Total y conteo por caso (expresiones SQL) de los proyectos del filtro, en una sola consulta agregada"""
+        asegurar_esquema()
+        columnas = [func.count(Proyecto.id).label('total')] + [
+            func.coalesce(func.sum(case((condicion, 1), else_=0)), 0).label(nombre)
+            for nombre, condicion in casos.items()
+        ]
+        return dict(db.query(*columnas).filter(*self.condiciones()).one()._mapping)
@@ -0,0 +1,155 @@
+import threading
+from datetime import date
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import event
+
+from configuracion import configuracion
+from database import SessionLocal
+from models import Proyecto, Cliente
+from portafolio import factor_conversion
+
+# ==============================
+# Supuestos de la proyección
+# ==============================
+# Días desde el deadline de la propuesta hasta recibir la OC (pipeline sin OC)
+DIAS_ADJUDICACION = 30
+# Plazo de entrega cuando el proyecto aún no lo tiene
+PLAZO_ENTREGA_DEFECTO = 30
+# Días entre la entrega y la emisión de la factura
+DIAS_FACTURACION = 5
+DIAS_PAGO_DEFECTO = 15
+
+# Estados que ya no generan cobros por proyectar
+ESTADOS_EXCLUIDOS = ('POSTVENTA',)
+
+ORIGENES = {
+    'factura': "Facturado",
+    'entrega': "OC recibida",
+    'pipeline': "Pipeline",
+}
+
+_cache = {'datos': None, 'dia': None}
+_lock = threading.Lock()
+
+# ==============================
+# Proyección por proyecto
+# ==============================
+def _consultar_proyectos():
+    db = SessionLocal()
+    try:
+        filas = db.query(
+            Proyecto.id, Proyecto.codigo_proyecto, Proyecto.nombre, Cliente.nombre,
+            Proyecto.estado_actual, Proyecto.asignado_a_id, Proyecto.moneda, Proyecto.tipo_cambio_historico,
+            Proyecto.valor_estimado, Proyecto.probabilidad_cierre,
+            Proyecto.fecha_deadline_propuesta, Proyecto.fecha_ingreso_oc, Proyecto.plazo_entrega,
+            Proyecto.fecha_facturacion, Proyecto.dias_pago,
+            Proyecto.monto_detraccion, Proyecto.monto_retencion, Proyecto.monto_penalidad,
+        ).join(Cliente, Proyecto.cliente_id == Cliente.id, isouter=True).filter(
+            Proyecto.activo == True,
+            Proyecto.pagado.isnot(True),
+            Proyecto.estado_actual.notin_(ESTADOS_EXCLUIDOS),
+        ).all()
+    finally:
+        db.close()
+    return pd.DataFrame(filas, columns=[
+        'id', 'codigo', 'nombre', 'cliente', 'estado', 'asignado_a_id', 'moneda', 'tipo_cambio',
+        'valor', 'probabilidad', 'fecha_deadline_propuesta', 'fecha_ingreso_oc', 'plazo_entrega',
+        'fecha_facturacion', 'dias_pago', 'monto_detraccion', 'monto_retencion', 'monto_penalidad',
+    ])
+
+def calcular_proyeccion(df, hoy=None):
+    """Fecha esperada de cobro, monto neto y probabilidad de cada proyecto (vectorizado).
+
+    - Facturado: fecha de facturación + días de pago.
+    - Con OC: OC + plazo de entrega + DIAS_FACTURACION + días de pago.
+    - Pipeline: deadline (o hoy) + DIAS_ADJUDICACION y luego igual que con OC.
+    Los hitos estimados que ya pasaron se corren a hoy; una factura con el plazo
+    de pago vencido queda como cobro vencido.
+    """
+    hoy = pd.Timestamp(hoy or date.today())
+    dias = lambda serie: pd.to_timedelta(serie, unit='D')
+    fechas = {columna: pd.to_datetime(df[columna], errors='coerce').dt.normalize()
+              for columna in ('fecha_deadline_propuesta', 'fecha_ingreso_oc', 'fecha_facturacion')}
+
+    oc_estimada = fechas['fecha_deadline_propuesta'].clip(lower=hoy).fillna(hoy) + dias(DIAS_ADJUDICACION)
+    oc = fechas['fecha_ingreso_oc'].fillna(oc_estimada)
+    plazo = pd.to_numeric(df['plazo_entrega'], errors='coerce').fillna(PLAZO_ENTREGA_DEFECTO)
+    facturacion_estimada = (oc + dias(plazo) + dias(DIAS_FACTURACION)).clip(lower=hoy)
+    facturado = fechas['fecha_facturacion'].notna()
+    facturacion = fechas['fecha_facturacion'].where(facturado, facturacion_estimada)
+
+    dias_pago = pd.to_numeric(df['dias_pago'], errors='coerce').fillna(DIAS_PAGO_DEFECTO)
+    fecha_cobro = facturacion + dias(dias_pago)
+
+    valor = pd.to_numeric(df['valor'], errors='coerce').fillna(0.0)
+    descuentos = sum(pd.to_numeric(df[c], errors='coerce').fillna(0.0)
+                     for c in ('monto_detraccion', 'monto_retencion', 'monto_penalidad'))
+    probabilidad = pd.to_numeric(df['probabilidad'], errors='coerce').fillna(0.0).where(~facturado, 100.0)
+
+    resultado = df[['id', 'codigo', 'nombre', 'cliente', 'estado', 'asignado_a_id', 'moneda']].copy()
+    resultado['tipo_cambio'] = pd.to_numeric(df['tipo_cambio'], errors='coerce').fillna(configuracion().TIPO_CAMBIO_DEFAULT)
+    resultado['origen'] = np.select([facturado, fechas['fecha_ingreso_oc'].notna()], ['factura', 'entrega'], 'pipeline')
+    resultado['fecha_cobro'] = fecha_cobro
+    resultado['vencido'] = fecha_cobro < hoy
+    resultado['fecha_flujo'] = fecha_cobro.clip(lower=hoy)  # Lo vencido se espera cobrar desde hoy
+    resultado['valor'] = valor
+    resultado['neto'] = (valor - descuentos).clip(lower=0.0)
+    resultado['probabilidad'] = probabilidad
+    resultado['neto_ponderado'] = resultado['neto'] * probabilidad / 100
+    return resultado.set_index('id', drop=False)
+
+def proyeccion_flujo():
+    """Proyección de cobros de los proyectos activos, con caché hasta que cambie algún proyecto"""
+    with _lock:
+        if _cache['datos'] is None or _cache['dia'] != date.today():
+            _cache['datos'] = calcular_proyeccion(_consultar_proyectos())
+            _cache['dia'] = date.today()
+        return _cache['datos']
+
+def invalidar_proyeccion():
+    with _lock:
+        _cache['datos'] = None
+
+# ==============================
+# Agrupación por período
+# ==============================
+def convertir_proyeccion(df, moneda_destino, tipo_cambio=None):
+    """Copia con neto y neto ponderado en la moneda destino (sin tipo_cambio: el histórico)"""
+    tasas = df['tipo_cambio'].to_numpy() if tipo_cambio is None else tipo_cambio
+    factor = factor_conversion(df['moneda'].to_numpy(), moneda_destino, tasas)
+    return df.assign(neto=df['neto'] * factor, neto_ponderado=df['neto_ponderado'] * factor)
+
+def flujo_por_periodo(df, frecuencia='W', columnas='origen'):
+    """Neto ponderado por semana ('W', inicia lunes) o mes ('M') y por `columnas`"""
+    if df.empty:
+        return pd.DataFrame()
+    periodo = df['fecha_flujo'].dt.to_period('W-SUN' if frecuencia == 'W' else 'M').dt.start_time
+    tabla = df.assign(periodo=periodo).pivot_table(
+        index='periodo', columns=columnas, values='neto_ponderado', aggfunc='sum', fill_value=0.0
+    )
+    # Períodos sin cobros en cero para que el gráfico no los salte
+    periodos = pd.date_range(tabla.index.min(), tabla.index.max(), freq='W-MON' if frecuencia == 'W' else 'MS')
+    tabla = tabla.reindex(periodos, fill_value=0.0)
+    tabla.index.name = 'periodo'
+    tabla.columns.name = None
+    return tabla
+
+# ==============================
+# Invalidación al escribir proyectos
+# ==============================
+@event.listens_for(SessionLocal, "after_flush")
+def _marcar_cambios(session, flush_context):
+    if any(isinstance(obj, Proyecto) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info['flujo_pendiente'] = True
+
+@event.listens_for(SessionLocal, "after_commit")
+def _invalidar_al_confirmar(session):
+    if session.info.pop('flujo_pendiente', False):
+        invalidar_proyeccion()
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _descartar_pendiente(session):
+    session.info.pop('flujo_pendiente', None)
@@ -0,0 +1,346 @@
+import html
+import logging
+import os
+import queue
+import re
+import threading
+import zipfile
+from datetime import datetime
+from xml.etree import ElementTree
+
+from sqlalchemy import text
+
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Configuración del índice
+# ==============================
+MAX_CARACTERES = 2_000_000  # Límite de texto indexado por documento
+EXTENSIONES_SOPORTADAS = {'.pdf', '.docx', '.xlsx'}
+
+# Marcadores internos para resaltar coincidencias en los snippets
+_INICIO_MARCA = "\x02"
+_FIN_MARCA = "\x03"
+
+_NS_WORD = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_NS_EXCEL = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+_esquema_listo = False
+_esquema_lock = threading.Lock()
+
+def asegurar_esquema():
+    """Crea las tablas del índice de documentos si no existen"""
+    global _esquema_listo
+    if _esquema_listo:
+        return
+    with _esquema_lock:
+        if _esquema_listo:
+            return
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS documentos_texto (
+                    archivo_id INTEGER PRIMARY KEY REFERENCES proyecto_archivos(id),
+                    tamanio_bytes INTEGER,
+                    mtime_ns INTEGER,
+                    estado TEXT NOT NULL,
+                    error TEXT,
+                    caracteres INTEGER DEFAULT 0,
+                    fecha_indexado DATETIME
+                )
+            """))
+            conn.execute(text("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS documentos_fts USING fts5(
+                    nombre_archivo,
+                    contenido,
+                    archivo_id UNINDEXED,
+                    tokenize = 'unicode61 remove_diacritics 2'
+                )
+            """))
+            # rowid = archivo_id para borrar y reindexar sin recorrer el índice. Las filas
+            # de índices anteriores con otro rowid se quitan y vuelven a quedar pendientes.
+            desalineados = [fila[0] for fila in conn.execute(text(
+                "SELECT archivo_id FROM documentos_fts WHERE rowid != archivo_id"
+            ))]
+            if desalineados:
+                conn.execute(text("DELETE FROM documentos_fts WHERE rowid != archivo_id"))
+                for archivo_id in desalineados:
+                    conn.execute(text("DELETE FROM documentos_texto WHERE archivo_id = :archivo_id"),
+                                 {"archivo_id": archivo_id})
+        _esquema_listo = True
+
+# ==============================
+# Extracción de texto
+# ==============================
+def _extraer_pdf(ruta):
+    """Extrae texto de un PDF (requiere pypdf)"""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise RuntimeError("pypdf no está instalado")
+
+    partes, total = [], 0
+    for pagina in PdfReader(ruta).pages:
+        contenido = pagina.extract_text() or ""
+        partes.append(contenido)
+        total += len(contenido)
+        if total >= MAX_CARACTERES:
+            break
+    return "\n".join(partes)
+
+def _extraer_docx(ruta):
+    """Extrae el texto de los párrafos de un DOCX"""
+    partes, total = [], 0
+    with zipfile.ZipFile(ruta) as docx, docx.open("word/document.xml") as xml:
+        parrafo = []
+        for _, elemento in ElementTree.iterparse(xml, events=("end",)):
+            if elemento.tag == f"{_NS_WORD}t" and elemento.text:
+                parrafo.append(elemento.text)
+            elif elemento.tag == f"{_NS_WORD}p":
+                if parrafo:
+                    linea = "".join(parrafo)
+                    partes.append(linea)
+                    total += len(linea)
+                    parrafo = []
+                elemento.clear()
+                if total >= MAX_CARACTERES:
+                    break
+    return "\n".join(partes)
+
+def _extraer_xlsx(ruta):
+    """Extrae las cadenas de texto de un XLSX (compartidas y en línea)"""
+    partes, total = [], 0
+    with zipfile.ZipFile(ruta) as xlsx:
+        nombres = [n for n in xlsx.namelist()
+                   if n == "xl/sharedStrings.xml" or (n.startswith("xl/worksheets/") and n.endswith(".xml"))]
+        for nombre in nombres:
+            with xlsx.open(nombre) as xml:
+                for _, elemento in ElementTree.iterparse(xml, events=("end",)):
+                    if elemento.tag == f"{_NS_EXCEL}t" and elemento.text:
+                        partes.append(elemento.text)
+                        total += len(elemento.text)
+                    elif elemento.tag in (f"{_NS_EXCEL}si", f"{_NS_EXCEL}row"):
+                        elemento.clear()
+                    if total >= MAX_CARACTERES:
+                        break
+    return "\n".join(partes)
+
+_EXTRACTORES = {
+    '.pdf': _extraer_pdf,
+    '.docx': _extraer_docx,
+    '.xlsx': _extraer_xlsx,
+}
+
+def extraer_texto(ruta):
+    """Extrae el texto plano de un documento según su extensión"""
+    extension = os.path.splitext(ruta)[1].lower()
+    extractor = _EXTRACTORES.get(extension)
+    if not extractor:
+        return None
+    contenido = extractor(ruta)
+    contenido = re.sub(r"[ \t]+", " ", contenido or "")
+    return contenido[:MAX_CARACTERES]
+
+# ==============================
+# Indexación
+# ==============================
+def _registrar_estado(conn, archivo_id, info, estado, error=None, caracteres=0):
+    conn.execute(text("""
+        INSERT INTO documentos_texto (archivo_id, tamanio_bytes, mtime_ns, estado, error, caracteres, fecha_indexado)
+        VALUES (:archivo_id, :tamanio, :mtime, :estado, :error, :caracteres, :fecha)
+        ON CONFLICT(archivo_id) DO UPDATE SET
+            tamanio_bytes = excluded.tamanio_bytes,
+            mtime_ns = excluded.mtime_ns,
+            estado = excluded.estado,
+            error = excluded.error,
+            caracteres = excluded.caracteres,
+            fecha_indexado = excluded.fecha_indexado
+    """), {
+        "archivo_id": archivo_id,
+        "tamanio": info.st_size if info else None,
+        "mtime": info.st_mtime_ns if info else None,
+        "estado": estado,
+        "error": error,
+        "caracteres": caracteres,
+        "fecha": datetime.now(),
+    })
+
+def indexar_archivo(archivo_id, forzar=False):
+    """Extrae e indexa un archivo; omite el trabajo si no cambió desde la última vez"""
+    asegurar_esquema()
+
+    with engine.connect() as conn:
+        fila = conn.execute(text("""
+            SELECT pa.ruta_archivo, pa.nombre_archivo, dt.tamanio_bytes, dt.mtime_ns, dt.estado
+            FROM proyecto_archivos pa
+            LEFT JOIN documentos_texto dt ON dt.archivo_id = pa.id
+            WHERE pa.id = :archivo_id
+        """), {"archivo_id": archivo_id}).fetchone()
+
+    if not fila:
+        return None
+
+    ruta, nombre_archivo, tamanio_previo, mtime_previo, estado_previo = fila
+    try:
+        info = os.stat(ruta)
+    except OSError:
+        info = None
+
+    if (not forzar and info and estado_previo == 'indexado'
+            and tamanio_previo == info.st_size and mtime_previo == info.st_mtime_ns):
+        return estado_previo
+
+    estado, error, contenido = 'indexado', None, ""
+    if info is None:
+        estado = 'faltante'
+    elif os.path.splitext(ruta)[1].lower() not in EXTENSIONES_SOPORTADAS:
+        estado = 'no_soportado'
+    else:
+        try:
+            contenido = extraer_texto(ruta) or ""
+        except Exception as e:
+            estado, error = 'error', str(e)[:500]
+            logger.warning(f"No se pudo extraer texto de {ruta}: {e}")
+
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM documentos_fts WHERE rowid = :archivo_id"), {"archivo_id": archivo_id})
+        if estado == 'indexado':
+            conn.execute(text("""
+                INSERT INTO documentos_fts (rowid, nombre_archivo, contenido, archivo_id)
+                VALUES (:archivo_id, :nombre, :contenido, :archivo_id)
+            """), {"nombre": nombre_archivo, "contenido": contenido, "archivo_id": archivo_id})
+        _registrar_estado(conn, archivo_id, info, estado, error, len(contenido))
+
+    return estado
+
+def eliminar_del_indice(archivo_id):
+    """Quita un archivo del índice de texto"""
+    asegurar_esquema()
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM documentos_fts WHERE rowid = :archivo_id"), {"archivo_id": archivo_id})
+        conn.execute(text("DELETE FROM documentos_texto WHERE archivo_id = :archivo_id"), {"archivo_id": archivo_id})
+
+# ==============================
+# Worker en segundo plano
+# ==============================
+_cola = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+def _procesar_cola():
+    while True:
+        archivo_id, forzar = _cola.get()
+        try:
+            indexar_archivo(archivo_id, forzar)
+        except Exception as e:
+            logger.error(f"Error indexando archivo {archivo_id}: {e}")
+        finally:
+            _cola.task_done()
+
+def iniciar_worker():
+    """Inicia (una sola vez por proceso) el hilo que indexa documentos"""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_procesar_cola, name="indice-documentos", daemon=True)
+            _worker.start()
+
+def encolar_archivo(archivo_id, forzar=False):
+    """Encola un archivo para indexarlo fuera del hilo de la petición"""
+    iniciar_worker()
+    _cola.put((archivo_id, forzar))
+
+def archivos_en_cola():
+    return _cola.qsize()
+
+def reindexar_pendientes(forzar=False):
+    """Encola los archivos nuevos, modificados o con error; devuelve cuántos encoló"""
+    asegurar_esquema()
+    with engine.connect() as conn:
+        filas = conn.execute(text("""
+            SELECT pa.id, pa.ruta_archivo, dt.tamanio_bytes, dt.mtime_ns, dt.estado
+            FROM proyecto_archivos pa
+            LEFT JOIN documentos_texto dt ON dt.archivo_id = pa.id
+        """)).fetchall()
+        huerfanos = conn.execute(text("""
+            SELECT dt.archivo_id FROM documentos_texto dt
+            LEFT JOIN proyecto_archivos pa ON pa.id = dt.archivo_id
+            WHERE pa.id IS NULL
+        """)).fetchall()
+
+    for (archivo_id,) in huerfanos:
+        eliminar_del_indice(archivo_id)
+
+    encolados = 0
+    for archivo_id, ruta, tamanio, mtime, estado in filas:
+        if not forzar and estado in ('indexado', 'no_soportado', 'faltante'):
+            try:
+                info = os.stat(ruta)
+                if estado == 'no_soportado' or (estado == 'indexado' and info.st_size == tamanio and info.st_mtime_ns == mtime):
+                    continue
+            except OSError:
+                if estado == 'faltante':
+                    continue
+        encolar_archivo(archivo_id, forzar)
+        encolados += 1
+    return encolados
+
+def resumen_indice():
+    """Cantidad de documentos por estado de indexación"""
+    asegurar_esquema()
+    with engine.connect() as conn:
+        filas = conn.execute(text("SELECT estado, COUNT(*) FROM documentos_texto GROUP BY estado")).fetchall()
+        total = conn.execute(text("SELECT COUNT(*) FROM proyecto_archivos")).scalar()
+    resumen = {estado: cantidad for estado, cantidad in filas}
+    resumen['pendiente'] = max(total - sum(resumen.values()), 0)
+    return resumen
+
+# ==============================
+# Búsqueda
+# ==============================
+def _consulta_fts(consulta):
+    """Convierte el texto del usuario en una consulta FTS5 segura (último término como prefijo)"""
+    terminos = re.findall(r"\w+", consulta or "", flags=re.UNICODE)
+    if not terminos:
+        return None
+    partes = [f'"{t}"' for t in terminos[:-1]] + [f'"{terminos[-1]}"*']
+    return " ".join(partes)
+
+def buscar_documentos(consulta, tipo_archivo_id=None, limite=50):
+    """Busca en el texto de los documentos y devuelve resultados ordenados por relevancia"""
+    asegurar_esquema()
+    consulta_fts = _consulta_fts(consulta)
+    if not consulta_fts:
+        return []
+
+    filtro_tipo = "AND pa.tipo_archivo_id = :tipo_archivo_id" if tipo_archivo_id else ""
+    with engine.connect() as conn:
+        filas = conn.execute(text(f"""
+            SELECT pa.id, pa.nombre_archivo, pa.ruta_archivo, pa.fecha_subida,
+                   ta.nombre AS tipo, p.id AS proyecto_id, p.codigo_proyecto, p.nombre AS proyecto,
+                   p.codigo_convocatoria, c.nombre AS cliente,
+                   snippet(documentos_fts, 1, :inicio, :fin, '…', 16) AS fragmento,
+                   bm25(documentos_fts, 5.0, 1.0) AS puntaje
+            FROM documentos_fts
+            JOIN proyecto_archivos pa ON pa.id = documentos_fts.rowid
+            JOIN proyectos p ON p.id = pa.proyecto_id
+            LEFT JOIN clientes c ON c.id = p.cliente_id
+            LEFT JOIN tipos_archivo ta ON ta.id = pa.tipo_archivo_id
+            WHERE documentos_fts MATCH :consulta {filtro_tipo}
+            ORDER BY puntaje
+            LIMIT :limite
+        """), {
+            "consulta": consulta_fts,
+            "inicio": _INICIO_MARCA,
+            "fin": _FIN_MARCA,
+            "tipo_archivo_id": tipo_archivo_id,
+            "limite": limite,
+        }).mappings().all()
+
+    return [dict(fila) for fila in filas]
+
+def resaltar_fragmento(fragmento):
+    """Escapa el fragmento y convierte los marcadores de coincidencia en <mark>"""
+    seguro = html.escape(fragmento or "")
+    return seguro.replace(_INICIO_MARCA, "<mark>").replace(_FIN_MARCA, "</mark>")
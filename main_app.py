@@ -1,9 +1,18 @@
 import streamlit as st
 from sqlalchemy.orm import Session
 from datetime import datetime
-import requests
 from database import SessionLocal
 from models import Proyecto, Estado, Usuario, Cliente, Contacto
+from ultimos_archivos import obtener_ultimos_archivos
+from tablero_kanban import tablero_kanban, evento_tablero
+from cache_tarjetas import tarjeta_cacheada
+from portafolio import construir_portafolio, convertir_columna, tasas_para_base, ordenar_por_urgencia
+from resumen_estados import resumen_por_estado
+from alertas import alertas_por_id, estilo_alerta, SIN_FECHA
+from tipo_cambio import iniciar_actualizacion, obtener_tipo_cambio, estado_tipo_cambio, solicitar_actualizacion
+from snapshots_pipeline import iniciar_snapshots
+from notificador import iniciar_notificador
+from busqueda import buscar
 from datetime import timedelta
 
 import logging
@@ -19,15 +28,9 @@ st.set_page_config(page_title="Workflow de Proyectos", page_icon="🏢", layout=
 # Función para obtener tipo de cambio SUNAT
 # ==============================
 def obtener_tipo_cambio_actual():
-    """Obtiene el tipo de cambio actual desde SUNAT"""
-    try:
-        url = "https://api.apis.net.pe/v1/tipo-cambio-sunat"
-        response = requests.get(url, timeout=5)
-        data = response.json()
-        return data['venta']  # Precio de venta SUNAT
-    except Exception as e:
-        st.warning(f"⚠️ No se pudo obtener tipo de cambio SUNAT: {str(e)}")
-        return 3.80  # Valor por defecto
+    """Tipo de cambio SUNAT guardado localmente; un hilo lo refresca en segundo plano"""
+    iniciar_actualizacion()
+    return obtener_tipo_cambio()
 
 # ==============================
 # Funciones de Base de Datos ORM
@@ -128,7 +131,9 @@ def actualizar_proyecto(proyecto_actualizado):
             proyecto_db.descripcion = proyecto_actualizado.descripcion
             proyecto_db.valor_estimado = proyecto_actualizado.valor_estimado
             proyecto_db.moneda = proyecto_actualizado.moneda
-            proyecto_db.estado_actual = proyecto_actualizado.estado_actual
+            if proyecto_db.estado_actual != proyecto_actualizado.estado_actual:
+                # Por mover_a_estado para dejar evento y transición registrados
+                proyecto_db.mover_a_estado(proyecto_actualizado.estado_actual)
             proyecto_db.fecha_ultima_actualizacion = datetime.now()
             proyecto_db.fecha_deadline_propuesta = proyecto_actualizado.fecha_deadline_propuesta
             proyecto_db.fecha_presentacion_cotizacion = proyecto_actualizado.fecha_presentacion_cotizacion
@@ -164,6 +169,8 @@ def actualizar_proyecto(proyecto_actualizado):
 # Inicializar primero el estado de edición FUERA del try-catch
 if "editando" not in st.session_state:
     st.session_state.editando = None
+if "kanban_visibles" not in st.session_state:
+    st.session_state.kanban_visibles = {}
 
 try:
     if "proyectos" not in st.session_state:
@@ -177,11 +184,20 @@ try:
     if "tipo_cambio_actual" not in st.session_state:
         st.session_state.tipo_cambio_actual = obtener_tipo_cambio_actual()
 
+    # Foto diaria del pipeline para los reportes de tendencia
+    iniciar_snapshots()
+
+    # Resumen por correo de deadlines y entregas (solo con SMTP_HOST configurado)
+    iniciar_notificador()
+
 except Exception as e:
     st.error("❌ Error crítico inicializando la aplicación:")
     st.error(str(e))
     st.stop()
 
+# Tarjetas visibles por columna del Kanban (se amplía con "Ver más")
+TARJETAS_POR_COLUMNA = 10
+
 # ==============================
 # Flujo lineal de estados
 # ==============================
@@ -209,61 +225,19 @@ def _close_editor():
 
     st.rerun()
 
-def convertir_a_pen(valor, moneda):
-    """Convierte un valor a PEN usando el tipo de cambio actual"""
-    if moneda == 'PEN':
-        return valor
-    else:
-        return valor * st.session_state.tipo_cambio_actual
-
 def obtener_estilo_deadline(nivel_alerta):
     """Devuelve estilo CSS según el nivel de alerta del deadline"""
-    estilos = {
-        'vencido': {'color': '#666666', 'icono': '☠️', 'fondo': '#F5F5F5'},
-        'critico': {'color': '#dc2626', 'icono': '🔥', 'fondo': '#fef2f2'},
-        'muy_urgente': {'color': '#ea580c', 'icono': '⏰', 'fondo': '#fff7ed'},
-        'urgente': {'color': '#ea580c', 'icono': '⏳', 'fondo': '#fff7ed'},
-        'por_vencer': {'color': '#ca8a04', 'icono': '📅', 'fondo': '#fefce8'},
-        'disponible': {'color': '#16a34a', 'icono': '✅', 'fondo': '#f0fdf4'},
-        'sin_deadline': {'color': '#16a34a', 'icono': '📌', 'fondo': '#f0fdf4'}
-    }
-    return estilos.get(nivel_alerta, estilos['sin_deadline'])
+    return estilo_alerta(nivel_alerta)
 
 def obtener_estilo_entrega(nivel_alerta):
     """Devuelve estilo CSS según el nivel de alerta del deadline"""
-    estilos = {
-        'vencido': {'color': '#666666', 'icono': '☠️', 'fondo': '#F5F5F5'},
-        'critico': {'color': '#dc2626', 'icono': '🔥', 'fondo': '#fef2f2'},
-        'muy_urgente': {'color': '#ea580c', 'icono': '⏰', 'fondo': '#fff7ed'},
-        'urgente': {'color': '#ea580c', 'icono': '⏳', 'fondo': '#fff7ed'},
-        'por_vencer': {'color': '#ca8a04', 'icono': '📅', 'fondo': '#fefce8'},
-        'disponible': {'color': '#16a34a', 'icono': '✅', 'fondo': '#f0fdf4'},
-        'sin_deadline': {'color': '#16a34a', 'icono': '📌', 'fondo': '#f0fdf4'}
-    }
-    return estilos.get(nivel_alerta, estilos['sin_deadline'])
+    return estilo_alerta(nivel_alerta)
 
 # ==============================
 # Estilos CSS
 # ==============================
 st.markdown("""
 <style>
-.card {
-  position: relative;
-  border: 2px solid #e5e7eb;
-  border-radius: 12px;
-  background: #ffffff;
-  padding: 12px 12px 8px 12px;
-  margin-bottom: 10px;
-  box-shadow: 2px 2px 6px rgba(0,0,0,0.07);
-  font-size: 14px;
-}
-.section-header {
-  color: white; padding: 14px; border-radius: 10px; text-align:center; margin-bottom: 14px;
-}
-.badge {
-  background: white; border-radius: 50%; width: 30px; height: 30px;
-  display: inline-flex; align-items: center; justify-content: center; font-weight: 700;
-}
 .status-info {
   background: #f0f9ff;
   border: 1px solid #0ea5e9;
@@ -271,19 +245,6 @@ st.markdown("""
   padding: 12px;
   margin: 16px 0;
 }
-.moneda-badge {
-  font-size: 10px;
-  padding: 2px 6px;
-  border-radius: 8px;
-  margin-left: 4px;
-}
-.deadline-badge {
-  font-size: 11px;
-  padding: 3px 8px;
-  border-radius: 10px;
-  margin-top: 4px;
-  display: inline-block;
-}
 </style>
 """, unsafe_allow_html=True)
 
@@ -319,17 +280,31 @@ nombres_estados = {
 # ==============================
 st.title("🏢 Workflow de Gestión de Proyectos")
 
+# Valores en PEN al tipo de cambio vigente hoy (misma base que "Vigente hoy" en las páginas)
+portafolio = construir_portafolio(st.session_state.proyectos)
+tasas_hoy = tasas_para_base(portafolio, 'hoy')
+valores_pen = convertir_columna(portafolio, 'PEN', tasas_hoy).to_dict()
+# Niveles de deadline y entrega de todo el tablero en una sola pasada
+alertas_tablero = alertas_por_id(portafolio)
+
+# Cantidad y total por estado desde SQL (GROUP BY con caché, se invalida al guardar proyectos)
+totales_estado = resumen_por_estado('PEN')
+
 # Mostrar información del estado de la base de datos
 if st.session_state.proyectos:
     # Calcular totales EN PEN
-    total_valor_pen = sum(convertir_a_pen(p.valor_estimado, p.moneda) for p in st.session_state.proyectos)
-    total_proyectos = len(st.session_state.proyectos)
+    total_proyectos = int(totales_estado['cantidad'].sum())
+    total_valor_pen = float(totales_estado['total'].sum())
+
+    estado_tc = estado_tipo_cambio()
+    fecha_tc = estado_tc['fecha'].strftime('%d/%m') if estado_tc['fecha'] else estado_tc['origen'].lower()
+    aviso_tc = f" ({'⚠️ ' if estado_tc['desactualizado'] else ''}{fecha_tc})"
 
     st.markdown(f"""
     <div class="status-info">
         <strong>📊 Estado del Sistema:</strong> {total_proyectos} proyectos activos |
         💰 Valor total: <strong>S/ {total_valor_pen:,.0f}</strong> |
-        💵 Tipo cambio: S/ {st.session_state.tipo_cambio_actual:.2f} por $1 |
+        💵 Tipo cambio: S/ {st.session_state.tipo_cambio_actual:.2f} por $1{aviso_tc} |
         📅 Última carga: {datetime.now().strftime('%H:%M:%S')}
     </div>
     """, unsafe_allow_html=True)
@@ -345,131 +320,337 @@ st.markdown("## 📋 Vista General del Workflow")
 st.markdown("### Visualiza el flujo de proyectos entre estados")
 
 # ==============================
-# Función para tarjetas
+# Editor de proyecto con flujo lineal
 # ==============================
-def crear_tarjeta_proyecto(proyecto, estado):
-    color = colores_estados.get(estado, "#ccc")
+@st.dialog("✏️ Editar Proyecto", width="large")
+def editor_proyecto(proyecto_id):
+    """Diálogo de edición; sus interacciones solo recargan el diálogo, guardar o mover recarga el tablero"""
+    try:
+        proyecto = next((p for p in st.session_state.proyectos if p.id == proyecto_id), None)
 
-    # Obtener nombres de relaciones
-    cliente_nombre = proyecto.cliente.nombre if proyecto.cliente else "Sin cliente"
-    usuario_nombre = proyecto.asignado_a.nombre if proyecto.asignado_a else "Sin asignar"
+        if not proyecto:
+            st.error("❌ Proyecto no encontrado")
+            st.session_state.editando = None
+            return
 
-    dias_sin = (datetime.now() - proyecto.fecha_ultima_actualizacion).days
-    extra_lines = []
+        st.caption(f"Proyecto #{proyecto.id} • Código: **{proyecto.codigo_proyecto}** • Estado actual: **{proyecto.estado_actual}**")
+
+        with st.form(f"form_edit_{proyecto.id}", clear_on_submit=False):
+            nuevo_nombre = st.text_input("Nombre", proyecto.nombre)
+
+            # Selector de cliente
+            opciones_clientes = {c.id: f"{c.nombre} ({c.ruc})" for c in st.session_state.clientes}
+
+            cliente_ids = list(opciones_clientes.keys())
+            # calcular índice real
+            cliente_index = cliente_ids.index(proyecto.cliente_id) if proyecto.cliente_id in cliente_ids else 0
+
+            cliente_seleccionado = st.selectbox(
+                "Cliente",
+                options=list(opciones_clientes.keys()),
+                format_func=lambda x: opciones_clientes[x],
+                index=cliente_index
+            )
+
+            nueva_descripcion = st.text_area("Descripción", proyecto.descripcion or "")
+
+            col_moneda, col_valor = st.columns(2)
+            with col_moneda:
+                nueva_moneda = st.selectbox("Moneda", ["PEN", "USD"], index=0 if proyecto.moneda == "PEN" else 1)
+            with col_valor:
+                nuevo_valor = st.number_input("Valor estimado", min_value=0, step=1000, value=int(proyecto.valor_estimado))
+
+            # Selector de usuario asignado
+            opciones_usuarios = {u.id: f"{u.nombre} ({u.cargo})" for u in st.session_state.usuarios}
+
+            usuario_ids = list(opciones_usuarios.keys())
+            usuario_index = usuario_ids.index(proyecto.asignado_a_id) if proyecto.asignado_a_id in usuario_ids else 0
+
+            usuario_seleccionado = st.selectbox(
+                "Asignado a",
+                options=usuario_ids,  # usar la misma lista que para calcular el índice
+                format_func=lambda x: opciones_usuarios[x],
+                index=usuario_index
+            )
+
+
+            # Selector de contacto principal
+            # Selector de contacto principal - CON VERIFICACIÓN
+            contactos_cliente = [c for c in st.session_state.contactos if c and hasattr(c, 'cliente_id') and c.cliente_id == cliente_seleccionado]
+            opciones_contactos = {c.id: f"{c.nombre} - {c.cargo}" for c in contactos_cliente if c and hasattr(c, 'nombre')}
+
+            contacto_ids = list(opciones_contactos.keys())
+
+            #contacto_seleccionado = st.selectbox(
+            #    "Contacto principal",
+            #    options=list(opciones_contactos.keys()),
+            #    format_func=lambda x: opciones_contactos[x],
+            #    index=0 if not opciones_contactos else None,
+            #    disabled=not opciones_contactos
+            #)
+
+            if contacto_ids:
+                contacto_index = contacto_ids.index(proyecto.contacto_principal_id) if proyecto.contacto_principal_id in contacto_ids else 0
+                contacto_seleccionado = st.selectbox(
+                    "Contacto principal",
+                    options=contacto_ids,
+                    format_func=lambda x: opciones_contactos[x],
+                    index=contacto_index
+                )
+            else:
+                contacto_seleccionado = None
+                st.selectbox("Contacto principal", options=["(sin contactos)"], disabled=True)
+
+            # Fechas adicionales
+            col_fecha1, col_fecha2 = st.columns(2)
+
+            with col_fecha1:
+                disabled_cotizacion = proyecto.estado_actual != "PREVENTA"
+                nueva_fecha_cotizacion = st.date_input(
+                    "Fecha presentación cotización",
+                    value=proyecto.fecha_presentacion_cotizacion.date() if proyecto.fecha_presentacion_cotizacion else None,
+                    format="DD/MM/YYYY",
+                    disabled=disabled_cotizacion,
+                    help="Solo editable en estado PREVENTA" if disabled_cotizacion else None
+                )
+
+            with col_fecha2:
+                disabled_deadline = proyecto.estado_actual not in ["OPORTUNIDAD", "PREVENTA"]
+                nueva_fecha_deadline = st.date_input(
+                    "Fecha deadline propuesta",
+                    value=proyecto.fecha_deadline_propuesta.date() if proyecto.fecha_deadline_propuesta else None,
+                    format="DD/MM/YYYY",
+                    disabled=disabled_deadline,
+                    help="Solo editable en estados OPORTUNIDAD y PREVENTA" if disabled_deadline else None
+                )
+
+            col1, col2 = st.columns(2)
+            with col1:
+                guardar = st.form_submit_button("💾 Guardar")
+            with col2:
+                cancelar = st.form_submit_button("❌ Cancelar")
+
+            if guardar:
+                try:
+
+                    # DEBUG: Mostrar lo que se va a guardar
+                    st.write(f"DEBUG: Guardando proyecto ID {proyecto.id}")
+                    st.write(f"DEBUG: Nuevo nombre: {nuevo_nombre}")
+                    st.write(f"DEBUG: Nuevo cliente ID: {cliente_seleccionado}")
+                    st.write(f"DEBUG: Nuevo usuario ID: {usuario_seleccionado}")
+
+                    proyecto.nombre = nuevo_nombre
+                    proyecto.descripcion = nueva_descripcion
+                    proyecto.valor_estimado = nuevo_valor
+                    proyecto.moneda = nueva_moneda
+                    proyecto.cliente_id = cliente_seleccionado
+                    proyecto.asignado_a_id = usuario_seleccionado
+                    proyecto.contacto_principal_id = contacto_seleccionado if contacto_seleccionado else None
+
+                    if nueva_fecha_cotizacion:
+                        proyecto.fecha_presentacion_cotizacion = datetime.combine(nueva_fecha_cotizacion, datetime.min.time())
+                    if nueva_fecha_deadline:
+                        proyecto.fecha_deadline_propuesta = datetime.combine(nueva_fecha_deadline, datetime.min.time())
+
+                    proyecto.fecha_ultima_actualizacion = datetime.now()
+
+                    # DEBUG: Verificar el objeto antes de guardar
+                    st.write(f"DEBUG: Proyecto a guardar - ID: {proyecto.id}, Nombre: {proyecto.nombre}")
+
+                    if actualizar_proyecto(proyecto):
+                        st.success("✅ Guardado!")
+                        _close_editor()
+                except Exception as e:
+                    st.error(f"❌ Error: {str(e)}")
+
+            if cancelar:
+                _close_editor()
+
+        st.markdown("---")
+        st.subheader("🔄 Acciones de Flujo")
+
+        # Convertir estado actual a Enum para el flujo
+        try:
+            estado_actual_enum = Estado(proyecto.estado_actual)
+            idx = flujo_estados.index(estado_actual_enum)
+        except:
+            idx = 0
+
+        anterior = flujo_estados[idx-1] if idx > 0 else None
+        siguiente = flujo_estados[idx+1] if idx < len(flujo_estados)-1 else None
+
+        if anterior and st.button(f"⬅️ Retroceder a {anterior.value}"):
+            try:
+                proyecto.estado_actual = anterior.value
+                proyecto.fecha_ultima_actualizacion = datetime.now()
+                if actualizar_proyecto(proyecto):
+                    st.success(f"✅ Movido a {anterior.value}")
+                    _close_editor()
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
+
+        if siguiente and st.button(f"➡️ Avanzar a {siguiente.value}"):
+            try:
+                proyecto.estado_actual = siguiente.value
+                proyecto.fecha_ultima_actualizacion = datetime.now()
+                if actualizar_proyecto(proyecto):
+                    st.success(f"✅ Movido a {siguiente.value}")
+                    _close_editor()
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
+    except Exception as e:
+        st.error(f"❌ Error cargando proyecto: {str(e)}")
+        st.session_state.editando = None
+
+# ==============================
+# Vista compacta de cada tarjeta
+# ==============================
+def vista_tarjeta(proyecto, estado, dias_sin, documentos=None):
+    """Datos de la tarjeta para el componente del tablero (solo valores JSON)"""
+    alertas = []
 
     if estado == Estado.OPORTUNIDAD:
         color_estado = "green" if dias_sin < 3 else "orange" if dias_sin < 7 else "red"
-        extra_lines.append(f"<span style='font-size:12px; color:{color_estado};'>⏰ {dias_sin} días sin actualizar</span>")
+        alertas.append({'texto': f"⏰ {dias_sin} días sin actualizar", 'color': color_estado, 'fondo': None})
 
     if estado == Estado.PREVENTA:
         if proyecto.fecha_presentacion_cotizacion:
-            extra_lines.append(
-                f"<div style='color: #16a34a; font-size: 11px; margin-top: 4px;'>"
-                f"✅ Cotización presentada: {proyecto.fecha_presentacion_cotizacion.strftime('%d/%m/%y')}"
-                f"</div>"
-            )
+            alertas.append({
+                'texto': f"✅ Cotización presentada: {proyecto.fecha_presentacion_cotizacion.strftime('%d/%m/%y')}",
+                'color': "#16a34a", 'fondo': None
+            })
         else:
-            extra_lines.append(
-                f"<div style='color: #ea580c; font-size: 11px; margin-top: 4px;'>"
-                f"⏳ Cotización en preparación"
-                f"</div>"
-            )
+            alertas.append({'texto': "⏳ Cotización en preparación", 'color': "#ea580c", 'fondo': None})
+
+    alerta = alertas_tablero[proyecto.id]
 
     if estado == Estado.DELIVERY:
-        #estado_entrega = obtener_estado_entrega(proyecto)
-        nivel_alerta = proyecto.obtener_nivel_alerta_entrega()
-        estilo = obtener_estilo_entrega(nivel_alerta)
-        dias_restantes = proyecto.dias_restantes_entrega()
-
-        if dias_restantes is not None:
-           texto_dias = f"{abs(dias_restantes)} días {'pasados' if dias_restantes < 0 else 'restantes'}"
-           extra_lines.append(
-                f"<div class='deadline-badge' style='background:{estilo['fondo']}; color:{estilo['color']}; border:1px solid {estilo['color']}20;'>"
-                f"{estilo['icono']} Plazo de Entrega: "
-                f"{texto_dias}</div>"
-            )
-       
+        estilo = obtener_estilo_entrega(alerta['nivel_entrega'])
+
+        if alerta['nivel_entrega'] != SIN_FECHA:
+            dias_restantes = int(alerta['dias_entrega'])
+            texto_dias = f"{abs(dias_restantes)} días {'pasados' if dias_restantes < 0 else 'restantes'}"
+            alertas.append({
+                'texto': f"{estilo['icono']} Plazo de Entrega: {texto_dias}",
+                'color': estilo['color'], 'fondo': estilo['fondo']
+            })
+
     if estado in [Estado.OPORTUNIDAD, Estado.PREVENTA] and proyecto.fecha_deadline_propuesta:
-        nivel_alerta = proyecto.obtener_nivel_alerta_deadline()
-        estilo = obtener_estilo_deadline(nivel_alerta)
-        dias_restantes = proyecto.dias_restantes_deadline()
+        estilo = obtener_estilo_deadline(alerta['nivel_deadline'])
+        dias_restantes = int(alerta['dias_deadline'])
 
-        if dias_restantes is not None and not proyecto.fecha_presentacion_cotizacion:
+        if not proyecto.fecha_presentacion_cotizacion:
             texto_dias = f"{abs(dias_restantes)} días {'pasados' if dias_restantes < 0 else 'restantes'}"
-            extra_lines.append(
-                f"<div class='deadline-badge' style='background:{estilo['fondo']}; color:{estilo['color']}; border:1px solid {estilo['color']}20;'>"
-                f"{estilo['icono']} Deadline: {proyecto.fecha_deadline_propuesta.strftime('%d/%m/%y')} "
-                f"({texto_dias})</div>"
-            )
+            alertas.append({
+                'texto': f"{estilo['icono']} Deadline: {proyecto.fecha_deadline_propuesta.strftime('%d/%m/%y')} ({texto_dias})",
+                'color': estilo['color'], 'fondo': estilo['fondo']
+            })
+
+    return {
+        'id': proyecto.id,
+        'nombre': proyecto.nombre,
+        'cliente': proyecto.cliente.nombre if proyecto.cliente else "Sin cliente",
+        'usuario': proyecto.asignado_a.nombre if proyecto.asignado_a else "Sin asignar",
+        'moneda': proyecto.moneda,
+        'valor': float(proyecto.valor_estimado or 0),
+        'valor_pen': float(valores_pen[proyecto.id]),
+        'alertas': alertas,
+        # Badges con el último documento de cada tipo
+        'documentos': [
+            {'tipo': tipo, 'titulo': f"{archivo.nombre_archivo} ({archivo.fecha_subida.strftime('%d/%m/%y')})"}
+            for tipo, archivo in sorted((documentos or {}).items())
+        ],
+    }
 
-    # Convertir valor a PEN para mostrar
-    valor_pen = convertir_a_pen(proyecto.valor_estimado, proyecto.moneda)
-    moneda_badge_color = "#4CAF50" if proyecto.moneda == 'PEN' else "#2196F3"
-    moneda_text = "S/ " if proyecto.moneda == 'PEN' else "$ "
-
-    # Crear contenedor para la tarjeta con botón
-    col1, col2 = st.columns([4, 1])
-
-    with col1:
-        st.markdown(f"""
-        <div class='card' style='border-color:{color}; margin-bottom: 5px;'>
-            <strong>{proyecto.nombre}</strong><br>
-            <span style="font-size:12px;">🏢 {cliente_nombre}</span><br>
-            <span style="font-size:12px;">👤 {usuario_nombre}</span><br>
-            <span style="font-size:13px; font-weight:bold; color:{color};">
-                💰 {moneda_text}{proyecto.valor_estimado:,.0f}
-                <span class='moneda-badge' style='background:{moneda_badge_color}; color:white;'>
-                    {proyecto.moneda}
-                </span>
-            </span><br>
-            <span style="font-size:12px; color:#666;">
-                ≈ S/ {valor_pen:,.0f}
-            </span><br>
-            {'<br>'.join(extra_lines)}
-        </div>
-        """, unsafe_allow_html=True)
-
-    with col2:
-        if st.button("✏️", key=f"edit_{proyecto.codigo_proyecto}", help="Editar proyecto"):
-            st.session_state.editando = proyecto.id
-            st.rerun()
+def tarjeta_kanban(proyecto, estado, documentos=None):
+    """Vista de la tarjeta desde la caché; los documentos vigentes forman parte de la clave"""
+    version_documentos = tuple(sorted((tipo, archivo.id) for tipo, archivo in (documentos or {}).items()))
+    alerta = alertas_tablero[proyecto.id]
+    # Días que muestra la tarjeta (None sin fecha, así la clave no arrastra NaN)
+    dias_sin = (datetime.now() - proyecto.fecha_ultima_actualizacion).days
+    dias_deadline, dias_entrega = (
+        None if alerta['nivel_' + tipo] == SIN_FECHA else int(alerta['dias_' + tipo])
+        for tipo in ('deadline', 'entrega')
+    )
+    return tarjeta_cacheada("kanban", proyecto, 'PEN', valores_pen[proyecto.id],
+                            lambda: vista_tarjeta(proyecto, estado, dias_sin, documentos), estado.value, version_documentos,
+                            alerta['nivel_deadline'], alerta['nivel_entrega'], dias_sin, dias_deadline, dias_entrega)
 
 # ==============================
 # Construcción del tablero Kanban
 # ==============================
-if st.session_state.proyectos:
-    col1, col2, col3, col4, col5 = st.columns(5)
-    cols_map = {
-        Estado.OPORTUNIDAD: col1,
-        Estado.PREVENTA: col2,
-        Estado.DELIVERY: col3,
-        Estado.COBRANZA: col4,
-        Estado.POSTVENTA: col5
+def columnas_tablero():
+    """Una entrada por estado con sus tarjetas visibles, ordenadas por urgencia"""
+    proyectos_por_id = {p.id: p for p in st.session_state.proyectos}
+    ids_por_estado = ordenar_por_urgencia(portafolio).groupby('estado', sort=False)['id'].apply(list).to_dict()
+    visibles_por_estado = {
+        estado: ids_por_estado.get(estado.value, [])[:st.session_state.kanban_visibles.get(estado.value, TARJETAS_POR_COLUMNA)]
+        for estado in flujo_estados
     }
 
-    for estado, col in cols_map.items():
-        color = colores_estados[estado]
-        proyectos_estado = [p for p in st.session_state.proyectos if p.estado_actual == estado.value]
+    # Último documento por tipo de las tarjetas visibles en una sola consulta
+    documentos_por_proyecto = obtener_ultimos_archivos([pid for ids in visibles_por_estado.values() for pid in ids])
 
-        with col:
-            st.markdown(
-                f"<div class='section-header' style='background:{color};'>"
-                f"<h3 style='margin:0;'>{iconos_estados[estado]} {nombres_estados[estado]}</h3>"
-                f"<div class='badge' style='color:{color};'>{len(proyectos_estado)}</div>"
-                f"</div>", unsafe_allow_html=True
-            )
+    columnas = []
+    for i, estado in enumerate(flujo_estados):
+        cantidad_estado = int(totales_estado['cantidad'].get(estado.value, 0))
+        ids_visibles = visibles_por_estado[estado]
+        columnas.append({
+            'estado': estado.value,
+            'titulo': nombres_estados[estado],
+            'icono': iconos_estados[estado],
+            'color': colores_estados[estado],
+            'cantidad': cantidad_estado,
+            'anterior': flujo_estados[i - 1].value if i > 0 else None,
+            'siguiente': flujo_estados[i + 1].value if i < len(flujo_estados) - 1 else None,
+            'mas': min(len(ids_por_estado.get(estado.value, [])) - len(ids_visibles), TARJETAS_POR_COLUMNA),
+            'menos': len(ids_visibles) > TARJETAS_POR_COLUMNA,
+            'tarjetas': [tarjeta_kanban(proyectos_por_id[pid], estado, documentos_por_proyecto.get(pid)) for pid in ids_visibles],
+        })
+    return columnas
+
+@st.fragment
+def tablero():
+    """Tablero en un solo componente; editar y paginar solo recargan este fragmento"""
+    # El evento se atiende antes de dibujar para que la paginación se refleje en este mismo render
+    evento = evento_tablero() or {}
+
+    if evento.get('tipo') == 'mas':
+        visibles = st.session_state.kanban_visibles.get(evento['estado'], TARJETAS_POR_COLUMNA)
+        st.session_state.kanban_visibles[evento['estado']] = visibles + TARJETAS_POR_COLUMNA
+
+    elif evento.get('tipo') == 'menos':
+        st.session_state.kanban_visibles[evento['estado']] = TARJETAS_POR_COLUMNA
+
+    elif evento.get('tipo') == 'mover':
+        proyecto = next((p for p in st.session_state.proyectos if p.id == evento['proyecto_id']), None)
+        estados_flujo = [e.value for e in flujo_estados]
+        if not proyecto or proyecto.estado_actual not in estados_flujo or evento['destino'] not in estados_flujo:
+            st.error("❌ Proyecto no encontrado")
+        # Solo se avanza o retrocede un paso en el flujo lineal
+        elif abs(estados_flujo.index(evento['destino']) - estados_flujo.index(proyecto.estado_actual)) != 1:
+            st.warning(f"⚠️ {proyecto.estado_actual} solo puede moverse a un estado vecino")
+        else:
+            try:
+                proyecto.estado_actual = evento['destino']
+                proyecto.fecha_ultima_actualizacion = datetime.now()
+                if actualizar_proyecto(proyecto):
+                    _close_editor()
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
 
-            if not proyectos_estado:
-                st.markdown(f"""
-                <div style='text-align: center; padding: 20px; color: #666; font-style: italic;'>
-                    Sin proyectos en {estado.value}
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                for proyecto in proyectos_estado:
-                    with st.container():
-                        crear_tarjeta_proyecto(proyecto, estado)
+    tablero_kanban(columnas_tablero())
 
+    if evento.get('tipo') == 'editar':
+        st.session_state.editando = evento['proyecto_id']
+        editor_proyecto(evento['proyecto_id'])
+
+if st.session_state.proyectos:
+    tablero()
+
+    # Accesos a las páginas de cada estado
+    for estado, col in zip(flujo_estados, st.columns(5)):
+        with col:
             # BOTÓN MODIFICADO - Ahora redirige a la página de oportunidades
             if estado == Estado.OPORTUNIDAD:
                 if st.button("📊 Administrar Oportunidades", key=f"btn_{estado}", use_container_width=True):
@@ -477,6 +658,9 @@ if st.session_state.proyectos:
             elif estado == Estado.PREVENTA: 
                 if st.button("📊 Administrar Preventa", key=f"btn_{estado}", use_container_width=True):
                     st.switch_page("pages/2_Preventa.py")
+            elif estado == Estado.COBRANZA:
+                if st.button("📊 Administrar Cobranza", key=f"btn_{estado}", use_container_width=True):
+                    st.switch_page("pages/4_Cobranza.py")
             else:
                 st.button("⏳ Próximamente", key=f"btn_{estado}", disabled=True, use_container_width=True)
 
@@ -487,196 +671,46 @@ else:
     st.markdown("2. 🔄 Recarga la aplicación")
     st.markdown("3. ➕ Crea tu primera oportunidad")
 
-# ==============================
-# Sidebar de edición con flujo lineal
-# ==============================
-if st.session_state.editando:
-    try:
-        print(f"DEBUG: Buscando proyecto ID {st.session_state.editando}")
-        print(f"DEBUG: Proyectos disponibles: {[p.id for p in st.session_state.proyectos]}")
-        proyecto = next((p for p in st.session_state.proyectos if p.id == st.session_state.editando), None)
-
-        # DEBUG: Mostrar si se encontró el proyecto
-        if not proyecto:
-            st.sidebar.error("❌ Proyecto no encontrado")
-            st.session_state.editando = None
-            st.rerun()
-
-        with st.sidebar:
-            st.header(f"✏️ Editar Proyecto #{proyecto.id}")
-            st.caption(f"Código: **{proyecto.codigo_proyecto}** • Estado actual: **{proyecto.estado_actual}**")
-
-            with st.form(f"form_edit_{proyecto.id}", clear_on_submit=False):
-                nuevo_nombre = st.text_input("Nombre", proyecto.nombre)
-
-                # Selector de cliente
-                opciones_clientes = {c.id: f"{c.nombre} ({c.ruc})" for c in st.session_state.clientes}
-
-                cliente_ids = list(opciones_clientes.keys())
-                # calcular índice real
-                cliente_index = cliente_ids.index(proyecto.cliente_id) if proyecto.cliente_id in cliente_ids else 0
-
-                cliente_seleccionado = st.selectbox(
-                    "Cliente",
-                    options=list(opciones_clientes.keys()),
-                    format_func=lambda x: opciones_clientes[x],
-                    index=cliente_index
-                )
-
-                nueva_descripcion = st.text_area("Descripción", proyecto.descripcion or "")
-
-                col_moneda, col_valor = st.columns(2)
-                with col_moneda:
-                    nueva_moneda = st.selectbox("Moneda", ["PEN", "USD"], index=0 if proyecto.moneda == "PEN" else 1)
-                with col_valor:
-                    nuevo_valor = st.number_input("Valor estimado", min_value=0, step=1000, value=int(proyecto.valor_estimado))
-
-                # Selector de usuario asignado
-                opciones_usuarios = {u.id: f"{u.nombre} ({u.cargo})" for u in st.session_state.usuarios}
-
-                usuario_ids = list(opciones_usuarios.keys())
-                usuario_index = usuario_ids.index(proyecto.asignado_a_id) if proyecto.asignado_a_id in usuario_ids else 0
-
-                usuario_seleccionado = st.selectbox(
-                    "Asignado a",
-                    options=usuario_ids,  # usar la misma lista que para calcular el índice
-                    format_func=lambda x: opciones_usuarios[x],
-                    index=usuario_index
-                )
-
-
-                # Selector de contacto principal
-                # Selector de contacto principal - CON VERIFICACIÓN
-                contactos_cliente = [c for c in st.session_state.contactos if c and hasattr(c, 'cliente_id') and c.cliente_id == cliente_seleccionado]
-                opciones_contactos = {c.id: f"{c.nombre} - {c.cargo}" for c in contactos_cliente if c and hasattr(c, 'nombre')}
-
-                contacto_ids = list(opciones_contactos.keys())
-
-                #contacto_seleccionado = st.selectbox(
-                #    "Contacto principal",
-                #    options=list(opciones_contactos.keys()),
-                #    format_func=lambda x: opciones_contactos[x],
-                #    index=0 if not opciones_contactos else None,
-                #    disabled=not opciones_contactos
-                #)
-
-                if contacto_ids:
-                    contacto_index = contacto_ids.index(proyecto.contacto_principal_id) if proyecto.contacto_principal_id in contacto_ids else 0
-                    contacto_seleccionado = st.selectbox(
-                        "Contacto principal",
-                        options=contacto_ids,
-                        format_func=lambda x: opciones_contactos[x],
-                        index=contacto_index
-                    )
-                else:
-                    contacto_seleccionado = None
-                    st.selectbox("Contacto principal", options=["(sin contactos)"], disabled=True)
-
-                # Fechas adicionales
-                col_fecha1, col_fecha2 = st.columns(2)
-
-                with col_fecha1:
-                    disabled_cotizacion = proyecto.estado_actual != "PREVENTA"
-                    nueva_fecha_cotizacion = st.date_input(
-                        "Fecha presentación cotización",
-                        value=proyecto.fecha_presentacion_cotizacion.date() if proyecto.fecha_presentacion_cotizacion else None,
-                        format="DD/MM/YYYY",
-                        disabled=disabled_cotizacion,
-                        help="Solo editable en estado PREVENTA" if disabled_cotizacion else None
-                    )
-
-                with col_fecha2:
-                    disabled_deadline = proyecto.estado_actual not in ["OPORTUNIDAD", "PREVENTA"]
-                    nueva_fecha_deadline = st.date_input(
-                        "Fecha deadline propuesta",
-                        value=proyecto.fecha_deadline_propuesta.date() if proyecto.fecha_deadline_propuesta else None,
-                        format="DD/MM/YYYY",
-                        disabled=disabled_deadline,
-                        help="Solo editable en estados OPORTUNIDAD y PREVENTA" if disabled_deadline else None
-                    )
-
-                col1, col2 = st.columns(2)
-                with col1:
-                    guardar = st.form_submit_button("💾 Guardar")
-                with col2:
-                    cancelar = st.form_submit_button("❌ Cancelar")
-
-                if guardar:
-                    try:
-
-                        # DEBUG: Mostrar lo que se va a guardar
-                        st.write(f"DEBUG: Guardando proyecto ID {proyecto.id}")
-                        st.write(f"DEBUG: Nuevo nombre: {nuevo_nombre}")
-                        st.write(f"DEBUG: Nuevo cliente ID: {cliente_seleccionado}")
-                        st.write(f"DEBUG: Nuevo usuario ID: {usuario_seleccionado}")
-
-                        proyecto.nombre = nuevo_nombre
-                        proyecto.descripcion = nueva_descripcion
-                        proyecto.valor_estimado = nuevo_valor
-                        proyecto.moneda = nueva_moneda
-                        proyecto.cliente_id = cliente_seleccionado
-                        proyecto.asignado_a_id = usuario_seleccionado
-                        proyecto.contacto_principal_id = contacto_seleccionado if contacto_seleccionado else None
-
-                        if nueva_fecha_cotizacion:
-                            proyecto.fecha_presentacion_cotizacion = datetime.combine(nueva_fecha_cotizacion, datetime.min.time())
-                        if nueva_fecha_deadline:
-                            proyecto.fecha_deadline_propuesta = datetime.combine(nueva_fecha_deadline, datetime.min.time())
-
-                        proyecto.fecha_ultima_actualizacion = datetime.now()
-
-                        # DEBUG: Verificar el objeto antes de guardar
-                        st.write(f"DEBUG: Proyecto a guardar - ID: {proyecto.id}, Nombre: {proyecto.nombre}")
-
-                        if actualizar_proyecto(proyecto):
-                            st.success("✅ Guardado!")
-                            _close_editor()
-                    except Exception as e:
-                        st.error(f"❌ Error: {str(e)}")
-
-                if cancelar:
-                    _close_editor()
+# En el sidebar de main_app.py
+if st.sidebar.button("🔍 Probar Conexión BD"):
+    st.switch_page("pages/test_database.py")
 
-            st.markdown("---")
-            st.subheader("🔄 Acciones de Flujo")
+if st.sidebar.button("📈 Tendencias del Pipeline"):
+    st.switch_page("pages/6_Tendencias.py")
 
-            # Convertir estado actual a Enum para el flujo
-            try:
-                estado_actual_enum = Estado(proyecto.estado_actual)
-                idx = flujo_estados.index(estado_actual_enum)
-            except:
-                idx = 0
+if st.sidebar.button("💵 Flujo de Caja"):
+    st.switch_page("pages/7_Flujo_Caja.py")
 
-            anterior = flujo_estados[idx-1] if idx > 0 else None
-            siguiente = flujo_estados[idx+1] if idx < len(flujo_estados)-1 else None
+if st.sidebar.button("⏱️ Tiempos por Etapa"):
+    st.switch_page("pages/8_Tiempos_Etapa.py")
 
-            if anterior and st.button(f"⬅️ Retroceder a {anterior.value}"):
-                try:
-                    proyecto.estado_actual = anterior.value
-                    proyecto.fecha_ultima_actualizacion = datetime.now()
-                    if actualizar_proyecto(proyecto):
-                        st.success(f"✅ Movido a {anterior.value}")
-                        _close_editor()
-                except Exception as e:
-                    st.error(f"❌ Error: {str(e)}")
-
-            if siguiente and st.button(f"➡️ Avanzar a {siguiente.value}"):
-                try:
-                    proyecto.estado_actual = siguiente.value
-                    proyecto.fecha_ultima_actualizacion = datetime.now()
-                    if actualizar_proyecto(proyecto):
-                        st.success(f"✅ Movido a {siguiente.value}")
-                        _close_editor()
-                except Exception as e:
-                    st.error(f"❌ Error: {str(e)}")
-    except Exception as e:
-        st.sidebar.error(f"❌ Error cargando proyecto: {str(e)}")
-        st.session_state.editando = None
-        st.rerun()
+# ==============================
+# Búsqueda global (índice FTS5)
+# ==============================
+ICONOS_BUSQUEDA = {'proyecto': "📁", 'cliente': "🏢", 'evento': "📝"}
 
-# En el sidebar de main_app.py
-if st.sidebar.button("🔍 Probar Conexión BD"):
-    st.switch_page("pages/test_database.py")
+with st.sidebar:
+    st.markdown("---")
+    texto_busqueda = st.text_input("🔎 Buscar", key="busqueda_global",
+                                   placeholder="Proyecto, código, convocatoria, cliente, RUC...")
+    if len(texto_busqueda.strip()) >= 2:
+        try:
+            resultados = buscar(texto_busqueda)
+        except Exception as e:
+            st.error(f"❌ Error en la búsqueda: {str(e)}")
+            resultados = None
+
+        if resultados is not None and resultados.empty:
+            st.caption("Sin resultados")
+        elif resultados is not None:
+            for fila in resultados.itertuples():
+                icono = ICONOS_BUSQUEDA[fila.tipo]
+                if fila.tipo == 'cliente':
+                    st.markdown(f"{icono} **{fila.titulo}**")
+                elif st.button(f"{icono} {fila.titulo}", key=f"busqueda_{fila.tipo}_{fila.id}", use_container_width=True):
+                    st.session_state.editando = int(fila.proyecto_id)
+                    editor_proyecto(int(fila.proyecto_id))
+                st.caption(fila.fragmento)
 
 # ==============================
 # Resumen general
@@ -687,17 +721,17 @@ if st.session_state.proyectos:
 
     resumen_cols = st.columns(5)
     for i, estado in enumerate(flujo_estados):
-        proyectos_estado = [p for p in st.session_state.proyectos if p.estado_actual == estado.value]
+        cantidad_estado = int(totales_estado['cantidad'].get(estado.value, 0))
         color = colores_estados[estado]
 
-        total_valor_pen = sum(convertir_a_pen(p.valor_estimado, p.moneda) for p in proyectos_estado)
+        total_valor_pen = totales_estado['total'].get(estado.value, 0.0)
 
         with resumen_cols[i]:
             st.markdown(f"""
             <div style='text-align: center; padding: 15px; background-color: {color}20; border-radius: 10px; border: 2px solid {color};'>
                 <div style='font-size: 24px;'>{iconos_estados[estado]}</div>
                 <div style='font-weight: bold; color: {color};'>{nombres_estados[estado]}</div>
-                <div style='font-size: 20px; font-weight: bold;'>{len(proyectos_estado)}</div>
+                <div style='font-size: 20px; font-weight: bold;'>{cantidad_estado}</div>
                 <div style='font-size: 12px;'>proyectos</div>
                 <div style='font-size: 16px; font-weight: bold; color: {color};'>S/ {total_valor_pen:,.0f}</div>
             </div>
@@ -713,7 +747,7 @@ with col1:
     st.markdown(f"*📅 Última actualización: {datetime.now().strftime('%d/%m/%Y %H:%M')}*")
 
 with col2:
-    st.markdown("*💡 Haz clic en ✏️ de cada tarjeta para editar*")
+    st.markdown("*💡 Haz clic en ✏️ para editar o arrastra una tarjeta a la columna vecina para moverla*")
 
 # Botón de refresh de datos
 if st.button("🔄 Actualizar Datos", help="Recargar datos desde la base de datos"):
@@ -721,6 +755,7 @@ if st.button("🔄 Actualizar Datos", help="Recargar datos desde la base de dato
     st.session_state.usuarios = cargar_usuarios()
     st.session_state.clientes = cargar_clientes()
     st.session_state.contactos = cargar_contactos()
+    solicitar_actualizacion()
     st.session_state.tipo_cambio_actual = obtener_tipo_cambio_actual()
     st.success("✅ Datos actualizados!")
     st.rerun()
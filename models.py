@@ -2,8 +2,10 @@ from datetime import datetime
 from datetime import timedelta
 from enum import Enum
 import random
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Boolean, ForeignKey, Text, Index, text
 from sqlalchemy.orm import relationship, declarative_base
+from alertas import nivel_alerta
+from configuracion import configuracion
 
 Base = declarative_base()
 
@@ -81,6 +83,10 @@ class TiposArchivo(Base):
 
 class ProyectoArchivos(Base):
     __tablename__ = 'proyecto_archivos'
+    __table_args__ = (
+        # Último archivo por proyecto y tipo (ver ultimos_archivos.py)
+        Index('ix_proyecto_archivos_ultimo', 'proyecto_id', 'tipo_archivo_id', 'fecha_subida'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     proyecto_id = Column(Integer, ForeignKey('proyectos.id'), nullable=False)
@@ -91,6 +97,7 @@ class ProyectoArchivos(Base):
     ruta_archivo = Column(String(500), nullable=False)    # ← Coincide con BD
     fecha_subida = Column(DateTime, default=datetime.now)
     descripcion = Column(Text)
+    tamanio_bytes = Column(Integer)  # Tamaño registrado al subir (reconciliación)
 
 
     # Relaciones (ajustar nombres)
@@ -113,6 +120,76 @@ class EventoHistorial(Base):
     proyecto = relationship("Proyecto", back_populates="historial")
     usuario = relationship("Usuario")
 
+class TransicionEstado(Base):
+    __tablename__ = 'transiciones_estado'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    proyecto_id = Column(Integer, ForeignKey('proyectos.id'), nullable=False)
+    estado_origen = Column(String(20))
+    estado_destino = Column(String(20), nullable=False)
+    fecha = Column(DateTime, default=datetime.now, nullable=False)
+    usuario_id = Column(Integer, ForeignKey('usuarios.id'))
+    evento_id = Column(Integer, ForeignKey('eventos_historial.id'), unique=True)  # Evento de texto equivalente
+
+    proyecto = relationship("Proyecto", back_populates="transiciones")
+    usuario = relationship("Usuario")
+    evento = relationship("EventoHistorial")
+
+    def __str__(self):
+        return f"{self.estado_origen} → {self.estado_destino} ({self.fecha})"
+
+class TipoCambio(Base):
+    __tablename__ = 'tipos_cambio'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    fecha = Column(Date, unique=True, nullable=False)  # Un registro por día (USD -> PEN)
+    compra = Column(Float)
+    venta = Column(Float, nullable=False)
+    origen = Column(String(50), default="SUNAT")
+    fecha_registro = Column(DateTime, default=datetime.now)
+
+    def __str__(self):
+        return f"{self.fecha}: {self.venta}"
+
+class SnapshotPipeline(Base):
+    __tablename__ = 'snapshots_pipeline'
+    __table_args__ = (
+        # Una fila por día y combinación de estado, ejecutivo y moneda; IFNULL porque en
+        # SQLite dos NULL nunca chocan y los grupos sin asignar se duplicarían
+        Index('ux_snapshots_pipeline_grupo', 'fecha', 'estado', text('IFNULL(asignado_a_id, 0)'), 'moneda', unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    fecha = Column(Date, nullable=False)
+    estado = Column(String(20), nullable=False)
+    asignado_a_id = Column(Integer, ForeignKey('usuarios.id'))
+    moneda = Column(String(10), nullable=False)
+    cantidad = Column(Integer, nullable=False)
+    valor = Column(Float, nullable=False)             # En la moneda del grupo
+    valor_ponderado = Column(Float, nullable=False)   # valor × probabilidad de cierre
+    fecha_registro = Column(DateTime, default=datetime.now)
+
+    def __str__(self):
+        return f"{self.fecha} {self.estado}/{self.moneda}: {self.cantidad}"
+
+class NotificacionEnviada(Base):
+    __tablename__ = 'notificaciones_enviadas'
+    __table_args__ = (
+        # Una alerta se notifica una sola vez por nivel y fecha límite
+        Index('ux_notificaciones_alerta', 'usuario_id', 'proyecto_id', 'tipo', 'nivel', 'fecha_limite', unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    usuario_id = Column(Integer, ForeignKey('usuarios.id'), nullable=False)
+    proyecto_id = Column(Integer, ForeignKey('proyectos.id'), nullable=False)
+    tipo = Column(String(20), nullable=False)       # deadline / entrega
+    nivel = Column(String(20), nullable=False)
+    fecha_limite = Column(DateTime, nullable=False)
+    fecha_envio = Column(DateTime, default=datetime.now)
+
+    def __str__(self):
+        return f"{self.tipo} {self.nivel} proyecto {self.proyecto_id} → usuario {self.usuario_id}"
+
 class Proyecto(Base):
     __tablename__ = 'proyectos'
 
@@ -122,7 +199,7 @@ class Proyecto(Base):
     descripcion = Column(String(1000))
     valor_estimado = Column(Float, nullable=False)
     moneda = Column(String(10), default="PEN")
-    tipo_cambio_historico = Column(Float, default=3.80)
+    tipo_cambio_historico = Column(Float, default=lambda: configuracion().TIPO_CAMBIO_DEFAULT)
 
     cliente_id = Column(Integer, ForeignKey('clientes.id'), nullable=False)
     asignado_a_id = Column(Integer, ForeignKey('usuarios.id'), nullable=False)
@@ -135,7 +212,7 @@ class Proyecto(Base):
     fecha_presentacion_cotizacion = Column(DateTime)
     activo = Column(Boolean, default=True)
     codigo_convocatoria = Column(String(100))
-    probabilidad_cierre = Column(Integer, default=25)
+    probabilidad_cierre = Column(Integer, default=lambda: configuracion().PROBABILIDAD_OPORTUNIDAD)
 
     # NUEVOS CAMPOS
     fecha_ingreso_oc = Column(DateTime)  # Fecha de Ingreso OC
@@ -167,6 +244,7 @@ class Proyecto(Base):
     contacto_principal = relationship("Contacto")
     historial = relationship("EventoHistorial", back_populates="proyecto", order_by="EventoHistorial.timestamp.desc()")
     archivos = relationship("ProyectoArchivos", back_populates="proyecto")
+    transiciones = relationship("TransicionEstado", back_populates="proyecto", order_by="TransicionEstado.fecha")
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -184,25 +262,36 @@ class Proyecto(Base):
         )
         self.historial.append(evento_obj)
         self.fecha_ultima_actualizacion = datetime.now()
+        return evento_obj
 
     def mover_a_estado(self, nuevo_estado, usuario_id=None):
         estado_anterior = self.estado_actual
         self.estado_actual = nuevo_estado.value if isinstance(nuevo_estado, Estado) else nuevo_estado
         self.actualizar_probabilidad_cierre()
-        self.agregar_evento_historial(
+        evento_obj = self.agregar_evento_historial(
             f"Estado cambiado de {estado_anterior} a {self.estado_actual}",
             usuario_id
         )
+        # Registro estructurado para los análisis de tiempos por etapa
+        self.transiciones.append(TransicionEstado(
+            estado_origen=estado_anterior,
+            estado_destino=self.estado_actual,
+            fecha=self.fecha_ultima_actualizacion,
+            usuario_id=usuario_id,
+            evento=evento_obj
+        ))
 
     def actualizar_probabilidad_cierre(self):
+        # PREVENTA arranca como oportunidad; PROBABILIDAD_PREVENTA se asigna al presentar la propuesta
+        inicial = configuracion().PROBABILIDAD_OPORTUNIDAD
         probabilidades = {
-            "OPORTUNIDAD": 25,
-            "PREVENTA": 25,
+            "OPORTUNIDAD": inicial,
+            "PREVENTA": inicial,
             "DELIVERY": 75,
             "COBRANZA": 90,
             "POSTVENTA": 100
         }
-        self.probabilidad_cierre = probabilidades.get(self.estado_actual, 25)
+        self.probabilidad_cierre = probabilidades.get(self.estado_actual, inicial)
 
     def establecer_deadline(self, fecha_deadline, usuario_id=None):
         if isinstance(fecha_deadline, datetime):
@@ -212,58 +301,23 @@ class Proyecto(Base):
                 usuario_id
             )
 
+    def fecha_entrega_estimada(self):
+        if not self.fecha_ingreso_oc or self.plazo_entrega is None:
+            return None
+        return self.fecha_ingreso_oc + timedelta(days=self.plazo_entrega)
+
+    # Niveles y días restantes con los mismos cortes que el motor de alertas por lote
     def obtener_nivel_alerta_deadline(self):
-        if not self.fecha_deadline_propuesta:
-            return 'sin_deadline'
-
-        dias_restantes = (self.fecha_deadline_propuesta - datetime.now()).days
-
-        if dias_restantes < 0:
-            return 'vencido'
-        elif dias_restantes == 0:
-            return 'critico'
-        elif dias_restantes <= 1:
-            return 'muy_urgente'
-        elif dias_restantes <= 3:
-            return 'urgente'
-        elif dias_restantes <= 7:
-            return 'por_vencer'
-        else:
-            return 'disponible'
+        return nivel_alerta(self.fecha_deadline_propuesta)[0]
 
     def obtener_nivel_alerta_entrega(self):
-        if not self.fecha_ingreso_oc:
-            return 'sin_deadline'
-
-        fecha_entrega = self.fecha_ingreso_oc + timedelta(days=self.plazo_entrega)
-        dias_restantes = (fecha_entrega - datetime.now()).days + 1
-
-        if dias_restantes < 0:
-            return 'vencido'
-        elif dias_restantes == 0:
-            return 'critico'
-        elif dias_restantes <= 1:
-            return 'muy_urgente'
-        elif dias_restantes <= 5:
-            return 'urgente'
-        elif dias_restantes <= 7:
-            return 'por_vencer'
-        else:
-            return 'disponible'
-
-
+        return nivel_alerta(self.fecha_entrega_estimada())[0]
 
     def dias_restantes_deadline(self):
-        if not self.fecha_deadline_propuesta:
-            return None
-        return (self.fecha_deadline_propuesta - datetime.now()).days
+        return nivel_alerta(self.fecha_deadline_propuesta)[1]
 
     def dias_restantes_entrega(self):
-        if not self.fecha_ingreso_oc:
-            return None
-        fecha_entrega = self.fecha_ingreso_oc + timedelta(days=self.plazo_entrega)
-        dias_restantes = (fecha_entrega - datetime.now()).days + 1
-        return dias_restantes
+        return nivel_alerta(self.fecha_entrega_estimada())[1]
 
     def agregar_archivo(self, tipo_archivo_id, usuario_id, nombre_original, nombre_almacenado,
                        ruta_archivo, tamanio_bytes, descripcion=None):
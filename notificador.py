@@ -0,0 +1,331 @@
+import argparse
+import logging
+import os
+import smtplib
+import socketserver
+import threading
+import time
+from datetime import datetime
+from email.message import EmailMessage
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.orm import joinedload
+
+from alertas import alertas_portafolio
+from configuracion import configuracion
+from database import SessionLocal, engine, asegurar_esquema
+from models import Proyecto, Estado, NotificacionEnviada
+from portafolio import construir_portafolio
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Configuración
+# ==============================
+INTERVALO_NOTIFICACION = int(os.environ.get("NOTIFICACION_INTERVALO", "900"))  # segundos entre revisiones
+SMTP_HOST = os.environ.get("SMTP_HOST")  # Sin host el hilo no se inicia
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "25"))
+SMTP_USUARIO = os.environ.get("SMTP_USUARIO")
+SMTP_CLAVE = os.environ.get("SMTP_CLAVE")
+SMTP_TLS = os.environ.get("SMTP_TLS", "0") == "1"
+REINTENTOS_SMTP = 3
+ESPERA_REINTENTO = 2  # segundos; se duplica en cada intento
+
+# Niveles del motor de alertas que generan correo
+NIVELES_NOTIFICAR = ('vencido', 'critico', 'muy_urgente')
+
+TIPOS = {
+    'deadline': "Deadline de propuesta",
+    'entrega': "Plazo de entrega",
+}
+
+_esquema_listo = False
+
+def _asegurar_tabla():
+    global _esquema_listo
+    if not _esquema_listo:
+        asegurar_esquema(NotificacionEnviada.__table__)
+        _esquema_listo = True
+
+# ==============================
+# Evaluación de alertas
+# ==============================
+def evaluar_alertas(ahora=None):
+    """Alertas a notificar de todos los proyectos activos (una pasada del motor de alertas).
+
+    Deadline: OPORTUNIDAD y PREVENTA sin propuesta presentada.
+    Entrega: DELIVERY aún no entregado.
+    """
+    ahora = ahora or datetime.now()
+    db = SessionLocal()
+    try:
+        proyectos = db.query(Proyecto).options(joinedload(Proyecto.asignado_a), joinedload(Proyecto.cliente)).filter(
+            Proyecto.activo == True,
+            Proyecto.asignado_a_id.isnot(None),
+            Proyecto.estado_actual.in_([Estado.OPORTUNIDAD.value, Estado.PREVENTA.value, Estado.DELIVERY.value]),
+        ).all()
+    finally:
+        db.close()
+
+    columnas = ['usuario_id', 'nombre_usuario', 'email', 'proyecto_id', 'codigo_proyecto', 'nombre', 'cliente',
+                'tipo', 'nivel', 'fecha_limite', 'dias']
+    if not proyectos:
+        return pd.DataFrame(columns=columnas)
+
+    portafolio = construir_portafolio(proyectos, ahora)
+    niveles = alertas_portafolio(portafolio, ahora)
+    fecha_entrega = portafolio['fecha_ingreso_oc'] + pd.to_timedelta(portafolio['plazo_entrega'].astype(float), unit='D')
+    entregado = pd.Series([bool(p.entregado) for p in proyectos], index=portafolio.index)
+
+    aplica_deadline = (portafolio['estado'].isin([Estado.OPORTUNIDAD.value, Estado.PREVENTA.value])
+                       & portafolio['fecha_presentacion_cotizacion'].isna()
+                       & niveles['nivel_deadline'].isin(NIVELES_NOTIFICAR))
+    aplica_entrega = ((portafolio['estado'] == Estado.DELIVERY.value) & ~entregado
+                      & niveles['nivel_entrega'].isin(NIVELES_NOTIFICAR))
+
+    por_id = {p.id: p for p in proyectos}
+    filas = []
+    for tipo, mascara, nivel, dias, fecha in (
+        ('deadline', aplica_deadline, 'nivel_deadline', 'dias_deadline', portafolio['fecha_deadline_propuesta']),
+        ('entrega', aplica_entrega, 'nivel_entrega', 'dias_entrega', fecha_entrega),
+    ):
+        for proyecto_id in portafolio.index[mascara]:
+            proyecto = por_id[proyecto_id]
+            filas.append({
+                'usuario_id': proyecto.asignado_a_id,
+                'nombre_usuario': proyecto.asignado_a.nombre,
+                'email': proyecto.asignado_a.email if proyecto.asignado_a.activo else None,
+                'proyecto_id': proyecto_id,
+                'codigo_proyecto': proyecto.codigo_proyecto,
+                'nombre': proyecto.nombre,
+                'cliente': proyecto.cliente.nombre if proyecto.cliente else "Sin cliente",
+                'tipo': tipo,
+                'nivel': niveles.at[proyecto_id, nivel],
+                'fecha_limite': fecha[proyecto_id].to_pydatetime(),
+                'dias': int(niveles.at[proyecto_id, dias]),
+            })
+    return pd.DataFrame(filas, columns=columnas)
+
+# ==============================
+# Deduplicación
+# ==============================
+def _reservar(alertas):
+    """Registra las alertas antes de enviarlas; devuelve solo las que nadie había registrado.
+
+    INSERT OR IGNORE sobre el índice único hace que dos procesos revisando a la
+    vez nunca envíen la misma alerta.
+    """
+    _asegurar_tabla()
+    reservadas = []
+    with engine.begin() as conn:
+        for alerta in alertas.itertuples():
+            resultado = conn.execute(text("""
+                INSERT OR IGNORE INTO notificaciones_enviadas (usuario_id, proyecto_id, tipo, nivel, fecha_limite, fecha_envio)
+                VALUES (:usuario_id, :proyecto_id, :tipo, :nivel, :fecha_limite, :fecha_envio)
+            """), {
+                'usuario_id': int(alerta.usuario_id), 'proyecto_id': int(alerta.proyecto_id), 'tipo': alerta.tipo,
+                'nivel': alerta.nivel, 'fecha_limite': alerta.fecha_limite.isoformat(sep=' '),
+                'fecha_envio': datetime.now().isoformat(sep=' '),
+            })
+            if resultado.rowcount:
+                reservadas.append(alerta.Index)
+    return alertas.loc[reservadas]
+
+def _liberar(alertas):
+    """Quita las reservas de un envío fallido para reintentarlo en la próxima revisión"""
+    with engine.begin() as conn:
+        for alerta in alertas.itertuples():
+            conn.execute(text("""
+                DELETE FROM notificaciones_enviadas
+                WHERE usuario_id = :usuario_id AND proyecto_id = :proyecto_id AND tipo = :tipo
+                  AND nivel = :nivel AND fecha_limite = :fecha_limite
+            """), {
+                'usuario_id': int(alerta.usuario_id), 'proyecto_id': int(alerta.proyecto_id), 'tipo': alerta.tipo,
+                'nivel': alerta.nivel, 'fecha_limite': alerta.fecha_limite.isoformat(sep=' '),
+            })
+
+# ==============================
+# Digest y envío SMTP
+# ==============================
+def componer_digest(nombre_usuario, email, alertas, remitente, ahora=None):
+    """Un correo con todas las alertas del usuario, las más urgentes primero"""
+    ahora = ahora or datetime.now()
+    alertas = alertas.sort_values(['dias', 'codigo_proyecto'])
+    vencidas = int((alertas['nivel'] == 'vencido').sum())
+
+    mensaje = EmailMessage()
+    mensaje['From'] = remitente
+    mensaje['To'] = email
+    mensaje['Subject'] = (f"⚠️ {len(alertas)} alertas de proyectos"
+                          f"{f' ({vencidas} vencidas)' if vencidas else ''} - {ahora.strftime('%d/%m/%Y')}")
+
+    lineas = [f"Hola {nombre_usuario},", "", "Estos proyectos requieren atención:", ""]
+    for tipo, etiqueta in TIPOS.items():
+        del_tipo = alertas[alertas['tipo'] == tipo]
+        if del_tipo.empty:
+            continue
+        lineas.append(f"{etiqueta}:")
+        for alerta in del_tipo.itertuples():
+            texto_dias = f"{abs(alerta.dias)} días {'pasados' if alerta.dias < 0 else 'restantes'}"
+            lineas.append(f"  - {alerta.codigo_proyecto} {alerta.nombre} ({alerta.cliente}): "
+                          f"{alerta.fecha_limite.strftime('%d/%m/%Y')} · {texto_dias} [{alerta.nivel}]")
+        lineas.append("")
+    lineas.append("Este resumen se envía una sola vez por cada cambio de nivel de alerta.")
+    mensaje.set_content("\n".join(lineas))
+    return mensaje
+
+def enviar_correo(mensaje, host=None, puerto=None):
+    """Envía por SMTP con reintentos y espera creciente; devuelve True si se entregó"""
+    host, puerto = host or SMTP_HOST, puerto or SMTP_PORT
+    espera = ESPERA_REINTENTO
+    for intento in range(1, REINTENTOS_SMTP + 1):
+        try:
+            with smtplib.SMTP(host, puerto, timeout=10) as servidor:
+                if SMTP_TLS:
+                    servidor.starttls()
+                if SMTP_USUARIO:
+                    servidor.login(SMTP_USUARIO, SMTP_CLAVE or "")
+                servidor.send_message(mensaje)
+            return True
+        except (smtplib.SMTPException, OSError) as e:
+            logger.warning(f"Envío a {mensaje['To']} falló (intento {intento}/{REINTENTOS_SMTP}): {e}")
+            if intento < REINTENTOS_SMTP:
+                time.sleep(espera)
+                espera *= 2
+    return False
+
+def notificar(ahora=None, host=None, puerto=None, simular=False):
+    """Una revisión completa: evalúa, agrupa por usuario y envía un digest a cada uno"""
+    ahora = ahora or datetime.now()
+    alertas = evaluar_alertas(ahora)
+    resumen = {'alertas': len(alertas), 'usuarios': 0, 'enviados': 0, 'fallidos': 0, 'sin_email': 0}
+    if alertas.empty:
+        return resumen
+
+    remitente = configuracion().EMAIL_NOTIFICACIONES
+    for (usuario_id, nombre_usuario, email), del_usuario in alertas.groupby(
+            ['usuario_id', 'nombre_usuario', 'email'], dropna=False):
+        if not isinstance(email, str) or not email:
+            resumen['sin_email'] += 1
+            continue
+        if simular:
+            mensaje = componer_digest(nombre_usuario, email, del_usuario, remitente, ahora)
+            print(f"Para: {mensaje['To']}\nAsunto: {mensaje['Subject']}\n\n{mensaje.get_content()}")
+            continue
+
+        nuevas = _reservar(del_usuario)
+        if nuevas.empty:
+            continue
+        resumen['usuarios'] += 1
+        if enviar_correo(componer_digest(nombre_usuario, email, nuevas, remitente, ahora), host, puerto):
+            resumen['enviados'] += 1
+        else:
+            _liberar(nuevas)
+            resumen['fallidos'] += 1
+    return resumen
+
+# ==============================
+# Hilo en segundo plano
+# ==============================
+_hilo = None
+_hilo_lock = threading.Lock()
+
+def _ciclo_notificaciones():
+    while True:
+        try:
+            resumen = notificar()
+            if resumen['enviados'] or resumen['fallidos']:
+                logger.info(f"Notificaciones: {resumen}")
+        except Exception as e:
+            logger.error(f"Error enviando notificaciones: {e}")
+        time.sleep(INTERVALO_NOTIFICACION)
+
+def iniciar_notificador():
+    """Inicia (una sola vez por proceso) el hilo de notificaciones; sin SMTP_HOST no hace nada"""
+    global _hilo
+    if not SMTP_HOST:
+        return
+    with _hilo_lock:
+        if _hilo is None or not _hilo.is_alive():
+            _hilo = threading.Thread(target=_ciclo_notificaciones, name="notificador", daemon=True)
+            _hilo.start()
+
+# ==============================
+# Sumidero SMTP local (pruebas)
+# ==============================
+class _SesionSMTP(socketserver.StreamRequestHandler):
+    """Lo mínimo del protocolo SMTP para recibir y guardar mensajes"""
+
+    def _responder(self, linea):
+        self.wfile.write(f"{linea}\r\n".encode())
+
+    def handle(self):
+        self._responder("220 sumidero listo")
+        remitente, destinatarios = None, []
+        while True:
+            linea = self.rfile.readline()
+            if not linea:
+                return
+            comando = linea.decode(errors='replace').strip()
+            verbo = comando[:4].upper()
+            if verbo in ('HELO', 'EHLO'):
+                self._responder("250 sumidero")
+            elif verbo == 'MAIL':
+                remitente, destinatarios = comando.split(':', 1)[1].strip(), []
+                self._responder("250 OK")
+            elif verbo == 'RCPT':
+                destinatarios.append(comando.split(':', 1)[1].strip())
+                self._responder("250 OK")
+            elif verbo == 'DATA':
+                self._responder("354 fin con <CRLF>.<CRLF>")
+                cuerpo = []
+                for dato in self.rfile:
+                    if dato in (b".\r\n", b".\n"):
+                        break
+                    cuerpo.append(dato[1:] if dato.startswith(b"..") else dato)
+                self.server.mensajes.append({'de': remitente, 'para': destinatarios, 'datos': b"".join(cuerpo)})
+                self._responder("250 OK")
+            elif verbo == 'QUIT':
+                self._responder("221 adiós")
+                return
+            else:
+                self._responder("250 OK")
+
+class SumideroSMTP(socketserver.ThreadingTCPServer):
+    """Servidor SMTP local que acepta todo y guarda los mensajes en `mensajes`"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", puerto=1025):
+        super().__init__((host, puerto), _SesionSMTP)
+        self.mensajes = []
+
+    def iniciar(self):
+        threading.Thread(target=self.serve_forever, name="sumidero-smtp", daemon=True).start()
+        return self
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Notificaciones de deadlines y entregas por correo")
+    parser.add_argument("--una-vez", action="store_true", help="Hacer una sola revisión y salir")
+    parser.add_argument("--simular", action="store_true", help="Imprimir los digests sin enviar ni registrar")
+    parser.add_argument("--sumidero", type=int, metavar="PUERTO", help="Levantar un sumidero SMTP local y enviar ahí")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    host, puerto = None, None
+    if args.sumidero:
+        sumidero = SumideroSMTP(puerto=args.sumidero).iniciar()
+        host, puerto = "127.0.0.1", args.sumidero
+    if not (host or SMTP_HOST or args.simular):
+        parser.error("Configura SMTP_HOST o usa --sumidero / --simular")
+
+    while True:
+        print(notificar(host=host, puerto=puerto, simular=args.simular))
+        if args.sumidero:
+            for mensaje in sumidero.mensajes:
+                print(f"📨 {mensaje['para']} ({len(mensaje['datos'])} bytes)")
+            sumidero.mensajes.clear()
+        if args.una_vez or args.simular:
+            break
+        time.sleep(INTERVALO_NOTIFICACION)
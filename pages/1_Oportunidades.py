@@ -8,6 +8,16 @@ import os
 import re
 from models import Proyecto, Estado, Usuario, Cliente, Contacto, TiposArchivo, ProyectoArchivos
 from database import SessionLocal
+from panel_exportacion import panel_exportacion
+from indice_documentos import encolar_archivo
+from previsualizacion import obtener_previsualizacion, soporta_previsualizacion
+from cache_tarjetas import tarjeta_cacheada
+from ultimos_archivos import obtener_ultimos_archivos_proyecto
+from portafolio import construir_portafolio, convertir_columna, tasas_para_base, BASES_TIPO_CAMBIO
+from cubo_pipeline import kpis_pipeline
+from alertas import alertas_por_id, estilo_alerta
+from configuracion import configuracion
+from filtros_proyectos import FiltroProyectos, RIESGOS, ETIQUETAS_PLAZO, SIN_PLAZO, condicion_niveles_deadline
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from sqlalchemy.orm import joinedload
@@ -75,19 +85,6 @@ def verificar_archivo_duplicado(proyecto_id, tipo_archivo, nombre_archivo):
     
     return os.path.exists(ruta_completa), nombre_final, ruta_completa
 
-def obtener_ultimo_tdr(proyecto_id):
-    """Obtiene el último TDR subido para un proyecto"""
-    db = SessionLocal()
-    try:
-        tdr = db.query(ProyectoArchivos).filter(
-            ProyectoArchivos.proyecto_id == proyecto_id,
-            ProyectoArchivos.tipo_archivo_id == 1  # ID para TDR
-        ).order_by(ProyectoArchivos.fecha_subida.desc()).first()
-        
-        return tdr
-    finally:
-        db.close()
-
 def obtener_archivos_proyecto(proyecto_id):
     """Obtiene todos los archivos de un proyecto"""
     db = SessionLocal()
@@ -125,7 +122,8 @@ def subir_archivo_proyecto(proyecto_id, tipo_archivo_id, archivo, usuario_id):
         
         # Guardar archivo en filesystem
         with open(ruta_completa, "wb") as f:
-            f.write(archivo.getvalue())
+            contenido = archivo.getvalue()
+            f.write(contenido)
         
         # Registrar en BD
         nuevo_archivo = ProyectoArchivos(
@@ -133,11 +131,15 @@ def subir_archivo_proyecto(proyecto_id, tipo_archivo_id, archivo, usuario_id):
             tipo_archivo_id=tipo_archivo_id,
             nombre_archivo=archivo.name,
             ruta_archivo=ruta_completa,
-            subido_por_id=usuario_id
+            subido_por_id=usuario_id,
+            tamanio_bytes=len(contenido)
         )
         
         db.add(nuevo_archivo)
         db.commit()
+
+        # Extraer texto e indexar en segundo plano
+        encolar_archivo(nuevo_archivo.id)
         
         return nuevo_archivo
     except Exception as e:
@@ -159,17 +161,11 @@ def get_db():
     finally:
         db.close()
 
-def cargar_proyectos_activos():
-    """Carga solo proyectos activos con todas las relaciones usando ORM"""
+def cargar_proyectos_activos(filtro):
+    """Carga los proyectos activos que cumplen el filtro, con sus relaciones (una sola consulta)"""
     try:
         db = SessionLocal()
-        proyectos = db.query(Proyecto).filter(Proyecto.activo == True).all()
-
-        # Cargar relaciones para evitar lazy loading
-        for proyecto in proyectos:
-            _ = proyecto.cliente
-            _ = proyecto.asignado_a
-            _ = proyecto.contacto_principal
+        proyectos = filtro.consulta(db).all()
 
         db.close()
         return proyectos
@@ -177,6 +173,30 @@ def cargar_proyectos_activos():
         st.error(f"❌ Error cargando proyectos: {str(e)}")
         return []
 
+def cargar_proyecto_activo(filtro, proyecto_id):
+    """Carga un proyecto por id si cumple el filtro, con sus relaciones"""
+    try:
+        db = SessionLocal()
+        proyecto = filtro.consulta(db).filter(Proyecto.id == proyecto_id).first()
+
+        db.close()
+        return proyecto
+    except Exception as e:
+        st.error(f"❌ Error cargando proyecto: {str(e)}")
+        return None
+
+def contar_proyectos(filtro, **casos):
+    """Total y conteos por caso de los proyectos que cumplen el filtro (una consulta agregada)"""
+    try:
+        db = SessionLocal()
+        conteos = filtro.conteos(db, **casos)
+
+        db.close()
+        return conteos
+    except Exception as e:
+        st.error(f"❌ Error contando proyectos: {str(e)}")
+        return dict.fromkeys(['total', *casos], 0)
+
 
 def cargar_historial_proyecto(proyecto_id):
     """Carga el historial de eventos para un proyecto específico"""
@@ -203,7 +223,7 @@ def crear_proyecto_orm(proyecto_data):
             descripcion=proyecto_data['descripcion'],
             valor_estimado=proyecto_data['valor_estimado'],
             moneda=proyecto_data['moneda'],
-            tipo_cambio_historico=proyecto_data.get('tipo_cambio', 3.80),
+            tipo_cambio_historico=proyecto_data.get('tipo_cambio', configuracion().TIPO_CAMBIO_DEFAULT),
             cliente_id=proyecto_data['cliente_id'],
             asignado_a_id=proyecto_data['asignado_a_id'],
             estado_actual=Estado.OPORTUNIDAD.value,
@@ -235,7 +255,7 @@ def actualizar_proyecto_orm(proyecto_id, datos_actualizados):
         proyecto.descripcion = datos_actualizados['descripcion']
         proyecto.valor_estimado = datos_actualizados['valor_estimado']
         proyecto.moneda = datos_actualizados['moneda']
-        proyecto.tipo_cambio_historico = datos_actualizados.get('tipo_cambio', 3.80)
+        proyecto.tipo_cambio_historico = datos_actualizados.get('tipo_cambio', configuracion().TIPO_CAMBIO_DEFAULT)
         proyecto.cliente_id = datos_actualizados['cliente_id']
         proyecto.asignado_a_id = datos_actualizados['asignado_a_id']
         proyecto.fecha_deadline_propuesta = datos_actualizados.get('fecha_deadline')
@@ -307,6 +327,40 @@ def mover_a_preventa_orm(proyecto_id):
         db.rollback()
         raise e
 
+def aplicar_en_lote_orm(proyecto_ids, accion):
+    """Aplica `accion(proyecto)` a varios proyectos en una sola transacción"""
+    db = SessionLocal()
+    try:
+        proyectos = db.query(Proyecto).filter(Proyecto.id.in_([int(pid) for pid in proyecto_ids])).all()
+        for proyecto in proyectos:
+            accion(proyecto)
+        db.commit()
+        return len(proyectos)
+    except Exception as e:
+        db.rollback()
+        raise e
+    finally:
+        db.close()
+
+def registrar_contacto_lote_orm(proyecto_ids):
+    """Registra un contacto en varios proyectos"""
+    def registrar(proyecto):
+        proyecto.agregar_evento_historial(f"Contacto registrado el {datetime.now().strftime('%d/%m/%Y %H:%M')}")
+        proyecto.fecha_ultima_actualizacion = datetime.now()
+    return aplicar_en_lote_orm(proyecto_ids, registrar)
+
+def eliminar_proyectos_lote_orm(proyecto_ids):
+    """Soft delete de varios proyectos"""
+    def eliminar(proyecto):
+        proyecto.activo = False
+        proyecto.fecha_ultima_actualizacion = datetime.now()
+        proyecto.agregar_evento_historial(f"Eliminado el {datetime.now().strftime('%d/%m/%Y %H:%M')}")
+    return aplicar_en_lote_orm(proyecto_ids, eliminar)
+
+def mover_a_preventa_lote_orm(proyecto_ids):
+    """Mueve varias oportunidades a preventa"""
+    return aplicar_en_lote_orm(proyecto_ids, lambda proyecto: proyecto.mover_a_estado(Estado.PREVENTA))
+
 def cargar_usuarios_activos():
     """Carga usuarios activos"""
     try:
@@ -343,10 +397,11 @@ def cargar_contactos_activos():
 # ==============================
 # Funciones de conversión de moneda (mantenidas igual)
 # ==============================
-def convertir_moneda(valor, moneda_origen, moneda_destino, tipo_cambio=3.8):
+def convertir_moneda(valor, moneda_origen, moneda_destino, tipo_cambio=None):
     """Convierte un valor entre PEN y USD"""
     if moneda_origen == moneda_destino:
         return valor
+    tipo_cambio = tipo_cambio or configuracion().TIPO_CAMBIO_DEFAULT
 
     if moneda_origen == 'PEN' and moneda_destino == 'USD':
         return valor / tipo_cambio
@@ -367,51 +422,29 @@ def formatear_moneda(valor, moneda):
 # ==============================
 def obtener_estilo_deadline(nivel_alerta):
     """Devuelve estilo CSS según el nivel de alerta del deadline"""
-    estilos = {
-        'vencido': {'color': '#666666', 'icono': '☠️', 'fondo': '#F5F5F5'},
-        'critico': {'color': '#dc2626', 'icono': '🔥', 'fondo': '#fef2f2'},
-        'muy_urgente': {'color': '#ea580c', 'icono': '⏰', 'fondo': '#fff7ed'},
-        'urgente': {'color': '#ea580c', 'icono': '⏳', 'fondo': '#fff7ed'},
-        'por_vencer': {'color': '#ca8a04', 'icono': '📅', 'fondo': '#fefce8'},
-        'disponible': {'color': '#16a34a', 'icono': '✅', 'fondo': '#f0fdf4'},
-        'sin_deadline': {'color': '#16a34a', 'icono': '📌', 'fondo': '#f0fdf4'}
-    }
-    return estilos.get(nivel_alerta, estilos['sin_deadline'])
+    return estilo_alerta(nivel_alerta)
 
 def calcular_criticidad_deadline(proyecto):
-    """Calcula la criticidad basada en el deadline"""
-    if not proyecto.fecha_deadline_propuesta:
-        return 'sin_deadline'
-
-    dias_restantes = (proyecto.fecha_deadline_propuesta - datetime.now()).days
-
-    if dias_restantes < 0:
-        return 'vencido'
-    elif dias_restantes == 0:
-        return 'critico'
-    elif dias_restantes <= 1:
-        return 'muy_urgente'
-    elif dias_restantes <= 3:
-        return 'urgente'
-    elif dias_restantes <= 7:
-        return 'por_vencer'
-    else:
-        return 'disponible'
+    """Nivel del deadline desde el motor de alertas (calculado por lote en cada recarga)"""
+    alerta = alertas_proyectos.get(proyecto.id)
+    return alerta['nivel_deadline'] if alerta else proyecto.obtener_nivel_alerta_deadline()
 
 def get_color_riesgo(dias_sin_actualizar):
     """Determina el color según la criticidad por inactividad"""
-    if dias_sin_actualizar > 15:
+    config = configuracion()
+    if dias_sin_actualizar > config.DIAS_ALERTA_CRITICO:
         return "#ff4b4b"
-    elif dias_sin_actualizar > 7:
+    elif dias_sin_actualizar > config.DIAS_ALERTA_RIESGO:
         return "#ffa64b"
     else:
         return "#4caf50"
 
 def get_estado_riesgo(dias_sin_actualizar):
     """Determina el estado textual del riesgo por inactividad"""
-    if dias_sin_actualizar > 15:
+    config = configuracion()
+    if dias_sin_actualizar > config.DIAS_ALERTA_CRITICO:
         return "Crítico"
-    elif dias_sin_actualizar > 7:
+    elif dias_sin_actualizar > config.DIAS_ALERTA_RIESGO:
         return "En Riesgo"
     else:
         return "Normal"
@@ -428,6 +461,9 @@ MONEDAS_DISPONIBLES = ['PEN', 'USD']
 if 'editing_project' not in st.session_state:
     st.session_state.editing_project = None
 
+# Tarjetas retiradas desde su fragmento (movidas o eliminadas); se limpia en cada recarga completa
+st.session_state.tarjetas_retiradas = {}
+
 # Session state para modales de archivos
 if 'modal_archivos_abierto' not in st.session_state:
     st.session_state.modal_archivos_abierto = False
@@ -443,8 +479,14 @@ st.page_link("main_app.py", label="🔙 Volver al Workflow Principal")
 # ==============================
 # Cargar datos desde ORM
 # ==============================
-proyectos_todos = cargar_proyectos_activos()
-proyectos_oportunidades = [p for p in proyectos_todos if p.estado_actual == Estado.OPORTUNIDAD.value]
+# Totales y prioridades del estado por agregados SQL; solo se cargan los proyectos filtrados
+filtro_estado = FiltroProyectos(estado=Estado.OPORTUNIDAD.value)
+conteos_oportunidades = contar_proyectos(
+    filtro_estado,
+    alta=condicion_niveles_deadline(['vencido', 'critico', 'muy_urgente'], filtro_estado.ahora),
+    media=condicion_niveles_deadline(['urgente', 'por_vencer'], filtro_estado.ahora),
+    baja=condicion_niveles_deadline(['disponible', SIN_PLAZO], filtro_estado.ahora),
+)
 
 # Cargar datos para selects
 usuarios_db = cargar_usuarios_activos()
@@ -458,6 +500,8 @@ CLIENTES_DISPONIBLES = [c.nombre for c in clientes_db]
 # Mapeos para IDs
 usuario_nombre_a_id = {u.nombre: u.id for u in usuarios_db}
 cliente_nombre_a_id = {c.nombre: c.id for c in clientes_db}
+usuario_id_a_nombre = {u.id: u.nombre for u in usuarios_db}
+cliente_id_a_nombre = {c.id: c.nombre for c in clientes_db}
 
 # Cargar tipos de archivo
 tipos_archivo_db = obtener_tipos_archivo()
@@ -465,62 +509,82 @@ tipos_archivo_db = obtener_tipos_archivo()
 # ==============================
 # MODAL PARA GESTIÓN DE ARCHIVOS
 # ==============================
-if st.session_state.modal_archivos_abierto and st.session_state.proyecto_archivos:
-    with st.sidebar:
-        st.header("📁 Gestión de Archivos")
-        st.write(f"Proyecto: **{st.session_state.proyecto_archivos.codigo_proyecto}**")
-        
-        # Subir nuevo archivo
-        with st.expander("📤 Subir nuevo archivo", expanded=True):
-            archivo_subir = st.file_uploader("Seleccionar archivo", type=['pdf', 'docx', 'xlsx', 'jpg', 'png'])
-            tipo_seleccionado = st.selectbox("Tipo de archivo", 
-                                           options=[(t.id, t.nombre) for t in tipos_archivo_db],
-                                           format_func=lambda x: x[1])
-            
-            if archivo_subir and st.button("Subir archivo"):
-                try:
-                    subir_archivo_proyecto(
-                        st.session_state.proyecto_archivos.id,
-                        tipo_seleccionado[0],
-                        archivo_subir,
-                        1  # ID del usuario actual (deberías obtenerlo de session)
-                    )
-                    st.success("✅ Archivo subido correctamente")
-                    time.sleep(1)
-                    st.rerun()
-                except FileExistsError as e:
-                    st.error(f"❌ {str(e)}")
-                except Exception as e:
-                    st.error(f"❌ Error al subir archivo: {str(e)}")
-        
-        # Listar archivos existentes
-        st.divider()
-        st.subheader("Archivos del proyecto")
-        archivos = obtener_archivos_proyecto(st.session_state.proyecto_archivos.id)
-        
-        if not archivos:
-            st.info("📝 No hay archivos subidos para este proyecto")
-        else:
-            for archivo in archivos:
-                with st.expander(f"{archivo.tipo_archivo.nombre}: {archivo.nombre_archivo}"):
-                    st.write(f"**Subido por:** {archivo.usuario.nombre if archivo.usuario else 'N/A'}")
-                    st.write(f"**Fecha:** {archivo.fecha_subida.strftime('%d/%m/%Y %H:%M')}")
-                    st.write(f"**Tamaño:** {os.path.getsize(archivo.ruta_archivo) if os.path.exists(archivo.ruta_archivo) else 'N/A'} bytes")
-                    
-                    if os.path.exists(archivo.ruta_archivo):
-                        with open(archivo.ruta_archivo, "rb") as f:
-                            st.download_button(
-                                "⬇️ Descargar",
-                                f.read(),
-                                archivo.nombre_archivo,
-                                key=f"download_{archivo.id}"
-                            )
-                    else:
-                        st.warning("⚠️ Archivo no encontrado en el filesystem")
-        
-        if st.button("Cerrar gestión de archivos"):
-            st.session_state.modal_archivos_abierto = False
-            st.rerun()
+@st.fragment
+def modal_archivos():
+    """Gestión de archivos del proyecto; subir o cerrar solo recarga este fragmento"""
+    if not (st.session_state.modal_archivos_abierto and st.session_state.proyecto_archivos):
+        return
+
+    st.header("📁 Gestión de Archivos")
+    st.write(f"Proyecto: **{st.session_state.proyecto_archivos.codigo_proyecto}**")
+
+    # Subir nuevo archivo
+    with st.expander("📤 Subir nuevo archivo", expanded=True):
+        archivo_subir = st.file_uploader("Seleccionar archivo", type=['pdf', 'docx', 'xlsx', 'jpg', 'png'])
+        tipo_seleccionado = st.selectbox("Tipo de archivo", 
+                                       options=[(t.id, t.nombre) for t in tipos_archivo_db],
+                                       format_func=lambda x: x[1])
+
+        if archivo_subir and st.button("Subir archivo"):
+            try:
+                subir_archivo_proyecto(
+                    st.session_state.proyecto_archivos.id,
+                    tipo_seleccionado[0],
+                    archivo_subir,
+                    1  # ID del usuario actual (deberías obtenerlo de session)
+                )
+                st.toast("✅ Archivo subido correctamente")
+                st.rerun(scope="fragment")
+            except FileExistsError as e:
+                st.error(f"❌ {str(e)}")
+            except Exception as e:
+                st.error(f"❌ Error al subir archivo: {str(e)}")
+
+    # Listar archivos existentes
+    st.divider()
+    st.subheader("Archivos del proyecto")
+    archivos = obtener_archivos_proyecto(st.session_state.proyecto_archivos.id)
+
+    if not archivos:
+        st.info("📝 No hay archivos subidos para este proyecto")
+    else:
+        for archivo in archivos:
+            with st.expander(f"{archivo.tipo_archivo.nombre}: {archivo.nombre_archivo}"):
+                st.write(f"**Subido por:** {archivo.usuario.nombre if archivo.usuario else 'N/A'}")
+                st.write(f"**Fecha:** {archivo.fecha_subida.strftime('%d/%m/%Y %H:%M')}")
+                st.write(f"**Tamaño:** {os.path.getsize(archivo.ruta_archivo) if os.path.exists(archivo.ruta_archivo) else 'N/A'} bytes")
+
+                # Miniatura y vista previa desde la caché de previsualizaciones
+                if soporta_previsualizacion(archivo.ruta_archivo):
+                    miniatura = obtener_previsualizacion(archivo.ruta_archivo, 'miniatura')
+                    if miniatura:
+                        st.image(miniatura)
+                        if st.toggle("🔍 Vista previa", key=f"preview_{archivo.id}"):
+                            vista = obtener_previsualizacion(archivo.ruta_archivo, 'vista')
+                            if vista:
+                                st.image(vista)
+
+                if os.path.exists(archivo.ruta_archivo):
+                    with open(archivo.ruta_archivo, "rb") as f:
+                        st.download_button(
+                            "⬇️ Descargar",
+                            f.read(),
+                            archivo.nombre_archivo,
+                            key=f"download_{archivo.id}"
+                        )
+                else:
+                    st.warning("⚠️ Archivo no encontrado en el filesystem")
+
+    # Exportación masiva de documentos en ZIP
+    panel_exportacion(st.session_state.proyecto_archivos)
+
+    if st.button("Cerrar gestión de archivos"):
+        st.session_state.modal_archivos_abierto = False
+        st.session_state.exportacion_zip = None
+        st.rerun(scope="fragment")
+
+with st.sidebar:
+    modal_archivos()
 
 # ==============================
 # Sidebar para filtros y vista 
@@ -530,76 +594,76 @@ with st.sidebar:
     vista_modo = st.radio("Modo de vista:", ["Tarjetas", "Tabla"])
 
     moneda_visualizacion = st.selectbox("Moneda para visualización:", MONEDAS_DISPONIBLES)
+    base_tipo_cambio = st.selectbox("Tipo de cambio:", list(BASES_TIPO_CAMBIO),
+                                    format_func=lambda base: BASES_TIPO_CAMBIO[base],
+                                    help="Histórico: el registrado en cada proyecto. Las demás opciones usan el tipo de cambio vigente en esa fecha.")
 
     st.header("🔍 Filtros")
-    filtro_ejecutivo = st.selectbox("Ejecutivo", ["Todos"] + EJECUTIVOS_DISPONIBLES)
-    filtro_cliente = st.selectbox("Cliente", ["Todos"] + CLIENTES_DISPONIBLES)
-    filtro_moneda = st.selectbox("Moneda", ["Todas"] + MONEDAS_DISPONIBLES)
-    filtro_riesgo = st.selectbox("Estado de Riesgo", ["Todos", "Normal", "En Riesgo", "Crítico"])
-    filtro_deadline = st.selectbox("Estado Deadline", ["Todos", "Vencido", "Crítico", "Urgente", "Por Vencer", "Disponible", "Sin Deadline"])
+    filtro_ejecutivo = st.selectbox("Ejecutivo", [None] + [u.id for u in usuarios_db],
+                                    format_func=lambda i: "Todos" if i is None else usuario_id_a_nombre[i])
+    filtro_cliente = st.selectbox("Cliente", [None] + [c.id for c in clientes_db],
+                                  format_func=lambda i: "Todos" if i is None else cliente_id_a_nombre[i])
+    filtro_moneda = st.selectbox("Moneda", [None] + MONEDAS_DISPONIBLES, format_func=lambda m: m or "Todas")
+    filtro_riesgo = st.selectbox("Estado de Riesgo", [None] + list(RIESGOS), format_func=lambda r: r or "Todos")
+    filtro_deadline = st.selectbox("Estado Deadline", [None, 'vencido', 'critico', 'urgente', 'por_vencer', 'disponible', 'sin_deadline'],
+                                   format_func=lambda d: ETIQUETAS_PLAZO.get(d, "Todos"))
 
+# ==============================
+# Aplicar filtros (una sola consulta SQL)
+# ==============================
+proyectos_filtrados = cargar_proyectos_activos(FiltroProyectos(
+    estado=Estado.OPORTUNIDAD.value, asignado_a_id=filtro_ejecutivo, cliente_id=filtro_cliente,
+    moneda=filtro_moneda, riesgo=filtro_riesgo, deadline=filtro_deadline,
+))
+portafolio = construir_portafolio(proyectos_filtrados)
+alertas_proyectos = alertas_por_id(portafolio)
+
+with st.sidebar:
     st.divider()
     st.header("📈 Estadísticas Rápidas")
-    total_oportunidades = len(proyectos_oportunidades)
+    tasas_visualizacion = tasas_para_base(portafolio, base_tipo_cambio)
+    # KPIs desde el cubo del pipeline, con los mismos filtros de ejecutivo, cliente y moneda
+    kpis = kpis_pipeline(
+        moneda_visualizacion, base_tipo_cambio,
+        estados=[Estado.OPORTUNIDAD.value],
+        asignados=None if filtro_ejecutivo is None else [filtro_ejecutivo],
+        clientes=None if filtro_cliente is None else [filtro_cliente],
+        monedas=None if filtro_moneda is None else [filtro_moneda],
+        probabilidad_fija=configuracion().PROBABILIDAD_OPORTUNIDAD,
+    )
+    valores_visualizacion = convertir_columna(portafolio, moneda_visualizacion, tasas_visualizacion).to_dict()
+    total_oportunidades = conteos_oportunidades['total']
     st.metric("Total Oportunidades", total_oportunidades)
 
     if total_oportunidades > 0:
-        valor_total = 0
-        for p in proyectos_oportunidades:
-            valor_convertido = convertir_moneda(
-                p.valor_estimado,
-                p.moneda,
-                moneda_visualizacion,
-                p.tipo_cambio_historico
-            )
-            valor_total += valor_convertido
-
-        st.metric("Valor Total Pipeline", formatear_moneda(valor_total, moneda_visualizacion))
-
-        oportunidades_riesgo = len([p for p in proyectos_oportunidades
-                                   if (datetime.now() - p.fecha_ultima_actualizacion).days > 7])
+        st.metric("Valor Total Pipeline", formatear_moneda(kpis['total'], moneda_visualizacion))
+
+        oportunidades_riesgo = kpis['en_riesgo']
         st.metric("En Riesgo", oportunidades_riesgo, delta=-oportunidades_riesgo if oportunidades_riesgo > 0 else 0)
 
 # ==============================
 # KPIs principales 
 # ==============================
-if proyectos_oportunidades:
+if total_oportunidades:
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        valor_pipeline = 0
-        for p in proyectos_oportunidades:
-            valor_convertido = convertir_moneda(
-                p.valor_estimado * 0.25,  # 25% de probabilidad
-                p.moneda,
-                moneda_visualizacion,
-                p.tipo_cambio_historico
-            )
-            valor_pipeline += valor_convertido
+        valor_pipeline = kpis['ponderado']
 
         st.metric("💰 Valor del Pipeline", formatear_moneda(valor_pipeline, moneda_visualizacion))
 
     with col2:
-        total_valor = 0
-        for p in proyectos_oportunidades:
-            valor_convertido = convertir_moneda(
-                p.valor_estimado,
-                p.moneda,
-                moneda_visualizacion,
-                p.tipo_cambio_historico
-            )
-            total_valor += valor_convertido
+        total_valor = kpis['total']
 
         st.metric("💸 Valor Total Estimado", formatear_moneda(total_valor, moneda_visualizacion))
 
     with col3:
-        avg_valor = total_valor / len(proyectos_oportunidades) if proyectos_oportunidades else 0
+        avg_valor = kpis['promedio']
         st.metric("📊 Valor Promedio", formatear_moneda(avg_valor, moneda_visualizacion))
 
     with col4:
         # Contar oportunidades con deadline vencido
-        oportunidades_vencidas = len([p for p in proyectos_oportunidades
-                                    if p.fecha_deadline_propuesta and p.fecha_deadline_propuesta < datetime.now()])
+        oportunidades_vencidas = kpis['deadlines_vencidos']
         st.metric("⏰ Deadlines Vencidos", oportunidades_vencidas)
 
 # ==============================
@@ -613,7 +677,9 @@ with st.expander("➕ Crear Nueva Oportunidad", expanded=False):
         with col1:
             nombre = st.text_input("Nombre de la Oportunidad*", placeholder="Ej: Proyecto Sistema CRM")
             cliente_nombre = st.selectbox("Cliente*", CLIENTES_DISPONIBLES)
-            moneda = st.selectbox("Moneda*", MONEDAS_DISPONIBLES, index=0)
+            moneda = st.selectbox("Moneda*", MONEDAS_DISPONIBLES,
+                                  index=MONEDAS_DISPONIBLES.index(configuracion().MONEDA_DEFAULT)
+                                  if configuracion().MONEDA_DEFAULT in MONEDAS_DISPONIBLES else 0)
 
         with col2:
             descripcion = st.text_area("Descripción Breve*", placeholder="Describe brevemente el proyecto...")
@@ -621,7 +687,7 @@ with st.expander("➕ Crear Nueva Oportunidad", expanded=False):
             valor_estimado = st.number_input("Valor Estimado*", min_value=0, value=10000, step=1000)
 
         with col3:
-            tipo_cambio = st.number_input("Tipo de Cambio (si aplica)", min_value=0.0, value=3.80, step=0.01,
+            tipo_cambio = st.number_input("Tipo de Cambio (si aplica)", min_value=0.0, value=configuracion().TIPO_CAMBIO_DEFAULT, step=0.01,
                                          disabled=moneda != 'USD',
                                          help="Solo aplicable para moneda USD")
             # Fecha deadline - editable para oportunidades
@@ -668,7 +734,7 @@ with st.expander("➕ Crear Nueva Oportunidad", expanded=False):
                         'descripcion': descripcion,
                         'valor_estimado': valor_estimado,
                         'moneda': moneda,
-                        'tipo_cambio': tipo_cambio if moneda == 'USD' else 3.80,
+                        'tipo_cambio': tipo_cambio if moneda == 'USD' else configuracion().TIPO_CAMBIO_DEFAULT,
                         'cliente_id': cliente_id,
                         'asignado_a_id': asignado_a_id,
                         'fecha_deadline': datetime.combine(fecha_deadline, hora_deadline) if fecha_deadline else None,
@@ -704,7 +770,7 @@ with st.expander("➕ Crear Nueva Oportunidad", expanded=False):
 # Formulario de Edición (MODIFICADO)
 # ==============================
 if st.session_state.editing_project is not None:
-    proyecto_editar = next((p for p in proyectos_oportunidades if p.id == st.session_state.editing_project), None)
+    proyecto_editar = cargar_proyecto_activo(filtro_estado, st.session_state.editing_project)
 
     if proyecto_editar:
         st.markdown("---")
@@ -712,7 +778,7 @@ if st.session_state.editing_project is not None:
             st.info(f"📝 Editando: **{proyecto_editar.codigo_proyecto}** - {proyecto_editar.nombre}")
 
             # Obtener último TDR para mostrar
-            ultimo_tdr = obtener_ultimo_tdr(proyecto_editar.id)
+            ultimo_tdr = obtener_ultimos_archivos_proyecto(proyecto_editar.id, ["TDR"]).get("TDR")
             
             # NUEVA SECCIÓN: Visualización de último TDR
             st.subheader("📎 Documentos TDR")
@@ -875,161 +941,124 @@ if st.session_state.editing_project is not None:
 # ... (Aplicar filtros, Vista de Tarjetas, Vista de Tabla, Footer, etc.) ...
 
 # ==============================
-# Aplicar filtros (mantenido igual)
+# HTML de la tarjeta (memorizado)
 # ==============================
-proyectos_filtrados = proyectos_oportunidades.copy()
-
-if filtro_ejecutivo != "Todos":
-    proyectos_filtrados = [p for p in proyectos_filtrados if p.asignado_a.nombre == filtro_ejecutivo]
-
-if filtro_cliente != "Todos":
-    proyectos_filtrados = [p for p in proyectos_filtrados if p.cliente.nombre == filtro_cliente]
-
-if filtro_moneda != "Todas":
-    proyectos_filtrados = [p for p in proyectos_filtrados if p.moneda == filtro_moneda]
-
-if filtro_riesgo != "Todos":
-    proyectos_filtrados = [p for p in proyectos_filtrados
-                          if get_estado_riesgo((datetime.now() - p.fecha_ultima_actualizacion).days) == filtro_riesgo]
+def dias_restantes_deadline(proyecto):
+    """Días hasta el deadline (None sin deadline); forma parte de la clave de la tarjeta"""
+    if not proyecto.fecha_deadline_propuesta:
+        return None
+    return (proyecto.fecha_deadline_propuesta - datetime.now()).days
 
-if filtro_deadline != "Todos":
-    proyectos_filtrados = [p for p in proyectos_filtrados
-                          if calcular_criticidad_deadline(p) == filtro_deadline.lower().replace(' ', '_')]
+def html_tarjeta_oportunidad(proyecto, valor_convertido, dias_restantes, criticidad_deadline):
+    """HTML de la tarjeta; se memoriza en cache_tarjetas mientras el proyecto y sus días no cambien"""
+    estilo_deadline = obtener_estilo_deadline(criticidad_deadline)
 
-# ==============================
-# Lista de Oportunidades (mantenido igual)
-# ==============================
-st.markdown("---")
-st.header(f"📋 Lista de Oportunidades ({len(proyectos_filtrados)} encontradas)")
+    # Formatear valor según moneda
+    valor_formateado = formatear_moneda(valor_convertido, moneda_visualizacion)
 
-if not proyectos_filtrados:
-    st.info("🔍 No hay oportunidades que coincidan con los filtros aplicados.")
-    st.markdown("**Sugerencias:**")
-    st.markdown("- Cambia los filtros en el sidebar")
-    st.markdown("- Crea una nueva oportunidad usando el formulario de arriba")
+    # Información del deadline
+    if dias_restantes is not None:
+        texto_dias = f"{abs(dias_restantes)} días {'pasados' if dias_restantes < 0 else 'restantes'}"
+        deadline_html = f"""{estilo_deadline['icono']} Deadline: {proyecto.fecha_deadline_propuesta.strftime('%d/%m/%y')} ({texto_dias})"""
+    else:
+        deadline_html = f"{estilo_deadline['icono']} Sin deadline"
+
+    # Tarjeta con estilo basado en el deadline
+    return f"""
+    <div style="
+        border: 2px solid {estilo_deadline['color']};
+        border-radius: 12px;
+        padding: 16px;
+        margin: 8px 0;
+        background: linear-gradient(145deg, {estilo_deadline['color']}08, {estilo_deadline['color']}15);
+        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
+    ">
+        <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px;">
+            <h4 style="color: {estilo_deadline['color']}; margin: 0; font-size: 16px;">{proyecto.codigo_proyecto}</h4>
+        </div>
+        <p style="margin: 8px 0; font-weight: bold; font-size: 14px;">{proyecto.nombre}</p>
+        <p style="margin: 4px 0; font-size: 12px;">👤 {proyecto.asignado_a}</p>
+        <p style="margin: 4px 0; font-size: 12px;">🏢 {proyecto.cliente}</p>
+        <p style="margin: 4px 0; font-size: 12px; color: #666;">💰 {valor_formateado} <small>({proyecto.moneda})</small></p>
+        {deadline_html}
+    </div>
+    """
 
 # ==============================
-# VISTA DE TARJETAS (mantenido igual excepto llamadas a funciones ORM)
+# Tarjeta de proyecto (fragmento)
 # ==============================
-elif vista_modo == "Tarjetas":
-    cols = st.columns(3)
-
-    for i, proyecto in enumerate(proyectos_filtrados):
-        dias_sin_actualizar = (datetime.now() - proyecto.fecha_ultima_actualizacion).days
-        color_riesgo = get_color_riesgo(dias_sin_actualizar)
-        estado_riesgo = get_estado_riesgo(dias_sin_actualizar)
-
-        # Calcular criticidad del deadline
+@st.fragment
+def tarjeta_oportunidad(proyecto, valor_convertido):
+    """Tarjeta con sus acciones; contacto, mover o eliminar solo recargan este fragmento"""
+    if proyecto.id in st.session_state.tarjetas_retiradas:
+        st.info(st.session_state.tarjetas_retiradas[proyecto.id])
+        return
+
+    with st.container():
+        dias_restantes = dias_restantes_deadline(proyecto)
         criticidad_deadline = calcular_criticidad_deadline(proyecto)
-        estilo_deadline = obtener_estilo_deadline(criticidad_deadline)
-
-        # Convertir valor a moneda de visualización
-        valor_convertido = convertir_moneda(
-            proyecto.valor_estimado,
-            proyecto.moneda,
-            moneda_visualizacion,
-            proyecto.tipo_cambio_historico
-        )
-
-        # Formatear valor según moneda
-        valor_formateado = formatear_moneda(valor_convertido, moneda_visualizacion)
+        st.markdown(tarjeta_cacheada("oportunidad", proyecto, moneda_visualizacion, valor_convertido,
+                                     lambda: html_tarjeta_oportunidad(proyecto, valor_convertido, dias_restantes, criticidad_deadline),
+                                     dias_restantes, criticidad_deadline),
+                    unsafe_allow_html=True)
 
-        # Calcular próximo contacto
-        fecha_proximo_contacto = proyecto.fecha_ultima_actualizacion + timedelta(days=random.randint(1, 5))
+        # Botones de acción (actualizados para usar ORM)
+        col1, col2, col3, col4 = st.columns(4)
 
-        with cols[i % 3]:
-            with st.container():
-                # Información del deadline
-                info_deadline = ""
-                if proyecto.fecha_deadline_propuesta:
-                    dias_restantes = (proyecto.fecha_deadline_propuesta - datetime.now()).days
-                    texto_dias = f"{abs(dias_restantes)} días {'pasados' if dias_restantes < 0 else 'restantes'}"
-                    deadline_html = f"""{estilo_deadline['icono']} Deadline: {proyecto.fecha_deadline_propuesta.strftime('%d/%m/%y')} ({texto_dias})"""
-                else:
-                    deadline_html = f"{estilo_deadline['icono']} Sin deadline"
-
-                # Tarjeta con estilo basado en el deadline
-                st.markdown(f"""
-                <div style="
-                    border: 2px solid {estilo_deadline['color']};
-                    border-radius: 12px;
-                    padding: 16px;
-                    margin: 8px 0;
-                    background: linear-gradient(145deg, {estilo_deadline['color']}08, {estilo_deadline['color']}15);
-                    box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-                ">
-                    <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px;">
-                        <h4 style="color: {estilo_deadline['color']}; margin: 0; font-size: 16px;">{proyecto.codigo_proyecto}</h4>
-                    </div>
-                    <p style="margin: 8px 0; font-weight: bold; font-size: 14px;">{proyecto.nombre}</p>
-                    <p style="margin: 4px 0; font-size: 12px;">👤 {proyecto.asignado_a}</p>
-                    <p style="margin: 4px 0; font-size: 12px;">🏢 {proyecto.cliente}</p>
-                    <p style="margin: 4px 0; font-size: 12px; color: #666;">💰 {valor_formateado} <small>({proyecto.moneda})</small></p>
-                    {deadline_html}
-                    <p style="margin: 4px 0; font-size: 11px; color: #666;">📅 Próximo: {fecha_proximo_contacto.strftime('%d/%m')}</p>
-                </div>
-                """, unsafe_allow_html=True)
-
-                # Botones de acción (actualizados para usar ORM)
-                col1, col2, col3, col4 = st.columns(4)
-
-                with col1:
-                    if st.button("✏️", key=f"edit_{proyecto.id}", help="Editar oportunidad"):
-                        st.session_state.editing_project = proyecto.id
-                        st.rerun()
+        with col1:
+            if st.button("✏️", key=f"edit_{proyecto.id}", help="Editar oportunidad"):
+                st.session_state.editing_project = proyecto.id
+                st.rerun()
 
-                with col2:
-                    if st.button("📞", key=f"contact_{proyecto.id}", help="Registrar contacto"):
-                        try:
-                            registrar_contacto_orm(proyecto.id)
-                            st.success("✅ Contacto registrado!")
-                            time.sleep(1)
-                            st.rerun()
-                        except Exception as e:
-                            st.error(f"❌ Error: {str(e)}")
+        with col2:
+            if st.button("📞", key=f"contact_{proyecto.id}", help="Registrar contacto"):
+                try:
+                    registrar_contacto_orm(proyecto.id)
+                    st.toast("✅ Contacto registrado!")
+                    proyecto.fecha_ultima_actualizacion = datetime.now()
+                    st.rerun(scope="fragment")
+                except Exception as e:
+                    st.error(f"❌ Error: {str(e)}")
 
-                with col3:
-                    if st.button("📤", key=f"prev_{proyecto.id}", help="Mover a Preventa"):
-                        try:
-                            mover_a_preventa_orm(proyecto.id)
-                            st.success("✅ Movido a PREVENTA!")
-                            time.sleep(1)
-                            st.rerun()
-                        except Exception as e:
-                            st.error(f"❌ Error: {str(e)}")
+        with col3:
+            if st.button("📤", key=f"prev_{proyecto.id}", help="Mover a Preventa"):
+                try:
+                    mover_a_preventa_orm(proyecto.id)
+                    st.session_state.tarjetas_retiradas[proyecto.id] = "✅ Movido a PREVENTA!"
+                    st.rerun(scope="fragment")
+                except Exception as e:
+                    st.error(f"❌ Error: {str(e)}")
 
-                with col4:
-                    if st.button("🗑️", key=f"delete_{proyecto.id}", help="Eliminar oportunidad"):
-                        try:
-                            eliminar_proyecto_soft_orm(proyecto.id)
-                            st.success("🗑️ Oportunidad eliminada!")
-                            time.sleep(1)
-                            st.rerun()
-                        except Exception as e:
-                            st.error(f"❌ Error: {str(e)}")
+        with col4:
+            if st.button("🗑️", key=f"delete_{proyecto.id}", help="Eliminar oportunidad"):
+                try:
+                    eliminar_proyecto_soft_orm(proyecto.id)
+                    st.session_state.tarjetas_retiradas[proyecto.id] = "🗑️ Oportunidad eliminada!"
+                    st.rerun(scope="fragment")
+                except Exception as e:
+                    st.error(f"❌ Error: {str(e)}")
 
 # ==============================
-# VISTA DE TABLA (mantenido igual excepto llamadas a funciones ORM)
+# Tabla con selección y panel de acciones (fragmento)
 # ==============================
-elif vista_modo == "Tabla":
+if 'version_tabla' not in st.session_state:
+    st.session_state.version_tabla = 0
+
+def limpiar_seleccion_tabla():
+    """Descarta la selección de la tabla (la clave del widget cambia)"""
+    st.session_state.version_tabla += 1
+
+@st.fragment
+def tabla_oportunidades(proyectos):
+    """Tabla con selección nativa de filas y un solo panel de acciones; seleccionar solo recarga este fragmento"""
     data = []
-    #for proyecto in enumerate(proyectos_filtrados):
-    for proyecto in proyectos_filtrados:
+    for proyecto in proyectos:
         dias_sin_actualizar = (datetime.now() - proyecto.fecha_ultima_actualizacion).days
         estado_riesgo = get_estado_riesgo(dias_sin_actualizar)
         criticidad_deadline = calcular_criticidad_deadline(proyecto)
-        estilo_deadline = obtener_estilo_deadline(criticidad_deadline)
-
-        # Convertir valor a moneda de visualización
-        valor_convertido = convertir_moneda(
-            proyecto.valor_estimado,
-            proyecto.moneda,
-            moneda_visualizacion,
-            proyecto.tipo_cambio_historico
-        )
 
         # Formatear valor según moneda
-        valor_formateado = formatear_moneda(valor_convertido, moneda_visualizacion)
+        valor_formateado = formatear_moneda(valores_visualizacion[proyecto.id], moneda_visualizacion)
 
         # Información del deadline
         info_deadline = "Sin deadline"
@@ -1051,75 +1080,135 @@ elif vista_modo == "Tabla":
             "ID": proyecto.id
         })
 
-    if data:
-        df = pd.DataFrame(data)
+    df = pd.DataFrame(data)
 
-        # Aplicar estilos (mantenido igual)
-        def aplicar_color_riesgo(val):
-            if val == 'Crítico':
-                return 'background-color: #ffe6e6; color: #d32f2f; font-weight: bold'
-            elif val == 'En Riesgo':
-                return 'background-color: #fff3e0; color: #f57c00; font-weight: bold'
-            else:
-                return 'background-color: #e8f5e8; color: #388e3c; font-weight: bold'
+    # Estilos por valor único de la columna (no por celda)
+    def aplicar_color_riesgo(val):
+        if val == 'Crítico':
+            return 'background-color: #ffe6e6; color: #d32f2f; font-weight: bold'
+        elif val == 'En Riesgo':
+            return 'background-color: #fff3e0; color: #f57c00; font-weight: bold'
+        else:
+            return 'background-color: #e8f5e8; color: #388e3c; font-weight: bold'
+
+    estilos_deadline = {}
+    for val in df['Estado Deadline'].unique():
+        estilos = obtener_estilo_deadline(val)
+        estilos_deadline[val] = f'background-color: {estilos["fondo"]}; color: {estilos["color"]}; font-weight: bold'
+
+    styled_df = df.style \
+        .map(aplicar_color_riesgo, subset=['Estado Riesgo']) \
+        .map(estilos_deadline.get, subset=['Estado Deadline'])
+
+    # Mostrar tabla sin la columna ID
+    columnas_mostrar = [col for col in df.columns if col != "ID" and col != "Estado Riesgo"]
+    seleccion = st.dataframe(styled_df,
+                             column_config={"ID": None},
+                             hide_index=True,
+                             use_container_width=True,
+                             column_order=columnas_mostrar,
+                             key=f"tabla_oportunidades_{st.session_state.version_tabla}",
+                             on_select="rerun",
+                             selection_mode="multi-row")
+
+    # Panel de acciones sobre la selección
+    ids_seleccionados = df['ID'].iloc[seleccion.selection.rows].tolist()
+    st.markdown("#### 🎛️ Acciones Rápidas")
+
+    if not ids_seleccionados:
+        st.info("ℹ️ Selecciona una o más oportunidades en la tabla para ver las acciones")
+        return
+
+    proyectos_por_id = {p.id: p for p in proyectos}
+    if len(ids_seleccionados) == 1:
+        proyecto = proyectos_por_id[ids_seleccionados[0]]
+        st.info(f"**Seleccionado:** {proyecto.codigo_proyecto} - {proyecto.nombre}")
+    else:
+        st.info(f"**{len(ids_seleccionados)} oportunidades seleccionadas**")
 
-        def aplicar_color_deadline(val):
-            estilos = obtener_estilo_deadline(val)
-            return f'background-color: {estilos["fondo"]}; color: {estilos["color"]}; font-weight: bold'
+    col1, col2, col3, col4, col5, col6 = st.columns(6)
 
-        styled_df = df.style \
-            .applymap(aplicar_color_riesgo, subset=['Estado Riesgo']) \
-            .applymap(aplicar_color_deadline, subset=['Estado Deadline'])
+    with col1:
+        if st.button("✏️ Editar", key="edit_tab", use_container_width=True, type="primary",
+                     disabled=len(ids_seleccionados) != 1, help="Selecciona una sola oportunidad para editar"):
+            st.session_state.editing_project = ids_seleccionados[0]
+            st.rerun()
 
-        # Mostrar tabla sin la columna ID
-        columnas_mostrar = [col for col in df.columns if col != "ID" and col != "Estado Riesgo"]
-        st.dataframe(styled_df.format({"ID": lambda x: ""}),
-                    column_config={"ID": None},
-                    hide_index=True,
-                    use_container_width=True,
-                    column_order=columnas_mostrar)
+    with col2:
+        if st.button("📞 Contacto", key="contact_tab", use_container_width=True):
+            try:
+                cantidad = registrar_contacto_lote_orm(ids_seleccionados)
+                st.toast(f"✅ Contacto registrado en {cantidad} oportunidades")
+                limpiar_seleccion_tabla()
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
 
-        # Acciones masivas (actualizadas para usar ORM)
-        st.markdown("#### 🎛️ Acciones Rápidas")
+    with col3:
+        if st.button("📤 Preventa", key="prev_tab", use_container_width=True):
+            try:
+                cantidad = mover_a_preventa_lote_orm(ids_seleccionados)
+                st.toast(f"✅ {cantidad} oportunidades movidas a PREVENTA")
+                limpiar_seleccion_tabla()
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
 
-        for proyecto in proyectos_filtrados:
-            with st.expander(f"⚙️ Acciones para {proyecto.codigo_proyecto} - {proyecto.nombre}", expanded=False):
-                col1, col2, col3, col4, col5 = st.columns(5)
+    with col4:
+        if st.button("🗑️ Eliminar", key="delete_tab", use_container_width=True):
+            try:
+                cantidad = eliminar_proyectos_lote_orm(ids_seleccionados)
+                st.toast(f"🗑️ {cantidad} oportunidades eliminadas")
+                limpiar_seleccion_tabla()
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
+
+    with col5:
+        with st.popover("📊 Ver Detalles", disabled=len(ids_seleccionados) != 1, use_container_width=True):
+            proyecto = proyectos_por_id[ids_seleccionados[0]]
+            st.write(f"**Descripción:** {proyecto.descripcion}")
+            st.write(f"**Moneda:** {proyecto.moneda}")
+            if proyecto.moneda == 'USD':
+                st.write(f"**Tipo de cambio:** {proyecto.tipo_cambio_historico}")
+            if proyecto.fecha_deadline_propuesta:
+                dias_restantes = (proyecto.fecha_deadline_propuesta - datetime.now()).days
+                st.write(f"**Deadline:** {proyecto.fecha_deadline_propuesta.strftime('%d/%m/%Y')} ({dias_restantes} días)")
+            st.write(f"**Creado:** {proyecto.fecha_creacion.strftime('%d/%m/%Y %H:%M')}")
+            st.write(f"**Última actualización:** {proyecto.fecha_ultima_actualizacion.strftime('%d/%m/%Y %H:%M')}")
+
+    with col6:
+        if st.button("🧹 Limpiar", key="clear_tab", use_container_width=True):
+            limpiar_seleccion_tabla()
+            st.rerun(scope="fragment")
 
-                with col1:
-                    if st.button("✏️ Editar", key=f"edit_tab_{proyecto.id}", use_container_width=True):
-                        st.session_state.editing_project = proyecto.id
-                        st.rerun()
+# ==============================
+# Lista de Oportunidades (mantenido igual)
+# ==============================
+st.markdown("---")
+st.header(f"📋 Lista de Oportunidades ({len(proyectos_filtrados)} encontradas)")
 
-                with col2:
-                    if st.button("📞 Contacto", key=f"contact_tab_{proyecto.id}", use_container_width=True):
-                        registrar_contacto_orm(proyecto.id)
-                        st.success("✅ Contacto registrado!")
-                        st.rerun()
+if not proyectos_filtrados:
+    st.info("🔍 No hay oportunidades que coincidan con los filtros aplicados.")
+    st.markdown("**Sugerencias:**")
+    st.markdown("- Cambia los filtros en el sidebar")
+    st.markdown("- Crea una nueva oportunidad usando el formulario de arriba")
 
-                with col3:
-                    if st.button("📤 Preventa", key=f"prev_tab_{proyecto.id}", use_container_width=True):
-                        mover_a_preventa_orm(proyecto.id)
-                        st.success("✅ Movido a PREVENTA!")
-                        st.rerun()
+# ==============================
+# VISTA DE TARJETAS (mantenido igual excepto llamadas a funciones ORM)
+# ==============================
+elif vista_modo == "Tarjetas":
+    cols = st.columns(3)
 
-                with col4:
-                    if st.button("🗑️ Eliminar", key=f"delete_tab_{proyecto.id}", use_container_width=True):
-                        eliminar_proyecto_soft_orm(proyecto.id)
-                        st.success("🗑️ Eliminado!")
-                        st.rerun()
+    for i, proyecto in enumerate(proyectos_filtrados):
+        with cols[i % 3]:
+            tarjeta_oportunidad(proyecto, valores_visualizacion[proyecto.id])
 
-                with col5:
-                    with st.popover("📊 Ver Detalles"):
-                        st.write(f"**Descripción:** {proyecto.descripcion}")
-                        st.write(f"**Moneda:** {proyecto.moneda}")
-                        if proyecto.moneda == 'USD':
-                            st.write(f"**Tipo de cambio:** {proyecto.tipo_cambio_historico}")
-                        if proyecto.fecha_deadline_propuesta:
-                            dias_restantes = (proyecto.fecha_deadline_propuesta - datetime.now()).days
-                            st.write(f"**Deadline:** {proyecto.fecha_deadline_propuesta.strftime('%d/%m/%Y')} ({dias_restantes} días)")
-                        st.write(f"**Creado:** {proyecto.fecha_creacion.strftime('%d/%m/%Y %H:%M')}")
-                        st.write(f"**Última actualización:** {proyecto.fecha_ultima_actualizacion.strftime('%d/%m/%Y %H:%M')}")
+# ==============================
+# VISTA DE TABLA (mantenido igual excepto llamadas a funciones ORM)
+# ==============================
+elif vista_modo == "Tabla":
+    tabla_oportunidades(proyectos_filtrados)
 
 # ==============================
 # Footer con información adicional (mantenido igual)
@@ -1129,18 +1218,11 @@ col1, col2, col3 = st.columns(3)
 
 with col1:
     st.markdown("### 📈 Estadísticas por Deadline")
-    if proyectos_oportunidades:
-        alta_prioridad = len([p for p in proyectos_oportunidades
-                            if calcular_criticidad_deadline(p) in ['vencido', 'critico', 'muy_urgente']])
-        media_prioridad = len([p for p in proyectos_oportunidades
-                             if calcular_criticidad_deadline(p) in ['urgente', 'por_vencer']])
-        baja_prioridad = len([p for p in proyectos_oportunidades
-                            if calcular_criticidad_deadline(p) in ['disponible', 'sin_deadline']])
-
-        st.write(f"🔴 Alta Prioridad: {alta_prioridad}")
-        st.write(f"🟠 Media Prioridad: {media_prioridad}")
-        st.write(f"🟢 Baja Prioridad: {baja_prioridad}")
-        st.write(f"📋 Total: {len(proyectos_oportunidades)}")
+    if total_oportunidades:
+        st.write(f"🔴 Alta Prioridad: {conteos_oportunidades['alta']}")
+        st.write(f"🟠 Media Prioridad: {conteos_oportunidades['media']}")
+        st.write(f"🟢 Baja Prioridad: {conteos_oportunidades['baja']}")
+        st.write(f"📋 Total: {total_oportunidades}")
 
 with col2:
     st.markdown("### 💡 Consejos")
@@ -8,10 +8,19 @@ import os
 import re
 from models import Proyecto, Estado, Usuario, Cliente, Contacto, TiposArchivo, ProyectoArchivos
 from database import SessionLocal
+from panel_exportacion import panel_exportacion
+from indice_documentos import encolar_archivo
+from previsualizacion import obtener_previsualizacion, soporta_previsualizacion
+from cache_tarjetas import tarjeta_cacheada
+from ultimos_archivos import obtener_ultimos_archivos_proyecto
+from portafolio import construir_portafolio, convertir_columna, tasas_para_base, BASES_TIPO_CAMBIO
+from cubo_pipeline import kpis_pipeline
+from alertas import alertas_por_id, estilo_alerta
+from configuracion import configuracion
+from filtros_proyectos import FiltroProyectos, RIESGOS, ETIQUETAS_PLAZO, SUBESTADOS
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from sqlalchemy.orm import joinedload
-from sqlalchemy import desc
 
 # ==============================
 # Configuración de la página
@@ -70,29 +79,6 @@ def verificar_archivo_duplicado(proyecto_id, tipo_archivo, nombre_archivo):
     
     return os.path.exists(ruta_completa), nombre_final, ruta_completa
 
-def obtener_ultimo_archivo_por_tipo(proyecto_id, nombre_tipo_archivo):
-    """Obtiene el último archivo subido de un tipo específico para un proyecto"""
-    db = SessionLocal()
-    try:
-        # Buscar el tipo de archivo por nombre
-        tipo_archivo = db.query(TiposArchivo).filter(
-            TiposArchivo.nombre == nombre_tipo_archivo,
-            TiposArchivo.activo == True
-        ).first()
-        
-        if not tipo_archivo:
-            return None
-        
-        # Obtener el último archivo de ese tipo
-        archivo = db.query(ProyectoArchivos).filter(
-            ProyectoArchivos.proyecto_id == proyecto_id,
-            ProyectoArchivos.tipo_archivo_id == tipo_archivo.id
-        ).order_by(desc(ProyectoArchivos.fecha_subida)).first()
-        
-        return archivo
-    finally:
-        db.close()
-
 def obtener_archivos_proyecto(proyecto_id):
     """Obtiene todos los archivos de un proyecto"""
     db = SessionLocal()
@@ -126,18 +112,23 @@ def subir_archivo_proyecto(proyecto_id, tipo_archivo_id, archivo, usuario_id):
             raise FileExistsError(f"Ya existe un archivo con el nombre: {nombre_sanitizado}")
         
         with open(ruta_completa, "wb") as f:
-            f.write(archivo.getvalue())
+            contenido = archivo.getvalue()
+            f.write(contenido)
         
         nuevo_archivo = ProyectoArchivos(
             proyecto_id=proyecto_id,
             tipo_archivo_id=tipo_archivo_id,
             nombre_archivo=archivo.name,
             ruta_archivo=ruta_completa,
-            subido_por_id=usuario_id
+            subido_por_id=usuario_id,
+            tamanio_bytes=len(contenido)
         )
         
         db.add(nuevo_archivo)
         db.commit()
+
+        # Extraer texto e indexar en segundo plano
+        encolar_archivo(nuevo_archivo.id)
         
         return nuevo_archivo
     except Exception as e:
@@ -156,16 +147,11 @@ def get_db():
     finally:
         db.close()
 
-def cargar_proyectos_activos():
-    """Carga solo proyectos activos con todas las relaciones usando ORM"""
+def cargar_proyectos_activos(filtro):
+    """Carga los proyectos activos que cumplen el filtro, con sus relaciones (una sola consulta)"""
     try:
         db = SessionLocal()
-        proyectos = db.query(Proyecto).filter(Proyecto.activo == True).all()
-
-        for proyecto in proyectos:
-            _ = proyecto.cliente
-            _ = proyecto.asignado_a
-            _ = proyecto.contacto_principal
+        proyectos = filtro.consulta(db).all()
 
         db.close()
         return proyectos
@@ -173,6 +159,30 @@ def cargar_proyectos_activos():
         st.error(f"❌ Error cargando proyectos: {str(e)}")
         return []
 
+def cargar_proyecto_activo(filtro, proyecto_id):
+    """Carga un proyecto por id si cumple el filtro, con sus relaciones"""
+    try:
+        db = SessionLocal()
+        proyecto = filtro.consulta(db).filter(Proyecto.id == proyecto_id).first()
+
+        db.close()
+        return proyecto
+    except Exception as e:
+        st.error(f"❌ Error cargando proyecto: {str(e)}")
+        return None
+
+def contar_proyectos(filtro, **casos):
+    """Total y conteos por caso de los proyectos que cumplen el filtro (una consulta agregada)"""
+    try:
+        db = SessionLocal()
+        conteos = filtro.conteos(db, **casos)
+
+        db.close()
+        return conteos
+    except Exception as e:
+        st.error(f"❌ Error contando proyectos: {str(e)}")
+        return dict.fromkeys(['total', *casos], 0)
+
 def cargar_historial_proyecto(proyecto_id):
     """Carga el historial de eventos para un proyecto específico"""
     try:
@@ -200,7 +210,7 @@ def actualizar_proyecto_orm(proyecto_id, datos_actualizados):
         proyecto.descripcion = datos_actualizados['descripcion']
         proyecto.valor_estimado = datos_actualizados['valor_estimado']
         proyecto.moneda = datos_actualizados['moneda']
-        proyecto.tipo_cambio_historico = datos_actualizados.get('tipo_cambio', 3.80)
+        proyecto.tipo_cambio_historico = datos_actualizados.get('tipo_cambio', configuracion().TIPO_CAMBIO_DEFAULT)
         proyecto.cliente_id = datos_actualizados['cliente_id']
         proyecto.asignado_a_id = datos_actualizados['asignado_a_id']
         proyecto.fecha_deadline_propuesta = datos_actualizados.get('fecha_deadline')
@@ -255,6 +265,36 @@ def registrar_contacto_orm(proyecto_id):
         db.rollback()
         raise e
 
+def aplicar_en_lote_orm(proyecto_ids, accion):
+    """Aplica `accion(proyecto)` a varios proyectos en una sola transacción"""
+    db = SessionLocal()
+    try:
+        proyectos = db.query(Proyecto).filter(Proyecto.id.in_([int(pid) for pid in proyecto_ids])).all()
+        for proyecto in proyectos:
+            accion(proyecto)
+        db.commit()
+        return len(proyectos)
+    except Exception as e:
+        db.rollback()
+        raise e
+    finally:
+        db.close()
+
+def registrar_contacto_lote_orm(proyecto_ids):
+    """Registra un contacto en varios proyectos"""
+    def registrar(proyecto):
+        proyecto.agregar_evento_historial(f"Contacto registrado el {datetime.now().strftime('%d/%m/%Y %H:%M')}")
+        proyecto.fecha_ultima_actualizacion = datetime.now()
+    return aplicar_en_lote_orm(proyecto_ids, registrar)
+
+def eliminar_proyectos_lote_orm(proyecto_ids):
+    """Soft delete de varios proyectos"""
+    def eliminar(proyecto):
+        proyecto.activo = False
+        proyecto.fecha_ultima_actualizacion = datetime.now()
+        proyecto.agregar_evento_historial(f"Eliminado el {datetime.now().strftime('%d/%m/%Y %H:%M')}")
+    return aplicar_en_lote_orm(proyecto_ids, eliminar)
+
 def marcar_propuesta_presentada_orm(proyecto_id):
     """Marca la propuesta como presentada y actualiza probabilidad al 50%"""
     try:
@@ -263,8 +303,8 @@ def marcar_propuesta_presentada_orm(proyecto_id):
         proyecto = db.query(Proyecto).filter(Proyecto.id == proyecto_id).first()
         if proyecto:
             proyecto.fecha_presentacion_cotizacion = datetime.now()
-            proyecto.probabilidad_cierre = 50
-            proyecto.agregar_evento_historial("✅ Propuesta presentada al cliente - Probabilidad 50%")
+            proyecto.probabilidad_cierre = configuracion().PROBABILIDAD_PREVENTA
+            proyecto.agregar_evento_historial(f"✅ Propuesta presentada al cliente - Probabilidad {proyecto.probabilidad_cierre}%")
             proyecto.fecha_ultima_actualizacion = datetime.now()
 
             db.commit()
@@ -359,10 +399,11 @@ def cargar_contactos_activos():
 # ==============================
 # Funciones de conversión de moneda
 # ==============================
-def convertir_moneda(valor, moneda_origen, moneda_destino, tipo_cambio=3.8):
+def convertir_moneda(valor, moneda_origen, moneda_destino, tipo_cambio=None):
     """Convierte un valor entre PEN and USD"""
     if moneda_origen == moneda_destino:
         return valor
+    tipo_cambio = tipo_cambio or configuracion().TIPO_CAMBIO_DEFAULT
 
     if moneda_origen == 'PEN' and moneda_destino == 'USD':
         return valor / tipo_cambio
@@ -383,55 +424,32 @@ def formatear_moneda(valor, moneda):
 # ==============================
 def obtener_estilo_deadline(nivel_alerta):
     """Devuelve estilo CSS según el nivel de alerta del deadline"""
-    estilos = {
-        'vencido': {'color': '#666666', 'icono': '☠️', 'fondo': '#F5F5F5'},
-        'critico': {'color': '#dc2626', 'icono': '🔥', 'fondo': '#fef2f2'},
-        'muy_urgente': {'color': '#ea580c', 'icono': '⏰', 'fondo': '#fff7ed'},
-        'urgente': {'color': '#ea580c', 'icono': '⏳', 'fondo': '#fff7ed'},
-        'por_vencer': {'color': '#ca8a04', 'icono': '📅', 'fondo': '#fefce8'},
-        'disponible': {'color': '#16a34a', 'icono': '✅', 'fondo': '#f0fdf4'},
-        'sin_deadline': {'color': '#16a34a', 'icono': '📌', 'fondo': '#f0fdf4'}
-    }
-    return estilos.get(nivel_alerta, estilos['sin_deadline'])
+    return estilo_alerta(nivel_alerta)
 
 def calcular_criticidad_deadline(proyecto):
-    """Calcula la criticidad basada en el deadline"""
+    """Nivel del deadline desde el motor de alertas (calculado por lote en cada recarga)"""
     # Si ya se presentó propuesta, el deadline ya no es relevante
     if proyecto.fecha_presentacion_cotizacion:
         return 'propuesta_presentada'
-    
-    if not proyecto.fecha_deadline_propuesta:
-        return 'sin_deadline'
-
-    dias_restantes = (proyecto.fecha_deadline_propuesta - datetime.now()).days
-
-    if dias_restantes < 0:
-        return 'vencido'
-    elif dias_restantes == 0:
-        return 'critico'
-    elif dias_restantes <= 1:
-        return 'muy_urgente'
-    elif dias_restantes <= 3:
-        return 'urgente'
-    elif dias_restantes <= 7:
-        return 'por_vencer'
-    else:
-        return 'disponible'
+    alerta = alertas_proyectos.get(proyecto.id)
+    return alerta['nivel_deadline'] if alerta else proyecto.obtener_nivel_alerta_deadline()
 
 def get_color_riesgo(dias_sin_actualizar):
     """Determina el color según la criticidad por inactividad"""
-    if dias_sin_actualizar > 15:
+    config = configuracion()
+    if dias_sin_actualizar > config.DIAS_ALERTA_CRITICO:
         return "#ff4b4b"
-    elif dias_sin_actualizar > 7:
+    elif dias_sin_actualizar > config.DIAS_ALERTA_RIESGO:
         return "#ffa64b"
     else:
         return "#4caf50"
 
 def get_estado_riesgo(dias_sin_actualizar):
     """Determina el estado textual del riesgo por inactividad"""
-    if dias_sin_actualizar > 15:
+    config = configuracion()
+    if dias_sin_actualizar > config.DIAS_ALERTA_CRITICO:
         return "Crítico"
-    elif dias_sin_actualizar > 7:
+    elif dias_sin_actualizar > config.DIAS_ALERTA_RIESGO:
         return "En Riesgo"
     else:
         return "Normal"
@@ -440,7 +458,7 @@ def obtener_estado_preventa(proyecto):
     """Determina el sub-estado de preventa basado en probabilidad_cierre"""
     if proyecto.probabilidad_cierre >= 75:
         return {'nombre': '🎉 OC FIRMADA', 'color': '#16a34a', 'icono': '🎉'}
-    elif proyecto.probabilidad_cierre >= 50:
+    elif proyecto.probabilidad_cierre >= configuracion().PROBABILIDAD_PREVENTA:
         return {'nombre': '📤 PROPUESTA ENTREGADA', 'color': '#4ECDC4', 'icono': '📤'}
     else:
         return {'nombre': '📋 PREVENTA ACTIVA', 'color': '#f59e0b', 'icono': '📋'}
@@ -451,10 +469,18 @@ def obtener_estado_preventa(proyecto):
 EJECUTIVOS_DISPONIBLES = []
 CLIENTES_DISPONIBLES = []
 MONEDAS_DISPONIBLES = ['PEN', 'USD']
+ETIQUETAS_SUBESTADO = {
+    'preventa_activa': f"📋 PREVENTA ACTIVA ({configuracion().PROBABILIDAD_OPORTUNIDAD}%)",
+    'propuesta_entregada': f"📤 PROPUESTA ENTREGADA ({configuracion().PROBABILIDAD_PREVENTA}%)",
+    'oc_firmada': "🎉 OC FIRMADA (75%)",
+}
 
 if 'editing_project' not in st.session_state:
     st.session_state.editing_project = None
 
+# Tarjetas retiradas desde su fragmento (movidas o eliminadas); se limpia en cada recarga completa
+st.session_state.tarjetas_retiradas = {}
+
 if 'modal_archivos_abierto' not in st.session_state:
     st.session_state.modal_archivos_abierto = False
 if 'proyecto_archivos' not in st.session_state:
@@ -469,8 +495,17 @@ st.page_link("main_app.py", label="🔙 Volver al Workflow Principal")
 # ==============================
 # Cargar datos desde ORM
 # ==============================
-proyectos_todos = cargar_proyectos_activos()
-proyectos_preventa = [p for p in proyectos_todos if p.estado_actual == Estado.PREVENTA.value]
+# Totales por sub-estado del estado por agregados SQL; solo se cargan los proyectos filtrados
+filtro_estado = FiltroProyectos(estado=Estado.PREVENTA.value)
+en_preventa_activa = SUBESTADOS['preventa_activa'][1]()
+conteos_preventa = contar_proyectos(
+    filtro_estado,
+    preventa_activa=en_preventa_activa,
+    propuesta_entregada=SUBESTADOS['propuesta_entregada'][1](),
+    oc_firmada=SUBESTADOS['oc_firmada'][1](),
+    # Deadline vencido, solo las que están en preventa activa
+    vencidas=en_preventa_activa & (Proyecto.fecha_deadline_propuesta < filtro_estado.ahora),
+)
 
 # Cargar datos para selects
 usuarios_db = cargar_usuarios_activos()
@@ -482,66 +517,88 @@ CLIENTES_DISPONIBLES = [c.nombre for c in clientes_db]
 
 usuario_nombre_a_id = {u.nombre: u.id for u in usuarios_db}
 cliente_nombre_a_id = {c.nombre: c.id for c in clientes_db}
+usuario_id_a_nombre = {u.id: u.nombre for u in usuarios_db}
+cliente_id_a_nombre = {c.id: c.nombre for c in clientes_db}
 
 tipos_archivo_db = obtener_tipos_archivo()
 
 # ==============================
 # MODAL PARA GESTIÓN DE ARCHIVOS
 # ==============================
-if st.session_state.modal_archivos_abierto and st.session_state.proyecto_archivos:
-    with st.sidebar:
-        st.header("📁 Gestión de Archivos")
-        st.write(f"Proyecto: **{st.session_state.proyecto_archivos.codigo_proyecto}**")
-        
-        with st.expander("📤 Subir nuevo archivo", expanded=True):
-            archivo_subir = st.file_uploader("Seleccionar archivo", type=['pdf', 'docx', 'xlsx', 'jpg', 'png'])
-            tipo_seleccionado = st.selectbox("Tipo de archivo", 
-                                           options=[(t.id, t.nombre) for t in tipos_archivo_db],
-                                           format_func=lambda x: x[1])
-            
-            if archivo_subir and st.button("Subir archivo"):
-                try:
-                    subir_archivo_proyecto(
-                        st.session_state.proyecto_archivos.id,
-                        tipo_seleccionado[0],
-                        archivo_subir,
-                        1  # ID del usuario actual
-                    )
-                    st.success("✅ Archivo subido correctamente")
-                    time.sleep(1)
-                    st.rerun()
-                except FileExistsError as e:
-                    st.error(f"❌ {str(e)}")
-                except Exception as e:
-                    st.error(f"❌ Error al subir archivo: {str(e)}")
-        
-        st.divider()
-        st.subheader("Archivos del proyecto")
-        archivos = obtener_archivos_proyecto(st.session_state.proyecto_archivos.id)
-        
-        if not archivos:
-            st.info("📝 No hay archivos subidos para este proyecto")
-        else:
-            for archivo in archivos:
-                with st.expander(f"{archivo.tipo_archivo.nombre}: {archivo.nombre_archivo}"):
-                    st.write(f"**Subido por:** {archivo.usuario.nombre if archivo.usuario else 'N/A'}")
-                    st.write(f"**Fecha:** {archivo.fecha_subida.strftime('%d/%m/%Y %H:%M')}")
-                    st.write(f"**Tamaño:** {os.path.getsize(archivo.ruta_archivo) if os.path.exists(archivo.ruta_archivo) else 'N/A'} bytes")
-                    
-                    if os.path.exists(archivo.ruta_archivo):
-                        with open(archivo.ruta_archivo, "rb") as f:
-                            st.download_button(
-                                "⬇️ Descargar",
-                                f.read(),
-                                archivo.nombre_archivo,
-                                key=f"download_{archivo.id}"
-                            )
-                    else:
-                        st.warning("⚠️ Archivo no encontrado en el filesystem")
-        
-        if st.button("Cerrar gestión de archivos"):
-            st.session_state.modal_archivos_abierto = False
-            st.rerun()
+@st.fragment
+def modal_archivos():
+    """Gestión de archivos del proyecto; subir o cerrar solo recarga este fragmento"""
+    if not (st.session_state.modal_archivos_abierto and st.session_state.proyecto_archivos):
+        return
+
+    st.header("📁 Gestión de Archivos")
+    st.write(f"Proyecto: **{st.session_state.proyecto_archivos.codigo_proyecto}**")
+
+    with st.expander("📤 Subir nuevo archivo", expanded=True):
+        archivo_subir = st.file_uploader("Seleccionar archivo", type=['pdf', 'docx', 'xlsx', 'jpg', 'png'])
+        tipo_seleccionado = st.selectbox("Tipo de archivo", 
+                                       options=[(t.id, t.nombre) for t in tipos_archivo_db],
+                                       format_func=lambda x: x[1])
+
+        if archivo_subir and st.button("Subir archivo"):
+            try:
+                subir_archivo_proyecto(
+                    st.session_state.proyecto_archivos.id,
+                    tipo_seleccionado[0],
+                    archivo_subir,
+                    1  # ID del usuario actual
+                )
+                st.toast("✅ Archivo subido correctamente")
+                st.rerun(scope="fragment")
+            except FileExistsError as e:
+                st.error(f"❌ {str(e)}")
+            except Exception as e:
+                st.error(f"❌ Error al subir archivo: {str(e)}")
+
+    st.divider()
+    st.subheader("Archivos del proyecto")
+    archivos = obtener_archivos_proyecto(st.session_state.proyecto_archivos.id)
+
+    if not archivos:
+        st.info("📝 No hay archivos subidos para este proyecto")
+    else:
+        for archivo in archivos:
+            with st.expander(f"{archivo.tipo_archivo.nombre}: {archivo.nombre_archivo}"):
+                st.write(f"**Subido por:** {archivo.usuario.nombre if archivo.usuario else 'N/A'}")
+                st.write(f"**Fecha:** {archivo.fecha_subida.strftime('%d/%m/%Y %H:%M')}")
+                st.write(f"**Tamaño:** {os.path.getsize(archivo.ruta_archivo) if os.path.exists(archivo.ruta_archivo) else 'N/A'} bytes")
+
+                # Miniatura y vista previa desde la caché de previsualizaciones
+                if soporta_previsualizacion(archivo.ruta_archivo):
+                    miniatura = obtener_previsualizacion(archivo.ruta_archivo, 'miniatura')
+                    if miniatura:
+                        st.image(miniatura)
+                        if st.toggle("🔍 Vista previa", key=f"preview_{archivo.id}"):
+                            vista = obtener_previsualizacion(archivo.ruta_archivo, 'vista')
+                            if vista:
+                                st.image(vista)
+
+                if os.path.exists(archivo.ruta_archivo):
+                    with open(archivo.ruta_archivo, "rb") as f:
+                        st.download_button(
+                            "⬇️ Descargar",
+                            f.read(),
+                            archivo.nombre_archivo,
+                            key=f"download_{archivo.id}"
+                        )
+                else:
+                    st.warning("⚠️ Archivo no encontrado en el filesystem")
+
+    # Exportación masiva de documentos en ZIP
+    panel_exportacion(st.session_state.proyecto_archivos)
+
+    if st.button("Cerrar gestión de archivos"):
+        st.session_state.modal_archivos_abierto = False
+        st.session_state.exportacion_zip = None
+        st.rerun(scope="fragment")
+
+with st.sidebar:
+    modal_archivos()
 
 # ==============================
 # Sidebar para filtros y vista 
@@ -551,111 +608,90 @@ with st.sidebar:
     vista_modo = st.radio("Modo de vista:", ["Tarjetas", "Tabla"])
 
     moneda_visualizacion = st.selectbox("Moneda para visualización:", MONEDAS_DISPONIBLES)
+    base_tipo_cambio = st.selectbox("Tipo de cambio:", list(BASES_TIPO_CAMBIO),
+                                    format_func=lambda base: BASES_TIPO_CAMBIO[base],
+                                    help="Histórico: el registrado en cada proyecto. Las demás opciones usan el tipo de cambio vigente en esa fecha.")
 
     st.header("🔍 Filtros")
-    filtro_ejecutivo = st.selectbox("Ejecutivo", ["Todos"] + EJECUTIVOS_DISPONIBLES)
-    filtro_cliente = st.selectbox("Cliente", ["Todos"] + CLIENTES_DISPONIBLES)
-    filtro_moneda = st.selectbox("Moneda", ["Todas"] + MONEDAS_DISPONIBLES)
-    filtro_riesgo = st.selectbox("Estado de Riesgo", ["Todos", "Normal", "En Riesgo", "Crítico"])
+    filtro_ejecutivo = st.selectbox("Ejecutivo", [None] + [u.id for u in usuarios_db],
+                                    format_func=lambda i: "Todos" if i is None else usuario_id_a_nombre[i])
+    filtro_cliente = st.selectbox("Cliente", [None] + [c.id for c in clientes_db],
+                                  format_func=lambda i: "Todos" if i is None else cliente_id_a_nombre[i])
+    filtro_moneda = st.selectbox("Moneda", [None] + MONEDAS_DISPONIBLES, format_func=lambda m: m or "Todas")
+    filtro_riesgo = st.selectbox("Estado de Riesgo", [None] + list(RIESGOS), format_func=lambda r: r or "Todos")
     
     # Filtro por sub-estado de preventa
-    filtro_subestado = st.selectbox("Estado Preventa", [
-        "Todos", 
-        "📋 PREVENTA ACTIVA (25%)", 
-        "📤 PROPUESTA ENTREGADA (50%)", 
-        "🎉 OC FIRMADA (75%)"
-    ])
+    filtro_subestado = st.selectbox("Estado Preventa", [None, 'preventa_activa', 'propuesta_entregada', 'oc_firmada'],
+                                    format_func=lambda e: ETIQUETAS_SUBESTADO.get(e, "Todos"))
     
-    filtro_deadline = st.selectbox("Estado Deadline", [
-        "Todos", 
-        "Vencido", 
-        "Crítico", 
-        "Urgente", 
-        "Por Vencer", 
-        "Disponible", 
-        "Sin Deadline",
-        "✅ Propuesta Presentada"
-    ])
+    filtro_deadline = st.selectbox("Estado Deadline", [None, 'vencido', 'critico', 'urgente', 'por_vencer', 'disponible',
+                                                       'sin_deadline', 'propuesta_presentada'],
+                                   format_func=lambda d: ETIQUETAS_PLAZO.get(d, "Todos"))
+
+# ==============================
+# Aplicar filtros
+# ==============================
+proyectos_filtrados = cargar_proyectos_activos(FiltroProyectos(
+    estado=Estado.PREVENTA.value, asignado_a_id=filtro_ejecutivo, cliente_id=filtro_cliente,
+    moneda=filtro_moneda, riesgo=filtro_riesgo, subestado=filtro_subestado, deadline=filtro_deadline,
+))
+portafolio = construir_portafolio(proyectos_filtrados)
+alertas_proyectos = alertas_por_id(portafolio)
 
+with st.sidebar:
     st.divider()
     st.header("📈 Estadísticas Rápidas")
-    total_preventa = len(proyectos_preventa)
+    tasas_visualizacion = tasas_para_base(portafolio, base_tipo_cambio)
+    # KPIs desde el cubo del pipeline, con los mismos filtros de ejecutivo, cliente y moneda
+    kpis = kpis_pipeline(
+        moneda_visualizacion, base_tipo_cambio,
+        estados=[Estado.PREVENTA.value],
+        asignados=None if filtro_ejecutivo is None else [filtro_ejecutivo],
+        clientes=None if filtro_cliente is None else [filtro_cliente],
+        monedas=None if filtro_moneda is None else [filtro_moneda],
+    )
+    valores_visualizacion = convertir_columna(portafolio, moneda_visualizacion, tasas_visualizacion).to_dict()
+    total_preventa = conteos_preventa['total']
     st.metric("Total Preventas", total_preventa)
 
     if total_preventa > 0:
-        valor_total = 0
-        for p in proyectos_preventa:
-            valor_convertido = convertir_moneda(
-                p.valor_estimado,
-                p.moneda,
-                moneda_visualizacion,
-                p.tipo_cambio_historico
-            )
-            valor_total += valor_convertido
-
-        st.metric("Valor Total Pipeline", formatear_moneda(valor_total, moneda_visualizacion))
-
-        preventas_riesgo = len([p for p in proyectos_preventa
-                               if (datetime.now() - p.fecha_ultima_actualizacion).days > 7])
+        st.metric("Valor Total Pipeline", formatear_moneda(kpis['total'], moneda_visualizacion))
+
+        preventas_riesgo = kpis['en_riesgo']
         st.metric("En Riesgo", preventas_riesgo, delta=-preventas_riesgo if preventas_riesgo > 0 else 0)
 
 # ==============================
 # KPIs principales 
 # ==============================
-if proyectos_preventa:
+if total_preventa:
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        valor_pipeline = 0
-        for p in proyectos_preventa:
-            # Valor ponderado por probabilidad
-            valor_convertido = convertir_moneda(
-                p.valor_estimado * (p.probabilidad_cierre / 100),
-                p.moneda,
-                moneda_visualizacion,
-                p.tipo_cambio_historico
-            )
-            valor_pipeline += valor_convertido
+        valor_pipeline = kpis['ponderado']
 
         st.metric("💰 Valor del Pipeline", formatear_moneda(valor_pipeline, moneda_visualizacion))
 
     with col2:
-        total_valor = 0
-        for p in proyectos_preventa:
-            valor_convertido = convertir_moneda(
-                p.valor_estimado,
-                p.moneda,
-                moneda_visualizacion,
-                p.tipo_cambio_historico
-            )
-            total_valor += valor_convertido
+        total_valor = kpis['total']
 
         st.metric("💸 Valor Total Estimado", formatear_moneda(total_valor, moneda_visualizacion))
 
     with col3:
-        # Contar proyectos por sub-estado
-        preventa_activa = len([p for p in proyectos_preventa if p.probabilidad_cierre == 25])
-        propuesta_entregada = len([p for p in proyectos_preventa if p.probabilidad_cierre == 50])
-        oc_firmada = len([p for p in proyectos_preventa if p.probabilidad_cierre >= 75])
-        
-        st.metric("📋 Preventa Activa", preventa_activa)
-        st.metric("📤 Propuesta Entregada", propuesta_entregada)
-        st.metric("🎉 OC Firmada", oc_firmada)
+        # Proyectos por sub-estado
+        st.metric("📋 Preventa Activa", conteos_preventa['preventa_activa'])
+        st.metric("📤 Propuesta Entregada", conteos_preventa['propuesta_entregada'])
+        st.metric("🎉 OC Firmada", conteos_preventa['oc_firmada'])
 
     with col4:
-        # Contar preventas con deadline vencido (solo las que están en preventa activa)
-        preventas_vencidas = len([p for p in proyectos_preventa
-                                if p.fecha_deadline_propuesta and 
-                                p.fecha_deadline_propuesta < datetime.now() and
-                                p.probabilidad_cierre < 50])
-        st.metric("⏰ Deadlines Vencidos", preventas_vencidas)
+        # Preventas con deadline vencido (solo las que están en preventa activa)
+        st.metric("⏰ Deadlines Vencidos", conteos_preventa['vencidas'])
 
 # ==============================
 # Formulario de Edición
 # ==============================
 #
 if st.session_state.editing_project is not None:
-    proyecto_editar = next((p for p in proyectos_preventa if p.id == st.session_state.editing_project), None)
+    proyecto_editar = cargar_proyecto_activo(filtro_estado, st.session_state.editing_project)
 
     if proyecto_editar:
         st.markdown("---")
@@ -664,7 +700,7 @@ if st.session_state.editing_project is not None:
             
             # Determinar el estado basado en FECHA de presentación y PROBABILIDAD
             tiene_propuesta_presentada = (proyecto_editar.fecha_presentacion_cotizacion is not None and 
-                                         proyecto_editar.probabilidad_cierre == 50)
+                                         proyecto_editar.probabilidad_cierre >= configuracion().PROBABILIDAD_PREVENTA)
             
             # Mostrar estado actual de preventa
             estado_preventa = obtener_estado_preventa(proyecto_editar)
@@ -677,9 +713,10 @@ if st.session_state.editing_project is not None:
             """, unsafe_allow_html=True)
 
             # Obtener los últimos archivos por tipo
-            ultimo_tdr = obtener_ultimo_archivo_por_tipo(proyecto_editar.id, "TDR")
-            ultima_propuesta = obtener_ultimo_archivo_por_tipo(proyecto_editar.id, "PROPUESTA")
-            ultimo_contrato = obtener_ultimo_archivo_por_tipo(proyecto_editar.id, "CONTRATO")
+            ultimos_archivos = obtener_ultimos_archivos_proyecto(proyecto_editar.id)
+            ultimo_tdr = ultimos_archivos.get("TDR")
+            ultima_propuesta = ultimos_archivos.get("PROPUESTA")
+            ultimo_contrato = ultimos_archivos.get("CONTRATO")
             
             # SECCIÓN DIFERENCIADA POR ESTADO
             if tiene_propuesta_presentada:
@@ -893,7 +930,7 @@ if st.session_state.editing_project is not None:
                             proyecto = db.query(Proyecto).filter(Proyecto.id == proyecto_editar.id).first()
                             if proyecto:
                                 proyecto.fecha_presentacion_cotizacion = datetime.combine(fecha_presentacion, hora_presentacion)
-                                proyecto.probabilidad_cierre = 50
+                                proyecto.probabilidad_cierre = configuracion().PROBABILIDAD_PREVENTA
                                 proyecto.agregar_evento_historial(f"Propuesta presentada el {fecha_presentacion.strftime('%d/%m/%Y %H:%M')}")
                                 
                                 # Subir archivo de propuesta si se proporcionó
@@ -1012,191 +1049,150 @@ if st.session_state.editing_project is not None:
 
 
 # ==============================
-# Aplicar filtros
+# HTML de la tarjeta (memorizado)
 # ==============================
-proyectos_filtrados = proyectos_preventa.copy()
-
-if filtro_ejecutivo != "Todos":
-    proyectos_filtrados = [p for p in proyectos_filtrados if p.asignado_a.nombre == filtro_ejecutivo]
-
-if filtro_cliente != "Todos":
-    proyectos_filtrados = [p for p in proyectos_filtrados if p.cliente.nombre == filtro_cliente]
-
-if filtro_moneda != "Todas":
-    proyectos_filtrados = [p for p in proyectos_filtrados if p.moneda == filtro_moneda]
-
-if filtro_riesgo != "Todos":
-    proyectos_filtrados = [p for p in proyectos_filtrados
-                          if get_estado_riesgo((datetime.now() - p.fecha_ultima_actualizacion).days) == filtro_riesgo]
-
-if filtro_subestado != "Todos":
-    if filtro_subestado == "📋 PREVENTA ACTIVA (25%)":
-        proyectos_filtrados = [p for p in proyectos_filtrados if p.probabilidad_cierre == 25]
-    elif filtro_subestado == "📤 PROPUESTA ENTREGADA (50%)":
-        proyectos_filtrados = [p for p in proyectos_filtrados if p.probabilidad_cierre == 50]
-    elif filtro_subestado == "🎉 OC FIRMADA (75%)":
-        proyectos_filtrados = [p for p in proyectos_filtrados if p.probabilidad_cierre >= 75]
-
-if filtro_deadline != "Todos":
-    if filtro_deadline == "✅ Propuesta Presentada":
-        proyectos_filtrados = [p for p in proyectos_filtrados if p.fecha_presentacion_cotizacion is not None]
+def dias_restantes_deadline(proyecto):
+    """Días hasta el deadline (None sin deadline); forma parte de la clave de la tarjeta"""
+    if not proyecto.fecha_deadline_propuesta:
+        return None
+    return (proyecto.fecha_deadline_propuesta - datetime.now()).days
+
+def html_tarjeta_preventa(proyecto, valor_convertido, dias_restantes, criticidad_deadline):
+    """HTML de la tarjeta; se memoriza en cache_tarjetas mientras el proyecto y sus días no cambien"""
+    # Obtener sub-estado de preventa (conservamos los colores originales)
+    estado_preventa = obtener_estado_preventa(proyecto)
+    probabilidad_presentada = configuracion().PROBABILIDAD_PREVENTA
+    estilo_deadline = obtener_estilo_deadline(criticidad_deadline)
+
+    # Formatear valor según moneda
+    valor_formateado = formatear_moneda(valor_convertido, moneda_visualizacion)
+
+    # Información del deadline (estilo igual a Oportunidades)
+    if dias_restantes is not None and proyecto.probabilidad_cierre < probabilidad_presentada:
+        texto_dias = f"{abs(dias_restantes)} días {'pasados' if dias_restantes < 0 else 'restantes'}"
+        deadline_html = f"""{estilo_deadline['icono']} Deadline: {proyecto.fecha_deadline_propuesta.strftime('%d/%m/%y')} ({texto_dias})"""
+    elif proyecto.fecha_presentacion_cotizacion:
+        deadline_html = f"✅ Propuesta: {proyecto.fecha_presentacion_cotizacion.strftime('%d/%m/%y')}"
     else:
-        proyectos_filtrados = [p for p in proyectos_filtrados
-                          if calcular_criticidad_deadline(p) == filtro_deadline.lower().replace(' ', '_')]
-
-# ==============================
-# Lista de Preventas
-# ==============================
-st.markdown("---")
-st.header(f"📋 Lista de Preventas ({len(proyectos_filtrados)} encontradas)")
-
-if not proyectos_filtrados:
-    st.info("🔍 No hay preventas que coincidan con los filtros aplicados.")
-
+        deadline_html = f"{estilo_deadline['icono']} Sin deadline"
+
+    # TARJETA CON ESTILO DE OPORTUNIDADES pero color de estado preventa
+    if proyecto.probabilidad_cierre >= probabilidad_presentada:
+        return f"""
+        <div style="
+            border: 2px solid {estado_preventa['color']};
+            border-radius: 12px;
+            padding: 16px;
+            margin: 8px 0;
+            background: linear-gradient(145deg, {estado_preventa['color']}08, {estado_preventa['color']}15);
+            box-shadow: 0 4px 6px rgba(0,0,0,0.1);
+        ">
+            <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px;">
+                <h4 style="color: {estado_preventa['color']}; margin: 0; font-size: 16px;">{proyecto.codigo_proyecto}</h4>
+                <span style="background-color: {estado_preventa['color']}20; color: {estado_preventa['color']};
+                            padding: 4px 8px; border-radius: 12px; font-size: 12px; font-weight: bold;">
+                    {estado_preventa['icono']} {proyecto.probabilidad_cierre}%
+                </span>
+            </div>
+            <p style="margin: 8px 0; font-weight: bold; font-size: 14px;">{proyecto.nombre}</p>
+            <p style="margin: 4px 0; font-size: 12px;">👤 {proyecto.asignado_a.nombre if proyecto.asignado_a else 'Sin asignar'}</p>
+            <p style="margin: 4px 0; font-size: 12px;">🏢 {proyecto.cliente.nombre if proyecto.cliente else 'Sin cliente'}</p>
+            <p style="margin: 4px 0; font-size: 12px; color: #666;">💰 {valor_formateado} <small>({proyecto.moneda})</small></p>
+            <p style="margin: 4px 0; font-size: 11px; color: {estado_preventa['color']};">{deadline_html}</p>
+        </div>
+        """
+    elif proyecto.probabilidad_cierre < probabilidad_presentada:
+        return f"""
+        <div style="
+            border: 2px solid {estilo_deadline['color']};
+            border-radius: 12px;
+            padding: 16px;
+            margin: 8px 0;
+            background: linear-gradient(145deg, {estilo_deadline['color']}08, {estilo_deadline['color']}15);
+            box-shadow: 0 4px 6px rgba(0,0,0,0.1);
+        ">
+            <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px;">
+                <h4 style="color: {estilo_deadline['color']}; margin: 0; font-size: 16px;">{proyecto.codigo_proyecto}</h4>
+            </div>
+            <p style="margin: 8px 0; font-weight: bold; font-size: 14px;">{proyecto.nombre}</p>
+            <p style="margin: 4px 0; font-size: 12px;">👤 {proyecto.asignado_a}</p>
+            <p style="margin: 4px 0; font-size: 12px;">🏢 {proyecto.cliente}</p>
+            <p style="margin: 4px 0; font-size: 12px; color: #666;">💰 {valor_formateado} <small>({proyecto.moneda})</small></p>
+            {deadline_html}
+        </div>
+        """
 
 # ==============================
-# VISTA DE TARJETAS (CON ESTILO DE OPORTUNIDADES)
+# Tarjeta de proyecto (fragmento)
 # ==============================
-elif vista_modo == "Tarjetas":
-    cols = st.columns(3)
-
-    for i, proyecto in enumerate(proyectos_filtrados):
-        dias_sin_actualizar = (datetime.now() - proyecto.fecha_ultima_actualizacion).days
-        color_riesgo = get_color_riesgo(dias_sin_actualizar)
-        estado_riesgo = get_estado_riesgo(dias_sin_actualizar)
-
-        # Obtener sub-estado de preventa (conservamos los colores originales)
-        estado_preventa = obtener_estado_preventa(proyecto)
+@st.fragment
+def tarjeta_preventa(proyecto, valor_convertido):
+    """Tarjeta con sus acciones; contacto, mover o eliminar solo recargan este fragmento"""
+    if proyecto.id in st.session_state.tarjetas_retiradas:
+        st.info(st.session_state.tarjetas_retiradas[proyecto.id])
+        return
+
+    with st.container():
+        dias_restantes = dias_restantes_deadline(proyecto)
         criticidad_deadline = calcular_criticidad_deadline(proyecto)
-        estilo_deadline = obtener_estilo_deadline(criticidad_deadline)
-
-        # Convertir valor a moneda de visualización
-        valor_convertido = convertir_moneda(
-            proyecto.valor_estimado,
-            proyecto.moneda,
-            moneda_visualizacion,
-            proyecto.tipo_cambio_historico
-        )
+        st.markdown(tarjeta_cacheada("preventa", proyecto, moneda_visualizacion, valor_convertido,
+                                     lambda: html_tarjeta_preventa(proyecto, valor_convertido, dias_restantes, criticidad_deadline),
+                                     dias_restantes, criticidad_deadline),
+                    unsafe_allow_html=True)
 
-        # Formatear valor según moneda
-        valor_formateado = formatear_moneda(valor_convertido, moneda_visualizacion)
+        # Botones de acción (igual que antes)
+        col_btn1, col_btn2, col_btn3, col_btn4 = st.columns(4)
 
-        # Calcular próximo contacto (similar a Oportunidades)
-        fecha_proximo_contacto = proyecto.fecha_ultima_actualizacion + timedelta(days=random.randint(1, 5))
-
-        with cols[i % 3]:
-            with st.container():
-                # Información del deadline (estilo igual a Oportunidades)
-                info_deadline = ""
-                if proyecto.fecha_deadline_propuesta and proyecto.probabilidad_cierre < 50:
-                    dias_restantes = (proyecto.fecha_deadline_propuesta - datetime.now()).days
-                    texto_dias = f"{abs(dias_restantes)} días {'pasados' if dias_restantes < 0 else 'restantes'}"
-                    deadline_html = f"""{estilo_deadline['icono']} Deadline: {proyecto.fecha_deadline_propuesta.strftime('%d/%m/%y')} ({texto_dias})"""
-                elif proyecto.fecha_presentacion_cotizacion:
-                    deadline_html = f"✅ Propuesta: {proyecto.fecha_presentacion_cotizacion.strftime('%d/%m/%y')}"
-                else:
-                    deadline_html = f"{estilo_deadline['icono']} Sin deadline"
-
-                # TARJETA CON ESTILO DE OPORTUNIDADES pero color de estado preventa
-                if proyecto.probabilidad_cierre >= 50:
-                    st.markdown(f"""
-                    <div style="
-                        border: 2px solid {estado_preventa['color']};
-                        border-radius: 12px;
-                        padding: 16px;
-                        margin: 8px 0;
-                        background: linear-gradient(145deg, {estado_preventa['color']}08, {estado_preventa['color']}15);
-                        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-                    ">
-                        <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px;">
-                            <h4 style="color: {estado_preventa['color']}; margin: 0; font-size: 16px;">{proyecto.codigo_proyecto}</h4>
-                            <span style="background-color: {estado_preventa['color']}20; color: {estado_preventa['color']};
-                                        padding: 4px 8px; border-radius: 12px; font-size: 12px; font-weight: bold;">
-                                {estado_preventa['icono']} {proyecto.probabilidad_cierre}%
-                            </span>
-                        </div>
-                        <p style="margin: 8px 0; font-weight: bold; font-size: 14px;">{proyecto.nombre}</p>
-                        <p style="margin: 4px 0; font-size: 12px;">👤 {proyecto.asignado_a.nombre if proyecto.asignado_a else 'Sin asignar'}</p>
-                        <p style="margin: 4px 0; font-size: 12px;">🏢 {proyecto.cliente.nombre if proyecto.cliente else 'Sin cliente'}</p>
-                        <p style="margin: 4px 0; font-size: 12px; color: #666;">💰 {valor_formateado} <small>({proyecto.moneda})</small></p>
-                        <p style="margin: 4px 0; font-size: 11px; color: {estado_preventa['color']};">{deadline_html}</p>
-                        <p style="margin: 4px 0; font-size: 11px; color: #666;">📅 Próximo: {fecha_proximo_contacto.strftime('%d/%m')}</p>
-                    </div>
-                    """, unsafe_allow_html=True)
-                elif proyecto.probabilidad_cierre < 50:
-                    st.markdown(f"""
-                    <div style="
-                        border: 2px solid {estilo_deadline['color']};
-                        border-radius: 12px;
-                        padding: 16px;
-                        margin: 8px 0;
-                        background: linear-gradient(145deg, {estilo_deadline['color']}08, {estilo_deadline['color']}15);
-                        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-                    ">
-                        <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px;">
-                            <h4 style="color: {estilo_deadline['color']}; margin: 0; font-size: 16px;">{proyecto.codigo_proyecto}</h4>
-                        </div>
-                        <p style="margin: 8px 0; font-weight: bold; font-size: 14px;">{proyecto.nombre}</p>
-                        <p style="margin: 4px 0; font-size: 12px;">👤 {proyecto.asignado_a}</p>
-                        <p style="margin: 4px 0; font-size: 12px;">🏢 {proyecto.cliente}</p>
-                        <p style="margin: 4px 0; font-size: 12px; color: #666;">💰 {valor_formateado} <small>({proyecto.moneda})</small></p>
-                        {deadline_html}
-                        <p style="margin: 4px 0; font-size: 11px; color: #666;">📅 Próximo: {fecha_proximo_contacto.strftime('%d/%m')}</p>
-                    </div>
-                    """, unsafe_allow_html=True)
-
-                # Botones de acción (igual que antes)
-                col_btn1, col_btn2, col_btn3, col_btn4 = st.columns(4)
-
-                with col_btn1:
-                    if st.button("✏️", key=f"edit_{proyecto.id}", help="Editar preventa"):
-                        st.session_state.editing_project = proyecto.id
-                        st.rerun()
+        with col_btn1:
+            if st.button("✏️", key=f"edit_{proyecto.id}", help="Editar preventa"):
+                st.session_state.editing_project = proyecto.id
+                st.rerun()
 
-                with col_btn2:
-                    if st.button("📞", key=f"contact_{proyecto.id}", help="Registrar contacto"):
-                        nuevo_deadline = registrar_contacto_orm(proyecto.id)
-                        st.success(f"✅ Contacto registrado. Próximo seguimiento: {nuevo_deadline.strftime('%d/%m/%Y')}")
-                        time.sleep(2)
-                        st.rerun()
+        with col_btn2:
+            if st.button("📞", key=f"contact_{proyecto.id}", help="Registrar contacto"):
+                nuevo_deadline = registrar_contacto_orm(proyecto.id)
+                st.toast(f"✅ Contacto registrado. Próximo seguimiento: {nuevo_deadline.strftime('%d/%m/%Y')}")
+                proyecto.fecha_ultima_actualizacion = datetime.now()
+                st.rerun(scope="fragment")
+
+        with col_btn3:
+            if proyecto.probabilidad_cierre < configuracion().PROBABILIDAD_PREVENTA:
+                if st.button("📤", key=f"propuesta_{proyecto.id}", help="Subir Propuesta"):
+                    st.session_state.editing_project = proyecto.id
+                    st.rerun()
+            elif proyecto.probabilidad_cierre < 75:
+                if st.button("🎉", key=f"oc_{proyecto.id}", help="Subir Orden de Compra"):
+                    st.session_state.editing_project = proyecto.id
+                    st.rerun()
 
-                with col_btn3:
-                    if proyecto.probabilidad_cierre == 25:
-                        if st.button("📤", key=f"propuesta_{proyecto.id}", help="Subir Propuesta"):
-                            st.session_state.editing_project = proyecto.id
-                            st.rerun()
-                    elif proyecto.probabilidad_cierre == 50:
-                        if st.button("🎉", key=f"oc_{proyecto.id}", help="Subir Orden de Compra"):
-                            st.session_state.editing_project = proyecto.id
-                            st.rerun()
-
-                with col_btn4:
-                    if st.button("🗑️", key=f"delete_{proyecto.id}", help="Eliminar preventa"):
-                        try:
-                            eliminar_proyecto_soft_orm(proyecto.id)
-                            st.success("🗑️ Preventa eliminada!")
-                            time.sleep(1)
-                            st.rerun()
-                        except Exception as e:
-                            st.error(f"❌ Error: {str(e)}")
+        with col_btn4:
+            if st.button("🗑️", key=f"delete_{proyecto.id}", help="Eliminar preventa"):
+                try:
+                    eliminar_proyecto_soft_orm(proyecto.id)
+                    st.session_state.tarjetas_retiradas[proyecto.id] = "🗑️ Preventa eliminada!"
+                    st.rerun(scope="fragment")
+                except Exception as e:
+                    st.error(f"❌ Error: {str(e)}")
 
 # ==============================
-# VISTA DE TABLA
+# Tabla con selección y panel de acciones (fragmento)
 # ==============================
-elif vista_modo == "Tabla":
+if 'version_tabla' not in st.session_state:
+    st.session_state.version_tabla = 0
+
+def limpiar_seleccion_tabla():
+    """Descarta la selección de la tabla (la clave del widget cambia)"""
+    st.session_state.version_tabla += 1
+
+@st.fragment
+def tabla_preventas(proyectos):
+    """Tabla con selección nativa de filas y un solo panel de acciones; seleccionar solo recarga este fragmento"""
     datos_tabla = []
-    for proyecto in proyectos_filtrados:
+    for proyecto in proyectos:
         dias_sin_actualizar = (datetime.now() - proyecto.fecha_ultima_actualizacion).days
         estado_preventa = obtener_estado_preventa(proyecto)
-        criticidad_deadline = calcular_criticidad_deadline(proyecto)
-        estilo_deadline = obtener_estilo_deadline(criticidad_deadline)
 
-        valor_visualizacion = convertir_moneda(
-            proyecto.valor_estimado,
-            proyecto.moneda,
-            moneda_visualizacion,
-            proyecto.tipo_cambio_historico
-        )
+        valor_visualizacion = valores_visualizacion[proyecto.id]
 
         datos_tabla.append({
             'Código': proyecto.codigo_proyecto,
@@ -1213,29 +1209,11 @@ elif vista_modo == "Tabla":
             'ID': proyecto.id
         })
 
-  # Asegurar selección única
-    if 'selected_project_id' not in st.session_state:
-        st.session_state.selected_project_id = None
-
-    # Marcar como seleccionado solo el proyecto en session_state
-    for i, proyecto in enumerate(proyectos_filtrados):
-        datos_tabla[i]['Seleccionar'] = (proyecto.id == st.session_state.selected_project_id)
-
     df = pd.DataFrame(datos_tabla)
 
-    # Reordenar columnas para que "Seleccionar" sea la primera
-    column_order = ['Seleccionar'] + [col for col in df.columns if col != 'Seleccionar' and col != 'ID']
-    df = df[column_order + ['ID']]
-
-    # Mostrar el DataFrame con checkboxes
-    edited_df = st.data_editor(
+    seleccion = st.dataframe(
         df,
         column_config={
-            "Seleccionar": st.column_config.CheckboxColumn(
-                "✓",
-                help="Selecciona un proyecto para editar",
-                width="small"
-            ),
             "ID": None,
             "Código": st.column_config.TextColumn("Código", width="small"),
             "Nombre": st.column_config.TextColumn("Nombre", width="medium"),
@@ -1251,66 +1229,83 @@ elif vista_modo == "Tabla":
         },
         hide_index=True,
         use_container_width=True,
-        disabled=["Código", "Nombre", "Cliente", "Valor", "Asignado", "Estado",
-                 "Probabilidad", "Deadline", "Propuesta", "Últ. Actualización",
-                 "Días sin actualizar", "ID"]
+        key=f"tabla_preventas_{st.session_state.version_tabla}",
+        on_select="rerun",
+        selection_mode="multi-row"
     )
 
-    # Actualizar selección automáticamente
-    selected_rows = edited_df[edited_df["Seleccionar"]]
-    if not selected_rows.empty:
-        new_selected_id = selected_rows.iloc[0]["ID"]
-        if new_selected_id != st.session_state.selected_project_id:
-            st.session_state.selected_project_id = new_selected_id
-            st.rerun()
+    # Panel de acciones sobre la selección
+    ids_seleccionados = df['ID'].iloc[seleccion.selection.rows].tolist()
+    st.markdown("---")
+
+    if not ids_seleccionados:
+        st.info("ℹ️ Selecciona una o más preventas de la tabla para ver las acciones")
+        return
+
+    if len(ids_seleccionados) == 1:
+        proyecto = next(p for p in proyectos if p.id == ids_seleccionados[0])
+        st.info(f"**Seleccionado:** {proyecto.codigo_proyecto} - {proyecto.nombre}")
     else:
-        # Si se deseleccionó todo, limpiar la selección
-        if st.session_state.selected_project_id is not None:
-            st.session_state.selected_project_id = None
+        st.info(f"**{len(ids_seleccionados)} preventas seleccionadas**")
+
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        if st.button("✏️ Editar", key="edit_selected", use_container_width=True, type="primary",
+                     disabled=len(ids_seleccionados) != 1, help="Selecciona un solo proyecto para editar"):
+            st.session_state.editing_project = ids_seleccionados[0]
             st.rerun()
 
-    # Botón de edición
-    st.markdown("---")
-    if st.session_state.selected_project_id:
-        selected_project = next((p for p in proyectos_filtrados if p.id == st.session_state.selected_project_id), None)
-        if selected_project:
-            col1, col2, col3 = st.columns([2, 1, 1])
-            with col1:
-                st.info(f"**Seleccionado:** {selected_project.codigo_proyecto} - {selected_project.nombre}")
-
-            with col2:
-                if st.button(
-                    "✏️ Editar",
-                    use_container_width=True,
-                    type="primary",
-                    key="edit_selected"
-                ):
-                    st.session_state.editing_project = selected_project.id
-                    st.rerun()
+    with col2:
+        if st.button("📞 Contacto", key="contact_selected", use_container_width=True):
+            try:
+                cantidad = registrar_contacto_lote_orm(ids_seleccionados)
+                st.toast(f"✅ Contacto registrado en {cantidad} proyectos")
+                limpiar_seleccion_tabla()
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
 
-            with col3:
-                if st.button(
-                    "🗑️ Limpiar",
-                    use_container_width=True,
-                    key="clear_selected"
-                ):
-                    st.session_state.selected_project_id = None
-                    st.rerun()
-    else:
-        st.info("ℹ️ Selecciona un proyecto de la tabla para habilitar la edición")
+    with col3:
+        if st.button("🗑️ Eliminar", key="delete_selected", use_container_width=True):
+            try:
+                cantidad = eliminar_proyectos_lote_orm(ids_seleccionados)
+                st.toast(f"🗑️ {cantidad} proyectos eliminados")
+                limpiar_seleccion_tabla()
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
 
+    with col4:
+        if st.button("🧹 Limpiar", key="clear_selected", use_container_width=True):
+            limpiar_seleccion_tabla()
+            st.rerun(scope="fragment")
 
-    # df = pd.DataFrame(datos_tabla)
-    # st.dataframe(
-    #     df,
-    #     column_config={
-    #         "ID": None
-    #     },
-    #     selection_mode="single-row",
-    #     hide_index=True,
-    #     use_container_width=True
-    # )
+# ==============================
+# Lista de Preventas
+# ==============================
+st.markdown("---")
+st.header(f"📋 Lista de Preventas ({len(proyectos_filtrados)} encontradas)")
+
+if not proyectos_filtrados:
+    st.info("🔍 No hay preventas que coincidan con los filtros aplicados.")
+
+
+# ==============================
+# VISTA DE TARJETAS (CON ESTILO DE OPORTUNIDADES)
+# ==============================
+elif vista_modo == "Tarjetas":
+    cols = st.columns(3)
+
+    for i, proyecto in enumerate(proyectos_filtrados):
+        with cols[i % 3]:
+            tarjeta_preventa(proyecto, valores_visualizacion[proyecto.id])
 
+# ==============================
+# VISTA DE TABLA
+# ==============================
+elif vista_modo == "Tabla":
+    tabla_preventas(proyectos_filtrados)
 
 # ==============================
 # Footer
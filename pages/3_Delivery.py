@@ -8,10 +8,19 @@ import os
 import re
 from models import Proyecto, Estado, Usuario, Cliente, Contacto, TiposArchivo, ProyectoArchivos
 from database import SessionLocal
+from panel_exportacion import panel_exportacion
+from indice_documentos import encolar_archivo
+from previsualizacion import obtener_previsualizacion, soporta_previsualizacion
+from cache_tarjetas import tarjeta_cacheada
+from ultimos_archivos import obtener_ultimos_archivos_proyecto
+from portafolio import construir_portafolio, convertir_columna, tasas_para_base, BASES_TIPO_CAMBIO
+from cubo_pipeline import kpis_pipeline
+from alertas import alertas_por_id, estilo_alerta
+from configuracion import configuracion
+from filtros_proyectos import FiltroProyectos, RIESGOS, ETIQUETAS_PLAZO, SUBESTADOS
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from sqlalchemy.orm import joinedload
-from sqlalchemy import desc
 
 # ==============================
 # Configuración de la página
@@ -70,27 +79,6 @@ def verificar_archivo_duplicado(proyecto_id, tipo_archivo, nombre_archivo):
     
     return os.path.exists(ruta_completa), nombre_final, ruta_completa
 
-def obtener_ultimo_archivo_por_tipo(proyecto_id, nombre_tipo_archivo):
-    """Obtiene el último archivo subido de un tipo específico para un proyecto"""
-    db = SessionLocal()
-    try:
-        tipo_archivo = db.query(TiposArchivo).filter(
-            TiposArchivo.nombre == nombre_tipo_archivo,
-            TiposArchivo.activo == True
-        ).first()
-        
-        if not tipo_archivo:
-            return None
-        
-        archivo = db.query(ProyectoArchivos).filter(
-            ProyectoArchivos.proyecto_id == proyecto_id,
-            ProyectoArchivos.tipo_archivo_id == tipo_archivo.id
-        ).order_by(desc(ProyectoArchivos.fecha_subida)).first()
-        
-        return archivo
-    finally:
-        db.close()
-
 def obtener_archivos_proyecto(proyecto_id):
     """Obtiene todos los archivos de un proyecto"""
     db = SessionLocal()
@@ -124,18 +112,23 @@ def subir_archivo_proyecto(proyecto_id, tipo_archivo_id, archivo, usuario_id):
             raise FileExistsError(f"Ya existe un archivo con el nombre: {nombre_sanitizado}")
         
         with open(ruta_completa, "wb") as f:
-            f.write(archivo.getvalue())
+            contenido = archivo.getvalue()
+            f.write(contenido)
         
         nuevo_archivo = ProyectoArchivos(
             proyecto_id=proyecto_id,
             tipo_archivo_id=tipo_archivo_id,
             nombre_archivo=archivo.name,
             ruta_archivo=ruta_completa,
-            subido_por_id=usuario_id
+            subido_por_id=usuario_id,
+            tamanio_bytes=len(contenido)
         )
         
         db.add(nuevo_archivo)
         db.commit()
+
+        # Extraer texto e indexar en segundo plano
+        encolar_archivo(nuevo_archivo.id)
         
         return nuevo_archivo
     except Exception as e:
@@ -154,16 +147,11 @@ def get_db():
     finally:
         db.close()
 
-def cargar_proyectos_activos():
-    """Carga solo proyectos activos con todas las relaciones usando ORM"""
+def cargar_proyectos_activos(filtro):
+    """Carga los proyectos activos que cumplen el filtro, con sus relaciones (una sola consulta)"""
     try:
         db = SessionLocal()
-        proyectos = db.query(Proyecto).filter(Proyecto.activo == True).all()
-
-        for proyecto in proyectos:
-            _ = proyecto.cliente
-            _ = proyecto.asignado_a
-            _ = proyecto.contacto_principal
+        proyectos = filtro.consulta(db).all()
 
         db.close()
         return proyectos
@@ -171,6 +159,30 @@ def cargar_proyectos_activos():
         st.error(f"❌ Error cargando proyectos: {str(e)}")
         return []
 
+def cargar_proyecto_activo(filtro, proyecto_id):
+    """Carga un proyecto por id si cumple el filtro, con sus relaciones"""
+    try:
+        db = SessionLocal()
+        proyecto = filtro.consulta(db).filter(Proyecto.id == proyecto_id).first()
+
+        db.close()
+        return proyecto
+    except Exception as e:
+        st.error(f"❌ Error cargando proyecto: {str(e)}")
+        return None
+
+def contar_proyectos(filtro, **casos):
+    """Total y conteos por caso de los proyectos que cumplen el filtro (una consulta agregada)"""
+    try:
+        db = SessionLocal()
+        conteos = filtro.conteos(db, **casos)
+
+        db.close()
+        return conteos
+    except Exception as e:
+        st.error(f"❌ Error contando proyectos: {str(e)}")
+        return dict.fromkeys(['total', *casos], 0)
+
 def cargar_historial_proyecto(proyecto_id):
     """Carga el historial de eventos para un proyecto específico"""
     try:
@@ -198,7 +210,7 @@ def actualizar_proyecto_orm(proyecto_id, datos_actualizados):
         proyecto.descripcion = datos_actualizados['descripcion']
         proyecto.valor_estimado = datos_actualizados['valor_estimado']
         proyecto.moneda = datos_actualizados['moneda']
-        proyecto.tipo_cambio_historico = datos_actualizados.get('tipo_cambio', 3.80)
+        proyecto.tipo_cambio_historico = datos_actualizados.get('tipo_cambio', configuracion().TIPO_CAMBIO_DEFAULT)
         proyecto.cliente_id = datos_actualizados['cliente_id']
         proyecto.asignado_a_id = datos_actualizados['asignado_a_id']
         proyecto.fecha_ultima_actualizacion = datetime.now()
@@ -251,6 +263,36 @@ def registrar_contacto_orm(proyecto_id):
         db.rollback()
         raise e
 
+def aplicar_en_lote_orm(proyecto_ids, accion):
+    """Aplica `accion(proyecto)` a varios proyectos en una sola transacción"""
+    db = SessionLocal()
+    try:
+        proyectos = db.query(Proyecto).filter(Proyecto.id.in_([int(pid) for pid in proyecto_ids])).all()
+        for proyecto in proyectos:
+            accion(proyecto)
+        db.commit()
+        return len(proyectos)
+    except Exception as e:
+        db.rollback()
+        raise e
+    finally:
+        db.close()
+
+def registrar_contacto_lote_orm(proyecto_ids):
+    """Registra un contacto en varios proyectos"""
+    def registrar(proyecto):
+        proyecto.agregar_evento_historial(f"Contacto registrado el {datetime.now().strftime('%d/%m/%Y %H:%M')}")
+        proyecto.fecha_ultima_actualizacion = datetime.now()
+    return aplicar_en_lote_orm(proyecto_ids, registrar)
+
+def eliminar_proyectos_lote_orm(proyecto_ids):
+    """Soft delete de varios proyectos"""
+    def eliminar(proyecto):
+        proyecto.activo = False
+        proyecto.fecha_ultima_actualizacion = datetime.now()
+        proyecto.agregar_evento_historial(f"Eliminado el {datetime.now().strftime('%d/%m/%Y %H:%M')}")
+    return aplicar_en_lote_orm(proyecto_ids, eliminar)
+
 def subir_guia_remision_orm(proyecto_id, usuario_id, fecha_entrega):
     """Sube guía de remisión y marca como entregado"""
     try:
@@ -331,10 +373,11 @@ def cargar_contactos_activos():
 # ==============================
 # Funciones de conversión de moneda
 # ==============================
-def convertir_moneda(valor, moneda_origen, moneda_destino, tipo_cambio=3.8):
+def convertir_moneda(valor, moneda_origen, moneda_destino, tipo_cambio=None):
     """Convierte un valor entre PEN and USD"""
     if moneda_origen == moneda_destino:
         return valor
+    tipo_cambio = tipo_cambio or configuracion().TIPO_CAMBIO_DEFAULT
 
     if moneda_origen == 'PEN' and moneda_destino == 'USD':
         return valor / tipo_cambio
@@ -355,52 +398,29 @@ def formatear_moneda(valor, moneda):
 # ==============================
 def obtener_estilo_entrega(nivel_alerta):
     """Devuelve estilo CSS según el nivel de alerta de entrega"""
-    estilos = {
-        'vencido': {'color': '#666666', 'icono': '☠️', 'fondo': '#F5F5F5'},
-        'critico': {'color': '#dc2626', 'icono': '🔥', 'fondo': '#fef2f2'},
-        'muy_urgente': {'color': '#ea580c', 'icono': '⏰', 'fondo': '#fff7ed'},
-        'urgente': {'color': '#ea580c', 'icono': '⏳', 'fondo': '#fff7ed'},
-        'por_vencer': {'color': '#ca8a04', 'icono': '📅', 'fondo': '#fefce8'},
-        'disponible': {'color': '#16a34a', 'icono': '✅', 'fondo': '#f0fdf4'},
-        'sin_deadline': {'color': '#16a34a', 'icono': '📌', 'fondo': '#f0fdf4'}
-    }
-    return estilos.get(nivel_alerta, estilos['sin_deadline'])
+    return estilo_alerta(nivel_alerta)
 
 def calcular_criticidad_entrega(proyecto):
-    """Calcula la criticidad basada en la fecha de entrega"""
-    if not proyecto.fecha_ingreso_oc or not proyecto.plazo_entrega:
-        return 'sin_deadline'
-
-    fecha_entrega_estimada = proyecto.fecha_ingreso_oc + timedelta(days=proyecto.plazo_entrega)
-    dias_restantes = (fecha_entrega_estimada - datetime.now()).days
-
-    if dias_restantes < 0:
-        return 'vencido'
-    elif dias_restantes == 0:
-        return 'critico'
-    elif dias_restantes <= 1:
-        return 'muy_urgente'
-    elif dias_restantes <= 3:
-        return 'urgente'
-    elif dias_restantes <= 7:
-        return 'por_vencer'
-    else:
-        return 'disponible'
+    """Nivel de la entrega desde el motor de alertas (calculado por lote en cada recarga)"""
+    alerta = alertas_proyectos.get(proyecto.id)
+    return alerta['nivel_entrega'] if alerta else proyecto.obtener_nivel_alerta_entrega()
 
 def get_color_riesgo(dias_sin_actualizar):
     """Determina el color según la criticidad por inactividad"""
-    if dias_sin_actualizar > 15:
+    config = configuracion()
+    if dias_sin_actualizar > config.DIAS_ALERTA_CRITICO:
         return "#ff4b4b"
-    elif dias_sin_actualizar > 7:
+    elif dias_sin_actualizar > config.DIAS_ALERTA_RIESGO:
         return "#ffa64b"
     else:
         return "#4caf50"
 
 def get_estado_riesgo(dias_sin_actualizar):
     """Determina el estado textual del riesgo por inactividad"""
-    if dias_sin_actualizar > 15:
+    config = configuracion()
+    if dias_sin_actualizar > config.DIAS_ALERTA_CRITICO:
         return "Crítico"
-    elif dias_sin_actualizar > 7:
+    elif dias_sin_actualizar > config.DIAS_ALERTA_RIESGO:
         return "En Riesgo"
     else:
         return "Normal"
@@ -424,6 +444,9 @@ MONEDAS_DISPONIBLES = ['PEN', 'USD']
 if 'editing_project' not in st.session_state:
     st.session_state.editing_project = None
 
+# Tarjetas retiradas desde su fragmento (movidas o eliminadas); se limpia en cada recarga completa
+st.session_state.tarjetas_retiradas = {}
+
 if 'modal_archivos_abierto' not in st.session_state:
     st.session_state.modal_archivos_abierto = False
 if 'proyecto_archivos' not in st.session_state:
@@ -438,8 +461,17 @@ st.page_link("main_app.py", label="🔙 Volver al Workflow Principal")
 # ==============================
 # Cargar datos desde ORM
 # ==============================
-proyectos_todos = cargar_proyectos_activos()
-proyectos_delivery = [p for p in proyectos_todos if p.estado_actual == Estado.DELIVERY.value]
+# Totales por sub-estado del estado por agregados SQL; solo se cargan los proyectos filtrados
+filtro_estado = FiltroProyectos(estado=Estado.DELIVERY.value)
+conteos_delivery = contar_proyectos(
+    filtro_estado,
+    pendientes=SUBESTADOS['pendiente_entrega'][1](),
+    entregados=SUBESTADOS['entregado'][1](),
+    facturados=SUBESTADOS['facturado'][1](),
+    # Entrega vencida y aún no entregada
+    entregas_vencidas=FiltroProyectos(entrega='vencido', subestado='pendiente_entrega',
+                                      ahora=filtro_estado.ahora).condicion(),
+)
 
 # Cargar datos para selects
 usuarios_db = cargar_usuarios_activos()
@@ -451,66 +483,88 @@ CLIENTES_DISPONIBLES = [c.nombre for c in clientes_db]
 
 usuario_nombre_a_id = {u.nombre: u.id for u in usuarios_db}
 cliente_nombre_a_id = {c.nombre: c.id for c in clientes_db}
+usuario_id_a_nombre = {u.id: u.nombre for u in usuarios_db}
+cliente_id_a_nombre = {c.id: c.nombre for c in clientes_db}
 
 tipos_archivo_db = obtener_tipos_archivo()
 
 # ==============================
 # MODAL PARA GESTIÓN DE ARCHIVOS
 # ==============================
-if st.session_state.modal_archivos_abierto and st.session_state.proyecto_archivos:
-    with st.sidebar:
-        st.header("📁 Gestión de Archivos")
-        st.write(f"Proyecto: **{st.session_state.proyecto_archivos.codigo_proyecto}**")
-        
-        with st.expander("📤 Subir nuevo archivo", expanded=True):
-            archivo_subir = st.file_uploader("Seleccionar archivo", type=['pdf', 'docx', 'xlsx', 'jpg', 'png'])
-            tipo_seleccionado = st.selectbox("Tipo de archivo", 
-                                           options=[(t.id, t.nombre) for t in tipos_archivo_db],
-                                           format_func=lambda x: x[1])
-            
-            if archivo_subir and st.button("Subir archivo"):
-                try:
-                    subir_archivo_proyecto(
-                        st.session_state.proyecto_archivos.id,
-                        tipo_seleccionado[0],
-                        archivo_subir,
-                        1  # ID del usuario actual
-                    )
-                    st.success("✅ Archivo subido correctamente")
-                    time.sleep(1)
-                    st.rerun()
-                except FileExistsError as e:
-                    st.error(f"❌ {str(e)}")
-                except Exception as e:
-                    st.error(f"❌ Error al subir archivo: {str(e)}")
-        
-        st.divider()
-        st.subheader("Archivos del proyecto")
-        archivos = obtener_archivos_proyecto(st.session_state.proyecto_archivos.id)
-        
-        if not archivos:
-            st.info("📝 No hay archivos subidos para este proyecto")
-        else:
-            for archivo in archivos:
-                with st.expander(f"{archivo.tipo_archivo.nombre}: {archivo.nombre_archivo}"):
-                    st.write(f"**Subido por:** {archivo.usuario.nombre if archivo.usuario else 'N/A'}")
-                    st.write(f"**Fecha:** {archivo.fecha_subida.strftime('%d/%m/%Y %H:%M')}")
-                    st.write(f"**Tamaño:** {os.path.getsize(archivo.ruta_archivo) if os.path.exists(archivo.ruta_archivo) else 'N/A'} bytes")
-                    
-                    if os.path.exists(archivo.ruta_archivo):
-                        with open(archivo.ruta_archivo, "rb") as f:
-                            st.download_button(
-                                "⬇️ Descargar",
-                                f.read(),
-                                archivo.nombre_archivo,
-                                key=f"download_{archivo.id}"
-                            )
-                    else:
-                        st.warning("⚠️ Archivo no encontrado en el filesystem")
-        
-        if st.button("Cerrar gestión de archivos"):
-            st.session_state.modal_archivos_abierto = False
-            st.rerun()
+@st.fragment
+def modal_archivos():
+    """Gestión de archivos del proyecto; subir o cerrar solo recarga este fragmento"""
+    if not (st.session_state.modal_archivos_abierto and st.session_state.proyecto_archivos):
+        return
+
+    st.header("📁 Gestión de Archivos")
+    st.write(f"Proyecto: **{st.session_state.proyecto_archivos.codigo_proyecto}**")
+
+    with st.expander("📤 Subir nuevo archivo", expanded=True):
+        archivo_subir = st.file_uploader("Seleccionar archivo", type=['pdf', 'docx', 'xlsx', 'jpg', 'png'])
+        tipo_seleccionado = st.selectbox("Tipo de archivo", 
+                                       options=[(t.id, t.nombre) for t in tipos_archivo_db],
+                                       format_func=lambda x: x[1])
+
+        if archivo_subir and st.button("Subir archivo"):
+            try:
+                subir_archivo_proyecto(
+                    st.session_state.proyecto_archivos.id,
+                    tipo_seleccionado[0],
+                    archivo_subir,
+                    1  # ID del usuario actual
+                )
+                st.toast("✅ Archivo subido correctamente")
+                st.rerun(scope="fragment")
+            except FileExistsError as e:
+                st.error(f"❌ {str(e)}")
+            except Exception as e:
+                st.error(f"❌ Error al subir archivo: {str(e)}")
+
+    st.divider()
+    st.subheader("Archivos del proyecto")
+    archivos = obtener_archivos_proyecto(st.session_state.proyecto_archivos.id)
+
+    if not archivos:
+        st.info("📝 No hay archivos subidos para este proyecto")
+    else:
+        for archivo in archivos:
+            with st.expander(f"{archivo.tipo_archivo.nombre}: {archivo.nombre_archivo}"):
+                st.write(f"**Subido por:** {archivo.usuario.nombre if archivo.usuario else 'N/A'}")
+                st.write(f"**Fecha:** {archivo.fecha_subida.strftime('%d/%m/%Y %H:%M')}")
+                st.write(f"**Tamaño:** {os.path.getsize(archivo.ruta_archivo) if os.path.exists(archivo.ruta_archivo) else 'N/A'} bytes")
+
+                # Miniatura y vista previa desde la caché de previsualizaciones
+                if soporta_previsualizacion(archivo.ruta_archivo):
+                    miniatura = obtener_previsualizacion(archivo.ruta_archivo, 'miniatura')
+                    if miniatura:
+                        st.image(miniatura)
+                        if st.toggle("🔍 Vista previa", key=f"preview_{archivo.id}"):
+                            vista = obtener_previsualizacion(archivo.ruta_archivo, 'vista')
+                            if vista:
+                                st.image(vista)
+
+                if os.path.exists(archivo.ruta_archivo):
+                    with open(archivo.ruta_archivo, "rb") as f:
+                        st.download_button(
+                            "⬇️ Descargar",
+                            f.read(),
+                            archivo.nombre_archivo,
+                            key=f"download_{archivo.id}"
+                        )
+                else:
+                    st.warning("⚠️ Archivo no encontrado en el filesystem")
+
+    # Exportación masiva de documentos en ZIP
+    panel_exportacion(st.session_state.proyecto_archivos)
+
+    if st.button("Cerrar gestión de archivos"):
+        st.session_state.modal_archivos_abierto = False
+        st.session_state.exportacion_zip = None
+        st.rerun(scope="fragment")
+
+with st.sidebar:
+    modal_archivos()
 
 # ==============================
 # Sidebar para filtros y vista 
@@ -520,109 +574,88 @@ with st.sidebar:
     vista_modo = st.radio("Modo de vista:", ["Tarjetas", "Tabla"])
 
     moneda_visualizacion = st.selectbox("Moneda para visualización:", MONEDAS_DISPONIBLES)
+    base_tipo_cambio = st.selectbox("Tipo de cambio:", list(BASES_TIPO_CAMBIO),
+                                    format_func=lambda base: BASES_TIPO_CAMBIO[base],
+                                    help="Histórico: el registrado en cada proyecto. Las demás opciones usan el tipo de cambio vigente en esa fecha.")
 
     st.header("🔍 Filtros")
-    filtro_ejecutivo = st.selectbox("Ejecutivo", ["Todos"] + EJECUTIVOS_DISPONIBLES)
-    filtro_cliente = st.selectbox("Cliente", ["Todos"] + CLIENTES_DISPONIBLES)
-    filtro_moneda = st.selectbox("Moneda", ["Todas"] + MONEDAS_DISPONIBLES)
-    filtro_riesgo = st.selectbox("Estado de Riesgo", ["Todos", "Normal", "En Riesgo", "Crítico"])
+    filtro_ejecutivo = st.selectbox("Ejecutivo", [None] + [u.id for u in usuarios_db],
+                                    format_func=lambda i: "Todos" if i is None else usuario_id_a_nombre[i])
+    filtro_cliente = st.selectbox("Cliente", [None] + [c.id for c in clientes_db],
+                                  format_func=lambda i: "Todos" if i is None else cliente_id_a_nombre[i])
+    filtro_moneda = st.selectbox("Moneda", [None] + MONEDAS_DISPONIBLES, format_func=lambda m: m or "Todas")
+    filtro_riesgo = st.selectbox("Estado de Riesgo", [None] + list(RIESGOS), format_func=lambda r: r or "Todos")
     
     # Filtro por sub-estado de delivery
-    filtro_subestado = st.selectbox("Estado Delivery", [
-        "Todos", 
-        "📦 PENDIENTE DE ENTREGA", 
-        "✅ ENTREGADO", 
-        "🧾 FACTURADO"
-    ])
+    filtro_subestado = st.selectbox("Estado Delivery", [None, 'pendiente_entrega', 'entregado', 'facturado'],
+                                    format_func=lambda e: SUBESTADOS[e][0] if e else "Todos")
     
-    filtro_entrega = st.selectbox("Estado Entrega", [
-        "Todos", 
-        "Vencido", 
-        "Crítico", 
-        "Urgente", 
-        "Por Vencer", 
-        "Disponible", 
-        "Sin Deadline"
-    ])
+    filtro_entrega = st.selectbox("Estado Entrega", [None, 'vencido', 'critico', 'urgente', 'por_vencer', 'disponible', 'sin_deadline'],
+                                  format_func=lambda d: ETIQUETAS_PLAZO.get(d, "Todos"))
+
+# ==============================
+# Aplicar filtros
+# ==============================
+proyectos_filtrados = cargar_proyectos_activos(FiltroProyectos(
+    estado=Estado.DELIVERY.value, asignado_a_id=filtro_ejecutivo, cliente_id=filtro_cliente,
+    moneda=filtro_moneda, riesgo=filtro_riesgo, subestado=filtro_subestado, entrega=filtro_entrega,
+))
+portafolio = construir_portafolio(proyectos_filtrados)
+alertas_proyectos = alertas_por_id(portafolio)
 
+with st.sidebar:
     st.divider()
     st.header("📈 Estadísticas Rápidas")
-    total_delivery = len(proyectos_delivery)
+    tasas_visualizacion = tasas_para_base(portafolio, base_tipo_cambio)
+    # KPIs desde el cubo del pipeline, con los mismos filtros de ejecutivo, cliente y moneda
+    kpis = kpis_pipeline(
+        moneda_visualizacion, base_tipo_cambio,
+        estados=[Estado.DELIVERY.value],
+        asignados=None if filtro_ejecutivo is None else [filtro_ejecutivo],
+        clientes=None if filtro_cliente is None else [filtro_cliente],
+        monedas=None if filtro_moneda is None else [filtro_moneda],
+    )
+    valores_visualizacion = convertir_columna(portafolio, moneda_visualizacion, tasas_visualizacion).to_dict()
+    total_delivery = conteos_delivery['total']
     st.metric("Total Delivery", total_delivery)
 
     if total_delivery > 0:
-        valor_total = 0
-        for p in proyectos_delivery:
-            valor_convertido = convertir_moneda(
-                p.valor_estimado,
-                p.moneda,
-                moneda_visualizacion,
-                p.tipo_cambio_historico
-            )
-            valor_total += valor_convertido
-
-        st.metric("Valor Total Pipeline", formatear_moneda(valor_total, moneda_visualizacion))
-
-        deliveries_riesgo = len([p for p in proyectos_delivery
-                               if (datetime.now() - p.fecha_ultima_actualizacion).days > 7])
+        st.metric("Valor Total Pipeline", formatear_moneda(kpis['total'], moneda_visualizacion))
+
+        deliveries_riesgo = kpis['en_riesgo']
         st.metric("En Riesgo", deliveries_riesgo, delta=-deliveries_riesgo if deliveries_riesgo > 0 else 0)
 
 # ==============================
 # KPIs principales 
 # ==============================
-if proyectos_delivery:
+if total_delivery:
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        valor_pipeline = 0
-        for p in proyectos_delivery:
-            # Valor ponderado por probabilidad
-            valor_convertido = convertir_moneda(
-                p.valor_estimado * (p.probabilidad_cierre / 100),
-                p.moneda,
-                moneda_visualizacion,
-                p.tipo_cambio_historico
-            )
-            valor_pipeline += valor_convertido
+        valor_pipeline = kpis['ponderado']
 
         st.metric("💰 Valor del Pipeline", formatear_moneda(valor_pipeline, moneda_visualizacion))
 
     with col2:
-        total_valor = 0
-        for p in proyectos_delivery:
-            valor_convertido = convertir_moneda(
-                p.valor_estimado,
-                p.moneda,
-                moneda_visualizacion,
-                p.tipo_cambio_historico
-            )
-            total_valor += valor_convertido
+        total_valor = kpis['total']
 
         st.metric("💸 Valor Total Estimado", formatear_moneda(total_valor, moneda_visualizacion))
 
     with col3:
-        # Contar proyectos por sub-estado
-        pendientes = len([p for p in proyectos_delivery if not p.entregado])
-        entregados = len([p for p in proyectos_delivery if p.entregado and not p.facturado])
-        facturados = len([p for p in proyectos_delivery if p.facturado])
-        
-        st.metric("📦 Pendientes de Entrega", pendientes)
-        st.metric("✅ Entregados", entregados)
-        st.metric("🧾 Facturados", facturados)
+        # Proyectos por sub-estado
+        st.metric("📦 Pendientes de Entrega", conteos_delivery['pendientes'])
+        st.metric("✅ Entregados", conteos_delivery['entregados'])
+        st.metric("🧾 Facturados", conteos_delivery['facturados'])
 
     with col4:
-        # Contar deliveries con entrega vencida
-        entregas_vencidas = len([p for p in proyectos_delivery
-                                if p.fecha_ingreso_oc and p.plazo_entrega and
-                                (p.fecha_ingreso_oc + timedelta(days=p.plazo_entrega)) < datetime.now() and
-                                not p.entregado])
-        st.metric("⏰ Entregas Vencidas", entregas_vencidas)
+        # Deliveries con entrega vencida
+        st.metric("⏰ Entregas Vencidas", conteos_delivery['entregas_vencidas'])
 
 # ==============================
 # Formulario de Edición
 # ==============================
 if st.session_state.editing_project is not None:
-    proyecto_editar = next((p for p in proyectos_delivery if p.id == st.session_state.editing_project), None)
+    proyecto_editar = cargar_proyecto_activo(filtro_estado, st.session_state.editing_project)
 
     if proyecto_editar:
         st.markdown("---")
@@ -641,8 +674,9 @@ if st.session_state.editing_project is not None:
             """, unsafe_allow_html=True)
 
             # Obtener los últimos archivos por tipo
-            ultima_guia = obtener_ultimo_archivo_por_tipo(proyecto_editar.id, "GUIA")
-            ultima_factura = obtener_ultimo_archivo_por_tipo(proyecto_editar.id, "FACTURA")
+            ultimos_archivos = obtener_ultimos_archivos_proyecto(proyecto_editar.id)
+            ultima_guia = ultimos_archivos.get("GUIA")
+            ultima_factura = ultimos_archivos.get("FACTURA")
             
             # SECCIÓN DIFERENCIADA POR ESTADO
             if proyecto_editar.facturado:
@@ -874,160 +908,127 @@ if st.session_state.editing_project is not None:
                     st.rerun()
 
 # ==============================
-# Aplicar filtros
+# HTML de la tarjeta (memorizado)
 # ==============================
-proyectos_filtrados = proyectos_delivery.copy()
-
-if filtro_ejecutivo != "Todos":
-    proyectos_filtrados = [p for p in proyectos_filtrados if p.asignado_a.nombre == filtro_ejecutivo]
-
-if filtro_cliente != "Todos":
-    proyectos_filtrados = [p for p in proyectos_filtrados if p.cliente.nombre == filtro_cliente]
-
-if filtro_moneda != "Todas":
-    proyectos_filtrados = [p for p in proyectos_filtrados if p.moneda == filtro_moneda]
-
-if filtro_riesgo != "Todos":
-    proyectos_filtrados = [p for p in proyectos_filtrados
-                          if get_estado_riesgo((datetime.now() - p.fecha_ultima_actualizacion).days) == filtro_riesgo]
-
-if filtro_subestado != "Todos":
-    if filtro_subestado == "📦 PENDIENTE DE ENTREGA":
-        proyectos_filtrados = [p for p in proyectos_filtrados if not p.entregado]
-    elif filtro_subestado == "✅ ENTREGADO":
-        proyectos_filtrados = [p for p in proyectos_filtrados if p.entregado and not p.facturado]
-    elif filtro_subestado == "🧾 FACTURADO":
-        proyectos_filtrados = [p for p in proyectos_filtrados if p.facturado]
-
-if filtro_entrega != "Todos":
-    proyectos_filtrados = [p for p in proyectos_filtrados
-                          if calcular_criticidad_entrega(p) == filtro_entrega.lower().replace(' ', '_')]
-
-# ==============================
-# Lista de Deliveries
-# ==============================
-st.markdown("---")
-st.header(f"📋 Lista de Deliveries ({len(proyectos_filtrados)} encontradas)")
-
-if not proyectos_filtrados:
-    st.info("🔍 No hay deliveries que coincidan con los filtros aplicados.")
+def dias_restantes_entrega(proyecto):
+    """Días hasta la entrega estimada (None sin OC o plazo); forma parte de la clave de la tarjeta"""
+    if not (proyecto.fecha_ingreso_oc and proyecto.plazo_entrega):
+        return None
+    return (proyecto.fecha_ingreso_oc + timedelta(days=proyecto.plazo_entrega) - datetime.now()).days
+
+def html_tarjeta_delivery(proyecto, valor_convertido, dias_restantes, criticidad_entrega):
+    """HTML de la tarjeta; se memoriza en cache_tarjetas mientras el proyecto y sus días no cambien"""
+    # Obtener sub-estado de delivery
+    estado_delivery = obtener_estado_delivery(proyecto)
+    estilo_entrega = obtener_estilo_entrega(criticidad_entrega)
+
+    # Formatear valor según moneda
+    valor_formateado = formatear_moneda(valor_convertido, moneda_visualizacion)
+
+    # Información de entrega
+    if dias_restantes is not None:
+        fecha_entrega_estimada = proyecto.fecha_ingreso_oc + timedelta(days=proyecto.plazo_entrega)
+        texto_dias = f"{abs(dias_restantes)} días {'pasados' if dias_restantes < 0 else 'restantes'}"
+        entrega_html = f"""{estilo_entrega['icono']} Entrega: {fecha_entrega_estimada.strftime('%d/%m/%y')} ({texto_dias})"""
+    else:
+        entrega_html = f"{estilo_entrega['icono']} Sin fecha de entrega"
+
+    # TARJETA CON ESTILO
+    return f"""
+    <div style="
+        border: 2px solid {estado_delivery['color']};
+        border-radius: 12px;
+        padding: 16px;
+        margin: 8px 0;
+        background: linear-gradient(145deg, {estado_delivery['color']}08, {estado_delivery['color']}15);
+        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
+    ">
+        <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px;">
+            <h4 style="color: {estado_delivery['color']}; margin: 0; font-size: 16px;">{proyecto.codigo_proyecto}</h4>
+            <span style="background-color: {estado_delivery['color']}20; color: {estado_delivery['color']};
+                        padding: 4px 8px; border-radius: 12px; font-size: 12px; font-weight: bold;">
+                {estado_delivery['icono']} {estado_delivery['nombre'].split()[-1]}
+            </span>
+        </div>
+        <p style="margin: 8px 0; font-weight: bold; font-size: 14px;">{proyecto.nombre}</p>
+        <p style="margin: 4px 0; font-size: 12px;">👤 {proyecto.asignado_a.nombre if proyecto.asignado_a else 'Sin asignar'}</p>
+        <p style="margin: 4px 0; font-size: 12px;">🏢 {proyecto.cliente.nombre if proyecto.cliente else 'Sin cliente'}</p>
+        <p style="margin: 4px 0; font-size: 12px; color: #666;">💰 {valor_formateado} <small>({proyecto.moneda})</small></p>
+        <p style="margin: 4px 0; font-size: 11px; color: {estado_delivery['color']};">{entrega_html}</p>
+    </div>
+    """
 
 # ==============================
-# VISTA DE TARJETAS
+# Tarjeta de proyecto (fragmento)
 # ==============================
-elif vista_modo == "Tarjetas":
-    cols = st.columns(3)
-
-    for i, proyecto in enumerate(proyectos_filtrados):
-        dias_sin_actualizar = (datetime.now() - proyecto.fecha_ultima_actualizacion).days
-        color_riesgo = get_color_riesgo(dias_sin_actualizar)
-        estado_riesgo = get_estado_riesgo(dias_sin_actualizar)
-
-        # Obtener sub-estado de delivery
-        estado_delivery = obtener_estado_delivery(proyecto)
+@st.fragment
+def tarjeta_delivery(proyecto, valor_convertido):
+    """Tarjeta con sus acciones; contacto, mover o eliminar solo recargan este fragmento"""
+    if proyecto.id in st.session_state.tarjetas_retiradas:
+        st.info(st.session_state.tarjetas_retiradas[proyecto.id])
+        return
+
+    with st.container():
+        dias_restantes = dias_restantes_entrega(proyecto)
         criticidad_entrega = calcular_criticidad_entrega(proyecto)
-        estilo_entrega = obtener_estilo_entrega(criticidad_entrega)
-
-        # Convertir valor a moneda de visualización
-        valor_convertido = convertir_moneda(
-            proyecto.valor_estimado,
-            proyecto.moneda,
-            moneda_visualizacion,
-            proyecto.tipo_cambio_historico
-        )
+        st.markdown(tarjeta_cacheada("delivery", proyecto, moneda_visualizacion, valor_convertido,
+                                     lambda: html_tarjeta_delivery(proyecto, valor_convertido, dias_restantes, criticidad_entrega),
+                                     dias_restantes, criticidad_entrega),
+                    unsafe_allow_html=True)
 
-        # Formatear valor según moneda
-        valor_formateado = formatear_moneda(valor_convertido, moneda_visualizacion)
+        # Botones de acción
+        col_btn1, col_btn2, col_btn3, col_btn4 = st.columns(4)
 
-        with cols[i % 3]:
-            with st.container():
-                # Información de entrega
-                info_entrega = ""
-                if proyecto.fecha_ingreso_oc and proyecto.plazo_entrega:
-                    fecha_entrega_estimada = proyecto.fecha_ingreso_oc + timedelta(days=proyecto.plazo_entrega)
-                    dias_restantes = (fecha_entrega_estimada - datetime.now()).days
-                    texto_dias = f"{abs(dias_restantes)} días {'pasados' if dias_restantes < 0 else 'restantes'}"
-                    entrega_html = f"""{estilo_entrega['icono']} Entrega: {fecha_entrega_estimada.strftime('%d/%m/%y')} ({texto_dias})"""
-                else:
-                    entrega_html = f"{estilo_entrega['icono']} Sin fecha de entrega"
-
-                # TARJETA CON ESTILO
-                st.markdown(f"""
-                <div style="
-                    border: 2px solid {estado_delivery['color']};
-                    border-radius: 12px;
-                    padding: 16px;
-                    margin: 8px 0;
-                    background: linear-gradient(145deg, {estado_delivery['color']}08, {estado_delivery['color']}15);
-                    box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-                ">
-                    <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px;">
-                        <h4 style="color: {estado_delivery['color']}; margin: 0; font-size: 16px;">{proyecto.codigo_proyecto}</h4>
-                        <span style="background-color: {estado_delivery['color']}20; color: {estado_delivery['color']};
-                                    padding: 4px 8px; border-radius: 12px; font-size: 12px; font-weight: bold;">
-                            {estado_delivery['icono']} {estado_delivery['nombre'].split()[-1]}
-                        </span>
-                    </div>
-                    <p style="margin: 8px 0; font-weight: bold; font-size: 14px;">{proyecto.nombre}</p>
-                    <p style="margin: 4px 0; font-size: 12px;">👤 {proyecto.asignado_a.nombre if proyecto.asignado_a else 'Sin asignar'}</p>
-                    <p style="margin: 4px 0; font-size: 12px;">🏢 {proyecto.cliente.nombre if proyecto.cliente else 'Sin cliente'}</p>
-                    <p style="margin: 4px 0; font-size: 12px; color: #666;">💰 {valor_formateado} <small>({proyecto.moneda})</small></p>
-                    <p style="margin: 4px 0; font-size: 11px; color: {estado_delivery['color']};">{entrega_html}</p>
-                </div>
-                """, unsafe_allow_html=True)
-
-                # Botones de acción
-                col_btn1, col_btn2, col_btn3, col_btn4 = st.columns(4)
-
-                with col_btn1:
-                    if st.button("✏️", key=f"edit_{proyecto.id}", help="Editar delivery"):
-                        st.session_state.editing_project = proyecto.id
-                        st.rerun()
+        with col_btn1:
+            if st.button("✏️", key=f"edit_{proyecto.id}", help="Editar delivery"):
+                st.session_state.editing_project = proyecto.id
+                st.rerun()
 
-                with col_btn2:
-                    if st.button("📞", key=f"contact_{proyecto.id}", help="Registrar contacto"):
-                        nuevo_deadline = registrar_contacto_orm(proyecto.id)
-                        st.success(f"✅ Contacto registrado. Próximo seguimiento: {nuevo_deadline.strftime('%d/%m/%Y')}")
-                        time.sleep(2)
-                        st.rerun()
+        with col_btn2:
+            if st.button("📞", key=f"contact_{proyecto.id}", help="Registrar contacto"):
+                nuevo_deadline = registrar_contacto_orm(proyecto.id)
+                st.toast(f"✅ Contacto registrado. Próximo seguimiento: {nuevo_deadline.strftime('%d/%m/%Y')}")
+                proyecto.fecha_ultima_actualizacion = datetime.now()
+                st.rerun(scope="fragment")
+
+        with col_btn3:
+            if not proyecto.entregado:
+                if st.button("📦", key=f"guia_{proyecto.id}", help="Subir Guía"):
+                    st.session_state.editing_project = proyecto.id
+                    st.rerun()
+            elif not proyecto.facturado:
+                if st.button("🧾", key=f"factura_{proyecto.id}", help="Subir Factura"):
+                    st.session_state.editing_project = proyecto.id
+                    st.rerun()
 
-                with col_btn3:
-                    if not proyecto.entregado:
-                        if st.button("📦", key=f"guia_{proyecto.id}", help="Subir Guía"):
-                            st.session_state.editing_project = proyecto.id
-                            st.rerun()
-                    elif not proyecto.facturado:
-                        if st.button("🧾", key=f"factura_{proyecto.id}", help="Subir Factura"):
-                            st.session_state.editing_project = proyecto.id
-                            st.rerun()
-
-                with col_btn4:
-                    if st.button("🗑️", key=f"delete_{proyecto.id}", help="Eliminar delivery"):
-                        try:
-                            eliminar_proyecto_soft_orm(proyecto.id)
-                            st.success("🗑️ Delivery eliminado!")
-                            time.sleep(1)
-                            st.rerun()
-                        except Exception as e:
-                            st.error(f"❌ Error: {str(e)}")
+        with col_btn4:
+            if st.button("🗑️", key=f"delete_{proyecto.id}", help="Eliminar delivery"):
+                try:
+                    eliminar_proyecto_soft_orm(proyecto.id)
+                    st.session_state.tarjetas_retiradas[proyecto.id] = "🗑️ Delivery eliminado!"
+                    st.rerun(scope="fragment")
+                except Exception as e:
+                    st.error(f"❌ Error: {str(e)}")
 
 # ==============================
-# VISTA DE TABLA
+# Tabla con selección y panel de acciones (fragmento)
 # ==============================
-elif vista_modo == "Tabla":
+if 'version_tabla' not in st.session_state:
+    st.session_state.version_tabla = 0
+
+def limpiar_seleccion_tabla():
+    """Descarta la selección de la tabla (la clave del widget cambia)"""
+    st.session_state.version_tabla += 1
+
+@st.fragment
+def tabla_deliveries(proyectos):
+    """Tabla con selección nativa de filas y un solo panel de acciones; seleccionar solo recarga este fragmento"""
     datos_tabla = []
-    for proyecto in proyectos_filtrados:
+    for proyecto in proyectos:
         dias_sin_actualizar = (datetime.now() - proyecto.fecha_ultima_actualizacion).days
         estado_delivery = obtener_estado_delivery(proyecto)
-        criticidad_entrega = calcular_criticidad_entrega(proyecto)
-        estilo_entrega = obtener_estilo_entrega(criticidad_entrega)
 
-        valor_visualizacion = convertir_moneda(
-            proyecto.valor_estimado,
-            proyecto.moneda,
-            moneda_visualizacion,
-            proyecto.tipo_cambio_historico
-        )
+        valor_visualizacion = valores_visualizacion[proyecto.id]
 
         datos_tabla.append({
             'Código': proyecto.codigo_proyecto,
@@ -1042,29 +1043,11 @@ elif vista_modo == "Tabla":
             'ID': proyecto.id
         })
 
-    # Asegurar selección única
-    if 'selected_project_id' not in st.session_state:
-        st.session_state.selected_project_id = None
-
-    # Marcar como seleccionado solo el proyecto en session_state
-    for i, proyecto in enumerate(proyectos_filtrados):
-        datos_tabla[i]['Seleccionar'] = (proyecto.id == st.session_state.selected_project_id)
-
     df = pd.DataFrame(datos_tabla)
 
-    # Reordenar columnas para que "Seleccionar" sea la primera
-    column_order = ['Seleccionar'] + [col for col in df.columns if col != 'Seleccionar' and col != 'ID']
-    df = df[column_order + ['ID']]
-
-    # Mostrar el DataFrame con checkboxes
-    edited_df = st.data_editor(
+    seleccion = st.dataframe(
         df,
         column_config={
-            "Seleccionar": st.column_config.CheckboxColumn(
-                "✓",
-                help="Selecciona un proyecto para editar",
-                width="small"
-            ),
             "ID": None,
             "Código": st.column_config.TextColumn("Código", width="small"),
             "Nombre": st.column_config.TextColumn("Nombre", width="medium"),
@@ -1078,52 +1061,82 @@ elif vista_modo == "Tabla":
         },
         hide_index=True,
         use_container_width=True,
-        disabled=["Código", "Nombre", "Cliente", "Valor", "Asignado", "Estado",
-                 "Entrega Estimada", "Últ. Actualización", "Días sin actualizar", "ID"]
+        key=f"tabla_deliveries_{st.session_state.version_tabla}",
+        on_select="rerun",
+        selection_mode="multi-row"
     )
 
-    # Actualizar selección automáticamente
-    selected_rows = edited_df[edited_df["Seleccionar"]]
-    if not selected_rows.empty:
-        new_selected_id = selected_rows.iloc[0]["ID"]
-        if new_selected_id != st.session_state.selected_project_id:
-            st.session_state.selected_project_id = new_selected_id
-            st.rerun()
+    # Panel de acciones sobre la selección
+    ids_seleccionados = df['ID'].iloc[seleccion.selection.rows].tolist()
+    st.markdown("---")
+
+    if not ids_seleccionados:
+        st.info("ℹ️ Selecciona uno o más deliveries de la tabla para ver las acciones")
+        return
+
+    if len(ids_seleccionados) == 1:
+        proyecto = next(p for p in proyectos if p.id == ids_seleccionados[0])
+        st.info(f"**Seleccionado:** {proyecto.codigo_proyecto} - {proyecto.nombre}")
     else:
-        # Si se deseleccionó todo, limpiar la selección
-        if st.session_state.selected_project_id is not None:
-            st.session_state.selected_project_id = None
+        st.info(f"**{len(ids_seleccionados)} deliveries seleccionados**")
+
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        if st.button("✏️ Editar", key="edit_selected", use_container_width=True, type="primary",
+                     disabled=len(ids_seleccionados) != 1, help="Selecciona un solo proyecto para editar"):
+            st.session_state.editing_project = ids_seleccionados[0]
             st.rerun()
 
-    # Botón de edición
-    st.markdown("---")
-    if st.session_state.selected_project_id:
-        selected_project = next((p for p in proyectos_filtrados if p.id == st.session_state.selected_project_id), None)
-        if selected_project:
-            col1, col2, col3 = st.columns([2, 1, 1])
-            with col1:
-                st.info(f"**Seleccionado:** {selected_project.codigo_proyecto} - {selected_project.nombre}")
-
-            with col2:
-                if st.button(
-                    "✏️ Editar",
-                    use_container_width=True,
-                    type="primary",
-                    key="edit_selected"
-                ):
-                    st.session_state.editing_project = selected_project.id
-                    st.rerun()
+    with col2:
+        if st.button("📞 Contacto", key="contact_selected", use_container_width=True):
+            try:
+                cantidad = registrar_contacto_lote_orm(ids_seleccionados)
+                st.toast(f"✅ Contacto registrado en {cantidad} proyectos")
+                limpiar_seleccion_tabla()
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
 
-            with col3:
-                if st.button(
-                    "🗑️ Limpiar",
-                    use_container_width=True,
-                    key="clear_selected"
-                ):
-                    st.session_state.selected_project_id = None
-                    st.rerun()
-    else:
-        st.info("ℹ️ Selecciona un proyecto de la tabla para habilitar la edición")
+    with col3:
+        if st.button("🗑️ Eliminar", key="delete_selected", use_container_width=True):
+            try:
+                cantidad = eliminar_proyectos_lote_orm(ids_seleccionados)
+                st.toast(f"🗑️ {cantidad} proyectos eliminados")
+                limpiar_seleccion_tabla()
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
+
+    with col4:
+        if st.button("🧹 Limpiar", key="clear_selected", use_container_width=True):
+            limpiar_seleccion_tabla()
+            st.rerun(scope="fragment")
+
+# ==============================
+# Lista de Deliveries
+# ==============================
+st.markdown("---")
+st.header(f"📋 Lista de Deliveries ({len(proyectos_filtrados)} encontradas)")
+
+if not proyectos_filtrados:
+    st.info("🔍 No hay deliveries que coincidan con los filtros aplicados.")
+
+# ==============================
+# VISTA DE TARJETAS
+# ==============================
+elif vista_modo == "Tarjetas":
+    cols = st.columns(3)
+
+    for i, proyecto in enumerate(proyectos_filtrados):
+        with cols[i % 3]:
+            tarjeta_delivery(proyecto, valores_visualizacion[proyecto.id])
+
+# ==============================
+# VISTA DE TABLA
+# ==============================
+elif vista_modo == "Tabla":
+    tabla_deliveries(proyectos_filtrados)
 
 # ==============================
 # Footer
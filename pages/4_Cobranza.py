@@ -0,0 +1,409 @@
+# pages/4_Cobranza.py
+import streamlit as st
+import pandas as pd
+from datetime import datetime, date
+from models import Proyecto, Cliente
+from database import SessionLocal
+from cobranza import (
+    aging_cartera, facturas_abiertas, contar_facturas_abiertas, pendientes_de_factura,
+    monto_esperado, aplicar_pago, TRAMOS, ETIQUETAS_TRAMOS
+)
+from conciliacion_bancaria import leer_extracto, conciliar, aplicar_conciliacion, METODOS
+from tipo_cambio import obtener_tipo_cambio
+
+# ==============================
+# Configuración de la página
+# ==============================
+st.set_page_config(page_title="Dashboard de Cobranza", layout="wide", page_icon="💰")
+
+MONEDAS_DISPONIBLES = ['PEN', 'USD']
+FACTURAS_POR_PAGINA = 200
+
+# ==============================
+# Funciones de Base de Datos ORM
+# ==============================
+def cargar_clientes_activos():
+    """Carga clientes activos"""
+    try:
+        db = SessionLocal()
+        clientes = db.query(Cliente).filter(Cliente.activo == True).all()
+        db.close()
+        return clientes
+    except Exception as e:
+        st.error(f"❌ Error cargando clientes: {str(e)}")
+        return []
+
+def aplicar_en_lote_orm(proyecto_ids, accion):
+    """Aplica `accion(proyecto)` a varios proyectos en una sola transacción"""
+    db = SessionLocal()
+    try:
+        proyectos = db.query(Proyecto).filter(Proyecto.id.in_([int(pid) for pid in proyecto_ids])).all()
+        for proyecto in proyectos:
+            accion(proyecto)
+        db.commit()
+        return len(proyectos)
+    except Exception as e:
+        db.rollback()
+        raise e
+    finally:
+        db.close()
+
+def registrar_pago_orm(proyecto_id, fecha_pago, monto):
+    """Registra el pago de una factura y la pasa a POSTVENTA"""
+    return aplicar_en_lote_orm([proyecto_id], lambda proyecto: aplicar_pago(proyecto, fecha_pago, monto))
+
+def registrar_pagos_lote_orm(proyecto_ids, fecha_pago):
+    """Registra el pago completo (monto esperado) de varias facturas"""
+    return aplicar_en_lote_orm(proyecto_ids, lambda proyecto: aplicar_pago(proyecto, fecha_pago, monto_esperado(proyecto)))
+
+def registrar_gestion_lote_orm(proyecto_ids):
+    """Registra una gestión de cobranza en varios proyectos"""
+    def registrar(proyecto):
+        proyecto.agregar_evento_historial(f"📞 Gestión de cobranza el {datetime.now().strftime('%d/%m/%Y %H:%M')}")
+    return aplicar_en_lote_orm(proyecto_ids, registrar)
+
+def actualizar_datos_factura_orm(proyecto_id, datos):
+    """Completa los datos de la factura que usan el aging y la conciliación"""
+    def actualizar(proyecto):
+        proyecto.numero_factura = datos['numero_factura'] or None
+        proyecto.fecha_facturacion = datos['fecha_facturacion']
+        proyecto.dias_pago = datos['dias_pago']
+        proyecto.facturado = True
+        proyecto.monto_detraccion = datos['monto_detraccion']
+        proyecto.tiene_detraccion = datos['monto_detraccion'] > 0
+        proyecto.monto_retencion = datos['monto_retencion']
+        proyecto.tiene_retencion = datos['monto_retencion'] > 0
+        proyecto.agregar_evento_historial(f"🧾 Datos de factura actualizados ({datos['numero_factura'] or 's/n'})")
+    return aplicar_en_lote_orm([proyecto_id], actualizar)
+
+def formatear_moneda(valor, moneda):
+    """Formatea un valor numérico según la moneda"""
+    if moneda == 'PEN':
+        return f"S/ {valor:,.2f}"
+    else:
+        return f"$ {valor:,.2f}"
+
+# ==============================
+# Inicialización
+# ==============================
+if 'version_tabla' not in st.session_state:
+    st.session_state.version_tabla = 0
+if 'pagina_cobranza' not in st.session_state:
+    st.session_state.pagina_cobranza = 1
+
+def limpiar_seleccion_tabla():
+    """Descarta la selección de la tabla (la clave del widget cambia)"""
+    st.session_state.version_tabla += 1
+
+# ==============================
+# Título y navegación
+# ==============================
+st.title("💰 Dashboard de COBRANZA")
+st.page_link("main_app.py", label="🔙 Volver al Workflow Principal")
+
+clientes_db = cargar_clientes_activos()
+cliente_nombre_a_id = {c.nombre: c.id for c in clientes_db}
+tipo_cambio_actual = obtener_tipo_cambio()
+
+# ==============================
+# Sidebar para filtros y vista
+# ==============================
+with st.sidebar:
+    st.header("🎛️ Opciones de Visualización")
+    moneda_visualizacion = st.selectbox("Moneda para visualización:", MONEDAS_DISPONIBLES)
+    st.caption(f"Tipo de cambio vigente: {tipo_cambio_actual:.3f}")
+
+    st.header("🔍 Filtros")
+    filtro_tramo = st.selectbox("Antigüedad", ["Todos"] + [clave for clave, _, _, _ in TRAMOS],
+                                format_func=lambda t: ETIQUETAS_TRAMOS.get(t, t))
+    filtro_cliente = st.selectbox("Cliente", ["Todos"] + [c.nombre for c in clientes_db])
+
+tramo = None if filtro_tramo == "Todos" else filtro_tramo
+cliente_id = None if filtro_cliente == "Todos" else cliente_nombre_a_id[filtro_cliente]
+
+# ==============================
+# KPIs y aging de la cartera
+# ==============================
+try:
+    aging = aging_cartera(moneda_destino=moneda_visualizacion, tipo_cambio=tipo_cambio_actual)
+except Exception as e:
+    st.error(f"❌ Error calculando la antigüedad de la cartera: {str(e)}")
+    st.stop()
+
+vencido = aging.drop(index='por_vencer')
+col1, col2, col3, col4 = st.columns(4)
+with col1:
+    st.metric("🧾 Facturas por Cobrar", int(aging['cantidad'].sum()))
+with col2:
+    st.metric("💰 Saldo por Cobrar", formatear_moneda(aging['neto'].sum(), moneda_visualizacion))
+with col3:
+    st.metric("⏰ Vencido", formatear_moneda(vencido['neto'].sum(), moneda_visualizacion),
+              delta=f"{int(vencido['cantidad'].sum())} facturas", delta_color="inverse")
+with col4:
+    st.metric("🚨 Más de 90 días", formatear_moneda(aging.loc['90_mas', 'neto'], moneda_visualizacion),
+              delta=f"{int(aging.loc['90_mas', 'cantidad'])} facturas", delta_color="inverse")
+
+st.subheader("📊 Antigüedad de la Cartera")
+col_grafico, col_tabla = st.columns([3, 2])
+with col_grafico:
+    st.bar_chart(aging.rename(index=ETIQUETAS_TRAMOS)['neto'])
+with col_tabla:
+    st.dataframe(
+        aging.rename(index=ETIQUETAS_TRAMOS),
+        column_config={
+            "cantidad": "Facturas",
+            "total": st.column_config.NumberColumn("Facturado", format="%.2f"),
+            "neto": st.column_config.NumberColumn("Saldo neto", format="%.2f"),
+        },
+        use_container_width=True
+    )
+
+# ==============================
+# Tabla de facturas con selección y acciones (fragmento)
+# ==============================
+@st.fragment
+def tabla_facturas(facturas):
+    """Facturas abiertas con selección nativa de filas y panel de acciones"""
+    factor = {'PEN': 1.0, 'USD': 1.0}
+    if moneda_visualizacion == 'PEN':
+        factor['USD'] = tipo_cambio_actual
+    else:
+        factor['PEN'] = 1 / tipo_cambio_actual
+
+    df = pd.DataFrame({
+        'Código': facturas['codigo_proyecto'],
+        'Factura': facturas['numero_factura'].fillna('—'),
+        'Cliente': facturas['cliente'],
+        'Ejecutivo': facturas['ejecutivo'],
+        'Moneda': facturas['moneda'],
+        'Saldo': facturas['neto'] * facturas['moneda'].map(factor),
+        'Vencimiento': facturas['vencimiento'],
+        'Días vencido': facturas['dias_vencido'].clip(lower=0),
+        'Antigüedad': facturas['tramo'].map(ETIQUETAS_TRAMOS),
+        'ID': facturas['id'],
+    })
+
+    simbolo = "S/" if moneda_visualizacion == 'PEN' else "$"
+    seleccion = st.dataframe(
+        df,
+        column_config={
+            "ID": None,
+            "Código": st.column_config.TextColumn("Código", width="small"),
+            "Factura": st.column_config.TextColumn("Factura", width="small"),
+            "Cliente": st.column_config.TextColumn("Cliente", width="medium"),
+            "Ejecutivo": st.column_config.TextColumn("Ejecutivo", width="small"),
+            "Moneda": st.column_config.TextColumn("Moneda", width="small"),
+            "Saldo": st.column_config.NumberColumn(f"Saldo ({simbolo})", format="%.2f", width="small"),
+            "Vencimiento": st.column_config.DateColumn("Vencimiento", format="DD/MM/YYYY", width="small"),
+            "Días vencido": st.column_config.NumberColumn("Días venc.", width="small"),
+            "Antigüedad": st.column_config.TextColumn("Antigüedad", width="small"),
+        },
+        hide_index=True,
+        use_container_width=True,
+        key=f"tabla_cobranza_{st.session_state.version_tabla}",
+        on_select="rerun",
+        selection_mode="multi-row"
+    )
+
+    ids_seleccionados = df['ID'].iloc[seleccion.selection.rows].tolist()
+    st.markdown("---")
+
+    if not ids_seleccionados:
+        st.info("ℹ️ Selecciona una o más facturas de la tabla para ver las acciones")
+        return
+
+    seleccionadas = facturas[facturas['id'].isin(ids_seleccionados)]
+    if len(ids_seleccionados) == 1:
+        factura = seleccionadas.iloc[0]
+        st.info(f"**Seleccionada:** {factura['codigo_proyecto']} - {factura['nombre']}")
+    else:
+        st.info(f"**{len(ids_seleccionados)} facturas seleccionadas** · Saldo: "
+                f"{formatear_moneda(df.loc[df['ID'].isin(ids_seleccionados), 'Saldo'].sum(), moneda_visualizacion)}")
+
+    fecha_pago = st.date_input("Fecha de pago", value=date.today(), format="DD/MM/YYYY", key="fecha_pago_lote")
+
+    if len(ids_seleccionados) == 1:
+        monto = st.number_input(f"Monto pagado ({factura['moneda']})", min_value=0.0,
+                                value=float(factura['neto']), step=100.0, key="monto_pago")
+
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        etiqueta = "💰 Registrar pago" if len(ids_seleccionados) == 1 else "💰 Registrar pagos completos"
+        if st.button(etiqueta, key="pagar_selected", use_container_width=True, type="primary"):
+            try:
+                if len(ids_seleccionados) == 1:
+                    cantidad = registrar_pago_orm(ids_seleccionados[0], fecha_pago, monto)
+                else:
+                    cantidad = registrar_pagos_lote_orm(ids_seleccionados, fecha_pago)
+                st.toast(f"✅ {cantidad} pagos registrados")
+                limpiar_seleccion_tabla()
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
+
+    with col2:
+        if st.button("📞 Gestión", key="gestion_selected", use_container_width=True):
+            try:
+                cantidad = registrar_gestion_lote_orm(ids_seleccionados)
+                st.toast(f"✅ Gestión registrada en {cantidad} facturas")
+                limpiar_seleccion_tabla()
+                st.rerun(scope="fragment")
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
+
+    with col3:
+        st.download_button(
+            "📥 Exportar",
+            data=seleccionadas.to_csv(index=False).encode("utf-8-sig"),
+            file_name=f"cobranza_{date.today().isoformat()}.csv",
+            mime="text/csv",
+            use_container_width=True,
+            key="exportar_selected"
+        )
+
+    with col4:
+        if st.button("🧹 Limpiar", key="clear_selected", use_container_width=True):
+            limpiar_seleccion_tabla()
+            st.rerun(scope="fragment")
+
+# ==============================
+# Lista de facturas abiertas (paginada sobre el índice de vencimiento)
+# ==============================
+st.markdown("---")
+total_facturas = contar_facturas_abiertas(tramo=tramo, cliente_id=cliente_id)
+st.header(f"📋 Facturas por Cobrar ({total_facturas} encontradas)")
+
+if not total_facturas:
+    st.info("🔍 No hay facturas abiertas que coincidan con los filtros aplicados.")
+else:
+    paginas = (total_facturas - 1) // FACTURAS_POR_PAGINA + 1
+    if paginas > 1:
+        pagina = st.number_input(f"Página (de {paginas})", min_value=1, max_value=paginas,
+                                 value=min(st.session_state.pagina_cobranza, paginas), step=1)
+        st.session_state.pagina_cobranza = pagina
+    else:
+        pagina = 1
+
+    facturas = facturas_abiertas(tramo=tramo, cliente_id=cliente_id, limite=FACTURAS_POR_PAGINA,
+                                 desplazamiento=(pagina - 1) * FACTURAS_POR_PAGINA)
+    tabla_facturas(facturas)
+
+# ==============================
+# Proyectos en COBRANZA sin datos de factura
+# ==============================
+pendientes = pendientes_de_factura()
+if not pendientes.empty:
+    st.markdown("---")
+    st.subheader(f"🧾 Sin datos de factura ({len(pendientes)})")
+    st.caption("Estos proyectos están en COBRANZA pero no tienen fecha de facturación, por lo que no entran al aging")
+
+    opciones = dict(zip(pendientes['id'], pendientes['codigo_proyecto'] + " - " + pendientes['nombre']))
+    proyecto_id = st.selectbox("Proyecto", list(opciones), format_func=opciones.get)
+
+    with st.form("form_datos_factura"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            numero_factura = st.text_input("Número de factura", placeholder="F001-00001234")
+            fecha_facturacion = st.date_input("Fecha de facturación", value=date.today(), format="DD/MM/YYYY")
+        with col2:
+            dias_pago = st.number_input("Días de pago", min_value=0, value=15, step=1)
+            monto_detraccion = st.number_input("Detracción", min_value=0.0, value=0.0, step=10.0)
+        with col3:
+            monto_retencion = st.number_input("Retención", min_value=0.0, value=0.0, step=10.0)
+
+        if st.form_submit_button("💾 Guardar datos de factura", type="primary"):
+            try:
+                actualizar_datos_factura_orm(proyecto_id, {
+                    'numero_factura': numero_factura.strip(),
+                    'fecha_facturacion': datetime.combine(fecha_facturacion, datetime.now().time()),
+                    'dias_pago': dias_pago,
+                    'monto_detraccion': monto_detraccion,
+                    'monto_retencion': monto_retencion,
+                })
+                st.success("✅ Datos de factura guardados")
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
+
+# ==============================
+# Conciliación con el extracto bancario
+# ==============================
+st.markdown("---")
+st.subheader("🏦 Conciliación Bancaria")
+st.caption("Sube el extracto del banco (CSV u OFX) para cruzar los abonos con las facturas abiertas")
+
+extracto = st.file_uploader("Extracto bancario", type=['csv', 'txt', 'ofx', 'qfx'], key="extracto_bancario")
+if extracto is not None and st.button("🔍 Conciliar extracto"):
+    try:
+        propuestas, sin_conciliar = conciliar(leer_extracto(extracto, extracto.name))
+        st.session_state.conciliacion = (propuestas, sin_conciliar)
+    except Exception as e:
+        st.error(f"❌ Error leyendo el extracto: {str(e)}")
+
+if 'conciliacion' in st.session_state:
+    propuestas, sin_conciliar = st.session_state.conciliacion
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Abonos conciliados", len(propuestas))
+    with col2:
+        st.metric("Automáticos", int(propuestas['aplicar'].sum()) if not propuestas.empty else 0)
+    with col3:
+        st.metric("Sin conciliar", len(sin_conciliar))
+
+    if not propuestas.empty:
+        propuestas = propuestas.assign(metodo=propuestas['metodo'].map(METODOS))
+        editadas = st.data_editor(
+            propuestas[['aplicar', 'fecha', 'monto', 'descripcion', 'referencia', 'codigo_proyecto',
+                        'cliente', 'numero_factura', 'monto_esperado', 'diferencia', 'metodo', 'proyecto_id']],
+            column_config={
+                "aplicar": st.column_config.CheckboxColumn("Aplicar"),
+                "fecha": st.column_config.DateColumn("Fecha", format="DD/MM/YYYY"),
+                "monto": st.column_config.NumberColumn("Abono", format="%.2f"),
+                "descripcion": "Glosa",
+                "referencia": "Operación",
+                "codigo_proyecto": "Código",
+                "cliente": "Cliente",
+                "numero_factura": "N° Factura",
+                "monto_esperado": st.column_config.NumberColumn("Esperado", format="%.2f"),
+                "diferencia": st.column_config.NumberColumn("Diferencia", format="%.2f"),
+                "metodo": "Coincidencia por",
+                "proyecto_id": None,
+            },
+            disabled=['fecha', 'monto', 'descripcion', 'referencia', 'codigo_proyecto', 'cliente',
+                      'numero_factura', 'monto_esperado', 'diferencia', 'metodo'],
+            hide_index=True,
+            use_container_width=True,
+            key="editor_conciliacion"
+        )
+        st.caption("Las coincidencias solo por monto o con monto distinto quedan sin marcar para revisión manual")
+
+        marcadas = int(editadas['aplicar'].sum())
+        if st.button(f"💰 Registrar {marcadas} pagos", type="primary", disabled=not marcadas):
+            try:
+                aplicados = aplicar_conciliacion(editadas)
+                del st.session_state.conciliacion
+                st.success(f"✅ {aplicados} pagos registrados")
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ Error registrando pagos: {str(e)}")
+
+    if not sin_conciliar.empty:
+        with st.expander(f"❔ Abonos sin conciliar ({len(sin_conciliar)})"):
+            st.dataframe(
+                sin_conciliar[['fecha', 'monto', 'descripcion', 'referencia']],
+                column_config={
+                    "fecha": st.column_config.DateColumn("Fecha", format="DD/MM/YYYY"),
+                    "monto": st.column_config.NumberColumn("Abono", format="%.2f"),
+                    "descripcion": "Glosa",
+                    "referencia": "Operación",
+                },
+                hide_index=True,
+                use_container_width=True
+            )
+
+# ==============================
+# Footer
+# ==============================
+st.markdown("---")
+st.caption(f"💰 Dashboard de Cobranza - Actualizado: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
@@ -0,0 +1,96 @@
+# pages/5_Documentos.py
+import html
+import streamlit as st
+from datetime import datetime
+from models import TiposArchivo
+from database import SessionLocal
+from indice_documentos import (
+    buscar_documentos, resaltar_fragmento, reindexar_pendientes,
+    resumen_indice, archivos_en_cola
+)
+
+# ==============================
+# Configuración de la página
+# ==============================
+st.set_page_config(page_title="Búsqueda de Documentos", layout="wide", page_icon="🔎")
+
+def obtener_tipos_archivo():
+    """Obtiene tipos de archivo desde BD"""
+    db = SessionLocal()
+    try:
+        tipos = db.query(TiposArchivo).filter(TiposArchivo.activo == True).all()
+        return tipos
+    finally:
+        db.close()
+
+# ==============================
+# Título y navegación
+# ==============================
+st.title("🔎 Búsqueda en Documentos")
+st.page_link("main_app.py", label="🔙 Volver al Workflow Principal")
+st.caption("Busca dentro del texto de TDR, propuestas y demás documentos PDF, DOCX y XLSX subidos")
+
+tipos_archivo_db = obtener_tipos_archivo()
+
+# ==============================
+# Sidebar: estado del índice
+# ==============================
+with st.sidebar:
+    st.header("🗂️ Índice de Documentos")
+    resumen = resumen_indice()
+    st.metric("Indexados", resumen.get('indexado', 0))
+    st.metric("Pendientes", resumen.get('pendiente', 0) + archivos_en_cola())
+    if resumen.get('error'):
+        st.metric("Con error", resumen['error'])
+    if resumen.get('faltante'):
+        st.metric("No encontrados", resumen['faltante'])
+
+    if st.button("🔄 Indexar nuevos y modificados", use_container_width=True):
+        encolados = reindexar_pendientes()
+        st.success(f"✅ {encolados} documentos en cola")
+
+    if st.button("♻️ Reindexar todo", use_container_width=True):
+        encolados = reindexar_pendientes(forzar=True)
+        st.success(f"✅ {encolados} documentos en cola")
+
+# ==============================
+# Búsqueda
+# ==============================
+col1, col2 = st.columns([3, 1])
+with col1:
+    consulta = st.text_input("Buscar", placeholder="Ej: switch cisco 2960")
+with col2:
+    tipo_filtro = st.selectbox("Tipo de archivo",
+                               options=[(None, "Todos")] + [(t.id, t.nombre) for t in tipos_archivo_db],
+                               format_func=lambda x: x[1])
+
+if consulta:
+    resultados = buscar_documentos(consulta, tipo_archivo_id=tipo_filtro[0])
+    st.markdown(f"### 📄 {len(resultados)} documentos encontrados")
+
+    if not resultados:
+        st.info("🔍 No hay documentos que coincidan con la búsqueda.")
+
+    for resultado in resultados:
+        fecha = resultado['fecha_subida']
+        if isinstance(fecha, str):
+            fecha = datetime.fromisoformat(fecha)
+        # Nombres de archivo, proyecto y cliente vienen del usuario: se escapan antes de armar el HTML
+        texto = {campo: html.escape(str(resultado[campo] or '')) for campo in (
+            'tipo', 'nombre_archivo', 'codigo_proyecto', 'proyecto', 'cliente', 'codigo_convocatoria')}
+        st.markdown(f"""
+        <div style="border: 1px solid #e5e7eb; border-radius: 10px; padding: 12px; margin: 8px 0;">
+            <strong>{texto['tipo']}: {texto['nombre_archivo']}</strong><br>
+            <span style="font-size:12px;">📋 {texto['codigo_proyecto']} - {texto['proyecto']}</span><br>
+            <span style="font-size:12px;">🏢 {texto['cliente'] or 'Sin cliente'}
+                {f" • 📑 {texto['codigo_convocatoria']}" if texto['codigo_convocatoria'] else ""}
+                {f" • 📅 {fecha.strftime('%d/%m/%Y')}" if fecha else ""}</span>
+            <p style="margin: 8px 0 0 0; font-size: 13px; color: #444;">{resaltar_fragmento(resultado['fragmento'])}</p>
+        </div>
+        """, unsafe_allow_html=True)
+
+# ==============================
+# Footer
+# ==============================
+st.markdown("---")
+st.caption(f"🔎 Búsqueda de Documentos - Actualizado: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
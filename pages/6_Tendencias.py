@@ -0,0 +1,147 @@
+# pages/6_Tendencias.py
+import streamlit as st
+from datetime import date, timedelta
+from models import Usuario
+from database import SessionLocal
+from snapshots_pipeline import (
+    cargar_snapshots, serie_tendencia, variacion_mensual, tomar_snapshot,
+    fechas_con_snapshot, iniciar_snapshots, DIMENSIONES, MEDIDAS
+)
+
+# ==============================
+# Configuración de la página
+# ==============================
+st.set_page_config(page_title="Tendencias del Pipeline", layout="wide", page_icon="📈")
+
+MONEDAS_DISPONIBLES = ["PEN", "USD"]
+
+def obtener_nombres_usuarios():
+    """Nombre por id de todos los usuarios (también inactivos, pueden aparecer en fotos antiguas)"""
+    try:
+        db = SessionLocal()
+        usuarios = {u.id: u.nombre for u in db.query(Usuario.id, Usuario.nombre).all()}
+        db.close()
+        return usuarios
+    except Exception as e:
+        st.error(f"❌ Error cargando usuarios: {str(e)}")
+        return {}
+
+def formatear_moneda(valor, moneda):
+    simbolo = "S/" if moneda == "PEN" else "$"
+    return f"{simbolo} {valor:,.0f}"
+
+iniciar_snapshots()
+
+# ==============================
+# Título y navegación
+# ==============================
+st.title("📈 Tendencias del Pipeline")
+st.page_link("main_app.py", label="🔙 Volver al Workflow Principal")
+st.caption("Evolución del pipeline a partir de la foto diaria por estado, ejecutivo y moneda")
+
+nombres_usuarios = obtener_nombres_usuarios()
+
+# ==============================
+# Sidebar: filtros y foto manual
+# ==============================
+with st.sidebar:
+    st.header("🎛️ Opciones de Visualización")
+    moneda_visualizacion = st.selectbox("Moneda para visualización:", MONEDAS_DISPONIBLES,
+                                        help="Cada foto se convierte con el tipo de cambio vigente en su fecha")
+    medida = st.selectbox("Medida", list(MEDIDAS), format_func=lambda m: MEDIDAS[m], index=1)
+    dimension = st.selectbox("Agrupar por", list(DIMENSIONES), format_func=lambda d: DIMENSIONES[d])
+    frecuencia = st.radio("Frecuencia", ["D", "M"], format_func=lambda f: "Diaria" if f == "D" else "Cierre de mes",
+                          horizontal=True)
+
+    hoy = date.today()
+    rango = st.date_input("Período", value=(hoy - timedelta(days=180), hoy), max_value=hoy)
+
+    st.header("🔍 Filtros")
+    filtro_ejecutivo = st.selectbox("Ejecutivo", ["Todos"] + sorted(nombres_usuarios.values()))
+    filtro_moneda = st.selectbox("Moneda", ["Todas"] + MONEDAS_DISPONIBLES)
+
+    st.divider()
+    st.header("📸 Fotos Diarias")
+    fechas = fechas_con_snapshot()
+    st.metric("Días registrados", len(fechas))
+    if fechas:
+        st.caption(f"Desde {fechas[0].strftime('%d/%m/%Y')} hasta {fechas[-1].strftime('%d/%m/%Y')}")
+
+    if st.button("📸 Tomar foto de hoy", use_container_width=True):
+        try:
+            filas = tomar_snapshot()
+            if filas:
+                st.success(f"✅ Foto guardada ({filas} grupos)")
+            else:
+                st.info("ℹ️ La foto de hoy ya existía")
+        except Exception as e:
+            st.error(f"❌ Error tomando la foto: {str(e)}")
+
+# ==============================
+# Datos de las fotos
+# ==============================
+desde, hasta = (rango[0], rango[-1]) if isinstance(rango, (tuple, list)) and rango else (None, None)
+try:
+    snapshots = cargar_snapshots(desde, hasta, moneda_visualizacion)
+except Exception as e:
+    st.error(f"❌ Error cargando fotos del pipeline: {str(e)}")
+    st.stop()
+
+if filtro_ejecutivo != "Todos":
+    ids_ejecutivo = [i for i, nombre in nombres_usuarios.items() if nombre == filtro_ejecutivo]
+    snapshots = snapshots[snapshots['asignado_a_id'].isin(ids_ejecutivo)]
+if filtro_moneda != "Todas":
+    snapshots = snapshots[snapshots['moneda'] == filtro_moneda]
+
+snapshots = snapshots.assign(asignado_a_id=snapshots['asignado_a_id'].map(nombres_usuarios).fillna("Sin asignar"))
+
+if snapshots.empty:
+    st.info("📭 No hay fotos del pipeline en el período seleccionado. La foto de hoy se toma automáticamente.")
+    st.stop()
+
+# ==============================
+# KPIs de la última foto
+# ==============================
+ultima_fecha = snapshots['fecha'].max()
+ultima = snapshots[snapshots['fecha'] == ultima_fecha]
+hace_un_mes = snapshots[snapshots['fecha'] <= ultima_fecha - timedelta(days=30)]
+anterior = hace_un_mes[hace_un_mes['fecha'] == hace_un_mes['fecha'].max()] if not hace_un_mes.empty else None
+
+col1, col2, col3 = st.columns(3)
+for col, (clave, etiqueta) in zip((col1, col2, col3), MEDIDAS.items()):
+    actual = ultima[clave].sum()
+    delta = None
+    if anterior is not None:
+        diferencia = actual - anterior[clave].sum()
+        delta = f"{diferencia:,.0f}" if clave == 'cantidad' else formatear_moneda(diferencia, moneda_visualizacion)
+    with col:
+        valor = f"{actual:,.0f}" if clave == 'cantidad' else formatear_moneda(actual, moneda_visualizacion)
+        st.metric(etiqueta, valor, delta=delta, help="Variación frente a la foto de hace 30 días")
+
+st.caption(f"📅 Última foto: {ultima_fecha.strftime('%d/%m/%Y')}")
+
+# ==============================
+# Gráficos de tendencia
+# ==============================
+st.markdown("---")
+st.subheader(f"📊 {MEDIDAS[medida]} por {DIMENSIONES[dimension].lower()}")
+serie = serie_tendencia(snapshots, dimension, medida, frecuencia)
+st.line_chart(serie)
+
+with st.expander("📈 Vista apilada"):
+    st.area_chart(serie)
+
+# ==============================
+# Variación mes a mes
+# ==============================
+st.markdown("---")
+st.subheader("🗓️ Variación mes a mes (cierre de cada mes)")
+variacion = variacion_mensual(snapshots, dimension, medida)
+if len(variacion) < 2:
+    st.info("ℹ️ Se necesitan fotos de al menos dos meses para comparar")
+formato_valor = "{:,.0f}"
+st.dataframe(
+    variacion.style.format({columna: ("{:+.1f}%" if columna[0] == 'variacion_pct' else formato_valor)
+                            for columna in variacion.columns}, na_rep="—"),
+    use_container_width=True
+)
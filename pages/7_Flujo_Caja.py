@@ -0,0 +1,167 @@
+# pages/7_Flujo_Caja.py
+import streamlit as st
+import pandas as pd
+from datetime import date, timedelta
+from models import Usuario
+from database import SessionLocal
+from flujo_caja import (
+    proyeccion_flujo, convertir_proyeccion, flujo_por_periodo, ORIGENES,
+    DIAS_ADJUDICACION, PLAZO_ENTREGA_DEFECTO, DIAS_FACTURACION
+)
+from tipo_cambio import obtener_tipo_cambio
+
+# ==============================
+# Configuración de la página
+# ==============================
+st.set_page_config(page_title="Flujo de Caja Proyectado", layout="wide", page_icon="💵")
+
+MONEDAS_DISPONIBLES = ["PEN", "USD"]
+
+def obtener_nombres_usuarios():
+    """Nombre por id de los usuarios"""
+    try:
+        db = SessionLocal()
+        usuarios = {u.id: u.nombre for u in db.query(Usuario.id, Usuario.nombre).all()}
+        db.close()
+        return usuarios
+    except Exception as e:
+        st.error(f"❌ Error cargando usuarios: {str(e)}")
+        return {}
+
+def formatear_moneda(valor, moneda):
+    simbolo = "S/" if moneda == "PEN" else "$"
+    return f"{simbolo} {valor:,.0f}"
+
+# ==============================
+# Título y navegación
+# ==============================
+st.title("💵 Flujo de Caja Proyectado")
+st.page_link("main_app.py", label="🔙 Volver al Workflow Principal")
+st.caption("Cobros esperados según OC, plazos de entrega, facturación y días de pago, ponderados por la probabilidad de cada etapa")
+
+nombres_usuarios = obtener_nombres_usuarios()
+
+# ==============================
+# Sidebar: opciones y filtros
+# ==============================
+with st.sidebar:
+    st.header("🎛️ Opciones de Visualización")
+    moneda_visualizacion = st.selectbox("Moneda para visualización:", MONEDAS_DISPONIBLES)
+    base_tipo_cambio = st.radio("Tipo de cambio:", ["Vigente hoy", "Histórico del proyecto"],
+                                help="Para proyectar caja futura suele usarse el tipo de cambio vigente")
+    frecuencia = st.radio("Agrupar por", ["W", "M"], format_func=lambda f: "Semana" if f == "W" else "Mes",
+                          horizontal=True)
+    horizonte_meses = st.slider("Horizonte (meses)", min_value=1, max_value=12, value=6)
+
+    st.header("🔍 Filtros")
+    filtro_origen = st.multiselect("Origen", list(ORIGENES), default=list(ORIGENES),
+                                   format_func=lambda o: ORIGENES[o])
+    filtro_ejecutivo = st.selectbox("Ejecutivo", ["Todos"] + sorted(nombres_usuarios.values()))
+    filtro_moneda = st.selectbox("Moneda", ["Todas"] + MONEDAS_DISPONIBLES)
+
+    st.divider()
+    st.caption(
+        f"Supuestos: OC {DIAS_ADJUDICACION} días después del deadline, "
+        f"entrega en {PLAZO_ENTREGA_DEFECTO} días si no hay plazo, "
+        f"factura {DIAS_FACTURACION} días después de la entrega."
+    )
+
+# ==============================
+# Proyección
+# ==============================
+try:
+    proyeccion = proyeccion_flujo()
+except Exception as e:
+    st.error(f"❌ Error calculando el flujo de caja: {str(e)}")
+    st.stop()
+
+tipo_cambio = obtener_tipo_cambio() if base_tipo_cambio == "Vigente hoy" else None
+flujo = convertir_proyeccion(proyeccion, moneda_visualizacion, tipo_cambio)
+
+flujo = flujo[flujo['origen'].isin(filtro_origen)]
+if filtro_ejecutivo != "Todos":
+    flujo = flujo[flujo['asignado_a_id'].map(nombres_usuarios) == filtro_ejecutivo]
+if filtro_moneda != "Todas":
+    flujo = flujo[flujo['moneda'] == filtro_moneda]
+
+hoy = pd.Timestamp(date.today())
+limite = hoy + pd.DateOffset(months=horizonte_meses)
+flujo = flujo[flujo['fecha_flujo'] < limite]
+
+if flujo.empty:
+    st.info("📭 No hay cobros proyectados con los filtros seleccionados")
+    st.stop()
+
+# ==============================
+# KPIs principales
+# ==============================
+col1, col2, col3, col4 = st.columns(4)
+
+with col1:
+    proximos_30 = flujo.loc[flujo['fecha_flujo'] < hoy + timedelta(days=30), 'neto_ponderado'].sum()
+    st.metric("📅 Próximos 30 días", formatear_moneda(proximos_30, moneda_visualizacion))
+
+with col2:
+    st.metric(f"💰 Ponderado a {horizonte_meses} meses", formatear_moneda(flujo['neto_ponderado'].sum(), moneda_visualizacion))
+
+with col3:
+    st.metric("💸 Neto sin ponderar", formatear_moneda(flujo['neto'].sum(), moneda_visualizacion))
+
+with col4:
+    vencidos = flujo[flujo['vencido']]
+    st.metric("🚨 Cobros Vencidos", formatear_moneda(vencidos['neto'].sum(), moneda_visualizacion),
+              delta=f"{len(vencidos)} facturas" if len(vencidos) else None, delta_color="inverse")
+
+# ==============================
+# Gráficos por período
+# ==============================
+st.markdown("---")
+st.subheader("📊 Cobros ponderados por " + ("semana" if frecuencia == "W" else "mes"))
+por_origen = flujo_por_periodo(flujo, frecuencia, 'origen').rename(columns=ORIGENES)
+st.bar_chart(por_origen)
+
+col_estado, col_acumulado = st.columns(2)
+with col_estado:
+    st.markdown("**Por estado**")
+    st.bar_chart(flujo_por_periodo(flujo, frecuencia, 'estado'))
+with col_acumulado:
+    st.markdown("**Acumulado**")
+    st.line_chart(por_origen.sum(axis=1).cumsum().rename("Acumulado"))
+
+# ==============================
+# Detalle por proyecto
+# ==============================
+st.markdown("---")
+st.subheader("📋 Detalle por Proyecto")
+detalle = flujo.sort_values('fecha_flujo').assign(
+    origen=lambda d: d['origen'].map(ORIGENES),
+    ejecutivo=lambda d: d['asignado_a_id'].map(nombres_usuarios),
+)[['codigo', 'nombre', 'cliente', 'ejecutivo', 'estado', 'origen', 'fecha_cobro', 'vencido',
+   'probabilidad', 'neto', 'neto_ponderado']]
+
+simbolo = "S/" if moneda_visualizacion == "PEN" else "$"
+st.dataframe(
+    detalle,
+    column_config={
+        "codigo": "Código",
+        "nombre": "Proyecto",
+        "cliente": "Cliente",
+        "ejecutivo": "Ejecutivo",
+        "estado": "Estado",
+        "origen": "Origen",
+        "fecha_cobro": st.column_config.DateColumn("Cobro Esperado", format="DD/MM/YYYY"),
+        "vencido": st.column_config.CheckboxColumn("Vencido"),
+        "probabilidad": st.column_config.NumberColumn("Prob.", format="%d%%"),
+        "neto": st.column_config.NumberColumn(f"Neto ({simbolo})", format="%.0f"),
+        "neto_ponderado": st.column_config.NumberColumn(f"Ponderado ({simbolo})", format="%.0f"),
+    },
+    hide_index=True,
+    use_container_width=True
+)
+
+st.download_button(
+    "📥 Descargar CSV",
+    data=detalle.to_csv(index=False).encode("utf-8-sig"),
+    file_name=f"flujo_caja_{date.today().isoformat()}.csv",
+    mime="text/csv"
+)
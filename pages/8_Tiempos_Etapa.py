@@ -0,0 +1,138 @@
+# pages/8_Tiempos_Etapa.py
+import streamlit as st
+from models import Proyecto, Estado
+from database import SessionLocal
+from transiciones import (
+    backfill_transiciones, tramos_por_etapa, tiempo_en_etapa,
+    proyectos_estancados, tiempos_ciclo
+)
+
+# ==============================
+# Configuración de la página
+# ==============================
+st.set_page_config(page_title="Tiempos por Etapa", layout="wide", page_icon="⏱️")
+
+ORDEN_ESTADOS = [estado.value for estado in Estado]
+
+def obtener_proyectos(ids):
+    """Código, nombre y ejecutivo de los proyectos indicados"""
+    try:
+        db = SessionLocal()
+        proyectos = {p.id: p for p in db.query(Proyecto).filter(Proyecto.id.in_(ids)).all()}
+        datos = {i: (p.codigo_proyecto, p.nombre, p.asignado_a.nombre if p.asignado_a else "") for i, p in proyectos.items()}
+        db.close()
+        return datos
+    except Exception as e:
+        st.error(f"❌ Error cargando proyectos: {str(e)}")
+        return {}
+
+# ==============================
+# Título y navegación
+# ==============================
+st.title("⏱️ Tiempos por Etapa")
+st.page_link("main_app.py", label="🔙 Volver al Workflow Principal")
+st.caption("Tiempo que pasan los proyectos activos en cada estado y dónde se están deteniendo")
+
+with st.sidebar:
+    st.header("🎛️ Opciones")
+    percentil = st.slider("Umbral de estancamiento (percentil)", min_value=50, max_value=95, value=75, step=5,
+                          help="Un proyecto se considera estancado si lleva más tiempo en su estado que este percentil de los tramos cerrados")
+    estado_final = st.selectbox("Ciclo hasta", ORDEN_ESTADOS[1:], index=1)
+
+    st.divider()
+    if st.button("🔄 Importar transiciones del historial", use_container_width=True):
+        try:
+            st.success(f"✅ {backfill_transiciones()} transiciones importadas")
+        except Exception as e:
+            st.error(f"❌ Error importando transiciones: {str(e)}")
+
+try:
+    tramos = tramos_por_etapa()
+except Exception as e:
+    st.error(f"❌ Error calculando tramos: {str(e)}")
+    st.stop()
+
+if tramos.empty:
+    st.info("📭 No hay proyectos activos")
+    st.stop()
+
+# ==============================
+# Tiempo en cada etapa
+# ==============================
+resumen = tiempo_en_etapa(tramos)
+resumen = resumen.reindex([e for e in ORDEN_ESTADOS if e in resumen.index])
+
+st.subheader("📊 Días en cada estado")
+cols = st.columns(len(resumen))
+for col, (estado, fila) in zip(cols, resumen.iterrows()):
+    with col:
+        mediana = fila['mediana_dias']
+        st.metric(estado, f"{mediana:.1f} días" if mediana == mediana else "—",
+                  help="Mediana de los tramos cerrados")
+        st.caption(f"{fila['en_curso']} en curso · {fila['tramos_cerrados']} cerrados")
+
+col_grafico, col_tabla = st.columns([1, 1])
+with col_grafico:
+    st.bar_chart(resumen[['mediana_dias', 'p90_dias']].rename(columns={'mediana_dias': 'Mediana', 'p90_dias': 'P90'}))
+with col_tabla:
+    st.dataframe(
+        resumen,
+        column_config={
+            "tramos_cerrados": "Cerrados",
+            "promedio_dias": st.column_config.NumberColumn("Promedio", format="%.1f"),
+            "mediana_dias": st.column_config.NumberColumn("Mediana", format="%.1f"),
+            "p90_dias": st.column_config.NumberColumn("P90", format="%.1f"),
+            "en_curso": "En curso",
+            "edad_promedio_en_curso": st.column_config.NumberColumn("Edad en curso", format="%.1f"),
+        },
+        use_container_width=True
+    )
+
+# ==============================
+# Tiempo de ciclo
+# ==============================
+st.markdown("---")
+st.subheader(f"🔁 Ciclo desde la creación hasta {estado_final}")
+ciclo = tiempos_ciclo(estado_final)
+if ciclo.empty:
+    st.info(f"ℹ️ Ningún proyecto activo ha llegado a {estado_final}")
+else:
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Proyectos", len(ciclo))
+    with col2:
+        st.metric("Mediana", f"{ciclo['dias'].median():.1f} días")
+    with col3:
+        st.metric("P90", f"{ciclo['dias'].quantile(0.9):.1f} días")
+    mensual = ciclo.groupby(ciclo['fecha_llegada'].dt.to_period('M').dt.start_time)['dias'].median()
+    st.line_chart(mensual.rename("Mediana de días"))
+
+# ==============================
+# Proyectos estancados
+# ==============================
+st.markdown("---")
+st.subheader("🐢 Proyectos estancados")
+estancados = proyectos_estancados(tramos, percentil / 100)
+if estancados.empty:
+    st.success("✅ Ningún proyecto supera el umbral en su estado actual")
+else:
+    datos = obtener_proyectos(estancados['proyecto_id'].tolist())
+    estancados = estancados.assign(
+        codigo=estancados['proyecto_id'].map(lambda i: datos.get(i, ("", "", ""))[0]),
+        nombre=estancados['proyecto_id'].map(lambda i: datos.get(i, ("", "", ""))[1]),
+        ejecutivo=estancados['proyecto_id'].map(lambda i: datos.get(i, ("", "", ""))[2]),
+    )
+    st.dataframe(
+        estancados[['codigo', 'nombre', 'ejecutivo', 'estado', 'inicio', 'dias', 'limite_dias']],
+        column_config={
+            "codigo": "Código",
+            "nombre": "Proyecto",
+            "ejecutivo": "Ejecutivo",
+            "estado": "Estado",
+            "inicio": st.column_config.DatetimeColumn("Desde", format="DD/MM/YYYY"),
+            "dias": st.column_config.NumberColumn("Días en estado", format="%.0f"),
+            "limite_dias": st.column_config.NumberColumn(f"P{percentil} del estado", format="%.1f"),
+        },
+        hide_index=True,
+        use_container_width=True
+    )
@@ -0,0 +1,125 @@
+# pages/9_Mantenimiento.py
+import streamlit as st
+import pandas as pd
+from datetime import datetime
+from database import SessionLocal
+from models import Usuario
+from reconciliacion import reconciliar, reparar, RAIZ_ARCHIVOS, DIRECTORIO_HUERFANOS
+
+# ==============================
+# Configuración de la página
+# ==============================
+st.set_page_config(page_title="Mantenimiento", layout="wide", page_icon="🛠️")
+
+st.title("🛠️ Mantenimiento de Archivos")
+st.page_link("main_app.py", label="🔙 Volver al Workflow Principal")
+st.caption(f"Reconciliación entre los documentos registrados y el contenido de {RAIZ_ARCHIVOS}")
+
+if 'reconciliacion' not in st.session_state:
+    st.session_state.reconciliacion = None
+
+def cargar_usuarios_activos():
+    """{id: nombre} de los usuarios activos"""
+    db = SessionLocal()
+    try:
+        return {u.id: u.nombre for u in db.query(Usuario).filter(Usuario.activo == True).order_by(Usuario.nombre)}
+    finally:
+        db.close()
+
+# ==============================
+# Escaneo
+# ==============================
+col1, col2 = st.columns([1, 3])
+with col1:
+    completo = st.checkbox("Revisión completa", value=False,
+                           help="Vuelve a leer todos los directorios. Necesario para detectar archivos reemplazados con el mismo nombre.")
+with col2:
+    if st.button("🔍 Reconciliar", type="primary"):
+        with st.spinner("Escaneando archivos..."):
+            try:
+                st.session_state.reconciliacion = reconciliar(completo=completo)
+            except Exception as e:
+                st.error(f"❌ Error en la reconciliación: {str(e)}")
+
+resultado = st.session_state.reconciliacion
+
+if not resultado:
+    st.info("Presiona **Reconciliar** para comparar la base de datos con los archivos en disco.")
+    st.stop()
+
+st.caption(
+    f"Último escaneo: {resultado['fecha'].strftime('%d/%m/%Y %H:%M')} • "
+    f"{resultado['directorios_examinados']} de {resultado['directorios_total']} directorios examinados "
+    f"en {resultado['duracion_segundos']:.2f} s"
+)
+
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Archivos en disco", resultado['archivos_en_disco'])
+col2.metric("Huérfanos", len(resultado['huerfanos']))
+col3.metric("Faltantes", len(resultado['faltantes']))
+col4.metric("Tamaño distinto", len(resultado['diferencias_tamanio']))
+
+# ==============================
+# Detalle
+# ==============================
+with st.expander(f"📂 Archivos huérfanos ({len(resultado['huerfanos'])})", expanded=bool(resultado['huerfanos'])):
+    st.caption("Existen en disco pero no están registrados en ningún proyecto")
+    if resultado['huerfanos']:
+        st.dataframe(pd.DataFrame(resultado['huerfanos']), use_container_width=True, hide_index=True)
+
+with st.expander(f"❓ Registros sin archivo ({len(resultado['faltantes'])})", expanded=bool(resultado['faltantes'])):
+    st.caption("Registrados en la base de datos pero el archivo no existe en disco")
+    if resultado['faltantes']:
+        st.dataframe(pd.DataFrame(resultado['faltantes']), use_container_width=True, hide_index=True)
+
+with st.expander(f"⚖️ Diferencias de tamaño ({len(resultado['diferencias_tamanio'])})"):
+    st.caption("El tamaño en disco no coincide con el registrado al subir el archivo")
+    if resultado['diferencias_tamanio']:
+        st.dataframe(pd.DataFrame(resultado['diferencias_tamanio']), use_container_width=True, hide_index=True)
+
+if resultado['sin_tamanio']:
+    st.caption(f"ℹ️ {len(resultado['sin_tamanio'])} registros anteriores no tienen tamaño registrado.")
+
+# ==============================
+# Reparación
+# ==============================
+st.markdown("---")
+st.subheader("🔧 Reparar")
+
+registrar = st.checkbox("Registrar huérfanos cuyo proyecto se puede identificar por la ruta")
+mover = st.checkbox(f"Mover los huérfanos restantes a {DIRECTORIO_HUERFANOS}")
+eliminar = st.checkbox("Eliminar registros cuyo archivo no existe")
+actualizar = st.checkbox("Actualizar tamaños registrados con el tamaño en disco")
+
+usuarios = cargar_usuarios_activos()
+responsable = st.selectbox("Responsable de la reparación*", list(usuarios), index=None,
+                           format_func=lambda i: usuarios[i], placeholder="Selecciona tu usuario")
+
+if st.button("🔧 Aplicar reparaciones",
+             disabled=responsable is None or not (registrar or mover or eliminar or actualizar)):
+    try:
+        conteo = reparar(
+            resultado,
+            usuario_id=responsable,
+            registrar_huerfanos=registrar,
+            mover_huerfanos=mover,
+            eliminar_faltantes=eliminar,
+            actualizar_tamanios=actualizar
+        )
+        st.success(
+            f"✅ Registrados: {conteo['registrados']} • Movidos: {conteo['movidos']} • "
+            f"Eliminados: {conteo['eliminados']} • Tamaños actualizados: {conteo['tamanios']}"
+        )
+        if conteo['omitidos']:
+            st.info(f"ℹ️ {conteo['omitidos']} elementos cambiaron desde el escaneo y se omitieron")
+        for error in conteo['errores']:
+            st.warning(f"⚠️ No se pudo mover {error['ruta']}: {error['error']}")
+        st.session_state.reconciliacion = None
+    except Exception as e:
+        st.error(f"❌ Error al reparar: {str(e)}")
+
+# ==============================
+# Footer
+# ==============================
+st.markdown("---")
+st.caption(f"🛠️ Mantenimiento - Actualizado: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
@@ -0,0 +1,63 @@
+import os
+from urllib.parse import urlsplit
+
+import streamlit as st
+
+from exportacion import EXPORTACION_PUERTO, estado_exportacion, solicitar_exportacion, url_descarga
+
+# ==============================
+# Exportación de documentos (modal de archivos)
+# ==============================
+# URL pública del servidor de descargas (proxy o EXPORTACION_HOST expuesto); sin ella se usa el
+# host con el que el navegador abrió la app, que solo alcanza al servidor si es la misma máquina
+EXPORTACION_URL = os.environ.get("EXPORTACION_URL")
+
+def _base_descargas():
+    if EXPORTACION_URL:
+        return EXPORTACION_URL
+    host = urlsplit(f"//{st.context.headers.get('Host') or 'localhost'}").hostname or "localhost"
+    return f"http://{host}:{EXPORTACION_PUERTO}"
+
+def panel_exportacion(proyecto):
+    """Sección "Exportar documentos": encola el ZIP del alcance elegido y muestra el enlace cuando está listo.
+
+    Se llama dentro del fragmento del modal de archivos.
+    """
+    st.divider()
+    st.subheader("📦 Exportar documentos")
+    alcances = {"Proyecto": ('proyecto', proyecto.id)}
+    if proyecto.cliente:
+        alcances["Cliente"] = ('cliente', proyecto.cliente_id)
+    if proyecto.codigo_convocatoria:
+        alcances["Convocatoria"] = ('convocatoria', proyecto.codigo_convocatoria)
+
+    alcance = st.radio("Alcance", list(alcances.keys()), horizontal=True, key="alcance_exportacion")
+    if st.button("📦 Generar ZIP", key="generar_zip"):
+        try:
+            clave = solicitar_exportacion(*alcances[alcance])
+            st.session_state.exportacion_zip = {'clave': clave, 'proyecto_id': proyecto.id}
+        except Exception as e:
+            st.error(f"❌ Error al generar ZIP: {str(e)}")
+
+    pedido = st.session_state.get("exportacion_zip")
+    if not pedido or pedido['proyecto_id'] != proyecto.id:
+        return
+    trabajo = estado_exportacion(pedido['clave'])
+    if trabajo is None:
+        return
+
+    if trabajo['estado'] == 'en_proceso':
+        st.info("⏳ Generando ZIP en segundo plano; puedes seguir trabajando")
+        if st.button("🔄 Actualizar estado", key="actualizar_zip"):
+            st.rerun(scope="fragment")
+    elif trabajo['estado'] == 'error':
+        st.error(f"❌ Error al generar ZIP: {trabajo['error']}")
+    elif trabajo['estado'] == 'vacio':
+        st.info("📝 No hay archivos para exportar")
+    else:
+        exportacion = trabajo['resultado']
+        st.caption(f"{exportacion['total_archivos']} archivos • {exportacion['tamanio_bytes'] / (1024 * 1024):,.1f} MB"
+                   f"{' • reutilizado' if exportacion['reutilizado'] else ''}")
+        if exportacion['faltantes']:
+            st.warning(f"⚠️ {exportacion['faltantes']} archivos no encontrados (ver MANIFIESTO.csv)")
+        st.link_button("⬇️ Descargar ZIP", url_descarga(exportacion['nombre'], _base_descargas()))
@@ -0,0 +1,204 @@
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from configuracion import configuracion
+from tipo_cambio import tipos_cambio_a_fecha
+
+# ==============================
+# Frame columnar del portafolio
+# ==============================
+COLUMNAS = [
+    'id', 'estado', 'moneda', 'valor_estimado', 'tipo_cambio', 'probabilidad',
+    'cliente_id', 'asignado_a_id', 'plazo_entrega', 'fecha_ultima_actualizacion', 'fecha_deadline_propuesta',
+    'fecha_presentacion_cotizacion', 'fecha_creacion', 'fecha_ingreso_oc', 'fecha_facturacion', 'fecha_pago',
+]
+
+# Atributos de Proyecto que lee construir_portafolio; bastan filas de columnas, sin objetos ORM
+ATRIBUTOS_PORTAFOLIO = (
+    'id', 'estado_actual', 'moneda', 'valor_estimado', 'tipo_cambio_historico', 'probabilidad_cierre',
+    'cliente_id', 'asignado_a_id', 'plazo_entrega', 'fecha_ultima_actualizacion', 'fecha_deadline_propuesta',
+    'fecha_presentacion_cotizacion', 'fecha_creacion', 'fecha_ingreso_oc', 'fecha_facturacion', 'fecha_pago',
+)
+
+# Fechas de referencia admitidas para la conversión a una fecha
+FECHAS_CONVERSION = {
+    'fecha_creacion': "Fecha de creación",
+    'fecha_ingreso_oc': "Ingreso de OC",
+    'fecha_facturacion': "Facturación",
+    'fecha_pago': "Pago",
+}
+
+# Opciones de tipo de cambio para mostrar montos convertidos
+BASES_TIPO_CAMBIO = {
+    'historico': "Histórico del proyecto",
+    'hoy': "Vigente hoy",
+    **FECHAS_CONVERSION,
+}
+
+def construir_portafolio(proyectos, ahora=None):
+    """Frame con una fila por proyecto (índice = id) para cálculos vectorizados"""
+    ahora = ahora or datetime.now()
+    tipo_cambio_default = configuracion().TIPO_CAMBIO_DEFAULT
+    datos = {
+        'id': [p.id for p in proyectos],
+        'estado': [p.estado_actual for p in proyectos],
+        'moneda': [p.moneda for p in proyectos],
+        'valor_estimado': [p.valor_estimado or 0.0 for p in proyectos],
+        'tipo_cambio': [p.tipo_cambio_historico or tipo_cambio_default for p in proyectos],
+        'probabilidad': [p.probabilidad_cierre or 0 for p in proyectos],
+        'cliente_id': [p.cliente_id for p in proyectos],
+        'asignado_a_id': [p.asignado_a_id for p in proyectos],
+        'plazo_entrega': [p.plazo_entrega for p in proyectos],
+        'fecha_ultima_actualizacion': [p.fecha_ultima_actualizacion for p in proyectos],
+        'fecha_deadline_propuesta': [p.fecha_deadline_propuesta for p in proyectos],
+        'fecha_presentacion_cotizacion': [p.fecha_presentacion_cotizacion for p in proyectos],
+        'fecha_creacion': [p.fecha_creacion for p in proyectos],
+        'fecha_ingreso_oc': [p.fecha_ingreso_oc for p in proyectos],
+        'fecha_facturacion': [p.fecha_facturacion for p in proyectos],
+        'fecha_pago': [p.fecha_pago for p in proyectos],
+    }
+    df = pd.DataFrame(datos, columns=COLUMNAS).set_index('id', drop=False)
+    df['valor_estimado'] = df['valor_estimado'].astype(float)
+    df['tipo_cambio'] = df['tipo_cambio'].astype(float)
+    df['probabilidad'] = df['probabilidad'].astype(float)
+    for columna in ('fecha_ultima_actualizacion', 'fecha_deadline_propuesta', 'fecha_presentacion_cotizacion',
+                    *FECHAS_CONVERSION):
+        df[columna] = pd.to_datetime(df[columna], errors='coerce')
+
+    df['dias_sin_actualizar'] = (pd.Timestamp(ahora) - df['fecha_ultima_actualizacion']).dt.days
+    df['deadline_vencido'] = df['fecha_deadline_propuesta'].notna() & (df['fecha_deadline_propuesta'] < pd.Timestamp(ahora))
+
+    # Fecha límite que define la urgencia: deadline de propuesta pendiente o plazo de entrega
+    pendiente_propuesta = df['estado'].isin(['OPORTUNIDAD', 'PREVENTA']) & df['fecha_presentacion_cotizacion'].isna()
+    fecha_entrega = df['fecha_ingreso_oc'] + pd.to_timedelta(df['plazo_entrega'].fillna(0), unit='D')
+    df['fecha_limite'] = df['fecha_deadline_propuesta'].where(pendiente_propuesta)
+    df.loc[df['estado'] == 'DELIVERY', 'fecha_limite'] = fecha_entrega
+    return df
+
+def ordenar_por_urgencia(df):
+    """Ordena por fecha límite más próxima (sin fecha al final) y luego por más días sin actualizar"""
+    return df.sort_values(['fecha_limite', 'fecha_ultima_actualizacion'], ascending=[True, True], na_position='last')
+
+# ==============================
+# Conversión de moneda
+# ==============================
+def factor_conversion(monedas, moneda_destino, tipo_cambio):
+    """Factor por fila para llevar montos PEN/USD a la moneda destino (mismas reglas que convertir_moneda)"""
+    monedas = np.asarray(monedas)
+    tipo_cambio = np.broadcast_to(np.asarray(tipo_cambio, dtype=float), monedas.shape)
+    factor = np.ones(monedas.shape, dtype=float)
+    if moneda_destino == 'USD':
+        mascara = monedas == 'PEN'
+        factor[mascara] = 1.0 / tipo_cambio[mascara]
+    elif moneda_destino == 'PEN':
+        mascara = monedas == 'USD'
+        factor[mascara] = tipo_cambio[mascara]
+    return factor
+
+def convertir_columna(df, moneda_destino, tipo_cambio=None, columna='valor_estimado'):
+    """Serie con `columna` convertida; sin tipo_cambio usa el histórico de cada proyecto"""
+    tasas = df['tipo_cambio'].to_numpy() if tipo_cambio is None else tipo_cambio
+    return df[columna] * factor_conversion(df['moneda'].to_numpy(), moneda_destino, tasas)
+
+def tasas_a_fecha(df, fecha):
+    """Tipo de cambio por fila vigente en `fecha` (columna de FECHAS_CONVERSION o una fecha fija).
+
+    Con una columna, las filas sin fecha o anteriores al historial usan el tipo de
+    cambio histórico del proyecto; con una fecha fija, el TIPO_CAMBIO_DEFAULT.
+    """
+    if isinstance(fecha, str):
+        return tipos_cambio_a_fecha(df[fecha].to_numpy(), respaldo=df['tipo_cambio'].to_numpy())
+    return tipos_cambio_a_fecha(np.full(len(df), np.datetime64(fecha, 'D')))
+
+def tasas_para_base(df, base='historico'):
+    """Tipo de cambio por fila según una opción de BASES_TIPO_CAMBIO (None = histórico del proyecto)"""
+    if base == 'historico':
+        return None
+    if base == 'hoy':
+        return tasas_a_fecha(df, date.today())
+    return tasas_a_fecha(df, base)
+
+def convertir_a_fecha(df, moneda_destino, fecha='fecha_creacion', columna='valor_estimado'):
+    """Convierte `columna` con el tipo de cambio vigente en `fecha`"""
+    return convertir_columna(df, moneda_destino, tasas_a_fecha(df, fecha), columna)
+
+def revaluacion_al_cierre(df, fecha_cierre, moneda_destino='PEN', fecha_origen='fecha_creacion'):
+    """Valor de cada proyecto al tipo de cambio de origen y al de cierre, con la diferencia de cambio"""
+    tasas_origen = tasas_a_fecha(df, fecha_origen)
+    tasas_cierre = tasas_a_fecha(df, fecha_cierre)
+    resultado = pd.DataFrame({
+        'id': df['id'],
+        'estado': df['estado'],
+        'moneda': df['moneda'],
+        'valor_estimado': df['valor_estimado'],
+        'tipo_cambio_origen': tasas_origen,
+        'tipo_cambio_cierre': tasas_cierre,
+        'valor_origen': convertir_columna(df, moneda_destino, tasas_origen),
+        'valor_cierre': convertir_columna(df, moneda_destino, tasas_cierre),
+    })
+    resultado['diferencia_cambio'] = resultado['valor_cierre'] - resultado['valor_origen']
+    return resultado
+
+# ==============================
+# KPIs
+# ==============================
+def resumen_kpis(df, moneda_destino, tipo_cambio=None, probabilidad_fija=None, dias_riesgo=None):
+    """Totales, promedio y valor ponderado por probabilidad en la moneda destino (riesgo: DIAS_ALERTA_RIESGO por defecto)"""
+    if df.empty:
+        return {'cantidad': 0, 'total': 0.0, 'ponderado': 0.0, 'promedio': 0.0,
+                'en_riesgo': 0, 'deadlines_vencidos': 0}
+
+    if dias_riesgo is None:
+        dias_riesgo = configuracion().DIAS_ALERTA_RIESGO
+    valores = convertir_columna(df, moneda_destino, tipo_cambio)
+    probabilidad = df['probabilidad'] if probabilidad_fija is None else probabilidad_fija
+    total = float(valores.sum())
+    return {
+        'cantidad': len(df),
+        'total': total,
+        'ponderado': float((valores * probabilidad / 100).sum()),
+        'promedio': total / len(df),
+        'en_riesgo': int((df['dias_sin_actualizar'] > dias_riesgo).sum()),
+        'deadlines_vencidos': int(df['deadline_vencido'].sum()),
+    }
+
+def totales_por_estado(df, moneda_destino, tipo_cambio=None):
+    """Cantidad, total y valor ponderado agrupados por estado"""
+    valores = convertir_columna(df, moneda_destino, tipo_cambio)
+    agrupado = pd.DataFrame({
+        'estado': df['estado'],
+        'total': valores,
+        'ponderado': valores * df['probabilidad'] / 100,
+    }).groupby('estado')
+    resumen = agrupado.agg(cantidad=('total', 'size'), total=('total', 'sum'), ponderado=('ponderado', 'sum'))
+    return resumen
+
+# ==============================
+# Revaluación de cierre por consola
+# ==============================
+if __name__ == "__main__":
+    import argparse
+
+    from database import SessionLocal
+    from models import Proyecto
+
+    parser = argparse.ArgumentParser(description="Revaluación del portafolio al tipo de cambio de una fecha de cierre")
+    parser.add_argument("fecha_cierre", type=date.fromisoformat, help="AAAA-MM-DD")
+    parser.add_argument("--moneda", default="PEN", choices=["PEN", "USD"])
+    parser.add_argument("--origen", default="fecha_creacion", choices=list(FECHAS_CONVERSION))
+    parser.add_argument("--salida", help="Ruta del CSV (por defecto se imprime el resumen)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        proyectos = db.query(Proyecto).filter(Proyecto.activo == True).all()
+        portafolio = construir_portafolio(proyectos)
+    finally:
+        db.close()
+
+    revaluacion = revaluacion_al_cierre(portafolio, args.fecha_cierre, args.moneda, args.origen)
+    if args.salida:
+        revaluacion.to_csv(args.salida, index=False)
+    print(revaluacion.groupby('estado')[['valor_origen', 'valor_cierre', 'diferencia_cambio']].sum().round(2))
@@ -0,0 +1,174 @@
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Configuración de la caché
+# ==============================
+DIRECTORIO_CACHE = "files/cache/previsualizaciones"
+TAMANIO_MAXIMO_CACHE = int(os.environ.get("PREVISUALIZACION_CACHE_MB", "256")) * 1024 * 1024
+
+# Ancho máximo en píxeles para cada variante
+TAMANIOS = {
+    'miniatura': 240,
+    'vista': 1000,
+}
+
+EXTENSIONES_IMAGEN = {'.jpg', '.jpeg', '.png'}
+EXTENSIONES_PDF = {'.pdf'}
+
+_lock = threading.Lock()
+_uso_cache = None  # Bytes ocupados; se calcula al primer uso
+
+# Memo en proceso de hashes: (ruta, tamaño, mtime) -> sha256
+_hashes = OrderedDict()
+_MAX_HASHES = 4096
+
+def soporta_previsualizacion(ruta):
+    """Indica si el archivo admite miniatura (PDF o imagen)"""
+    extension = os.path.splitext(ruta)[1].lower()
+    return extension in EXTENSIONES_IMAGEN or extension in EXTENSIONES_PDF
+
+def hash_archivo(ruta):
+    """SHA-256 del contenido, recalculado solo si cambian tamaño o fecha de modificación"""
+    info = os.stat(ruta)
+    clave = (ruta, info.st_size, info.st_mtime_ns)
+
+    with _lock:
+        if clave in _hashes:
+            _hashes.move_to_end(clave)
+            return _hashes[clave]
+
+    hasher = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(bloque)
+    digest = hasher.hexdigest()
+
+    with _lock:
+        _hashes[clave] = digest
+        while len(_hashes) > _MAX_HASHES:
+            _hashes.popitem(last=False)
+    return digest
+
+# ==============================
+# Renderizado
+# ==============================
+def _renderizar_imagen(ruta, ancho, destino):
+    from PIL import Image, ImageOps
+
+    with Image.open(ruta) as imagen:
+        imagen.draft("RGB", (ancho, ancho))  # Decodificación reducida en JPEG
+        imagen = ImageOps.exif_transpose(imagen).convert("RGB")
+        imagen.thumbnail((ancho, ancho * 2))
+        imagen.save(destino, "JPEG", quality=80, optimize=True)
+
+def _renderizar_pdf(ruta, ancho, destino):
+    """Renderiza la primera página con PyMuPDF o, en su defecto, con pdftoppm"""
+    try:
+        import fitz
+    except ImportError:
+        fitz = None
+
+    if fitz is not None:
+        with fitz.open(ruta) as documento:
+            pagina = documento[0]
+            escala = ancho / pagina.rect.width
+            pixmap = pagina.get_pixmap(matrix=fitz.Matrix(escala, escala), alpha=False)
+            pixmap.save(destino, output="jpeg", jpg_quality=80)
+        return
+
+    if shutil.which("pdftoppm"):
+        base = destino[:-len(".jpg")]
+        subprocess.run(
+            ["pdftoppm", "-f", "1", "-l", "1", "-singlefile", "-jpeg", "-scale-to-x", str(ancho),
+             "-scale-to-y", "-1", ruta, base],
+            check=True, capture_output=True, timeout=30
+        )
+        return
+
+    raise RuntimeError("No hay renderizador de PDF disponible (instale PyMuPDF o poppler-utils)")
+
+# ==============================
+# Caché LRU en disco
+# ==============================
+def _calcular_uso():
+    total = 0
+    if os.path.isdir(DIRECTORIO_CACHE):
+        for entrada in os.scandir(DIRECTORIO_CACHE):
+            if entrada.is_file():
+                total += entrada.stat().st_size
+    return total
+
+def _registrar_escritura(tamanio):
+    """Suma el nuevo archivo al uso y desaloja los menos usados si se supera el límite"""
+    global _uso_cache
+    with _lock:
+        if _uso_cache is None:
+            _uso_cache = _calcular_uso()
+        else:
+            _uso_cache += tamanio
+
+        if _uso_cache <= TAMANIO_MAXIMO_CACHE:
+            return
+
+        # La fecha de modificación se actualiza en cada acceso, así que es el orden LRU
+        entradas = sorted(
+            (e for e in os.scandir(DIRECTORIO_CACHE)
+             if e.is_file() and e.name.endswith(".jpg") and not e.name.startswith(".")),
+            key=lambda e: e.stat().st_mtime
+        )
+        objetivo = TAMANIO_MAXIMO_CACHE * 0.9
+        for entrada in entradas:
+            if _uso_cache <= objetivo:
+                break
+            try:
+                tamanio_entrada = entrada.stat().st_size
+                os.remove(entrada.path)
+                _uso_cache -= tamanio_entrada
+            except OSError:
+                pass
+
+def obtener_previsualizacion(ruta, variante='miniatura'):
+    """Ruta de la previsualización en caché; la genera si no existe. None si no se puede"""
+    if variante not in TAMANIOS or not soporta_previsualizacion(ruta) or not os.path.exists(ruta):
+        return None
+
+    try:
+        digest = hash_archivo(ruta)
+    except OSError:
+        return None
+
+    destino = os.path.join(DIRECTORIO_CACHE, f"{digest}_{variante}.jpg")
+    if os.path.exists(destino):
+        try:
+            os.utime(destino)  # Marca de uso para el orden LRU
+        except OSError:
+            pass
+        return destino
+
+    os.makedirs(DIRECTORIO_CACHE, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(suffix=".jpg", dir=DIRECTORIO_CACHE, prefix=".tmp_")
+    os.close(descriptor)
+    try:
+        extension = os.path.splitext(ruta)[1].lower()
+        if extension in EXTENSIONES_PDF:
+            _renderizar_pdf(ruta, TAMANIOS[variante], temporal)
+        else:
+            _renderizar_imagen(ruta, TAMANIOS[variante], temporal)
+        os.replace(temporal, destino)
+    except Exception as e:
+        logger.warning(f"No se pudo generar previsualización de {ruta}: {e}")
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        return None
+
+    _registrar_escritura(os.path.getsize(destino))
+    return destino
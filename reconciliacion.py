@@ -0,0 +1,358 @@
+import argparse
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+from database import SessionLocal, engine
+from models import Proyecto, TiposArchivo, ProyectoArchivos
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Configuración
+# ==============================
+RAIZ_ARCHIVOS = "files/proyectos"
+DIRECTORIO_HUERFANOS = "files/huerfanos"
+TAMANIO_LOTE = 1000
+
+_esquema_listo = False
+_esquema_lock = threading.Lock()
+
+def asegurar_esquema():
+    """Crea las tablas del índice persistente del filesystem si no existen"""
+    global _esquema_listo
+    if _esquema_listo:
+        return
+    with _esquema_lock:
+        if _esquema_listo:
+            return
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS fs_directorios (
+                    ruta TEXT PRIMARY KEY,
+                    padre TEXT,
+                    mtime_ns INTEGER NOT NULL,
+                    fecha_escaneo DATETIME
+                )
+            """))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_fs_directorios_padre ON fs_directorios (padre)"))
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS fs_archivos (
+                    ruta TEXT PRIMARY KEY,
+                    directorio TEXT NOT NULL,
+                    tamanio_bytes INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL
+                )
+            """))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_fs_archivos_directorio ON fs_archivos (directorio)"))
+        _esquema_listo = True
+
+def _normalizar(ruta):
+    return os.path.normpath(ruta).replace(os.sep, "/")
+
+# ==============================
+# Escaneo incremental
+# ==============================
+def _eliminar_directorios(conn, rutas):
+    for ruta in rutas:
+        conn.execute(text("DELETE FROM fs_archivos WHERE directorio = :ruta"), {"ruta": ruta})
+        conn.execute(text("DELETE FROM fs_directorios WHERE ruta = :ruta"), {"ruta": ruta})
+
+def escanear(raiz=RAIZ_ARCHIVOS, completo=False):
+    """Actualiza el índice del filesystem; solo lista los directorios cuyo mtime cambió.
+
+    Agregar, quitar o renombrar archivos cambia el mtime del directorio. Una
+    modificación en sitio (mismo nombre) no lo cambia: use completo=True para
+    volver a leer tamaño y fecha de todos los archivos.
+    """
+    asegurar_esquema()
+    raiz = _normalizar(raiz)
+    inicio = time.monotonic()
+
+    with engine.connect() as conn:
+        filas = conn.execute(text("SELECT ruta, padre, mtime_ns FROM fs_directorios")).fetchall()
+
+    conocidos = {ruta: mtime for ruta, _, mtime in filas}
+    hijos = {}
+    for ruta, padre, _ in filas:
+        hijos.setdefault(padre, []).append(ruta)
+
+    vistos = set()
+    examinados = 0
+    pendientes = [raiz]
+    ahora = datetime.now()
+
+    with engine.begin() as conn:
+        while pendientes:
+            directorio = pendientes.pop()
+            try:
+                info = os.stat(directorio)
+            except OSError:
+                continue
+            vistos.add(directorio)
+
+            if not completo and conocidos.get(directorio) == info.st_mtime_ns:
+                pendientes.extend(hijos.get(directorio, []))
+                continue
+
+            archivos, subdirectorios = [], []
+            try:
+                with os.scandir(directorio) as entradas:
+                    for entrada in entradas:
+                        if entrada.is_dir(follow_symlinks=False):
+                            subdirectorios.append(_normalizar(entrada.path))
+                        elif entrada.is_file(follow_symlinks=False):
+                            estado = entrada.stat(follow_symlinks=False)
+                            archivos.append({
+                                "ruta": _normalizar(entrada.path),
+                                "directorio": directorio,
+                                "tamanio": estado.st_size,
+                                "mtime": estado.st_mtime_ns,
+                            })
+            except OSError as e:
+                logger.warning(f"No se pudo listar {directorio}: {e}")
+                continue
+
+            conn.execute(text("DELETE FROM fs_archivos WHERE directorio = :ruta"), {"ruta": directorio})
+            for i in range(0, len(archivos), TAMANIO_LOTE):
+                conn.execute(text("""
+                    INSERT INTO fs_archivos (ruta, directorio, tamanio_bytes, mtime_ns)
+                    VALUES (:ruta, :directorio, :tamanio, :mtime)
+                """), archivos[i:i + TAMANIO_LOTE])
+            conn.execute(text("""
+                INSERT INTO fs_directorios (ruta, padre, mtime_ns, fecha_escaneo)
+                VALUES (:ruta, :padre, :mtime, :fecha)
+                ON CONFLICT(ruta) DO UPDATE SET
+                    padre = excluded.padre, mtime_ns = excluded.mtime_ns, fecha_escaneo = excluded.fecha_escaneo
+            """), {
+                "ruta": directorio,
+                "padre": None if directorio == raiz else _normalizar(os.path.dirname(directorio)),
+                "mtime": info.st_mtime_ns,
+                "fecha": ahora,
+            })
+
+            examinados += 1
+            pendientes.extend(subdirectorios)
+
+        # Directorios que ya no existen bajo la raíz
+        desaparecidos = [ruta for ruta in conocidos
+                         if ruta not in vistos and (ruta == raiz or ruta.startswith(raiz + "/"))]
+        _eliminar_directorios(conn, desaparecidos)
+
+    return {
+        'directorios_total': len(vistos),
+        'directorios_examinados': examinados,
+        'directorios_eliminados': len(desaparecidos),
+        'duracion_segundos': time.monotonic() - inicio,
+    }
+
+# ==============================
+# Reconciliación contra proyecto_archivos
+# ==============================
+def reconciliar(raiz=RAIZ_ARCHIVOS, completo=False):
+    """Compara proyecto_archivos con el índice del filesystem y reporta diferencias"""
+    estadisticas = escanear(raiz, completo)
+    raiz = _normalizar(raiz)
+
+    with engine.connect() as conn:
+        en_disco = {ruta: tamanio for ruta, tamanio in conn.execute(text(
+            "SELECT ruta, tamanio_bytes FROM fs_archivos WHERE ruta LIKE :prefijo"
+        ), {"prefijo": raiz + "/%"})}
+        registros = conn.execute(text("""
+            SELECT pa.id, pa.ruta_archivo, pa.tamanio_bytes, pa.nombre_archivo, p.codigo_proyecto
+            FROM proyecto_archivos pa
+            LEFT JOIN proyectos p ON p.id = pa.proyecto_id
+        """)).fetchall()
+
+    faltantes, diferencias, sin_tamanio = [], [], []
+    referenciadas = set()
+
+    for archivo_id, ruta_bd, tamanio_bd, nombre, codigo in registros:
+        ruta = _normalizar(ruta_bd)
+        referenciadas.add(ruta)
+
+        if ruta.startswith(raiz + "/"):
+            tamanio_disco = en_disco.get(ruta)
+        else:
+            # Rutas fuera de la raíz escaneada: verificación directa
+            tamanio_disco = os.path.getsize(ruta) if os.path.isfile(ruta) else None
+
+        fila = {'id': archivo_id, 'codigo_proyecto': codigo, 'nombre_archivo': nombre, 'ruta': ruta_bd}
+        if tamanio_disco is None:
+            faltantes.append(fila)
+        elif tamanio_bd is None:
+            sin_tamanio.append({**fila, 'tamanio_disco': tamanio_disco})
+        elif tamanio_bd != tamanio_disco:
+            diferencias.append({**fila, 'tamanio_bd': tamanio_bd, 'tamanio_disco': tamanio_disco})
+
+    huerfanos = [{'ruta': ruta, 'tamanio_bytes': tamanio}
+                 for ruta, tamanio in sorted(en_disco.items()) if ruta not in referenciadas]
+
+    return {
+        **estadisticas,
+        'raiz': raiz,
+        'archivos_en_disco': len(en_disco),
+        'registros_bd': len(registros),
+        'huerfanos': huerfanos,
+        'faltantes': faltantes,
+        'diferencias_tamanio': diferencias,
+        'sin_tamanio': sin_tamanio,
+        'fecha': datetime.now(),
+    }
+
+# ==============================
+# Acciones de reparación
+# ==============================
+def _proyecto_y_tipo_desde_ruta(db, ruta, raiz, tipos):
+    """Deduce proyecto y tipo desde files/proyectos/CLIENTE/CODIGO/TIPO_nombre.ext"""
+    partes = os.path.relpath(ruta, raiz).replace(os.sep, "/").split("/")
+    if len(partes) != 3:
+        return None, None, None
+    _, codigo, nombre = partes
+    proyecto = db.query(Proyecto).filter(Proyecto.codigo_proyecto == codigo).first()
+    if not proyecto:
+        return None, None, None
+
+    prefijo, _, resto = nombre.partition("_")
+    tipo = tipos.get(prefijo) or tipos.get("OTRO")
+    nombre_original = resto if prefijo in tipos and resto else nombre
+    return proyecto, tipo, nombre_original
+
+def _referenciadas(db):
+    """Rutas (normalizadas) registradas en proyecto_archivos en este momento"""
+    return {_normalizar(ruta) for (ruta,) in db.query(ProyectoArchivos.ruta_archivo).all()}
+
+def reparar(resultado, *, usuario_id, registrar_huerfanos=False, mover_huerfanos=False,
+            eliminar_faltantes=False, actualizar_tamanios=False):
+    """Aplica las reparaciones seleccionadas sobre un resultado de reconciliar().
+
+    El resultado puede venir de una ejecución anterior de la página, así que cada
+    ruta se vuelve a verificar justo antes de actuar y las que ya no están en la
+    misma situación se omiten. `usuario_id` es quien registra los huérfanos.
+    """
+    from indice_documentos import encolar_archivo, eliminar_del_indice
+
+    if usuario_id is None:
+        raise ValueError("Se requiere el usuario que aplica la reparación")
+
+    raiz = resultado['raiz']
+    conteo = {'registrados': 0, 'movidos': 0, 'eliminados': 0, 'tamanios': 0, 'omitidos': 0, 'errores': []}
+    nuevos_ids, eliminados_ids, pendientes_mover = [], [], []
+
+    db = SessionLocal()
+    try:
+        if registrar_huerfanos or mover_huerfanos:
+            tipos = {t.nombre: t for t in db.query(TiposArchivo).filter(TiposArchivo.activo == True).all()}
+            referenciadas = _referenciadas(db)
+            for huerfano in resultado['huerfanos']:
+                ruta = huerfano['ruta']
+                if not os.path.isfile(ruta) or _normalizar(ruta) in referenciadas:
+                    conteo['omitidos'] += 1
+                    continue
+
+                proyecto, tipo, nombre = (None, None, None)
+                if registrar_huerfanos:
+                    proyecto, tipo, nombre = _proyecto_y_tipo_desde_ruta(db, ruta, raiz, tipos)
+                if proyecto and tipo:
+                    nuevo = ProyectoArchivos(
+                        proyecto_id=proyecto.id,
+                        tipo_archivo_id=tipo.id,
+                        subido_por_id=usuario_id,
+                        nombre_archivo=nombre,
+                        ruta_archivo=ruta,
+                        tamanio_bytes=os.path.getsize(ruta),
+                        descripcion="Registrado por reconciliación de almacenamiento"
+                    )
+                    db.add(nuevo)
+                    db.flush()
+                    nuevos_ids.append(nuevo.id)
+                    conteo['registrados'] += 1
+                elif mover_huerfanos:
+                    pendientes_mover.append(ruta)
+
+        if eliminar_faltantes:
+            for faltante in resultado['faltantes']:
+                registro = db.get(ProyectoArchivos, faltante['id'])
+                # Solo si el registro sigue apuntando a la misma ruta y el archivo sigue sin existir
+                if registro is None or registro.ruta_archivo != faltante['ruta'] or os.path.exists(registro.ruta_archivo):
+                    conteo['omitidos'] += 1
+                    continue
+                db.delete(registro)
+                eliminados_ids.append(registro.id)
+                conteo['eliminados'] += 1
+
+        if actualizar_tamanios:
+            for fila in resultado['diferencias_tamanio'] + resultado['sin_tamanio']:
+                registro = db.get(ProyectoArchivos, fila['id'])
+                try:
+                    tamanio = os.path.getsize(registro.ruta_archivo) if registro else None
+                except OSError:
+                    tamanio = None
+                if tamanio is None:
+                    conteo['omitidos'] += 1
+                    continue
+                registro.tamanio_bytes = tamanio
+                conteo['tamanios'] += 1
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    # Filesystem e índice solo después de confirmar la transacción; los huérfanos
+    # se verifican otra vez antes de moverlos por si se registraron mientras tanto
+    try:
+        referenciadas = _referenciadas(db) if pendientes_mover else set()
+        for ruta in pendientes_mover:
+            if not os.path.isfile(ruta) or _normalizar(ruta) in referenciadas:
+                conteo['omitidos'] += 1
+                continue
+            destino = os.path.join(DIRECTORIO_HUERFANOS, os.path.relpath(ruta, raiz))
+            try:
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                shutil.move(ruta, destino)
+                conteo['movidos'] += 1
+            except OSError as e:
+                logger.warning(f"No se pudo mover {ruta}: {e}")
+                conteo['errores'].append({'ruta': ruta, 'error': str(e)})
+    finally:
+        db.close()
+
+    for archivo_id in nuevos_ids:
+        encolar_archivo(archivo_id)
+    for archivo_id in eliminados_ids:
+        eliminar_del_indice(archivo_id)
+
+    return conteo
+
+# ==============================
+# Ejecución como job
+# ==============================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconciliación entre proyecto_archivos y el filesystem")
+    parser.add_argument("--raiz", default=RAIZ_ARCHIVOS)
+    parser.add_argument("--completo", action="store_true", help="Revisar todos los directorios, no solo los modificados")
+    parser.add_argument("--actualizar-tamanios", action="store_true")
+    parser.add_argument("--registrar-huerfanos", action="store_true")
+    parser.add_argument("--usuario-id", type=int, help="Usuario que aplica las reparaciones (obligatorio para reparar)")
+    args = parser.parse_args()
+    if (args.actualizar_tamanios or args.registrar_huerfanos) and args.usuario_id is None:
+        parser.error("--usuario-id es obligatorio para aplicar reparaciones")
+
+    logging.basicConfig(level=logging.INFO)
+    resultado = reconciliar(args.raiz, args.completo)
+    print(f"Directorios: {resultado['directorios_total']} ({resultado['directorios_examinados']} examinados) "
+          f"en {resultado['duracion_segundos']:.1f} s")
+    print(f"Huérfanos: {len(resultado['huerfanos'])} | Faltantes: {len(resultado['faltantes'])} | "
+          f"Diferencias de tamaño: {len(resultado['diferencias_tamanio'])}")
+
+    if args.actualizar_tamanios or args.registrar_huerfanos:
+        print(reparar(resultado,
+                      usuario_id=args.usuario_id,
+                      registrar_huerfanos=args.registrar_huerfanos,
+                      actualizar_tamanios=args.actualizar_tamanios))
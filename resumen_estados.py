@@ -0,0 +1,84 @@
+import threading
+import time
+from datetime import date
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import event, func
+
+from database import SessionLocal
+from models import Proyecto
+from portafolio import factor_conversion
+from tipo_cambio import tipos_cambio_a_fecha
+
+# ==============================
+# Resumen por estado en SQL
+# ==============================
+# Respaldo para escrituras hechas fuera de este proceso (scripts, otra instancia)
+RESUMEN_TTL_SEGUNDOS = 300
+
+_cache = {'datos': None, 'momento': 0.0}
+_lock = threading.Lock()
+
+def _consultar_resumen():
+    """Cantidad, total y valor ponderado por estado y moneda con GROUP BY"""
+    db = SessionLocal()
+    try:
+        filas = db.query(
+            Proyecto.estado_actual,
+            Proyecto.moneda,
+            func.count(Proyecto.id),
+            func.coalesce(func.sum(Proyecto.valor_estimado), 0.0),
+            func.coalesce(func.sum(Proyecto.valor_estimado * func.coalesce(Proyecto.probabilidad_cierre, 0) / 100.0), 0.0),
+        ).filter(
+            Proyecto.activo == True
+        ).group_by(
+            Proyecto.estado_actual, Proyecto.moneda
+        ).all()
+    finally:
+        db.close()
+    return pd.DataFrame(filas, columns=['estado', 'moneda', 'cantidad', 'total', 'ponderado'])
+
+def resumen_por_estado_moneda():
+    """Frame (estado, moneda, cantidad, total, ponderado) en la moneda original, con caché"""
+    with _lock:
+        if _cache['datos'] is None or time.monotonic() - _cache['momento'] > RESUMEN_TTL_SEGUNDOS:
+            _cache['datos'] = _consultar_resumen()
+            _cache['momento'] = time.monotonic()
+        return _cache['datos']
+
+def resumen_por_estado(moneda_destino='PEN', tipo_cambio=None):
+    """Cantidad, total y ponderado por estado (índice) en la moneda destino.
+
+    Sin `tipo_cambio` usa el vigente hoy, la misma base que "Vigente hoy" en las páginas.
+    """
+    resumen = resumen_por_estado_moneda()
+    if tipo_cambio is None:
+        tipo_cambio = float(tipos_cambio_a_fecha(np.array([np.datetime64(date.today(), 'D')]))[0])
+
+    factor = factor_conversion(resumen['moneda'].to_numpy(), moneda_destino, tipo_cambio)
+    convertido = resumen.assign(total=resumen['total'] * factor, ponderado=resumen['ponderado'] * factor)
+    return convertido.groupby('estado')[['cantidad', 'total', 'ponderado']].sum()
+
+def invalidar_resumen():
+    with _lock:
+        _cache['datos'] = None
+
+# ==============================
+# Invalidación al escribir proyectos
+# ==============================
+@event.listens_for(SessionLocal, "after_flush")
+def _marcar_cambios(session, flush_context):
+    # En after_flush las colecciones new/dirty/deleted aún muestran lo que se escribió
+    if any(isinstance(obj, Proyecto) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info['resumen_pendiente'] = True
+
+@event.listens_for(SessionLocal, "after_commit")
+def _invalidar_al_confirmar(session):
+    if session.info.pop('resumen_pendiente', False):
+        invalidar_resumen()
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _descartar_pendiente(session):
+    session.info.pop('resumen_pendiente', None)
@@ -0,0 +1,191 @@
+import argparse
+import logging
+import os
+import threading
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from database import engine, asegurar_esquema
+from models import SnapshotPipeline
+from portafolio import factor_conversion
+from tipo_cambio import tipos_cambio_a_fecha
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Configuración
+# ==============================
+# Cada cuánto revisa el hilo si ya existe la foto del día (segundos)
+INTERVALO_SNAPSHOT = int(os.environ.get("SNAPSHOT_INTERVALO", "3600"))
+
+DIMENSIONES = {
+    'estado': "Estado",
+    'asignado_a_id': "Ejecutivo",
+    'moneda': "Moneda",
+}
+
+MEDIDAS = {
+    'cantidad': "Cantidad de proyectos",
+    'valor': "Valor total",
+    'valor_ponderado': "Valor ponderado",
+}
+
+_esquema_listo = False
+
+def _migrar_indice_grupo():
+    """Reemplaza el índice único anterior, donde los grupos sin ejecutivo (NULL) no chocaban,
+    y borra los duplicados que dejó pasar"""
+    with engine.begin() as conn:
+        ddl = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND name = 'ux_snapshots_pipeline_grupo'"
+        )).scalar()
+        if ddl and 'IFNULL' in ddl.upper():
+            return
+        conn.execute(text("DROP INDEX IF EXISTS ux_snapshots_pipeline_grupo"))
+        conn.execute(text("""
+            DELETE FROM snapshots_pipeline WHERE id NOT IN (
+                SELECT MIN(id) FROM snapshots_pipeline
+                GROUP BY fecha, estado, IFNULL(asignado_a_id, 0), moneda
+            )
+        """))
+    asegurar_esquema(*SnapshotPipeline.__table__.indexes)
+
+def _asegurar_tabla():
+    global _esquema_listo
+    if not _esquema_listo:
+        asegurar_esquema(SnapshotPipeline.__table__)
+        _migrar_indice_grupo()
+        _esquema_listo = True
+
+# ==============================
+# Escritura de la foto diaria
+# ==============================
+def tomar_snapshot(fecha=None, reemplazar=False):
+    """Guarda la foto del pipeline activo para `fecha` (hoy por defecto).
+
+    Es idempotente: si ya hay filas para ese día no escribe nada, salvo con
+    reemplazar=True. Devuelve la cantidad de filas insertadas.
+    """
+    _asegurar_tabla()
+    fecha = (fecha or date.today()).isoformat()
+    with engine.begin() as conn:
+        if reemplazar:
+            conn.execute(text("DELETE FROM snapshots_pipeline WHERE fecha = :fecha"), {"fecha": fecha})
+        elif conn.execute(text("SELECT 1 FROM snapshots_pipeline WHERE fecha = :fecha LIMIT 1"), {"fecha": fecha}).first():
+            return 0
+
+        # OR IGNORE: si otro proceso tomó la misma foto en paralelo, el índice único la descarta
+        # (incluidos los grupos sin ejecutivo, el índice compara IFNULL(asignado_a_id, 0))
+        resultado = conn.execute(text("""
+            INSERT OR IGNORE INTO snapshots_pipeline
+                (fecha, estado, asignado_a_id, moneda, cantidad, valor, valor_ponderado, fecha_registro)
+            SELECT :fecha, COALESCE(estado_actual, 'OPORTUNIDAD'), asignado_a_id, COALESCE(moneda, 'PEN'),
+                   COUNT(*),
+                   COALESCE(SUM(valor_estimado), 0),
+                   COALESCE(SUM(valor_estimado * COALESCE(probabilidad_cierre, 0) / 100.0), 0),
+                   CURRENT_TIMESTAMP
+            FROM proyectos
+            WHERE activo = 1
+            GROUP BY COALESCE(estado_actual, 'OPORTUNIDAD'), asignado_a_id, COALESCE(moneda, 'PEN')
+        """), {"fecha": fecha})
+    return resultado.rowcount
+
+def fechas_con_snapshot():
+    """Fechas que ya tienen foto, ordenadas"""
+    _asegurar_tabla()
+    with engine.connect() as conn:
+        filas = conn.execute(text("SELECT DISTINCT fecha FROM snapshots_pipeline ORDER BY fecha")).fetchall()
+    return [date.fromisoformat(str(fila[0])) for fila in filas]
+
+_hilo = None
+_hilo_lock = threading.Lock()
+
+def _ciclo_snapshots():
+    while True:
+        try:
+            filas = tomar_snapshot()
+            if filas:
+                logger.info(f"Snapshot del pipeline: {filas} filas")
+        except Exception as e:
+            logger.error(f"Error tomando snapshot del pipeline: {e}")
+        time.sleep(INTERVALO_SNAPSHOT)
+
+def iniciar_snapshots():
+    """Inicia (una sola vez por proceso) el hilo que toma la foto diaria"""
+    global _hilo
+    with _hilo_lock:
+        if _hilo is None or not _hilo.is_alive():
+            _hilo = threading.Thread(target=_ciclo_snapshots, name="snapshots-pipeline", daemon=True)
+            _hilo.start()
+
+# ==============================
+# Lectura para reportes de tendencia
+# ==============================
+def cargar_snapshots(desde=None, hasta=None, moneda_destino='PEN'):
+    """Filas de snapshots_pipeline entre dos fechas, con valores llevados a la moneda destino.
+
+    La conversión usa el tipo de cambio vigente en la fecha de cada foto.
+    """
+    _asegurar_tabla()
+    condiciones, parametros = [], {}
+    if desde:
+        condiciones.append("fecha >= :desde")
+        parametros['desde'] = str(desde)
+    if hasta:
+        condiciones.append("fecha <= :hasta")
+        parametros['hasta'] = str(hasta)
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+
+    with engine.connect() as conn:
+        df = pd.read_sql_query(text(f"""
+            SELECT fecha, estado, asignado_a_id, moneda, cantidad, valor, valor_ponderado
+            FROM snapshots_pipeline {where}
+            ORDER BY fecha
+        """), conn, params=parametros)
+
+    df['fecha'] = pd.to_datetime(df['fecha'])
+    if not df.empty:
+        tasas = tipos_cambio_a_fecha(df['fecha'].to_numpy(dtype='datetime64[D]'))
+        factor = factor_conversion(df['moneda'].to_numpy(), moneda_destino, tasas)
+        df['valor'] = df['valor'] * factor
+        df['valor_ponderado'] = df['valor_ponderado'] * factor
+    return df
+
+def serie_tendencia(df, dimension='estado', medida='valor', frecuencia='D'):
+    """Tabla fecha × valores de `dimension` con la suma de `medida`.
+
+    Con frecuencia 'M' cada mes toma su última foto (estado del pipeline al cierre del mes).
+    """
+    if df.empty:
+        return pd.DataFrame()
+    if frecuencia == 'M':
+        cierres = df.groupby(df['fecha'].dt.to_period('M'))['fecha'].transform('max')
+        df = df[df['fecha'] == cierres].assign(fecha=lambda d: d['fecha'].dt.to_period('M').dt.to_timestamp())
+    serie = df.pivot_table(index='fecha', columns=dimension, values=medida, aggfunc='sum', fill_value=0)
+    serie.columns.name = None
+    return serie
+
+def variacion_mensual(df, dimension='estado', medida='valor'):
+    """Valor al cierre de cada mes por `dimension` y variación % frente al mes anterior"""
+    serie = serie_tendencia(df, dimension, medida, frecuencia='M')
+    if serie.empty:
+        return serie
+    serie['Total'] = serie.sum(axis=1)
+    variacion = serie.pct_change().replace([np.inf, -np.inf], np.nan) * 100
+    resultado = pd.concat({'valor': serie, 'variacion_pct': variacion}, axis=1)
+    resultado.index = resultado.index.strftime('%Y-%m')
+    return resultado
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Foto diaria del pipeline")
+    parser.add_argument("--reemplazar", action="store_true", help="Volver a tomar la foto de hoy")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    filas = tomar_snapshot(reemplazar=args.reemplazar)
+    print(f"{filas} filas guardadas" if filas else "La foto de hoy ya existía")
+    print(f"{len(fechas_con_snapshot())} días con foto")
@@ -0,0 +1,35 @@
+import os
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+# ==============================
+# Componente del tablero Kanban
+# ==============================
+# Frontend estático (HTML + JS sin compilación) servido por Streamlit
+DIRECTORIO_COMPONENTE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "componentes", "tablero_kanban")
+
+_componente = components.declare_component("tablero_kanban", path=DIRECTORIO_COMPONENTE)
+
+def tablero_kanban(columnas, key="tablero_kanban"):
+    """Dibuja el tablero en un solo componente.
+
+    `columnas` es una lista de dicts con estado, titulo, icono, color, cantidad,
+    anterior/siguiente (estados vecinos del flujo), mas/menos (paginación) y
+    tarjetas (vistas compactas con id).
+    """
+    _componente(columnas=columnas, key=key, default=None)
+
+def evento_tablero(key="tablero_kanban"):
+    """Evento nuevo del tablero (o None), disponible antes de volver a dibujarlo.
+
+    Los eventos son dicts con `tipo` ('editar', 'mover', 'mas' o 'menos') y los
+    datos de la acción. El componente conserva su último valor entre recargas,
+    por eso cada evento se entrega una sola vez.
+    """
+    evento = st.session_state.get(key)
+    clave_nonce = f"{key}_ultimo_nonce"
+    if not evento or evento.get('nonce') == st.session_state.get(clave_nonce):
+        return None
+    st.session_state[clave_nonce] = evento['nonce']
+    return evento
@@ -0,0 +1,18 @@
+import atexit
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+# ==============================
+# Base de datos de pruebas
+# ==============================
+# Las pruebas trabajan sobre una copia de proyectos.db; RAZUMFLOW_DB_URL se fija antes de
+# que cualquier módulo de la app importe database.py
+RAIZ = Path(__file__).resolve().parent.parent
+_directorio = tempfile.mkdtemp(prefix="razumflow-pruebas-")
+atexit.register(shutil.rmtree, _directorio, ignore_errors=True)
+
+_copia = Path(_directorio) / "proyectos.db"
+shutil.copyfile(RAIZ / "proyectos.db", _copia)
+os.environ["RAZUMFLOW_DB_URL"] = f"sqlite:///{_copia}"
@@ -0,0 +1,39 @@
+import pytest
+
+from conciliacion_bancaria import IndiceFacturas, montos_aceptados
+
+def _factura(pid, valor, moneda='PEN'):
+    proyecto = {'id': pid, 'numero_factura': None, 'ruc': None, 'moneda': moneda, 'valor_estimado': valor,
+                'monto_detraccion': None, 'monto_retencion': None, 'monto_penalidad': None}
+    proyecto['montos'] = montos_aceptados(proyecto)
+    return proyecto
+
+@pytest.fixture
+def indice():
+    # La factura grande fija el ancho de los buckets (0.1 % de 2 000 000 = 2000)
+    return IndiceFacturas([_factura(1, 1000.00), _factura(2, 1001.50), _factura(3, 2_000_000.00),
+                           _factura(4, 5000.00, 'USD')])
+
+@pytest.mark.parametrize("monto, esperados", [
+    (1000.00, {1}),
+    (999.00, {1}),              # borde inferior de la tolerancia absoluta
+    (1000.99, {1, 2}),
+    (1002.50, {2}),
+    (998.99, set()),
+    (2_001_999.00, {3}),        # tolerancia relativa, en el bucket vecino
+    (1_997_999.00, set()),
+])
+def test_por_importe_dentro_de_tolerancia(indice, monto, esperados):
+    assert indice.por_importe(monto, 'PEN') == esperados
+
+def test_por_importe_filtra_moneda(indice):
+    assert indice.por_importe(5000.00, 'PEN') == set()
+    assert indice.por_importe(5000.00, 'USD') == {4}
+    assert indice.por_importe(5000.00) == {4}
+
+def test_buckets_en_bordes_de_ancho():
+    # Sin montos grandes el ancho es la tolerancia absoluta; el abono cae en el bucket vecino
+    indice = IndiceFacturas([_factura(1, 10.99), _factura(2, 12.00)])
+    assert indice.ancho == 1.0
+    assert indice.por_importe(11.50) == {1, 2}      # buckets 10 y 12 alrededor del 11
+    assert indice.por_importe(10.00) == {1}
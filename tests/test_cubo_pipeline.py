@@ -0,0 +1,144 @@
+from datetime import datetime
+
+import pytest
+
+from configuracion import configuracion
+import cubo_pipeline
+from cubo_pipeline import Histograma, kpis_cubo, reconstruir_cubo
+from database import SessionLocal
+from filtros_proyectos import FiltroProyectos
+from models import Proyecto
+from portafolio import construir_portafolio, resumen_kpis
+
+# Momentos alrededor de los cortes de días de la base de ejemplo
+MOMENTOS = [
+    datetime(2025, 9, 10, 9, 0),
+    datetime(2025, 9, 12, 10, 0),
+    datetime(2025, 9, 20, 0, 0),
+    datetime(2025, 10, 1, 23, 59),
+]
+
+@pytest.fixture(scope="module")
+def proyectos():
+    reconstruir_cubo()
+    db = SessionLocal()
+    try:
+        yield db.query(Proyecto).filter(Proyecto.activo == True).all()
+    finally:
+        db.close()
+
+@pytest.mark.parametrize("ahora", MOMENTOS)
+@pytest.mark.parametrize("dias_riesgo", [0, 3, 7, 15])
+def test_kpis_cubo_coincide_con_resumen_kpis(proyectos, ahora, dias_riesgo):
+    esperado = resumen_kpis(construir_portafolio(proyectos, ahora), 'PEN', dias_riesgo=dias_riesgo)
+    obtenido = kpis_cubo('PEN', dias_riesgo=dias_riesgo, ahora=ahora)
+
+    assert obtenido['cantidad'] == esperado['cantidad']
+    assert obtenido['en_riesgo'] == esperado['en_riesgo']
+    assert obtenido['deadlines_vencidos'] == esperado['deadlines_vencidos']
+    assert obtenido['total'] == pytest.approx(esperado['total'])
+    assert obtenido['ponderado'] == pytest.approx(esperado['ponderado'])
+
+@pytest.mark.parametrize("ahora", MOMENTOS)
+def test_en_riesgo_coincide_con_filtro(proyectos, ahora):
+    dias_riesgo = configuracion().DIAS_ALERTA_RIESGO
+    db = SessionLocal()
+    try:
+        filtrados = sum(FiltroProyectos(riesgo=riesgo, ahora=ahora).consulta(db).filter(Proyecto.activo == True).count()
+                        for riesgo in ('En Riesgo', 'Crítico'))
+    finally:
+        db.close()
+
+    assert kpis_cubo('PEN', dias_riesgo=dias_riesgo, ahora=ahora)['en_riesgo'] == filtrados
+
+@pytest.mark.parametrize("ahora", MOMENTOS)
+def test_riesgo_por_defecto_usa_configuracion(proyectos, ahora):
+    dias_riesgo = configuracion().DIAS_ALERTA_RIESGO
+    portafolio = construir_portafolio(proyectos, ahora)
+
+    assert resumen_kpis(portafolio, 'PEN') == resumen_kpis(portafolio, 'PEN', dias_riesgo=dias_riesgo)
+    assert kpis_cubo('PEN', ahora=ahora) == kpis_cubo('PEN', dias_riesgo=dias_riesgo, ahora=ahora)
+
+# ==============================
+# Histogramas y mantenimiento incremental
+# ==============================
+def test_histograma_corrige_solo_el_dia_del_corte():
+    histograma = Histograma()
+    for momento in (datetime(2025, 9, 1, 8), datetime(2025, 9, 1, 8), datetime(2025, 9, 3, 9),
+                    datetime(2025, 9, 3, 17), datetime(2025, 9, 5)):
+        histograma.sumar(momento, 1)
+    histograma.sumar(datetime(2025, 9, 1, 8), -1)
+
+    assert histograma.contar_antes(datetime(2025, 9, 1, 8)) == 0
+    assert histograma.contar_antes(datetime(2025, 9, 1, 8), incluir_limite=True) == 1
+    assert histograma.contar_antes(datetime(2025, 9, 3, 12)) == 2
+    assert histograma.contar_antes(datetime(2025, 9, 4)) == 3
+    assert histograma.contar_antes(datetime(2026, 1, 1)) == 4
+
+def _comparar_con_portafolio(ahora):
+    db = SessionLocal()
+    try:
+        proyectos = db.query(Proyecto).filter(Proyecto.activo == True).all()
+    finally:
+        db.close()
+    esperado = resumen_kpis(construir_portafolio(proyectos, ahora), 'PEN', dias_riesgo=7)
+    obtenido = kpis_cubo('PEN', dias_riesgo=7, ahora=ahora)
+    assert {k: obtenido[k] for k in ('cantidad', 'en_riesgo', 'deadlines_vencidos')} == \
+        {k: esperado[k] for k in ('cantidad', 'en_riesgo', 'deadlines_vencidos')}
+    assert obtenido['total'] == pytest.approx(esperado['total'])
+
+@pytest.fixture
+def proyecto_editable():
+    db = SessionLocal()
+    proyecto = db.query(Proyecto).filter(Proyecto.activo == True).order_by(Proyecto.id).first()
+    originales = {atributo: getattr(proyecto, atributo)
+                  for atributo in ('valor_estimado', 'fecha_ultima_actualizacion', 'fecha_deadline_propuesta', 'activo')}
+    proyecto_id = proyecto.id
+    db.close()
+    yield proyecto_id
+
+    db = SessionLocal()
+    db.query(Proyecto).filter(Proyecto.id == proyecto_id).update(originales)
+    db.commit()
+    db.close()
+    reconstruir_cubo()
+
+def _editar(proyecto_id, **valores):
+    db = SessionLocal()
+    try:
+        proyecto = db.get(Proyecto, proyecto_id)
+        for atributo, valor in valores.items():
+            setattr(proyecto, atributo, valor)
+        db.commit()
+    finally:
+        db.close()
+
+def test_cambios_confirmados_se_reflejan_sin_reconstruir(proyecto_editable):
+    ahora = datetime(2025, 9, 12, 10, 0)
+    reconstruir_cubo()
+    _editar(proyecto_editable, valor_estimado=123456.0, fecha_deadline_propuesta=datetime(2025, 9, 12, 9, 0))
+    _comparar_con_portafolio(ahora)
+
+    _editar(proyecto_editable, activo=False)
+    _comparar_con_portafolio(ahora)
+
+def test_cambio_durante_la_reconstruccion_no_se_pierde(proyecto_editable, monkeypatch):
+    ahora = datetime(2025, 9, 12, 10, 0)
+    reconstruir_cubo()
+
+    # _aporte corre después de la lectura y antes del reemplazo: la edición cae en esa ventana
+    aporte_real = cubo_pipeline._aporte
+    editado = []
+
+    def aporte_con_escritura_concurrente(valores):
+        if not editado:
+            editado.append(True)
+            _editar(proyecto_editable, valor_estimado=654321.0,
+                    fecha_ultima_actualizacion=datetime(2025, 9, 11, 10, 0))
+        return aporte_real(valores)
+
+    monkeypatch.setattr(cubo_pipeline, "_aporte", aporte_con_escritura_concurrente)
+    reconstruir_cubo()
+    monkeypatch.undo()
+    assert editado
+    _comparar_con_portafolio(ahora)
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+import exportacion
+from exportacion import _prefijo, exportar_zip
+
+# Cliente de la base de ejemplo con documentos
+CLIENTE_ID = 2
+
+@pytest.fixture
+def directorio(tmp_path, monkeypatch):
+    monkeypatch.setattr(exportacion, "DIRECTORIO_EXPORTACIONES", str(tmp_path))
+    return tmp_path
+
+def test_prefijo_usa_el_identificador_y_no_colisiona():
+    assert _prefijo('cliente', 2) == "cliente_2"
+    assert _prefijo('convocatoria', "CONV-2024.001") == "convocatoria_CONV-2024.001"
+    # Códigos que se sanitizan igual no comparten prefijo
+    assert _prefijo('convocatoria', "A/B") != _prefijo('convocatoria', "AB")
+    assert _prefijo('convocatoria', "A/B") != _prefijo('convocatoria', "A B")
+
+def test_limpieza_borra_solo_versiones_del_mismo_alcance(directorio):
+    ajenos = [
+        f"cliente_{CLIENTE_ID}_SAC_0123456789abcdef.zip",   # otro prefijo que empieza igual
+        f"cliente_{CLIENTE_ID}2_0123456789abcdef.zip",      # otro id con los mismos dígitos iniciales
+        f"cliente_{CLIENTE_ID}_notas.zip",                  # no es una huella
+    ]
+    anterior = f"cliente_{CLIENTE_ID}_0123456789abcdef.zip"
+    for nombre in ajenos + [anterior]:
+        (directorio / nombre).write_bytes(b"zip")
+
+    resultado = exportar_zip('cliente', CLIENTE_ID)
+    assert resultado['nombre'].startswith(f"cliente_{CLIENTE_ID}_")
+    assert sorted(os.listdir(directorio)) == sorted(ajenos + [resultado['nombre']])
+
+    # Sin cambios en los archivos se reutiliza el mismo ZIP
+    assert exportar_zip('cliente', CLIENTE_ID)['reutilizado']
+
+def test_trabajos_terminados_se_podan(monkeypatch):
+    monkeypatch.setattr(exportacion, "_trabajos", {
+        'cliente:1': {'estado': 'listo', 'fin': exportacion.time.monotonic() - exportacion.TTL_TRABAJOS - 1},
+        'cliente:2': {'estado': 'listo', 'fin': exportacion.time.monotonic()},
+        'cliente:3': {'estado': 'en_proceso'},
+    })
+    assert exportacion.estado_exportacion('cliente:1') is None
+    assert exportacion.estado_exportacion('cliente:2')['estado'] == 'listo'
+    assert exportacion.estado_exportacion('cliente:3')['estado'] == 'en_proceso'
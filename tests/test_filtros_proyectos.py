@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from alertas import alertas_por_id, nivel_alerta
+from configuracion import configuracion, guardar
+from database import SessionLocal
+from filtros_proyectos import SIN_PLAZO, SUBESTADOS, FiltroProyectos, condicion_niveles_deadline
+from models import Estado, Proyecto
+from portafolio import construir_portafolio
+
+AHORA = datetime(2025, 9, 12, 10, 0)
+
+@pytest.fixture
+def db():
+    sesion = SessionLocal()
+    yield sesion
+    sesion.close()
+
+def _proyectos(db, estado):
+    return FiltroProyectos(estado=estado, ahora=AHORA).consulta(db).all()
+
+@pytest.mark.parametrize("niveles", [
+    ['vencido', 'critico', 'muy_urgente'],
+    ['urgente', 'por_vencer'],
+    ['disponible', SIN_PLAZO],
+])
+def test_conteos_por_nivel_de_deadline(db, niveles):
+    proyectos = _proyectos(db, Estado.OPORTUNIDAD.value)
+    alertas = alertas_por_id(construir_portafolio(proyectos, AHORA), AHORA)
+    esperado = sum(alertas[p.id]['nivel_deadline'] in niveles for p in proyectos)
+
+    conteos = FiltroProyectos(estado=Estado.OPORTUNIDAD.value, ahora=AHORA).conteos(
+        db, nivel=condicion_niveles_deadline(niveles, AHORA))
+    assert conteos == {'total': len(proyectos), 'nivel': esperado}
+
+def test_conteos_por_subestado(db):
+    proyectos = _proyectos(db, Estado.PREVENTA.value)
+    presentada = configuracion().PROBABILIDAD_PREVENTA
+
+    conteos = FiltroProyectos(estado=Estado.PREVENTA.value, ahora=AHORA).conteos(
+        db, **{subestado: SUBESTADOS[subestado][1]()
+               for subestado in ('preventa_activa', 'propuesta_entregada', 'oc_firmada')})
+    assert conteos == {
+        'total': len(proyectos),
+        'preventa_activa': sum(p.probabilidad_cierre < presentada for p in proyectos),
+        'propuesta_entregada': sum(presentada <= p.probabilidad_cierre <= 74 for p in proyectos),
+        'oc_firmada': sum(p.probabilidad_cierre >= 75 for p in proyectos),
+    }
+
+def test_conteos_sin_filas(db):
+    conteos = FiltroProyectos(estado='INEXISTENTE').conteos(db, caso=Proyecto.entregado == True)
+    assert conteos == {'total': 0, 'caso': 0}
+
+@pytest.fixture
+def dias_urgente():
+    """Cambia ALERTA_DIAS_URGENTE durante la prueba y restaura el valor anterior"""
+    anterior = configuracion().ALERTA_DIAS_URGENTE
+    yield lambda dias: guardar('ALERTA_DIAS_URGENTE', dias)
+    guardar('ALERTA_DIAS_URGENTE', anterior)
+
+def test_umbrales_desde_configuracion(db, dias_urgente):
+    ahora = datetime(2025, 9, 4, 8, 0)     # dos deadlines de oportunidad a 4 días
+    fecha = ahora + timedelta(days=4, hours=1)
+    filtro = FiltroProyectos(estado=Estado.OPORTUNIDAD.value, deadline='urgente', ahora=ahora)
+    assert nivel_alerta(fecha, ahora) == ('por_vencer', 4)
+    assert filtro.consulta(db).count() == 0
+
+    dias_urgente(5)
+    assert nivel_alerta(fecha, ahora) == ('urgente', 4)
+
+    proyectos = FiltroProyectos(estado=Estado.OPORTUNIDAD.value, ahora=ahora).consulta(db).all()
+    alertas = alertas_por_id(construir_portafolio(proyectos, ahora), ahora)
+    esperado = sum(alertas[p.id]['nivel_deadline'] in ('muy_urgente', 'urgente') for p in proyectos)
+    assert esperado > 0
+    assert filtro.consulta(db).count() == esperado
@@ -0,0 +1,71 @@
+import socket
+from datetime import datetime
+from email import message_from_bytes
+
+import pytest
+from sqlalchemy import text
+
+import notificador
+from database import engine
+from notificador import SumideroSMTP, notificar
+
+# Con esta fecha todos los deadlines y entregas de la base de ejemplo están vencidos
+AHORA = datetime(2030, 1, 1, 9, 0)
+
+@pytest.fixture(autouse=True)
+def sin_registros(monkeypatch):
+    monkeypatch.setattr(notificador, "ESPERA_REINTENTO", 0)
+    notificador._asegurar_tabla()
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM notificaciones_enviadas"))
+
+@pytest.fixture
+def sumidero():
+    servidor = SumideroSMTP(puerto=0).iniciar()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+def _puerto_cerrado():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _registradas():
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM notificaciones_enviadas")).scalar()
+
+def test_un_digest_por_usuario_y_sin_repetir(sumidero):
+    puerto = sumidero.server_address[1]
+    primero = notificar(AHORA, "127.0.0.1", puerto)
+    assert primero['alertas'] > 0
+    assert primero['enviados'] == primero['usuarios'] > 0
+    assert primero['fallidos'] == 0
+    assert len(sumidero.mensajes) == primero['enviados']
+    alertas = notificador.evaluar_alertas(AHORA)
+    assert _registradas() == int(alertas['email'].fillna('').astype(bool).sum())
+
+    destinatarios = [message_from_bytes(m['datos'])['To'] for m in sumidero.mensajes]
+    assert len(set(destinatarios)) == len(destinatarios)
+
+    # Las mismas alertas ya quedaron registradas: la segunda revisión no envía nada
+    segundo = notificar(AHORA, "127.0.0.1", puerto)
+    assert (segundo['usuarios'], segundo['enviados'], segundo['fallidos']) == (0, 0, 0)
+    assert len(sumidero.mensajes) == primero['enviados']
+
+def test_envio_fallido_libera_las_reservas(sumidero):
+    fallido = notificar(AHORA, "127.0.0.1", _puerto_cerrado())
+    assert fallido['fallidos'] == fallido['usuarios'] > 0
+    assert fallido['enviados'] == 0
+    assert _registradas() == 0
+
+    # La próxima revisión reintenta las mismas alertas
+    reintento = notificar(AHORA, "127.0.0.1", sumidero.server_address[1])
+    assert reintento['enviados'] == fallido['fallidos']
+    assert len(sumidero.mensajes) == reintento['enviados']
+
+def test_simular_no_registra_ni_envia(sumidero, capsys):
+    resumen = notificar(AHORA, "127.0.0.1", sumidero.server_address[1], simular=True)
+    assert resumen['alertas'] > 0 and resumen['enviados'] == 0
+    assert sumidero.mensajes == [] and _registradas() == 0
+    assert "Asunto:" in capsys.readouterr().out
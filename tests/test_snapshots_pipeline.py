@@ -0,0 +1,51 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+import snapshots_pipeline
+from database import engine
+
+FECHA = date(1990, 1, 1)
+
+INSERTAR_GRUPO = text("""
+    INSERT OR IGNORE INTO snapshots_pipeline
+        (fecha, estado, asignado_a_id, moneda, cantidad, valor, valor_ponderado)
+    VALUES (:fecha, 'OPORTUNIDAD', NULL, 'PEN', 1, 100, 25)
+""")
+
+def _filas(fecha=FECHA):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM snapshots_pipeline WHERE fecha = :fecha"),
+                            {"fecha": fecha.isoformat()}).scalar()
+
+@pytest.fixture(autouse=True)
+def sin_foto():
+    snapshots_pipeline._asegurar_tabla()
+    yield
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM snapshots_pipeline WHERE fecha = :fecha"), {"fecha": FECHA.isoformat()})
+
+def test_grupo_sin_ejecutivo_no_se_duplica():
+    with engine.begin() as conn:
+        insertadas = [conn.execute(INSERTAR_GRUPO, {"fecha": FECHA.isoformat()}).rowcount for _ in range(2)]
+    assert insertadas == [1, 0]
+
+def test_migra_indice_anterior(monkeypatch):
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ux_snapshots_pipeline_grupo"))
+        conn.execute(text("""
+            CREATE UNIQUE INDEX ux_snapshots_pipeline_grupo
+            ON snapshots_pipeline (fecha, estado, asignado_a_id, moneda)
+        """))
+        for _ in range(2):
+            conn.execute(INSERTAR_GRUPO, {"fecha": FECHA.isoformat()})
+    assert _filas() == 2
+
+    monkeypatch.setattr(snapshots_pipeline, "_esquema_listo", False)
+    snapshots_pipeline._asegurar_tabla()
+    assert _filas() == 1
+    with engine.connect() as conn:
+        ddl = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE name = 'ux_snapshots_pipeline_grupo'")).scalar()
+    assert 'IFNULL' in ddl
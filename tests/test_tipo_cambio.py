@@ -0,0 +1,126 @@
+import threading
+from datetime import date
+
+import numpy as np
+import pytest
+
+import tipo_cambio
+from tipo_cambio import CircuitBreaker, crear_servidor_stub, guardar_tipo_cambio, tipos_cambio_a_fecha
+
+class Reloj:
+    """Sustituye time.monotonic para avanzar el tiempo a mano"""
+
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(tipo_cambio.time, "monotonic", reloj)
+    return reloj
+
+@pytest.fixture
+def stub():
+    servidor = crear_servidor_stub(puerto=0, venta=3.71, compra=3.69)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    servidor.url = f"http://127.0.0.1:{servidor.server_address[1]}/"
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+@pytest.fixture
+def circuito(monkeypatch):
+    circuito = CircuitBreaker(umbral_fallos=2, tiempo_abierto=60)
+    monkeypatch.setattr(tipo_cambio, "circuito", circuito)
+    return circuito
+
+# ==============================
+# Circuit breaker
+# ==============================
+def test_circuito_se_abre_tras_umbral_y_pasa_a_semiabierto(reloj):
+    circuito = CircuitBreaker(umbral_fallos=3, tiempo_abierto=60)
+    circuito.registrar_fallo()
+    circuito.registrar_fallo()
+    assert circuito.estado == "cerrado"
+
+    circuito.registrar_fallo()
+    assert circuito.estado == "abierto"
+    assert not circuito.permite_llamada()
+
+    reloj.ahora += 59
+    assert circuito.estado == "abierto"
+    reloj.ahora += 1
+    assert circuito.estado == "semiabierto"
+    assert circuito.permite_llamada()
+
+def test_circuito_semiabierto_vuelve_a_abrirse_o_se_cierra(reloj):
+    circuito = CircuitBreaker(umbral_fallos=1, tiempo_abierto=60)
+    circuito.registrar_fallo()
+    reloj.ahora += 60
+    assert circuito.estado == "semiabierto"
+
+    # El intento de prueba falla: otro periodo completo abierto
+    circuito.registrar_fallo()
+    assert circuito.estado == "abierto"
+
+    reloj.ahora += 60
+    circuito.registrar_exito()
+    assert circuito.estado == "cerrado"
+    assert circuito.fallos == 0
+
+# ==============================
+# Actualización contra el servidor stub
+# ==============================
+def test_actualizar_guarda_el_valor_del_stub(stub, circuito):
+    assert tipo_cambio.actualizar_tipo_cambio(stub.url)
+    assert tipo_cambio.obtener_tipo_cambio() == pytest.approx(3.71)
+    estado = tipo_cambio.estado_tipo_cambio()
+    assert (estado['fecha'], estado['compra'], estado['origen']) == (date.today(), pytest.approx(3.69), 'STUB')
+    assert circuito.estado == "cerrado"
+
+def test_stub_caido_abre_el_circuito_y_no_se_consulta(stub, circuito, reloj, monkeypatch):
+    stub.fallar = True
+    assert not tipo_cambio.actualizar_tipo_cambio(stub.url)
+    assert not tipo_cambio.actualizar_tipo_cambio(stub.url)
+    assert circuito.estado == "abierto"
+
+    # Con el circuito abierto no se llama a la API aunque el servicio ya responda
+    llamadas = []
+    consultar_api = tipo_cambio.consultar_api
+    monkeypatch.setattr(tipo_cambio, "consultar_api", lambda url=None: llamadas.append(url) or consultar_api(url))
+    stub.fallar = False
+    assert not tipo_cambio.actualizar_tipo_cambio(stub.url)
+    assert llamadas == []
+
+    # Pasado el tiempo abierto, el intento de prueba se hace y cierra el circuito
+    reloj.ahora += 60
+    assert tipo_cambio.actualizar_tipo_cambio(stub.url)
+    assert llamadas == [stub.url]
+    assert circuito.estado == "cerrado"
+
+# ==============================
+# Tipo de cambio a una fecha
+# ==============================
+def test_tipos_cambio_a_fecha_toma_el_ultimo_en_o_antes(monkeypatch):
+    # Fechas anteriores a la base de ejemplo para no mezclarse con su historial
+    guardar_tipo_cambio(date(1990, 1, 1), 3.10)
+    guardar_tipo_cambio(date(1990, 1, 10), 3.20)
+    guardar_tipo_cambio(date(1990, 1, 20), 3.30)
+
+    fechas = np.array(['1989-12-31', '1990-01-01', '1990-01-09', '1990-01-10', '1990-01-15', '1990-01-20', 'NaT'],
+                      dtype='datetime64[D]')
+    resultado = tipos_cambio_a_fecha(fechas, respaldo=9.99)
+    np.testing.assert_allclose(resultado, [9.99, 3.10, 3.10, 3.20, 3.20, 3.30, 9.99])
+
+    # El respaldo puede ser un array del mismo largo
+    respaldo = np.arange(len(fechas), dtype=float)
+    resultado = tipos_cambio_a_fecha(fechas, respaldo=respaldo)
+    assert resultado[0] == 0.0 and resultado[-1] == 6.0
+
+    # Sin respaldo se usa TIPO_CAMBIO_DEFAULT de la configuración
+    monkeypatch.setattr(tipo_cambio, "obtener_tipo_cambio_configurado", lambda: 3.85)
+    assert tipos_cambio_a_fecha(fechas[:1])[0] == pytest.approx(3.85)
@@ -0,0 +1,332 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+from sqlalchemy import text
+
+from configuracion import configuracion
+from database import SessionLocal, engine, asegurar_esquema
+from models import TipoCambio
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Configuración
+# ==============================
+TIPO_CAMBIO_URL = os.environ.get("TIPO_CAMBIO_URL", "https://api.apis.net.pe/v1/tipo-cambio-sunat")
+INTERVALO_ACTUALIZACION = int(os.environ.get("TIPO_CAMBIO_INTERVALO", "3600"))  # segundos
+TIMEOUT_CONSULTA = 5
+TTL_MEMORIA = 60  # segundos antes de releer la tabla (otros procesos pueden actualizarla)
+
+# ==============================
+# Circuit breaker
+# ==============================
+class CircuitBreaker:
+    """Deja de llamar a un servicio caído durante `tiempo_abierto` segundos tras varios fallos"""
+
+    def __init__(self, umbral_fallos=3, tiempo_abierto=300):
+        self.umbral_fallos = umbral_fallos
+        self.tiempo_abierto = tiempo_abierto
+        self.fallos = 0
+        self.abierto_desde = None
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self):
+        with self._lock:
+            if self.abierto_desde is None:
+                return "cerrado"
+            if time.monotonic() - self.abierto_desde >= self.tiempo_abierto:
+                return "semiabierto"
+            return "abierto"
+
+    def permite_llamada(self):
+        # En semiabierto se deja pasar un intento de prueba
+        return self.estado != "abierto"
+
+    def registrar_exito(self):
+        with self._lock:
+            self.fallos = 0
+            self.abierto_desde = None
+
+    def registrar_fallo(self):
+        with self._lock:
+            self.fallos += 1
+            if self.fallos >= self.umbral_fallos:
+                self.abierto_desde = time.monotonic()
+
+circuito = CircuitBreaker()
+
+# ==============================
+# Persistencia
+# ==============================
+_esquema_listo = False
+_memoria = {'registro': None, 'leido': 0.0, 'historial': None, 'historial_leido': 0.0}
+_memoria_lock = threading.Lock()
+
+def _asegurar_tabla():
+    global _esquema_listo
+    if not _esquema_listo:
+        asegurar_esquema(TipoCambio.__table__)
+        _esquema_listo = True
+
+def obtener_tipo_cambio_configurado():
+    """TIPO_CAMBIO_DEFAULT del servicio de configuración"""
+    return configuracion().TIPO_CAMBIO_DEFAULT
+
+def guardar_tipo_cambio(fecha, venta, compra=None, origen="SUNAT"):
+    """Inserta o actualiza el tipo de cambio de un día"""
+    _asegurar_tabla()
+    db = SessionLocal()
+    try:
+        registro = db.query(TipoCambio).filter(TipoCambio.fecha == fecha).first()
+        if registro is None:
+            registro = TipoCambio(fecha=fecha)
+            db.add(registro)
+        registro.venta = venta
+        registro.compra = compra
+        registro.origen = origen
+        registro.fecha_registro = datetime.now()
+        db.commit()
+    finally:
+        db.close()
+
+    with _memoria_lock:
+        _memoria['leido'] = 0.0  # Forzar relectura
+        _memoria['historial_leido'] = 0.0
+
+def _ultimo_registro():
+    """Último tipo de cambio guardado, con caché en memoria de TTL_MEMORIA segundos"""
+    with _memoria_lock:
+        if time.monotonic() - _memoria['leido'] < TTL_MEMORIA:
+            return _memoria['registro']
+
+    _asegurar_tabla()
+    db = SessionLocal()
+    try:
+        registro = db.query(TipoCambio).order_by(TipoCambio.fecha.desc()).first()
+        datos = None
+        if registro:
+            datos = {
+                'fecha': registro.fecha,
+                'venta': registro.venta,
+                'compra': registro.compra,
+                'origen': registro.origen,
+            }
+    finally:
+        db.close()
+
+    with _memoria_lock:
+        _memoria['registro'] = datos
+        _memoria['leido'] = time.monotonic()
+    return datos
+
+# ==============================
+# Lectura (nunca bloquea por red)
+# ==============================
+def obtener_tipo_cambio():
+    """Tipo de cambio de venta vigente (USD -> PEN) sin consultar la API"""
+    registro = _ultimo_registro()
+    if registro:
+        return registro['venta']
+    return obtener_tipo_cambio_configurado()
+
+def estado_tipo_cambio():
+    """Detalle del valor vigente para mostrar en la interfaz"""
+    registro = _ultimo_registro()
+    if registro:
+        return {**registro, 'desactualizado': registro['fecha'] < date.today(), 'circuito': circuito.estado}
+    return {
+        'fecha': None,
+        'venta': obtener_tipo_cambio_configurado(),
+        'compra': None,
+        'origen': 'CONFIGURACION',
+        'desactualizado': True,
+        'circuito': circuito.estado,
+    }
+
+# ==============================
+# Historial y conversión a una fecha
+# ==============================
+def historial_tipos_cambio():
+    """Arrays ordenados (fechas datetime64[D], venta) de toda la tabla, con caché en memoria"""
+    with _memoria_lock:
+        if _memoria['historial'] is not None and time.monotonic() - _memoria['historial_leido'] < TTL_MEMORIA:
+            return _memoria['historial']
+
+    _asegurar_tabla()
+    with engine.connect() as conn:
+        filas = conn.execute(text("SELECT fecha, venta FROM tipos_cambio ORDER BY fecha")).fetchall()
+    fechas = np.array([fila[0] for fila in filas], dtype='datetime64[D]')
+    ventas = np.array([fila[1] for fila in filas], dtype=float)
+
+    with _memoria_lock:
+        _memoria['historial'] = (fechas, ventas)
+        _memoria['historial_leido'] = time.monotonic()
+    return fechas, ventas
+
+def tipos_cambio_a_fecha(fechas, respaldo=None):
+    """Tipo de cambio vigente en cada fecha: el último registrado en o antes de ella.
+
+    Las fechas vacías o anteriores al historial toman `respaldo` (escalar o array
+    del mismo largo); por defecto TIPO_CAMBIO_DEFAULT de configuraciones.
+    """
+    fechas = np.asarray(fechas, dtype='datetime64[D]')
+    historial_fechas, historial_ventas = historial_tipos_cambio()
+
+    resultado = np.full(fechas.shape, np.nan)
+    if len(historial_fechas):
+        posiciones = np.searchsorted(historial_fechas, fechas, side='right') - 1
+        validas = (posiciones >= 0) & ~np.isnat(fechas)
+        resultado[validas] = historial_ventas[posiciones[validas]]
+
+    faltantes = np.isnan(resultado)
+    if faltantes.any():
+        if respaldo is None:
+            respaldo = obtener_tipo_cambio_configurado()
+        resultado[faltantes] = np.broadcast_to(np.asarray(respaldo, dtype=float), fechas.shape)[faltantes]
+    return resultado
+
+def importar_historial(ruta_csv, origen="IMPORTADO"):
+    """Carga tipos de cambio históricos desde un CSV con columnas fecha,venta[,compra]"""
+    import csv
+
+    with open(ruta_csv, newline="", encoding="utf-8-sig") as f:
+        registros = [{
+            'fecha': date.fromisoformat(fila['fecha']),
+            'venta': float(fila['venta']),
+            'compra': float(fila['compra']) if fila.get('compra') else None,
+            'origen': origen,
+            'fecha_registro': datetime.now(),
+        } for fila in csv.DictReader(f)]
+
+    _asegurar_tabla()
+    with engine.begin() as conn:
+        for i in range(0, len(registros), 1000):
+            conn.execute(text("""
+                INSERT INTO tipos_cambio (fecha, venta, compra, origen, fecha_registro)
+                VALUES (:fecha, :venta, :compra, :origen, :fecha_registro)
+                ON CONFLICT(fecha) DO UPDATE SET
+                    venta = excluded.venta, compra = excluded.compra,
+                    origen = excluded.origen, fecha_registro = excluded.fecha_registro
+            """), registros[i:i + 1000])
+
+    with _memoria_lock:
+        _memoria['leido'] = 0.0
+        _memoria['historial_leido'] = 0.0
+    return len(registros)
+
+# ==============================
+# Actualización desde la API
+# ==============================
+def consultar_api(url=None):
+    """Consulta la API de tipo de cambio y devuelve (fecha, venta, compra, origen)"""
+    respuesta = requests.get(url or TIPO_CAMBIO_URL, timeout=TIMEOUT_CONSULTA)
+    respuesta.raise_for_status()
+    datos = respuesta.json()
+    fecha = date.fromisoformat(datos['fecha']) if datos.get('fecha') else date.today()
+    compra = float(datos['compra']) if datos.get('compra') else None
+    return fecha, float(datos['venta']), compra, datos.get('origen') or "SUNAT"
+
+def actualizar_tipo_cambio(url=None):
+    """Consulta la API respetando el circuit breaker; True si guardó un valor nuevo"""
+    if not circuito.permite_llamada():
+        return False
+    try:
+        fecha, venta, compra, origen = consultar_api(url)
+    except Exception as e:
+        circuito.registrar_fallo()
+        logger.warning(f"No se pudo obtener tipo de cambio ({circuito.estado}): {e}")
+        return False
+
+    circuito.registrar_exito()
+    guardar_tipo_cambio(fecha, venta, compra, origen)
+    return True
+
+_hilo = None
+_hilo_lock = threading.Lock()
+_despertar = threading.Event()
+
+def _ciclo_actualizacion():
+    while True:
+        try:
+            actualizar_tipo_cambio()
+        except Exception as e:
+            logger.error(f"Error actualizando tipo de cambio: {e}")
+        _despertar.wait(INTERVALO_ACTUALIZACION)
+        _despertar.clear()
+
+def iniciar_actualizacion():
+    """Inicia (una sola vez por proceso) el hilo que refresca el tipo de cambio"""
+    global _hilo
+    with _hilo_lock:
+        if _hilo is None or not _hilo.is_alive():
+            _hilo = threading.Thread(target=_ciclo_actualizacion, name="tipo-cambio", daemon=True)
+            _hilo.start()
+
+def solicitar_actualizacion():
+    """Pide al hilo una actualización inmediata sin esperar el resultado"""
+    iniciar_actualizacion()
+    _despertar.set()
+
+# ==============================
+# Servidor stub para pruebas locales
+# ==============================
+def crear_servidor_stub(puerto=8765, venta=3.75, compra=3.74, fallar=False, demora=0):
+    """Servidor HTTP que imita la API de SUNAT; usar con TIPO_CAMBIO_URL=http://127.0.0.1:<puerto>/"""
+
+    class Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if demora:
+                time.sleep(demora)
+            if self.server.fallar:
+                self.send_response(503)
+                self.end_headers()
+                return
+            cuerpo = json.dumps({
+                'compra': self.server.compra,
+                'venta': self.server.venta,
+                'origen': 'STUB',
+                'moneda': 'USD',
+                'fecha': date.today().isoformat(),
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), Manejador)
+    servidor.venta, servidor.compra, servidor.fallar = venta, compra, fallar
+    return servidor
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tipo de cambio: actualización manual o servidor stub")
+    parser.add_argument("--stub", action="store_true", help="Levantar el servidor stub local")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--venta", type=float, default=3.75)
+    parser.add_argument("--fallar", action="store_true", help="El stub responde 503")
+    parser.add_argument("--demora", type=float, default=0, help="Segundos de espera por respuesta")
+    parser.add_argument("--importar", metavar="CSV", help="Cargar historial (columnas fecha,venta[,compra])")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.stub:
+        servidor = crear_servidor_stub(args.puerto, args.venta, fallar=args.fallar, demora=args.demora)
+        print(f"Stub de tipo de cambio en http://127.0.0.1:{args.puerto}/")
+        servidor.serve_forever()
+    elif args.importar:
+        print(f"{importar_historial(args.importar)} tipos de cambio importados")
+    else:
+        print("Actualizado" if actualizar_tipo_cambio() else "Sin cambios")
+        print(estado_tipo_cambio())
@@ -0,0 +1,136 @@
+import argparse
+import re
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import text
+
+from database import engine
+
+# ==============================
+# Backfill desde eventos_historial
+# ==============================
+# Texto que deja Proyecto.mover_a_estado (versiones antiguas escribían "to")
+PATRON_EVENTO = re.compile(r"^Estado cambiado de (\S+) (?:a|to) (\S+)$")
+
+_backfill_hecho = False
+
+def backfill_transiciones():
+    """Crea transiciones a partir de los eventos de texto que aún no tienen una (idempotente)"""
+    global _backfill_hecho
+    with engine.begin() as conn:
+        eventos = conn.execute(text("""
+            SELECT e.id, e.proyecto_id, e.evento, e.timestamp, e.usuario_id
+            FROM eventos_historial e
+            LEFT JOIN transiciones_estado t ON t.evento_id = e.id
+            WHERE e.evento LIKE 'Estado cambiado de %' AND t.id IS NULL
+        """)).fetchall()
+
+        registros = []
+        for evento_id, proyecto_id, evento, fecha, usuario_id in eventos:
+            coincidencia = PATRON_EVENTO.match(evento.strip())
+            if coincidencia:
+                registros.append({
+                    'proyecto_id': proyecto_id,
+                    'estado_origen': coincidencia.group(1),
+                    'estado_destino': coincidencia.group(2),
+                    'fecha': fecha,
+                    'usuario_id': usuario_id,
+                    'evento_id': evento_id,
+                })
+        if registros:
+            conn.execute(text("""
+                INSERT INTO transiciones_estado (proyecto_id, estado_origen, estado_destino, fecha, usuario_id, evento_id)
+                VALUES (:proyecto_id, :estado_origen, :estado_destino, :fecha, :usuario_id, :evento_id)
+            """), registros)
+    _backfill_hecho = True
+    return len(registros)
+
+def _asegurar_backfill():
+    if not _backfill_hecho:
+        backfill_transiciones()
+
+# ==============================
+# Tramos por etapa (SQL con LEAD)
+# ==============================
+def tramos_por_etapa(ahora=None):
+    """Un tramo por cada estancia de un proyecto activo en un estado.
+
+    El primer tramo empieza en fecha_creacion con el estado de origen de la
+    primera transición (o el estado actual si nunca se movió). `fin` es NULL
+    en el tramo en curso, cuyos días se cuentan hasta `ahora`.
+    """
+    _asegurar_backfill()
+    ahora = ahora or datetime.now()
+    with engine.connect() as conn:
+        df = pd.read_sql_query(text("""
+            WITH movimientos AS (
+                SELECT p.id AS proyecto_id,
+                       COALESCE((SELECT t.estado_origen FROM transiciones_estado t
+                                 WHERE t.proyecto_id = p.id ORDER BY t.fecha LIMIT 1),
+                                p.estado_actual) AS estado,
+                       p.fecha_creacion AS fecha
+                FROM proyectos p
+                WHERE p.activo = 1
+                UNION ALL
+                SELECT t.proyecto_id, t.estado_destino, t.fecha
+                FROM transiciones_estado t
+                JOIN proyectos p ON p.id = t.proyecto_id
+                WHERE p.activo = 1
+            )
+            SELECT proyecto_id, estado, fecha AS inicio,
+                   LEAD(fecha) OVER tramo AS fin,
+                   MAX(julianday(COALESCE(LEAD(fecha) OVER tramo, :ahora)) - julianday(fecha), 0) AS dias
+            FROM movimientos
+            WINDOW tramo AS (PARTITION BY proyecto_id ORDER BY fecha)
+        """), conn, params={'ahora': ahora.isoformat(sep=' ')})
+    df['inicio'] = pd.to_datetime(df['inicio'], format='mixed')
+    df['fin'] = pd.to_datetime(df['fin'], format='mixed')
+    df['en_curso'] = df['fin'].isna()
+    return df
+
+def tiempo_en_etapa(tramos):
+    """Días por estado: promedio, mediana y p90 de los tramos cerrados, y edad de los abiertos"""
+    cerrados = tramos[~tramos['en_curso']].groupby('estado')['dias']
+    abiertos = tramos[tramos['en_curso']].groupby('estado')['dias']
+    resumen = pd.DataFrame({
+        'tramos_cerrados': cerrados.size(),
+        'promedio_dias': cerrados.mean(),
+        'mediana_dias': cerrados.median(),
+        'p90_dias': cerrados.quantile(0.9),
+        'en_curso': abiertos.size(),
+        'edad_promedio_en_curso': abiertos.mean(),
+    })
+    resumen[['tramos_cerrados', 'en_curso']] = resumen[['tramos_cerrados', 'en_curso']].fillna(0).astype(int)
+    return resumen
+
+def proyectos_estancados(tramos, percentil=0.75):
+    """Tramos en curso que ya superan el percentil de duración de su estado"""
+    limites = tramos[~tramos['en_curso']].groupby('estado')['dias'].quantile(percentil)
+    abiertos = tramos[tramos['en_curso']].copy()
+    abiertos['limite_dias'] = abiertos['estado'].map(limites)
+    return abiertos[abiertos['dias'] > abiertos['limite_dias']].sort_values('dias', ascending=False)
+
+def tiempos_ciclo(estado_final='DELIVERY'):
+    """Días desde la creación hasta la primera llegada a `estado_final`, por proyecto"""
+    _asegurar_backfill()
+    with engine.connect() as conn:
+        df = pd.read_sql_query(text("""
+            SELECT p.id AS proyecto_id, p.fecha_creacion, MIN(t.fecha) AS fecha_llegada,
+                   MAX(julianday(MIN(t.fecha)) - julianday(p.fecha_creacion), 0) AS dias
+            FROM proyectos p
+            JOIN transiciones_estado t ON t.proyecto_id = p.id AND t.estado_destino = :estado_final
+            WHERE p.activo = 1
+            GROUP BY p.id, p.fecha_creacion
+        """), conn, params={'estado_final': estado_final})
+    df['fecha_llegada'] = pd.to_datetime(df['fecha_llegada'], format='mixed')
+    return df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transiciones de estado")
+    parser.add_argument("--backfill", action="store_true", help="Crear transiciones desde eventos_historial")
+    args = parser.parse_args()
+
+    if args.backfill:
+        print(f"{backfill_transiciones()} transiciones creadas")
+    print(tiempo_en_etapa(tramos_por_etapa()).round(1))
@@ -0,0 +1,72 @@
+import threading
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload
+
+from database import SessionLocal, asegurar_esquema
+from models import ProyectoArchivos, TiposArchivo
+
+# Límite de parámetros por consulta (SQLite admite 999 en versiones antiguas)
+TAMANIO_LOTE = 900
+
+_indice_listo = False
+_indice_lock = threading.Lock()
+
+def _asegurar_indice():
+    """Crea el índice (proyecto_id, tipo_archivo_id, fecha_subida) en bases existentes"""
+    global _indice_listo
+    if _indice_listo:
+        return
+    with _indice_lock:
+        if not _indice_listo:
+            asegurar_esquema(*ProyectoArchivos.__table__.indexes)
+            _indice_listo = True
+
+def obtener_ultimos_archivos(proyecto_ids, tipos=None):
+    """Último archivo de cada tipo para varios proyectos en una sola consulta.
+
+    Devuelve {proyecto_id: {nombre_tipo: ProyectoArchivos}}; los proyectos sin
+    archivos no aparecen y se ignoran los tipos de archivo inactivos. `tipos` restringe a nombres como ["TDR", "PROPUESTA"].
+    """
+    _asegurar_indice()
+    proyecto_ids = list(dict.fromkeys(proyecto_ids))
+    resultado = {}
+    if not proyecto_ids:
+        return resultado
+
+    db = SessionLocal()
+    try:
+        for i in range(0, len(proyecto_ids), TAMANIO_LOTE):
+            lote = proyecto_ids[i:i + TAMANIO_LOTE]
+
+            orden = func.row_number().over(
+                partition_by=(ProyectoArchivos.proyecto_id, ProyectoArchivos.tipo_archivo_id),
+                order_by=(ProyectoArchivos.fecha_subida.desc(), ProyectoArchivos.id.desc())
+            ).label("orden")
+            # Solo tipos activos, como hacían los helpers por proyecto
+            recientes = select(ProyectoArchivos.id, orden).join(TiposArchivo).where(
+                ProyectoArchivos.proyecto_id.in_(lote),
+                TiposArchivo.activo == True
+            )
+            if tipos:
+                recientes = recientes.where(TiposArchivo.nombre.in_(tipos))
+            recientes = recientes.subquery()
+
+            archivos = db.query(ProyectoArchivos).join(
+                recientes, recientes.c.id == ProyectoArchivos.id
+            ).filter(
+                recientes.c.orden == 1
+            ).options(
+                joinedload(ProyectoArchivos.tipo_archivo)
+            ).all()
+
+            for archivo in archivos:
+                resultado.setdefault(archivo.proyecto_id, {})[archivo.tipo_archivo.nombre] = archivo
+
+        return resultado
+    finally:
+        db.close()
+
+def obtener_ultimos_archivos_proyecto(proyecto_id, tipos=None):
+    """Último archivo de cada tipo para un proyecto: {nombre_tipo: ProyectoArchivos}"""
+    return obtener_ultimos_archivos([proyecto_id], tipos).get(proyecto_id, {})